@@ -0,0 +1,208 @@
+# benchmarks/bench_async_vs_sync.py
+#
+# Prova di carico di /api/search_food: server sincrono (Flask, N worker) contro server ASGI
+# (un solo event loop), entrambi contro un finto OpenFoodFacts locale con latenza configurabile
+# e una coda lenta opzionale (per misurare l'effetto dell'hedging).
+#
+# Ogni client virtuale invia richieste una dopo l'altra (carico a ciclo chiuso); le query sono
+# tutte diverse, quindi ogni richiesta arriva all'upstream (nessun hit in cache).
+#
+# Uso: python benchmarks/bench_async_vs_sync.py [--clients 200] [--requests 2000] [--latency 0.1]
+#                                              [--slow-ratio 0.05] [--slow-factor 10] [--sync-workers 8]
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from src import api_server, asgi_server
+from src.integrations import http_client, openfoodfacts_client
+from src.integrations.local_cache import LocalCache
+from src.integrations.upstream_scheduler import UpstreamScheduler, set_scheduler
+
+
+class StubSearch(BaseHTTPRequestHandler):
+    """Finto search.pl di OpenFoodFacts: risponde dopo `latency` secondi, a volte `slow_factor` volte più lento."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # header e corpo sono scritti separatamente: senza, ogni risposta attende l'ACK ritardato
+    latency = 0.1
+    slow_ratio = 0.0
+    slow_factor = 10.0
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            slow = cls.rng.random() < cls.slow_ratio
+        time.sleep(cls.latency * (cls.slow_factor if slow else 1))
+        body = json.dumps({"products": [{"code": "8001", "product_name_it": "Spaghetti", "brands": "Barilla",
+                                         "nutriments": {"energy-kcal_100g": 359}}]}).encode("utf-8")
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # richiesta annullata dal client (es. la copia più lenta di una ricerca hedged)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # il default (5) fa scartare le connessioni quando arrivano centinaia di client insieme
+
+
+def serve_stub(port_queue, latency: float, slow_ratio: float, slow_factor: float) -> None:
+    """Avvia il finto upstream in un processo separato, così non compete per il GIL con il server misurato."""
+    StubSearch.latency = latency
+    StubSearch.slow_ratio = slow_ratio
+    StubSearch.slow_factor = slow_factor
+    server = StubServer(("127.0.0.1", 0), StubSearch)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def percentiles(latencies: list[float]) -> dict:
+    ordered = sorted(latencies)
+
+    def pick(percent):
+        return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+    return {"p50_ms": pick(50) * 1e3, "p95_ms": pick(95) * 1e3, "p99_ms": pick(99) * 1e3}
+
+
+def run_sync(clients: int, total: int, workers: int) -> tuple[float, list[float], int]:
+    """Flask con `workers` thread (come gunicorn con worker sincroni): le richieste oltre il pool attendono in coda."""
+    flask_client = api_server.app.test_client()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+    latencies, errors = [], []
+
+    def handle(query):
+        return flask_client.get(f"/api/search_food?query={query}").status_code
+
+    def client():
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            started = time.perf_counter()
+            status = pool.submit(handle, f"sync{index}").result()
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    pool.shutdown()
+    return elapsed, latencies, len(errors)
+
+
+async def _call_asgi(query: str) -> int:
+    scope = {"type": "http", "method": "GET", "path": "/api/search_food",
+             "query_string": f"query={query}".encode(), "headers": []}
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    await asgi_server.app(scope, receive, send)
+    return status["code"]
+
+
+def run_async(clients: int, total: int, prefix: str) -> tuple[float, list[float], int]:
+    """App ASGI su un solo event loop, con `clients` richieste in volo contemporaneamente."""
+    latencies, errors = [], []
+
+    async def main():
+        counter = iter(range(total))
+
+        async def client():
+            for index in counter:
+                started = time.perf_counter()
+                status = await _call_asgi(f"{prefix}{index}")
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors.append(status)
+
+        try:
+            await asyncio.gather(*(client() for _ in range(clients)))
+        finally:
+            await http_client.close_async_client()
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return time.perf_counter() - started, latencies, len(errors)
+
+
+def report(name: str, elapsed: float, latencies: list[float], errors: int) -> dict:
+    result = {"mode": name, "requests": len(latencies), "errors": errors,
+              "throughput_rps": len(latencies) / elapsed, **percentiles(latencies)}
+    print(f"{name:<14} {result['throughput_rps']:8.1f} req/s   p50 {result['p50_ms']:7.1f} ms   "
+          f"p95 {result['p95_ms']:7.1f} ms   p99 {result['p99_ms']:7.1f} ms   errori {errors}")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Confronto di carico tra server sincrono e ASGI.")
+    parser.add_argument("--clients", type=int, default=200, help="client virtuali concorrenti")
+    parser.add_argument("--requests", type=int, default=2000, help="richieste totali per modalità")
+    parser.add_argument("--latency", type=float, default=0.1, help="latenza dell'upstream finto (s)")
+    parser.add_argument("--slow-ratio", type=float, default=0.05, help="frazione di risposte lente dell'upstream")
+    parser.add_argument("--slow-factor", type=float, default=10.0, help="quanto sono più lente le risposte lente")
+    parser.add_argument("--sync-workers", type=int, default=8, help="thread del server sincrono")
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    stub = multiprocessing.Process(target=serve_stub, daemon=True,
+                                   args=(port_queue, args.latency, args.slow_ratio, args.slow_factor))
+    stub.start()
+    openfoodfacts_client.BASE_URL_SEARCH_CGI = f"http://127.0.0.1:{port_queue.get(timeout=10)}/cgi/search.pl"
+    openfoodfacts_client.set_product_cache(LocalCache())
+    openfoodfacts_client.set_offline_index(None)
+    set_scheduler("off_search", UpstreamScheduler("off_search", rate_per_minute=0))  # si misura il server, non il limite
+
+    print(f"Upstream finto: {args.latency * 1e3:.0f} ms ({args.slow_ratio:.0%} delle risposte x{args.slow_factor:g}); "
+          f"{args.clients} client, {args.requests} richieste per modalità\n")
+    results = [report(f"sync ({args.sync_workers} thr)", *run_sync(args.clients, args.requests, args.sync_workers))]
+
+    openfoodfacts_client.OFF_HEDGE_PERCENTILE = 0
+    results.append(report("async", *run_async(args.clients, args.requests, "async")))
+
+    openfoodfacts_client.OFF_HEDGE_PERCENTILE = 90
+    run_async(args.clients, 200, "warmup")  # popola la finestra delle latenze usata per la soglia di hedging
+    results.append(report("async + hedge", *run_async(args.clients, args.requests, "hedge")))
+    print(f"\nRicerche duplicate (hedging): {openfoodfacts_client.get_cache_stats()['hedged_searches']}")
+
+    stub.terminate()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
@@ -0,0 +1,61 @@
+# benchmarks/bench_autocomplete.py
+#
+# Latenza di suggest() su un indice di autocompletamento pieno (max_entries voci con nomi sintetici),
+# per prefissi corti (molti candidati, limitati da max_scan), lunghi e senza risultati.
+# L'obiettivo è restare sotto i 5 ms per suggerimento anche sul prefisso di una sola lettera.
+#
+# Uso: python benchmarks/bench_autocomplete.py [--entries 20000] [--queries 2000] [--json risultati.json] [--compare prima.json]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from benchmarks.harness import finish, percentiles
+from src.integrations.autocomplete_index import AutocompleteIndex
+
+WORDS = ["pasta", "pane", "latte", "yogurt", "biscotti", "riso", "tonno", "olio", "caffe", "succo"]
+PREFIXES = ("p", "pa", "pas", "latte y", "marca12", "z")
+TARGET_MS = 5.0
+
+
+def full_index(entries: int, seed: int) -> AutocompleteIndex:
+    rng = random.Random(seed)
+    index = AutocompleteIndex(max_entries=entries)
+    for i in range(entries):
+        index.add_product(f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i}", f"marca{i % 300}", str(i),
+                          weight=rng.randint(1, 50))
+    return index
+
+
+def bench_prefix(index: AutocompleteIndex, prefix: str, queries: int) -> dict:
+    index.suggest(prefix)   # riscaldamento
+    latencies = []
+    for _ in range(queries):
+        started = time.perf_counter()
+        index.suggest(prefix)
+        latencies.append(time.perf_counter() - started)
+    return {"name": f"suggest '{prefix}'", **percentiles(latencies)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark dell'autocompletamento su un indice pieno.")
+    parser.add_argument("--entries", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=2_000, help="suggerimenti per prefisso")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    parser.add_argument("--compare", help="risultati precedenti con cui confrontare")
+    args = parser.parse_args()
+
+    index = full_index(args.entries, args.seed)
+    results = [bench_prefix(index, prefix, args.queries) for prefix in PREFIXES]
+    for result in results:
+        verdict = "" if result["p99_ms"] < TARGET_MS else f"  OLTRE l'obiettivo di {TARGET_MS:.0f} ms"
+        print(f"{result['name']:<20} p50 {result['p50_ms']:7.3f} ms  p99 {result['p99_ms']:7.3f} ms{verdict}")
+    config = {key: value for key, value in vars(args).items() if key not in ("json", "compare")}
+    finish("autocomplete", config, results, args.json, args.compare)
@@ -0,0 +1,261 @@
+# benchmarks/bench_load.py
+#
+# Prova di carico end-to-end di /api/search_food e /api/calculate_needs contro i servizi finti
+# (benchmarks/fakes.py): OpenFoodFacts gira in un processo separato e riproduce le risposte
+# registrate, Gemini è un modello finto installato nel processo. Per entrambi si possono
+# configurare latenza, risposte lente, errori e risposte malformate.
+#
+# Carico a ciclo chiuso: ogni client virtuale invia la richiesta successiva appena riceve la risposta.
+# Per ogni scenario e server riporta throughput, p50/p95/p99, risposte di errore, risposte degradate
+# (nota locale al posto di quella di Gemini) ed errori upstream contati dalla telemetria.
+#
+# Uso: python benchmarks/bench_load.py [--scenario search_food calculate_needs] [--server sync asgi]
+#                                      [--clients 50] [--requests 1000] [--off-latency 0.05] [--off-error-rate 0.01]
+#                                      [--gemini-latency 0.5] [--ai-ratio 0.2] [--json risultati.json] [--compare prima.json]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from benchmarks.fakes import FakeGeminiModel, add_fault_arguments, faults_from_args, load_recordings, start_fake_off, \
+    use_fake_off
+from benchmarks.harness import finish, percentiles
+from src import api_server, asgi_server
+from src.core.nutritional_calculator import ACTIVITY_MULTIPLIERS
+from src.integrations import gemini_service, http_client, telemetry, upstream_scheduler
+
+SCENARIOS = ("search_food", "calculate_needs")
+SERVERS = ("sync", "asgi")
+OBJECTIVES = ("perdere peso", "mantenere il peso", "aumentare la massa muscolare")
+
+
+# --- RICHIESTE ---
+
+def build_requests(scenario: str, total: int, unique_queries: bool = False, ai_ratio: float = 0.0,
+                   profiles: int = 200, seed: int = 0) -> list[tuple[str, str, str, dict | None]]:
+    """
+    Richieste (metodo, percorso, query string, corpo JSON) di uno scenario.
+
+    search_food usa le query registrate (dopo la prima volta servite dalla cache) oppure, con
+    `unique_queries`, query tutte diverse che arrivano sempre all'upstream. calculate_needs sceglie
+    tra `profiles` profili; una quota `ai_ratio` chiede la nota a Gemini (?notes=ai).
+    """
+    rng = random.Random(seed)
+    if scenario == "search_food":
+        queries = sorted(load_recordings()["search"])
+        return [("GET", "/api/search_food", f"query={rng.choice(queries)} {index}" if unique_queries
+                 else f"query={rng.choice(queries)}", None) for index in range(total)]
+
+    pool = [{"age": str(rng.randint(18, 80)), "weight": f"{rng.uniform(45, 120):.1f}",
+             "height": str(rng.randint(150, 200)), "gender": rng.choice(("male", "female")),
+             "activity_level": rng.choice(sorted(ACTIVITY_MULTIPLIERS)), "objectives": rng.choice(OBJECTIVES)}
+            for _ in range(profiles)]
+    return [("POST", "/api/calculate_needs", "notes=ai" if rng.random() < ai_ratio else "", rng.choice(pool))
+            for _ in range(total)]
+
+
+def _outcome(status: int, payload) -> str | None:
+    """None se la risposta è riuscita, "error" per uno stato diverso da 200, "degraded" se Gemini ha fallito."""
+    if status != 200:
+        return "error"
+    if isinstance(payload, dict) and "notes_error" in payload:
+        return "degraded"
+    return None
+
+
+# --- SERVER ---
+
+def run_sync(requests: list, clients: int, workers: int) -> tuple[float, list[float], list[str | None]]:
+    """Flask con `workers` thread (come gunicorn con worker sincroni): le richieste oltre il pool attendono in coda."""
+    flask_client = api_server.app.test_client()
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = iter(requests)
+    pending_lock = threading.Lock()
+    latencies, outcomes = [], []
+
+    def handle(method, path, query, body):
+        response = flask_client.open(f"{path}?{query}" if query else path, method=method, json=body)
+        return _outcome(response.status_code, response.get_json(silent=True))
+
+    def client():
+        while True:
+            with pending_lock:
+                request = next(pending, None)
+            if request is None:
+                return
+            started = time.perf_counter()
+            outcome = pool.submit(handle, *request).result()
+            latencies.append(time.perf_counter() - started)
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    pool.shutdown()
+    return elapsed, latencies, outcomes
+
+
+async def _call_asgi(method: str, path: str, query: str, body: dict | None) -> str | None:
+    raw_body = json.dumps(body).encode("utf-8") if body is not None else b""
+    headers = [(b"content-type", b"application/json")] if body is not None else []
+    scope = {"type": "http", "method": method, "path": path, "query_string": query.encode(), "headers": headers}
+    response = {"body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": raw_body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await asgi_server.app(scope, receive, send)
+    try:
+        payload = json.loads(response["body"]) if method == "POST" else None
+    except ValueError:
+        payload = None
+    return _outcome(response["status"], payload)
+
+
+def run_asgi(requests: list, clients: int) -> tuple[float, list[float], list[str | None]]:
+    """App ASGI su un solo event loop, con `clients` richieste in volo contemporaneamente."""
+    latencies, outcomes = [], []
+
+    async def main():
+        pending = iter(requests)
+
+        async def client():
+            for request in pending:
+                started = time.perf_counter()
+                outcome = await _call_asgi(*request)
+                latencies.append(time.perf_counter() - started)
+                outcomes.append(outcome)
+
+        try:
+            await asyncio.gather(*(client() for _ in range(clients)))
+        finally:
+            await http_client.close_async_client()
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return time.perf_counter() - started, latencies, outcomes
+
+
+# --- MISURA ---
+
+def upstream_error_counts() -> dict:
+    """Errori upstream per "servizio/tipo" letti dall'esposizione Prometheus della telemetria."""
+    counts = {}
+    prefix = "allenatore_upstream_errors_total{"
+    for line in telemetry.render_metrics().splitlines():
+        if line.startswith(prefix):
+            labels, value = line[len(prefix):].rsplit("} ", 1)
+            upstream, error_type = (part.split("=", 1)[1].strip('"') for part in labels.split(","))
+            counts[f"{upstream}/{error_type}"] = float(value)
+    return counts
+
+
+def reset_state(off_base_url: str, gemini: FakeGeminiModel, rate_limits: bool = False) -> None:
+    """
+    Cache vuote e pianificatori nuovi prima di ogni esecuzione, così server diversi partono dalle stesse
+    condizioni. Con `rate_limits` valgono i limiti di richieste configurati (upstream_scheduler).
+    """
+    use_fake_off(off_base_url, rate_limits)
+    upstream_scheduler.set_scheduler(
+        "gemini", None if rate_limits else upstream_scheduler.UpstreamScheduler("gemini", rate_per_minute=0))
+    gemini_service.set_model(gemini)
+    gemini_service.advice_cache.clear()
+
+
+def measure(scenario: str, server: str, requests: list, clients: int, sync_workers: int) -> dict:
+    before = upstream_error_counts()
+    if server == "sync":
+        elapsed, latencies, outcomes = run_sync(requests, clients, sync_workers)
+    else:
+        elapsed, latencies, outcomes = run_asgi(requests, clients)
+    after = upstream_error_counts()
+    errors = outcomes.count("error")
+    return {
+        "name": f"{scenario}/{server}", "scenario": scenario, "server": server, "requests": len(latencies),
+        "clients": clients, "seconds": round(elapsed, 3), "throughput_rps": round(len(latencies) / elapsed, 1),
+        **percentiles(latencies), "errors": errors, "degraded": outcomes.count("degraded"),
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "upstream_errors": {key: value - before.get(key, 0) for key, value in after.items()
+                            if value - before.get(key, 0)},
+    }
+
+
+def run(args: argparse.Namespace, off_base_url: str, gemini: FakeGeminiModel) -> list[dict]:
+    results = []
+    for scenario in args.scenario:
+        requests = build_requests(scenario, args.requests, args.unique_queries, args.ai_ratio, args.profiles, args.seed)
+        for server in args.server:
+            reset_state(off_base_url, gemini, args.rate_limits)
+            result = measure(scenario, server, requests, args.clients, args.sync_workers)
+            results.append(result)
+            print(f"{result['name']:<22} {result['throughput_rps']:8.1f} req/s   p50 {result['p50_ms']:7.1f} ms   "
+                  f"p95 {result['p95_ms']:7.1f} ms   p99 {result['p99_ms']:7.1f} ms   errori {result['errors']}   "
+                  f"degradate {result['degraded']}")
+            if result["upstream_errors"]:
+                print(f"{'':<22} errori upstream: {result['upstream_errors']}")
+    return results
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Prova di carico con OpenFoodFacts e Gemini finti.")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--server", nargs="+", choices=SERVERS, default=list(SERVERS))
+    parser.add_argument("--clients", type=int, default=50, help="client virtuali concorrenti")
+    parser.add_argument("--requests", type=int, default=1000, help="richieste per scenario e server")
+    parser.add_argument("--sync-workers", type=int, default=8, help="thread del server sincrono")
+    parser.add_argument("--unique-queries", action="store_true", help="ricerche tutte diverse (nessun hit in cache)")
+    parser.add_argument("--ai-ratio", type=float, default=0.2, help="quota di calculate_needs con ?notes=ai")
+    parser.add_argument("--profiles", type=int, default=200, help="profili distinti di calculate_needs")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="applica i limiti di richieste configurati (OFF_*_RATE_PER_MIN, GEMINI_RATE_PER_MIN)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="CRITICAL",
+                        help="livello dei log durante la prova (gli errori iniettati non finiscono nel terminale)")
+    add_fault_arguments(parser, "off-", "OpenFoodFacts")
+    add_fault_arguments(parser, "gemini-", "Gemini")
+    parser.set_defaults(gemini_latency=0.5, gemini_jitter=0.2)
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    parser.add_argument("--compare", help="risultati precedenti con cui confrontare")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    args = parse_args(argv)
+    telemetry.configure_logging(level=args.log_level)
+    off_faults = faults_from_args(args, "off-", args.seed)
+    gemini_faults = faults_from_args(args, "gemini-", args.seed + 1)
+    process, off_base_url = start_fake_off(off_faults)
+    try:
+        print(f"OpenFoodFacts finto: {off_faults.to_dict()}\nGemini finto: {gemini_faults.to_dict()}\n"
+              f"{args.clients} client, {args.requests} richieste per scenario e server\n")
+        results = run(args, off_base_url, FakeGeminiModel(gemini_faults))
+    finally:
+        process.terminate()
+        gemini_service.set_model(None)
+        telemetry.configure_logging()
+    config = {key: value for key, value in vars(args).items() if key not in ("json", "compare")}
+    return finish("load", config, results, args.json, args.compare)
+
+
+if __name__ == '__main__':
+    main()
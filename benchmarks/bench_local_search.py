@@ -0,0 +1,135 @@
+# benchmarks/bench_local_search.py
+#
+# Ricerca locale tollerante agli errori su un catalogo sintetico di prodotti italiani:
+# tempo di costruzione dell'indice, latenza delle query (p50/p95/p99) e recall@5 su query
+# ottenute dai nomi dei prodotti con errori di battitura, accenti tolti e parole mancanti.
+# Una query è trovata se tra i primi 5 risultati c'è un prodotto che contiene tutte le sue
+# parole senza l'errore (nel catalogo molti prodotti hanno lo stesso nome).
+#
+# Uso: python benchmarks/bench_local_search.py [--products 1000000] [--queries 500] [--json risultati.json]
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from src.integrations.autocomplete_index import normalize
+from src.integrations.local_search import LocalSearchIndex
+
+FOODS = ["pasta", "spaghetti", "penne", "fusilli", "rigatoni", "parmigiano reggiano", "grana padano", "mozzarella",
+         "ricotta", "yogurt greco", "yogurt bianco", "latte intero", "latte scremato", "biscotti", "fette biscottate",
+         "crackers", "grissini", "pane integrale", "caffè macinato", "caffè in grani", "tè verde", "succo d'arancia",
+         "passata di pomodoro", "pomodori pelati", "tonno all'olio", "olio extravergine", "aceto balsamico",
+         "prosciutto crudo", "prosciutto cotto", "bresaola", "mortadella", "salame", "riso carnaroli", "riso basmati",
+         "farina 00", "zucchero di canna", "cioccolato fondente", "nocciole", "mandorle", "ceci", "lenticchie",
+         "fagioli borlotti", "piselli", "tortellini", "gnocchi di patate", "pesto alla genovese", "muesli",
+         "corn flakes", "gelato alla vaniglia", "acqua frizzante", "birra", "vino rosso", "kefir", "burro",
+         "mascarpone", "gorgonzola", "pecorino romano", "focaccia", "piadina", "taralli"]
+QUALIFIERS = ["biologico", "senza glutine", "integrale", "light", "0%", "classico", "al naturale", "dop", "igp",
+              "senza lattosio", "proteico", "bio", "extra", "fresco", "stagionato", "affumicato", "piccante", "dolce"]
+BRANDS = ["Barilla", "De Cecco", "Granarolo", "Parmalat", "Mutti", "Rio Mare", "Lavazza", "Illy", "Mulino Bianco",
+          "Galbani", "Fage", "Conad", "Coop", "Esselunga", "Rummo", "Garofalo", "Cirio", "Kellogg's", "Ferrero",
+          "Zuegg", "Santàl", "Müller", "Yomo", "Vallelata", "Beretta", "Rovagnati", "Citterio", "Sperlari"]
+
+
+def synthetic_products(count: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        words = [rng.choice(FOODS)] + rng.sample(QUALIFIERS, rng.randint(0, 2))
+        if rng.random() < 0.3:
+            words.append(f"{rng.choice([125, 250, 500, 750, 1000])}g")
+        if rng.random() < 0.5:
+            words.append(f"linea{rng.randint(1, 20000)}")  # varianti e codici prodotto, rendono i nomi quasi unici
+        products.append({"barcode": str(8000000000000 + i), "name": " ".join(words), "brands": rng.choice(BRANDS),
+                         "calories_100g": round(rng.uniform(20, 600), 1)})
+    return products
+
+
+def misspell(product: dict, rng: random.Random) -> tuple[str, str]:
+    """
+    Una query "umana" per il prodotto: accenti tolti, una parola omessa, a volte la marca, un errore
+    di battitura in una parola lunga. Restituisce (query senza errore, query con errore).
+    """
+    words = product["name"].replace("è", "e").replace("à", "a").replace("'", " ").split()
+    if len(words) > 2 and rng.random() < 0.5:
+        words.pop(rng.randrange(1, len(words)))
+    if rng.random() < 0.5:
+        words.append(product["brands"].split()[0])
+    clean = " ".join(words)
+    candidates = [i for i, word in enumerate(words) if len(word) >= 5 and word.isalpha()]
+    if candidates:
+        i = rng.choice(candidates)
+        word, pos = words[i], rng.randrange(1, len(words[i]) - 1)
+        edit = rng.choice(("delete", "double", "swap", "replace"))
+        if edit == "delete":
+            word = word[:pos] + word[pos + 1:]
+        elif edit == "double":
+            word = word[:pos] + word[pos] + word[pos:]
+        elif edit == "swap":
+            word = word[:pos - 1] + word[pos] + word[pos - 1] + word[pos + 1:]
+        else:
+            word = word[:pos] + rng.choice("aeiou") + word[pos + 1:]
+        words[i] = word
+    return clean, " ".join(words)
+
+
+def contains_words(product: dict, query: str) -> bool:
+    return set(normalize(query).split()) <= set(normalize(f"{product['name']} {product['brands']}").split())
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark della ricerca locale tollerante agli errori.")
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    products = synthetic_products(args.products)
+    print(f"Catalogo sintetico: {len(products)} prodotti in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    index = LocalSearchIndex()
+    for start in range(0, len(products), 10000):
+        index.add_products(products[start:start + 10000])
+    index.optimize()
+    build_seconds = time.perf_counter() - started
+    print(f"Indice costruito in {build_seconds:.1f}s: {index.stats()}")
+
+    rng = random.Random(1)
+    clean_queries, queries = map(list, zip(*(misspell(product, rng) for product in rng.sample(products, args.queries))))
+    queries += ["parmiggiano", "yogurt greco 0%", "mozarella", "cafe macinato", "prosciuto crudo", "spagetti barilla"]
+    index.search("pasta integrale")   # la prima query alloca gli array di punteggio
+
+    latencies, hits = [], 0
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        results = index.search(query, page_size=5)
+        latencies.append(time.perf_counter() - started)
+        if i < len(clean_queries) and any(contains_words(result, clean_queries[i]) for result in results):
+            hits += 1
+        elif i >= len(clean_queries):
+            print(f"  '{query}' -> {[(result['name'], result['brands']) for result in results[:3]]}")
+
+    summary = {
+        "products": len(products), "queries": len(queries), "build_seconds": round(build_seconds, 2),
+        "p50_ms": percentile(latencies, 50) * 1e3, "p95_ms": percentile(latencies, 95) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3, "recall_at_5": hits / len(clean_queries),
+    }
+    print(f"Latenza: p50 {summary['p50_ms']:.2f} ms, p95 {summary['p95_ms']:.2f} ms, p99 {summary['p99_ms']:.2f} ms; "
+          f"recall@5 sulle query con errori: {summary['recall_at_5']:.1%}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,67 @@
+# benchmarks/bench_meal_plan.py
+#
+# Tempo di plan_meals per un piano settimanale su migliaia di alimenti sintetici (valori nutrizionali
+# e prezzi casuali ma plausibili), con e senza minimizzazione del costo. L'obiettivo è una settimana
+# su 5000 candidati ben sotto il secondo.
+#
+# Uso: python benchmarks/bench_meal_plan.py [--sizes 500 5000 20000] [--days 7] [--repeat 3] [--json risultati.json]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from benchmarks.harness import finish, percentiles
+from src.core.recipe_manager import plan_meals
+
+TARGETS = {"calories": 2000, "protein": 120, "carbs": 230, "fat": 65}
+TARGET_SECONDS = 1.0
+
+
+def synthetic_foods(count: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    protein, carbs, fat = rng.uniform(0, 30, count), rng.uniform(0, 80, count), rng.uniform(0, 40, count)
+    calories = protein * 4 + carbs * 4 + fat * 9
+    prices = rng.uniform(1, 25, count)
+    return [{"barcode": str(i), "name": f"alimento {i}", "calories_100g": float(calories[i]),
+             "protein_100g": float(protein[i]), "carbs_100g": float(carbs[i]), "fat_100g": float(fat[i]),
+             "price_per_kg": float(prices[i])} for i in range(count)]
+
+
+def bench_plan(foods: list[dict], days: int, minimize_cost: bool, repeat: int) -> dict:
+    durations, plan = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        plan = plan_meals(foods, TARGETS, days=days, minimize_cost=minimize_cost)
+        durations.append(time.perf_counter() - started)
+    return {"name": f"n={len(foods)} days={days}{' costo' if minimize_cost else ''}",
+            "p50_ms": percentiles(durations)["p50_ms"], "within_tolerance": plan["within_tolerance"]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark del piano alimentare.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 5_000, 20_000])
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    parser.add_argument("--compare", help="risultati precedenti con cui confrontare")
+    args = parser.parse_args()
+
+    plan_meals(synthetic_foods(100), TARGETS, days=1)   # riscaldamento (import e allocazioni di NumPy)
+    results = []
+    for size in args.sizes:
+        foods = synthetic_foods(size)
+        for minimize_cost in (False, True):
+            result = bench_plan(foods, args.days, minimize_cost, args.repeat)
+            results.append(result)
+            verdict = "" if result["p50_ms"] < TARGET_SECONDS * 1e3 else f"  OLTRE l'obiettivo di {TARGET_SECONDS:.0f} s"
+            print(f"{result['name']:<28} {result['p50_ms']:9.1f} ms  entro le tolleranze: "
+                  f"{result['within_tolerance']}{verdict}")
+    config = {key: value for key, value in vars(args).items() if key not in ("json", "compare")}
+    finish("meal_plan", config, results, args.json, args.compare)
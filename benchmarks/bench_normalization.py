@@ -0,0 +1,82 @@
+# benchmarks/bench_normalization.py
+#
+# Micro-benchmark del codice di normalizzazione sulle risposte registrate di OpenFoodFacts:
+# decodifica JSON (riferimento), normalizzazione della ricerca e del prodotto, dei record locali
+# e chiave canonica del profilo usata dalla cache dei consigli.
+#
+# Uso: python benchmarks/bench_normalization.py [--number 2000] [--json risultati.json] [--compare prima.json]
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from benchmarks.fakes import load_recordings
+from benchmarks.harness import finish
+from src.integrations.advice_cache import canonical_profile_key
+from src.integrations.local_data import product_from_record
+from src.integrations.openfoodfacts_client import _product_from_payload, _products_from_search_payload
+
+PROFILE = {"age": "46", "weight": "70,4", "height": "170", "gender": "Male", "activity_level": "light",
+           "objectives": "Perdere peso gradualmente!", "profession": "Impiegato", "body_fat": "22.5"}
+
+
+def cases(recordings: dict) -> dict:
+    """Nome -> (funzione senza argomenti, elementi elaborati per chiamata)."""
+    search_payloads = list(recordings["search"].items())
+    product_payloads = list(recordings["product"].items())
+    search_bytes = [json.dumps(payload).encode("utf-8") for _, payload in search_payloads]
+    records = [payload["product"] for _, payload in product_payloads]
+    search_items = sum(len(payload.get("products", [])) for _, payload in search_payloads)
+
+    def decode_search():
+        for body in search_bytes:
+            json.loads(body)
+
+    def normalize_search():
+        for query, payload in search_payloads:
+            _products_from_search_payload(query, payload)
+
+    def normalize_product():
+        for barcode, payload in product_payloads:
+            _product_from_payload(barcode, payload)
+
+    def normalize_record():
+        for record in records:
+            product_from_record(record)
+
+    return {
+        "json_decode_search": (decode_search, search_items),
+        "normalize_search": (normalize_search, search_items),
+        "normalize_product": (normalize_product, len(product_payloads)),
+        "product_from_record": (normalize_record, len(records)),
+        "canonical_profile_key": (lambda: canonical_profile_key(PROFILE), 1),
+    }
+
+
+def run(number: int, repeat: int, recordings: dict | None = None) -> list[dict]:
+    results = []
+    for name, (function, items) in cases(recordings or load_recordings()).items():
+        best = min(timeit.repeat(function, number=number, repeat=repeat)) / number
+        results.append({"name": name, "items_per_call": items, "us_per_op": round(best / items * 1e6, 3),
+                        "ops_per_s": round(items / best)})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmark della normalizzazione dei prodotti.")
+    parser.add_argument("--number", type=int, default=2000, help="chiamate per misura")
+    parser.add_argument("--repeat", type=int, default=5, help="misure (si tiene la migliore)")
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    parser.add_argument("--compare", help="risultati precedenti con cui confrontare")
+    args = parser.parse_args()
+
+    results = run(args.number, args.repeat)
+    for result in results:
+        print(f"{result['name']:<24} {result['us_per_op']:8.2f} µs/elemento  ({result['ops_per_s']:>10,} elementi/s)")
+    finish("normalization", {"number": args.number, "repeat": args.repeat}, results, args.json, args.compare)
@@ -0,0 +1,128 @@
+# benchmarks/bench_nutrition_db.py
+#
+# Tabella nutrizionale sintetica: tempo di caricamento e memoria del processo (RSS) del loader JSON
+# contro il formato binario mappato in memoria, più la latenza delle ricerche per barcode.
+# Ogni caricamento gira in un processo nuovo, così il picco di RSS misura solo quel loader.
+#
+# Uso: python benchmarks/bench_nutrition_db.py [--products 500000] [--lookups 100000] [--json risultati.json]
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from src.integrations.nutrition_db import convert_to_binary
+
+NAMES = ["Pasta di semola", "Riso Carnaroli", "Yogurt greco 0%", "Passata di pomodoro", "Tonno al naturale",
+         "Latte parzialmente scremato", "Biscotti integrali", "Olio extravergine", "Caffè macinato"]
+BRANDS = ["Barilla", "Scotti", "Fage", "Mutti", "Rio Mare", "Granarolo", "Mulino Bianco", "Monini", "Lavazza"]
+
+# Eseguito in un processo nuovo: carica la tabella, legge un prodotto per barcode e riporta tempi e RSS
+LOAD_SCRIPT = """
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+
+
+def peak_rss_kb():
+    # VmHWM è del processo corrente; ru_maxrss su Linux eredita il picco del processo padre
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+from src.integrations.nutrition_db import JsonNutritionDB, NutritionDB
+imported = peak_rss_kb()
+loader = NutritionDB if sys.argv[2].endswith(".nfdb") else JsonNutritionDB
+started = time.perf_counter()
+db = loader(sys.argv[2])
+loaded = time.perf_counter() - started
+product = db.get_by_barcode(sys.argv[3])
+first_lookup = time.perf_counter() - started
+rss = peak_rss_kb()
+print(json.dumps({"rows": len(db), "load_ms": loaded * 1e3, "first_lookup_ms": first_lookup * 1e3,
+                  "found": product is not None, "rss_mb": rss / 1024, "loader_rss_mb": (rss - imported) / 1024}))
+"""
+
+
+def barcode(i: int) -> str:
+    return f"80{i:011d}"
+
+
+def write_products(path: str, count: int) -> None:
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"products": [')
+        for i in range(count):
+            product = {
+                "code": barcode(i), "product_name": f"{rng.choice(NAMES)} {i}", "brands": rng.choice(BRANDS),
+                "image_url": f"https://images.openfoodfacts.org/images/products/{barcode(i)}/front.jpg",
+                "nutriments": {"energy-kcal_100g": round(rng.uniform(20, 900), 1),
+                               "proteins_100g": round(rng.uniform(0, 30), 1),
+                               "carbohydrates_100g": round(rng.uniform(0, 80), 1),
+                               "fat_100g": round(rng.uniform(0, 60), 1)},
+            }
+            f.write(("," if i else "") + json.dumps(product, ensure_ascii=False))
+        f.write("]}")
+
+
+def measure_load(path: str, probe: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", LOAD_SCRIPT, PROJECT_ROOT_DIR, path, probe],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_lookups(path: str, count: int, products: int) -> dict:
+    from src.integrations.nutrition_db import load_nutrition_db
+
+    db = load_nutrition_db(path)
+    rng = random.Random(1)
+    probes = [barcode(rng.randrange(products)) for _ in range(count)]
+    started = time.perf_counter()
+    for probe in probes:
+        db.get_by_barcode(probe)
+    elapsed = time.perf_counter() - started
+    return {"lookups": count, "us_per_lookup": round(elapsed / count * 1e6, 2)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark del formato binario della tabella nutrizionale.")
+    parser.add_argument("--products", type=int, default=500_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "nutritional_database.json")
+        write_products(source, args.products)
+        started = time.perf_counter()
+        summary = convert_to_binary(source)
+        convert_seconds = time.perf_counter() - started
+        binary = summary["out_path"]
+        print(f"Tabella sintetica: {args.products} prodotti, JSON {summary['source_bytes'] / 1e6:.1f} MB, "
+              f"binario {summary['binary_bytes'] / 1e6:.1f} MB (conversione {convert_seconds:.1f}s)")
+
+        probe = barcode(args.products // 2)
+        results = {"products": args.products, "convert_seconds": round(convert_seconds, 2),
+                   "json_bytes": summary["source_bytes"], "binary_bytes": summary["binary_bytes"]}
+        for label, path in (("json", source), ("binary", binary)):
+            load = measure_load(path, probe)
+            lookups = measure_lookups(path, args.lookups, args.products)
+            results[label] = {**{key: round(value, 2) if isinstance(value, float) else value
+                                 for key, value in load.items()}, **lookups}
+            print(f"{label:>6}: caricamento {load['load_ms']:.1f} ms, primo prodotto {load['first_lookup_ms']:.1f} ms, "
+                  f"RSS {load['rss_mb']:.0f} MB (loader {load['loader_rss_mb']:.0f} MB), "
+                  f"{lookups['us_per_lookup']:.1f} µs per ricerca")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
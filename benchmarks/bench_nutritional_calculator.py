@@ -0,0 +1,56 @@
+# benchmarks/bench_nutritional_calculator.py
+#
+# Throughput del calcolo del fabbisogno: singolo profilo (percorso di /api/calculate_needs)
+# e API vettoriale su lotti di profili.
+#
+# Uso: python benchmarks/bench_nutritional_calculator.py [--sizes 1000 10000 100000]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from src.core import nutritional_calculator as calc
+
+
+def bench_single(repeat: int) -> float:
+    user_data = {"age": "46", "weight": "70", "height": "170", "gender": "male",
+                 "activity_level": "light", "objectives": "perdere peso gradualmente"}
+    calc.calculate_needs(user_data)  # riscaldamento
+    started = time.perf_counter()
+    for _ in range(repeat):
+        calc.calculate_needs(user_data)
+    return (time.perf_counter() - started) / repeat
+
+
+def bench_batch(size: int, repeat: int) -> float:
+    rng = np.random.default_rng(0)
+    args = (
+        rng.integers(18, 80, size), rng.uniform(45, 120, size), rng.uniform(150, 200, size),
+        rng.random(size) < 0.5, rng.choice(list(calc.ACTIVITY_MULTIPLIERS.values()), size),
+        rng.integers(0, len(calc.GOALS), size),
+    )
+    calc.calculate_needs_batch(*args)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        calc.calculate_needs_batch(*args)
+    return (time.perf_counter() - started) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark del calcolo del fabbisogno.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    single = bench_single(args.repeat * 100)
+    print(f"calculate_needs (singolo profilo): {single * 1e6:.1f} µs/richiesta")
+    for size in args.sizes:
+        elapsed = bench_batch(size, args.repeat)
+        print(f"calculate_needs_batch n={size:>9}: {elapsed * 1e3:8.2f} ms  ->  {size / elapsed:,.0f} profili/s")
@@ -0,0 +1,93 @@
+# benchmarks/bench_price_ingestion.py
+#
+# Ingestione di un volantino sintetico molto grande nella tabella dei prezzi: righe al secondo,
+# picco di memoria del processo (RSS) e costo della reingestione dopo aver cambiato una piccola
+# parte delle voci (solo quelle vengono riscritte).
+#
+# Uso: python benchmarks/bench_price_ingestion.py [--lines 2000000] [--changed 0.01] [--json risultati.json]
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from src.integrations.data_scraper import PriceStore
+
+PRODUCTS = ["Pasta di semola", "Riso Carnaroli", "Yogurt greco 0%", "Passata di pomodoro", "Tonno al naturale",
+            "Latte parzialmente scremato", "Biscotti integrali", "Olio extravergine", "Caffè macinato",
+            "Mozzarella di bufala", "Prosciutto crudo", "Farina 00", "Fette biscottate", "Ceci lessati"]
+BRANDS = ["Barilla", "Scotti", "Fage", "Mutti", "Rio Mare", "Granarolo", "Mulino Bianco", "Monini", "Lavazza", "Conad"]
+FORMATS = ["125 g", "250 g", "500 g", "1 kg", "3 x 80 g", "1 l", "750 ml"]
+
+
+def flyer_line(i: int, rng: random.Random, price_shift: float = 0.0) -> str:
+    price = round(rng.uniform(0.5, 15) + price_shift, 2)
+    line = f"{rng.choice(PRODUCTS)} {rng.choice(BRANDS)} linea {i} {rng.choice(FORMATS)} € {price:.2f}".replace(".", ",")
+    if rng.random() < 0.3:
+        line += f" invece di € {price * 1.3:.2f}".replace(".", ",")
+    return line + "\n"
+
+
+def write_flyer(path: str, lines: int, changed: float = 0.0) -> None:
+    rng, change_rng = random.Random(0), random.Random(1)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Valido dal 04/01 al 17/01/2024\n")
+        for i in range(lines):
+            f.write(flyer_line(i, rng, 0.1 if change_rng.random() < changed else 0.0))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss è in KB su Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark dell'ingestione dei volantini.")
+    parser.add_argument("--lines", type=int, default=2_000_000)
+    parser.add_argument("--changed", type=float, default=0.01, help="quota delle voci cambiate alla reingestione")
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "volantino_2024.txt")
+        write_flyer(path, args.lines)
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"Volantino sintetico: {args.lines} righe, {size_mb:.0f} MB")
+        store = PriceStore(db_path=os.path.join(directory, "prezzi.sqlite3"), data_dir=directory)
+
+        rss_before = peak_rss_mb()
+        started = time.perf_counter()
+        first = store.ingest_file(path, matcher=None)
+        first_seconds = time.perf_counter() - started
+        print(f"Prima ingestione: {first_seconds:.1f}s ({args.lines / first_seconds:.0f} righe/s), {first}")
+
+        started = time.perf_counter()
+        store.ingest_file(path, matcher=None)
+        same_seconds = time.perf_counter() - started
+
+        write_flyer(path, args.lines, changed=args.changed)
+        started = time.perf_counter()
+        second = store.ingest_file(path, matcher=None)
+        second_seconds = time.perf_counter() - started
+        print(f"Reingestione con il {args.changed:.0%} di voci cambiate: {second_seconds:.1f}s, {second}")
+        rss_after = peak_rss_mb()
+
+    summary = {
+        "lines": args.lines, "file_mb": round(size_mb, 1),
+        "first_seconds": round(first_seconds, 2), "lines_per_second": round(args.lines / first_seconds),
+        "unchanged_file_seconds": round(same_seconds, 3),
+        "changed_ratio": args.changed, "reingest_seconds": round(second_seconds, 2), "updated": second["updated"],
+        "peak_rss_mb_before": round(rss_before, 1), "peak_rss_mb_after": round(rss_after, 1),
+    }
+    print(f"File identico: {same_seconds * 1e3:.1f} ms; picco RSS: {rss_before:.0f} MB prima, {rss_after:.0f} MB dopo")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
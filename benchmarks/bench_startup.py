@@ -0,0 +1,90 @@
+# benchmarks/bench_startup.py
+#
+# Avvio a freddo del server: tempo di import di src.api_server e latenza della prima richiesta
+# sulle route principali, misurati ogni volta in un interprete nuovo (come un'istanza serverless).
+# Registra anche se durante l'avvio o le route senza IA si è tentato di importare l'SDK Google.
+#
+# Uso: python benchmarks/bench_startup.py [--runs 5]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULT_MARKER = "STARTUP_RESULT "
+
+# Eseguito nel processo figlio. Il finder registra ogni tentativo di import di "google.*"
+# (anche se il pacchetto non è installato) senza interferire con l'import vero e proprio.
+_CHILD_SCRIPT = r'''
+import json, sys, time
+
+class GoogleImportRecorder:
+    attempts = []
+    def find_spec(self, name, path=None, target=None):
+        if name == "google" or name.startswith("google."):
+            self.attempts.append(name)
+        return None
+
+recorder = GoogleImportRecorder()
+sys.meta_path.insert(0, recorder)
+sys.path.insert(0, PROJECT_ROOT_DIR)
+
+started = time.perf_counter()
+import src.api_server as api_server
+import_s = time.perf_counter() - started
+
+from src.integrations import openfoodfacts_client
+openfoodfacts_client._fetch_search_results = lambda query, page_size, lang: (None, [])  # niente rete
+
+client = api_server.app.test_client()
+timings = {}
+for label, call in (
+    ("index", lambda: client.get("/")),
+    ("search_food", lambda: client.get("/api/search_food?query=pasta")),
+    ("calculate_needs", lambda: client.post("/api/calculate_needs", json={
+        "age": "46", "weight": "70", "height": "170", "gender": "male",
+        "activity_level": "light", "objectives": "perdere peso"})),
+):
+    started = time.perf_counter()
+    response = call()
+    timings[label] = time.perf_counter() - started
+    assert response.status_code == 200, (label, response.status_code)
+
+print(RESULT_MARKER + json.dumps({
+    "import_s": import_s,
+    "first_request_s": timings,
+    "google_import_attempts": sorted(set(recorder.attempts)),
+}))
+'''
+
+
+def measure_startup(python: str = sys.executable) -> dict:
+    """Avvia un interprete nuovo e restituisce i tempi di import e della prima richiesta per route."""
+    script = f"PROJECT_ROOT_DIR = {PROJECT_ROOT_DIR!r}\nRESULT_MARKER = {RESULT_MARKER!r}\n{_CHILD_SCRIPT}"
+    env = dict(os.environ, OFF_CACHE_PATH="", OFF_OFFLINE_INDEX_DIR="", GEMINI_API_KEY="")
+    completed = subprocess.run([python, "-c", script], capture_output=True, text=True, env=env,
+                               cwd=PROJECT_ROOT_DIR, timeout=120)
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"Misura dell'avvio fallita:\n{completed.stdout}\n{completed.stderr}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark dell'avvio a freddo del server.")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [measure_startup() for _ in range(args.runs)]
+    import_times = [run["import_s"] for run in runs]
+    print(f"import src.api_server: mediana {statistics.median(import_times) * 1e3:.1f} ms "
+          f"(min {min(import_times) * 1e3:.1f}, max {max(import_times) * 1e3:.1f})")
+    for route in runs[0]["first_request_s"]:
+        values = [run["first_request_s"][route] for run in runs]
+        print(f"prima richiesta {route:<16}: mediana {statistics.median(values) * 1e3:.1f} ms")
+    attempts = sorted({name for run in runs for name in run["google_import_attempts"]})
+    print(f"import google.* tentati: {attempts or 'nessuno'}")
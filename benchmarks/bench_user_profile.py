@@ -0,0 +1,167 @@
+# benchmarks/bench_user_profile.py
+#
+# Diario alimentare sintetico di un anno per più utenti: costo di scrittura di una voce (con
+# l'aggiornamento dei totali) e latenza di "quanto resta per oggi" e dell'andamento settimanale
+# letti dai totali incrementali, confrontati con la stessa risposta ricalcolata sommando il diario.
+# Le letture sono misurate dopo una settimana, tre mesi e un anno di storico: i totali incrementali
+# restano costanti, la somma dello storico cresce con lui.
+# Alla fine più processi scrivono sullo stesso file e si verifica che nessun incremento vada perso.
+#
+# Uso: python benchmarks/bench_user_profile.py [--users 20] [--days 365] [--items-per-day 5] [--queries 500]
+#                                              [--writers 4] [--json risultati.json] [--compare prima.json]
+
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from benchmarks.harness import finish, percentiles
+from src.core.user_profile import DEFAULT_TREND_WEEKS, ProfileStore, week_start
+
+FOODS = [("Pasta di semola", 350, 12, 70, 1.5), ("Yogurt greco 0%", 57, 10, 4, 0.2), ("Mela", 52, 0.3, 14, 0.2),
+         ("Petto di pollo", 110, 23, 0, 1.5), ("Olio extravergine", 884, 0, 0, 100), ("Pane integrale", 247, 13, 41, 3.4),
+         ("Tonno al naturale", 103, 24, 0, 0.8), ("Riso Carnaroli", 355, 7, 79, 0.6), ("Latte parzialmente scremato", 46,
+                                                                                      3.4, 5, 1.6)]
+PROFILE = {"age": "35", "weight": "72", "height": "174", "gender": "female", "activity_level": "light",
+           "objectives": "perdere peso"}
+CHECKPOINTS = (7, 90, 365)
+START_DAY = datetime.date(2023, 1, 2)
+
+
+def food_item(rng: random.Random) -> dict:
+    name, calories, protein, carbs, fat = rng.choice(FOODS)
+    return {"name": name, "calories_100g": calories, "protein_100g": protein, "carbs_100g": carbs, "fat_100g": fat,
+            "grams": rng.randint(10, 250)}
+
+
+def resum_today(store: ProfileStore, user_id: str, day: str) -> tuple:
+    """Consumato del giorno sommando le voci del diario (senza totali giornalieri)."""
+    with store._lock:
+        return store._conn.execute("SELECT SUM(calories), SUM(protein), SUM(carbs), SUM(fat), COUNT(*) FROM food_log"
+                                   " WHERE user_id = ? AND day = ?", (user_id, day)).fetchone()
+
+
+def resum_trend(store: ProfileStore, user_id: str, weeks: int) -> list:
+    """Andamento settimanale raggruppando tutto lo storico dell'utente (senza totali settimanali)."""
+    with store._lock:
+        rows = store._conn.execute(
+            "SELECT date(day, '-' || ((CAST(strftime('%w', day) AS INTEGER) + 6) % 7) || ' days') AS week,"
+            " SUM(calories), SUM(protein), SUM(carbs), SUM(fat), COUNT(*), COUNT(DISTINCT day)"
+            " FROM food_log WHERE user_id = ? GROUP BY week ORDER BY week", (user_id,)).fetchall()
+    return rows[-weeks:]
+
+
+def time_queries(name: str, fn, users: list[str], queries: int, rng: random.Random) -> dict:
+    latencies = []
+    for _ in range(queries):
+        user_id = rng.choice(users)
+        started = time.perf_counter()
+        fn(user_id)
+        latencies.append(time.perf_counter() - started)
+    return {"name": name, "queries": queries, **percentiles(latencies),
+            "mean_us": round(sum(latencies) / len(latencies) * 1e6, 1)}
+
+
+def fill_and_measure(store: ProfileStore, users: list[str], days: int, items_per_day: int, queries: int,
+                     seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    for user_id in users:
+        store.save_profile(user_id, PROFILE)
+    store.flush()
+
+    results, write_latencies = [], []
+    checkpoints = sorted({checkpoint for checkpoint in CHECKPOINTS if checkpoint < days} | {days})
+    for offset in range(days):
+        day = (START_DAY + datetime.timedelta(days=offset)).isoformat()
+        for user_id in users:
+            for _ in range(items_per_day):
+                started = time.perf_counter()
+                store.log_food(user_id, food_item(rng), day=day, logged_at=0.0)
+                write_latencies.append(time.perf_counter() - started)
+        if offset + 1 not in checkpoints:
+            continue
+        history = f"{offset + 1}d"
+        print(f"Storico di {offset + 1} giorni ({len(write_latencies)} voci):")
+        for result in (
+                time_queries(f"remaining_today/{history}", lambda user_id: store.remaining_today(user_id, day),
+                             users, queries, rng),
+                time_queries(f"resum_today/{history}", lambda user_id: resum_today(store, user_id, day),
+                             users, queries, rng),
+                time_queries(f"weekly_trend/{history}",
+                             lambda user_id: store.weekly_trend(user_id, DEFAULT_TREND_WEEKS, day), users, queries, rng),
+                time_queries(f"resum_trend/{history}",
+                             lambda user_id: resum_trend(store, user_id, DEFAULT_TREND_WEEKS), users, queries, rng)):
+            results.append(result)
+            print(f"  {result['name']:<24} media {result['mean_us']:9.1f} µs   p50 {result['p50_ms']:7.3f} ms   "
+                  f"p99 {result['p99_ms']:7.3f} ms")
+
+    write = {"name": "log_food", "writes": len(write_latencies), **percentiles(write_latencies),
+             "writes_per_s": round(len(write_latencies) / sum(write_latencies))}
+    print(f"Scrittura di una voce: {write['writes_per_s']} voci/s, p50 {write['p50_ms']:.3f} ms, "
+          f"p99 {write['p99_ms']:.3f} ms")
+    return [write] + results
+
+
+def _writer_process(db_path: str, writes: int, seed: int) -> None:
+    store = ProfileStore(db_path)
+    rng = random.Random(seed)
+    for _ in range(writes):
+        store.log_food("condiviso", food_item(rng), day=START_DAY.isoformat())
+    store.close()
+
+
+def concurrent_writers(db_path: str, writers: int, writes: int) -> dict:
+    """Più processi scrivono per lo stesso utente e lo stesso giorno: i totali devono contare ogni voce."""
+    ProfileStore(db_path).close()           # schema creato prima di avviare i processi
+    processes = [multiprocessing.Process(target=_writer_process, args=(db_path, writes, seed))
+                 for seed in range(writers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    store = ProfileStore(db_path)
+    today = store.remaining_today("condiviso", START_DAY.isoformat())
+    expected = resum_today(store, "condiviso", START_DAY.isoformat())
+    week = store.weekly_trend("condiviso", 1, START_DAY.isoformat())[0]
+    store.close()
+    consistent = (today["items"] == expected[4] == writers * writes and week["items"] == expected[4]
+                  and abs(today["consumed"]["calories"] - expected[0]) < 1 and week["week"] == week_start(START_DAY.isoformat()))
+    result = {"name": "concurrent_writers", "writers": writers, "writes": writers * writes, "seconds": round(elapsed, 2),
+              "writes_per_s": round(writers * writes / elapsed), "consistent": consistent}
+    print(f"{writers} processi, {writers * writes} voci: {result['writes_per_s']} voci/s, "
+          f"totali {'coerenti' if consistent else 'NON coerenti'} con il diario")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark del diario alimentare con totali incrementali.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--items-per-day", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500, help="letture per misura")
+    parser.add_argument("--writers", type=int, default=4, help="processi per la prova di scrittura concorrente")
+    parser.add_argument("--writes", type=int, default=500, help="voci per processo")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    parser.add_argument("--compare", help="risultati precedenti con cui confrontare")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ProfileStore(os.path.join(directory, "utenti.sqlite3"))
+        users = [f"utente{index}" for index in range(args.users)]
+        results = fill_and_measure(store, users, args.days, args.items_per_day, args.queries, args.seed)
+        store.close()
+        results.append(concurrent_writers(os.path.join(directory, "concorrente.sqlite3"), args.writers, args.writes))
+    config = {key: value for key, value in vars(args).items() if key not in ("json", "compare")}
+    finish("user_profile", config, results, args.json, args.compare)
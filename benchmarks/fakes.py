@@ -0,0 +1,317 @@
+# benchmarks/fakes.py
+#
+# Sostituti locali dei servizi esterni per benchmark e prove di carico:
+#   - un finto OpenFoodFacts HTTP che riproduce le risposte registrate in recordings/openfoodfacts.json
+#     (ricerca search.pl e prodotto v2), con latenza, jitter, risposte lente ed errori iniettabili;
+#   - un finto modello Gemini (stessa interfaccia di GenerativeModel.generate_content, anche in streaming)
+#     con latenza ed errori iniettabili, da installare con gemini_service.set_model().
+#
+# Uso: python benchmarks/fakes.py serve [--port 8765] [--latency 0.05] [--error-rate 0.01]
+#      python benchmarks/fakes.py record --query pasta --query tonno --barcode 8076809513753
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+RECORDINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings", "openfoodfacts.json")
+NOT_FOUND = {"status": 0, "status_verbose": "product not found"}
+FAULT_FIELDS = ("latency", "jitter", "slow_ratio", "slow_factor", "error_rate", "malformed_rate")
+
+
+def load_recordings(path: str = RECORDINGS_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FaultInjection:
+    """
+    Comportamento di un servizio finto: latenza base più jitter uniforme, una quota di risposte
+    `slow_factor` volte più lente, una quota di errori (HTTP 503 o eccezione) e di risposte malformate.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, slow_ratio: float = 0.0, slow_factor: float = 10.0,
+                 error_rate: float = 0.0, malformed_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_ratio = slow_ratio
+        self.slow_factor = slow_factor
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> tuple[float, str | None]:
+        """Ritardo da applicare e difetto da iniettare (None, "error" o "malformed") per la prossima risposta."""
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            if self._rng.random() < self.slow_ratio:
+                delay *= self.slow_factor
+            roll = self._rng.random()
+        if roll < self.error_rate:
+            return delay, "error"
+        if roll < self.error_rate + self.malformed_rate:
+            return delay, "malformed"
+        return delay, None
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in FAULT_FIELDS}
+
+
+# --- FINTO OPENFOODFACTS ---
+
+class FakeOpenFoodFactsHandler(BaseHTTPRequestHandler):
+    """Risponde su /cgi/search.pl e /api/v2/product/<barcode> con le risposte registrate."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    recordings = {"search": {}, "product": {}}
+    encoded = {}
+    faults = FaultInjection()
+    requests_served = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.requests_served += 1
+        delay, fault = cls.faults.draw()
+        if delay:
+            time.sleep(delay)
+        url = urlsplit(self.path)
+        if fault == "error":
+            self._send(503, b'{"error": "service unavailable"}')
+        elif fault == "malformed":
+            self._send(200, b'{"products": [{"code": "80')      # JSON troncato
+        elif url.path.endswith("/search.pl"):
+            query = parse_qs(url.query).get("search_terms", [""])[0]
+            self._send(200, self._encoded("search", self._search_key(query)))
+        elif "/api/v2/product/" in url.path:
+            barcode = url.path.rsplit("/", 1)[-1]
+            payload = self._encoded("product", barcode)
+            self._send(200 if payload is not None else 404, payload or json.dumps(NOT_FOUND).encode())
+        else:
+            self._send(404, b'{"error": "not found"}')
+
+    @classmethod
+    def _search_key(cls, query: str) -> str | None:
+        # una query registrata risponde con la sua registrazione; le altre con una registrazione
+        # scelta in modo deterministico dalle parole della query (le risposte variano come dal vivo)
+        searches = cls.recordings["search"]
+        normalized = " ".join(query.lower().split())
+        if normalized in searches:
+            return normalized
+        for key in searches:
+            if key in normalized:
+                return key
+        keys = sorted(searches)
+        return keys[sum(map(ord, normalized)) % len(keys)] if keys else None
+
+    @classmethod
+    def _encoded(cls, kind: str, key: str | None) -> bytes | None:
+        if (kind, key) not in cls.encoded:
+            payload = cls.recordings[kind].get(key) if key is not None else None
+            if payload is None and kind == "search":
+                payload = {"count": 0, "page": 1, "page_size": 24, "products": [], "skip": 0}
+            cls.encoded[kind, key] = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        return cls.encoded[kind, key]
+
+    def _send(self, status: int, body: bytes) -> None:
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # richiesta annullata dal client (scadenza o hedging)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # il default (5) fa scartare le connessioni quando arrivano centinaia di client insieme
+
+
+def _configure_handler(faults: FaultInjection, recordings: dict | None) -> None:
+    FakeOpenFoodFactsHandler.recordings = recordings if recordings is not None else load_recordings()
+    FakeOpenFoodFactsHandler.encoded = {}
+    FakeOpenFoodFactsHandler.faults = faults
+    FakeOpenFoodFactsHandler.requests_served = 0
+
+
+def serve_fake_off_in_thread(faults: FaultInjection | None = None, recordings: dict | None = None):
+    """
+    Avvia il finto OpenFoodFacts in un thread di questo processo (per i test).
+
+    Returns:
+        tuple: (server, base_url); chiudere con server.shutdown() e server.server_close().
+    """
+    _configure_handler(faults or FaultInjection(), recordings)
+    server = FakeServer(("127.0.0.1", 0), FakeOpenFoodFactsHandler)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _serve_process(port_queue, faults: dict, port: int) -> None:
+    _configure_handler(FaultInjection(**faults), None)
+    server = FakeServer(("127.0.0.1", port), FakeOpenFoodFactsHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_fake_off(faults: FaultInjection | None = None, port: int = 0):
+    """
+    Avvia il finto OpenFoodFacts in un processo separato, così non compete per il GIL con il server misurato.
+
+    Returns:
+        tuple: (processo, base_url); fermare con processo.terminate().
+    """
+    port_queue = multiprocessing.Queue()
+    # la configurazione passa come dict: il lock di FaultInjection non si trasferisce tra processi
+    process = multiprocessing.Process(target=_serve_process, args=(port_queue, (faults or FaultInjection()).to_dict(), port),
+                                      daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port_queue.get(timeout=10)}"
+
+
+def use_fake_off(base_url: str, rate_limits: bool = False) -> None:
+    """
+    Punta il client OpenFoodFacts al servizio finto, con una cache solo in memoria e senza indice offline.
+    Senza `rate_limits` i pianificatori di OFF non limitano le richieste (si misura il server, non il limite).
+    """
+    from src.integrations import openfoodfacts_client
+    from src.integrations.local_cache import LocalCache
+    from src.integrations.upstream_scheduler import UpstreamScheduler, set_scheduler
+
+    openfoodfacts_client.BASE_URL_SEARCH_CGI = f"{base_url}/cgi/search.pl"
+    openfoodfacts_client.BASE_URL_PRODUCT_V2 = f"{base_url}/api/v2/product/"
+    openfoodfacts_client.set_product_cache(LocalCache())
+    openfoodfacts_client.set_offline_index(None)
+    for upstream in ("off_barcode", "off_search"):
+        set_scheduler(upstream, None if rate_limits else UpstreamScheduler(upstream, rate_per_minute=0))
+
+
+# --- FINTO GEMINI ---
+
+class FakeGeminiError(RuntimeError):
+    pass
+
+
+class FakeGeminiResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """
+    Sostituto di GenerativeModel: risponde dopo la latenza configurata con una nota (o, se è richiesto
+    JSON, con un consiglio completo). Gli errori iniettati imitano un DEADLINE_EXCEEDED di gRPC.
+    """
+
+    NOTES = ("Con questo apporto puoi raggiungere il tuo obiettivo in modo graduale. "
+             "Distribuisci le proteine sui pasti principali e monitora il peso ogni settimana.")
+    ADVICE = {"calories": 2200, "protein": 110, "carbs": 275, "fat": 73, "notes": NOTES}
+
+    def __init__(self, faults: FaultInjection | None = None, chunk_words: int = 4):
+        self.faults = faults or FaultInjection()
+        self.chunk_words = chunk_words
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        delay, fault = self.faults.draw()
+        wants_json = (generation_config or {}).get("response_mime_type") == "application/json"
+        text = json.dumps(self.ADVICE, ensure_ascii=False) if wants_json else self.NOTES
+        if fault == "malformed":
+            text = text[:len(text) // 2]
+        if stream:
+            return self._stream(text, delay, fault)
+        time.sleep(delay)
+        if fault == "error":
+            raise FakeGeminiError("504 DEADLINE_EXCEEDED (errore iniettato)")
+        return FakeGeminiResponse(text)
+
+    def _stream(self, text: str, delay: float, fault: str | None):
+        words = text.split(" ")
+        chunks = [" ".join(words[i:i + self.chunk_words]) + " " for i in range(0, len(words), self.chunk_words)]
+        for index, chunk in enumerate(chunks):
+            time.sleep(delay / len(chunks))
+            if fault == "error" and index == len(chunks) // 2:
+                raise FakeGeminiError("504 DEADLINE_EXCEEDED (errore iniettato)")
+            yield FakeGeminiResponse(chunk)
+
+
+# --- REGISTRAZIONE DELLE RISPOSTE REALI ---
+
+def record_responses(queries: list[str], barcodes: list[str], path: str = RECORDINGS_PATH) -> dict:
+    """Interroga OpenFoodFacts dal vivo con gli stessi parametri del client e aggiunge le risposte alla registrazione."""
+    from src.integrations import openfoodfacts_client
+    from src.integrations.http_client import get_session
+
+    recordings = load_recordings(path) if os.path.exists(path) else {"search": {}, "product": {}}
+    headers = {"User-Agent": openfoodfacts_client.USER_AGENT}
+    for query in queries:
+        response = get_session().get(openfoodfacts_client.BASE_URL_SEARCH_CGI, headers=headers, timeout=30,
+                                     params=openfoodfacts_client._search_params(query, 24, "it"))
+        response.raise_for_status()
+        recordings["search"][" ".join(query.lower().split())] = response.json()
+    for barcode in barcodes:
+        fields = "product_name_it,product_name,nutriments,brands,code,image_url,status,status_verbose"
+        response = get_session().get(f"{openfoodfacts_client.BASE_URL_PRODUCT_V2}{barcode}", headers=headers,
+                                     params={"fields": fields}, timeout=30)
+        if response.status_code != 404:
+            response.raise_for_status()
+            recordings["product"][barcode] = response.json()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(recordings, f, ensure_ascii=False, indent=1)
+    return {"search": len(recordings["search"]), "product": len(recordings["product"])}
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser, prefix: str, service: str) -> None:
+    """Opzioni da riga di comando per configurare un FaultInjection (es. --off-latency, --gemini-error-rate)."""
+    parser.add_argument(f"--{prefix}latency", type=float, default=0.05, help=f"latenza base di {service} (s)")
+    parser.add_argument(f"--{prefix}jitter", type=float, default=0.02, help="jitter uniforme aggiunto (s)")
+    parser.add_argument(f"--{prefix}slow-ratio", type=float, default=0.0, help="quota di risposte lente")
+    parser.add_argument(f"--{prefix}slow-factor", type=float, default=10.0, help="quanto sono più lente")
+    parser.add_argument(f"--{prefix}error-rate", type=float, default=0.0, help="quota di errori iniettati")
+    parser.add_argument(f"--{prefix}malformed-rate", type=float, default=0.0, help="quota di risposte malformate")
+
+
+def faults_from_args(args: argparse.Namespace, prefix: str, seed: int = 0) -> FaultInjection:
+    prefix = prefix.replace("-", "_")
+    return FaultInjection(**{key: getattr(args, prefix + key) for key in FAULT_FIELDS}, seed=seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servizi esterni finti per benchmark e prove di carico.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="avvia il finto OpenFoodFacts")
+    serve.add_argument("--port", type=int, default=8765)
+    add_fault_arguments(serve, "", "OpenFoodFacts")
+    record = commands.add_parser("record", help="registra risposte reali di OpenFoodFacts")
+    record.add_argument("--query", action="append", default=[])
+    record.add_argument("--barcode", action="append", default=[])
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        _configure_handler(faults_from_args(args, ""), None)
+        server = FakeServer(("127.0.0.1", args.port), FakeOpenFoodFactsHandler)
+        print(f"Finto OpenFoodFacts in ascolto su http://127.0.0.1:{server.server_address[1]}")
+        server.serve_forever()
+    else:
+        print(json.dumps(record_responses(args.query, args.barcode)))
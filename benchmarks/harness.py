@@ -0,0 +1,117 @@
+# benchmarks/harness.py
+#
+# Funzioni comuni ai benchmark: percentili delle latenze e salvataggio dei risultati in JSON con i
+# dati dell'esecuzione (data, commit, interprete, macchina), così esecuzioni diverse si confrontano:
+#
+#     python benchmarks/bench_load.py --json dopo.json --compare prima.json
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# metrica -> True se un valore più alto è meglio
+COMPARED_METRICS = {"throughput_rps": True, "ops_per_s": True, "p50_ms": False, "p95_ms": False, "p99_ms": False,
+                    "us_per_op": False, "error_rate": False}
+
+
+def percentiles(latencies: list[float]) -> dict:
+    """p50/p95/p99 in millisecondi di una lista di latenze in secondi (zeri se la lista è vuota)."""
+    if not latencies:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    ordered = sorted(latencies)
+
+    def pick(percent):
+        return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))] * 1e3
+
+    return {"p50_ms": round(pick(50), 3), "p95_ms": round(pick(95), 3), "p99_ms": round(pick(99), 3)}
+
+
+def _git(*args: str) -> str | None:
+    try:
+        return subprocess.run(["git", *args], cwd=PROJECT_ROOT_DIR, capture_output=True, text=True,
+                              timeout=10, check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_metadata() -> dict:
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git("rev-parse", "--short", "HEAD"),
+        "git_dirty": None if status is None else bool(status),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def build_report(benchmark: str, config: dict, results: list[dict]) -> dict:
+    """Documento JSON di un'esecuzione: `results` è una lista di dizionari con una chiave "name" univoca."""
+    return {"benchmark": benchmark, "run": run_metadata(), "config": config, "results": results}
+
+
+def save_report(path: str, report: dict) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+def compare_reports(previous: dict, current: dict) -> list[dict]:
+    """
+    Variazioni tra due esecuzioni dello stesso benchmark, per ogni risultato con lo stesso nome.
+
+    Returns:
+        list[dict]: {"name", "metric", "before", "after", "change_pct", "better"} per ogni metrica confrontabile.
+    """
+    before = {result["name"]: result for result in previous.get("results", [])}
+    changes = []
+    for result in current.get("results", []):
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if metric not in result or metric not in old or not old[metric]:
+                continue
+            change = (result[metric] - old[metric]) / old[metric] * 100
+            changes.append({"name": result["name"], "metric": metric, "before": old[metric], "after": result[metric],
+                            "change_pct": round(change, 1), "better": (change > 0) == higher_is_better})
+    return changes
+
+
+def print_comparison(previous_path: str, current: dict) -> list[dict]:
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    changes = compare_reports(previous, current)
+    run = previous.get("run", {})
+    print(f"\nConfronto con {previous_path} (commit {run.get('git_commit')}, {run.get('timestamp')}):")
+    for change in changes:
+        verdict = "meglio" if change["better"] else "peggio"
+        if abs(change["change_pct"]) < 1:
+            verdict = "invariato"
+        print(f"  {change['name']:<32} {change['metric']:<15} {change['before']:>10} -> {change['after']:>10} "
+              f"({change['change_pct']:+.1f}%, {verdict})")
+    if not changes:
+        print("  nessun risultato in comune")
+    return changes
+
+
+def finish(benchmark: str, config: dict, results: list[dict], json_path: str | None, compare_path: str | None) -> dict:
+    """Salva (se richiesto) e confronta (se richiesto) i risultati di un benchmark; restituisce il report."""
+    report = build_report(benchmark, config, results)
+    if json_path:
+        save_report(json_path, report)
+        print(f"\nRisultati salvati in {json_path}")
+    if compare_path:
+        print_comparison(compare_path, report)
+    return report
+
+
+if __name__ == '__main__':
+    sys.exit("Modulo di supporto: esegui uno dei benchmark in questa cartella.")
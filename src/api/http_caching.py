@@ -0,0 +1,133 @@
+# src/api/http_caching.py
+#
+# Cache HTTP e compressione delle risposte, condivise dal server Flask (api_server) e da quello ASGI
+# (asgi_server) così che le due modalità rispondano con gli stessi header.
+#
+# - Le rotte GET in CACHE_POLICIES ricevono ETag (debole, calcolato sul corpo non compresso) e
+#   Cache-Control; una richiesta con If-None-Match corrispondente riceve 304 senza corpo.
+# - I corpi testuali (JSON, HTML, CSS, JS) di almeno HTTP_COMPRESS_MIN_BYTES sono compressi con
+#   brotli, se il modulo `brotli` è installato e il client lo accetta, altrimenti con gzip.
+#   Le immagini e gli stream (SSE) non sono mai compressi.
+
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli      # opzionale: senza, si usa solo gzip
+except ImportError:
+    brotli = None
+
+# --- CONFIGURAZIONE ---
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv('HTTP_COMPRESS_MIN_BYTES', '1024'))   # sotto, la compressione non conviene
+HTTP_GZIP_LEVEL = int(os.getenv('HTTP_GZIP_LEVEL', '6'))
+HTTP_BROTLI_QUALITY = int(os.getenv('HTTP_BROTLI_QUALITY', '5'))             # 4-6: buon compromesso per risposte dinamiche
+HTTP_SEARCH_MAX_AGE = int(os.getenv('HTTP_SEARCH_MAX_AGE', '300'))           # secondi
+HTTP_PRODUCT_MAX_AGE = int(os.getenv('HTTP_PRODUCT_MAX_AGE', '3600'))
+HTTP_THUMB_MAX_AGE = int(os.getenv('HTTP_THUMB_MAX_AGE', str(7 * 24 * 3600)))
+
+# Rotta (modello di Flask o percorso ASGI) -> Cache-Control delle risposte 200.
+# stale-while-revalidate: il browser mostra subito la copia scaduta e la riconvalida (di solito con un 304).
+CACHE_POLICIES = {
+    "/api/search_food": f"public, max-age={HTTP_SEARCH_MAX_AGE}, stale-while-revalidate={HTTP_SEARCH_MAX_AGE * 12}",
+    "/api/autocomplete": f"public, max-age={HTTP_SEARCH_MAX_AGE}",
+    "/api/product/<barcode>": f"public, max-age={HTTP_PRODUCT_MAX_AGE}, stale-while-revalidate={HTTP_PRODUCT_MAX_AGE * 24}",
+    "/api/thumb": f"public, max-age={HTTP_THUMB_MAX_AGE}, immutable",
+}
+
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/css", "text/plain", "application/javascript",
+                      "text/javascript", "image/svg+xml")
+NOT_COMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+# --- ETAG E RICHIESTE CONDIZIONALI ---
+
+def compute_etag(body: bytes) -> str:
+    """ETag debole del corpo: la stessa rappresentazione ha lo stesso ETag con qualunque Content-Encoding."""
+    return f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Confronto debole (RFC 9110) tra l'header If-None-Match (lista o "*") e l'ETag corrente."""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+
+# --- COMPRESSIONE ---
+
+def _accepted_codings(accept_encoding: str | None) -> dict:
+    codings = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            codings[name.strip().lower()] = quality
+    return codings
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """"br" o "gzip" secondo Accept-Encoding (valori q compresi); None se il client non ne accetta nessuno."""
+    codings = _accepted_codings(accept_encoding)
+    wildcard = codings.get("*", 0.0)
+    options = (("br", "gzip") if brotli is not None else ("gzip",))
+    accepted = [(codings.get(coding, wildcard), -index, coding) for index, coding in enumerate(options)]
+    quality, _, coding = max(accepted)
+    return coding if quality > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=HTTP_BROTLI_QUALITY)
+    # mtime=0: lo stesso corpo produce sempre gli stessi byte compressi
+    return gzip.compress(body, compresslevel=HTTP_GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(content_type: str | None) -> bool:
+    mimetype = (content_type or "").split(";")[0].strip().lower()
+    return mimetype in COMPRESSIBLE_TYPES and mimetype not in NOT_COMPRESSIBLE_TYPES
+
+
+# --- RISPOSTA COMPLETA ---
+
+def finalize_response(status: int, body: bytes, content_type: str, request_headers, route: str | None = None,
+                      method: str = "GET") -> tuple[int, list[tuple[str, str]], bytes]:
+    """
+    Applica cache HTTP e compressione a una risposta già costruita.
+
+    Args:
+        request_headers: header della richiesta (mapping con chiavi case-insensitive o minuscole).
+        route: modello della rotta, per la politica di CACHE_POLICIES (None = nessuna cache HTTP).
+
+    Returns:
+        tuple: (status, header aggiuntivi o sostitutivi, corpo). Lo status diventa 304 se la copia del client è valida.
+    """
+    headers = []
+    policy = CACHE_POLICIES.get(route) if method in ("GET", "HEAD") and status == 200 else None
+    compressible = is_compressible(content_type)
+    if compressible:
+        headers.append(("Vary", "Accept-Encoding"))
+    if policy is not None:
+        etag = compute_etag(body)
+        headers += [("ETag", etag), ("Cache-Control", policy)]
+        if etag_matches(request_headers.get("if-none-match"), etag):
+            return 304, headers, b""
+
+    if compressible and len(body) >= HTTP_COMPRESS_MIN_BYTES:
+        encoding = choose_encoding(request_headers.get("accept-encoding"))
+        if encoding is not None:
+            body = compress(body, encoding)
+            headers.append(("Content-Encoding", encoding))
+    headers += [("Content-Type", content_type), ("Content-Length", str(len(body)))]
+    return status, headers, body
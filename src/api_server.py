@@ -1,97 +1,453 @@
 # src/api_server.py
 
-from flask import Flask, render_template, jsonify, request 
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context, g
 
-# --- BLOCCO IMPORT PER search_products_by_name (come prima) ---
+# --- BLOCCO IMPORT PER search_products (come prima) ---
 import sys
 import os
+import functools
+import json
+import time
 PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT_DIR not in sys.path:
     sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from src.integrations.telemetry import PROMETHEUS_CONTENT_TYPE, get_logger, observe_request, render_metrics
+
+log = get_logger("api")
+
 try:
-    from src.integrations.openfoodfacts_client import search_products_by_name
-    print("INFO: 'search_products_by_name' importato con successo da src.integrations.openfoodfacts_client")
+    from src.integrations.openfoodfacts_client import (
+        search_products, get_cache_stats, get_products_by_barcodes, add_product_listener, OFF_BATCH_MAX_ITEMS,
+        local_catalog_products, lookup_product, retry_after_seconds, ERROR_INVALID_BARCODE,
+        ERROR_NOT_FOUND, ERROR_RATE_LIMITED
+    )
+    log.debug("Client OpenFoodFacts importato")
 except ModuleNotFoundError as e:
-    print(f"ERRORE CRITICO: ModuleNotFoundError durante l'import di search_products_by_name: {e}")
-    search_products_by_name = None 
+    log.critical("ModuleNotFoundError durante l'import del client OpenFoodFacts", error=str(e))
+    search_products = None
+    get_cache_stats = None
+    get_products_by_barcodes = None
+    local_catalog_products = None
+    lookup_product = None
 except ImportError as e:
-    print(f"ERRORE CRITICO: ImportError durante l'import di search_products_by_name: {e}")
-    search_products_by_name = None
+    log.critical("ImportError durante l'import del client OpenFoodFacts", error=str(e))
+    search_products = None
+    get_cache_stats = None
+    get_products_by_barcodes = None
+    local_catalog_products = None
+    lookup_product = None
 # --- FINE BLOCCO IMPORT ---
 
 # --- NUOVO BLOCCO IMPORT PER gemini_service ---
 try:
-    from src.integrations.gemini_service import get_nutritional_advice_from_gemini
-    print("INFO: 'get_nutritional_advice_from_gemini' importato con successo da src.integrations.gemini_service")
+    from src.integrations.gemini_service import (
+        get_nutritional_notes_from_gemini, stream_nutritional_notes_from_gemini, get_advice_cache_stats
+    )
+    log.debug("Servizio Gemini importato")
 except ModuleNotFoundError as e:
-    print(f"ERRORE CRITICO: ModuleNotFoundError durante l'import di get_nutritional_advice_from_gemini: {e}")
-    print(f"PROJECT_ROOT_DIR aggiunto a sys.path: {PROJECT_ROOT_DIR}") # Debug aggiunto
-    print(f"sys.path attuale: {sys.path}") # Debug aggiunto
-    get_nutritional_advice_from_gemini = None
+    log.critical("ModuleNotFoundError durante l'import del servizio Gemini", error=str(e),
+                 project_root=PROJECT_ROOT_DIR, sys_path=sys.path)
+    get_nutritional_notes_from_gemini = None
+    stream_nutritional_notes_from_gemini = None
+    get_advice_cache_stats = None
 except ImportError as e:
-    print(f"ERRORE CRITICO: ImportError durante l'import di get_nutritional_advice_from_gemini: {e}")
-    print(f"PROJECT_ROOT_DIR aggiunto a sys.path: {PROJECT_ROOT_DIR}") # Debug aggiunto
-    print(f"sys.path attuale: {sys.path}") # Debug aggiunto
-    get_nutritional_advice_from_gemini = None
+    log.critical("ImportError durante l'import del servizio Gemini", error=str(e),
+                 project_root=PROJECT_ROOT_DIR, sys_path=sys.path)
+    get_nutritional_notes_from_gemini = None
+    stream_nutritional_notes_from_gemini = None
+    get_advice_cache_stats = None
 # --- FINE NUOVO BLOCCO IMPORT ---
 
+# Il calcolo del fabbisogno è locale e non dipende da servizi esterni
+from src.core.nutritional_calculator import calculate_needs, describe_needs
+from src.core.recipe_manager import parse_meal_plan_request, plan_meals
+from src.core.user_profile import DEFAULT_TREND_WEEKS, ProfileStoreNotConfigured, get_profile_store
+
+# Autocompletamento: ogni prodotto restituito da ricerche e lookup alimenta l'indice dei prefissi
+from src.integrations.autocomplete_index import get_autocomplete_index, record_products
+from src.integrations.upstream_scheduler import get_scheduler_stats
+from src.integrations.thumbnails import THUMB_DEFAULT_SIZE, THUMB_SIZES, ThumbnailError, get_thumbnail_cache
+from src.api.http_caching import finalize_response
+if search_products is not None:
+    add_product_listener(record_products)
+
+AUTOCOMPLETE_DEFAULT_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 20
+MEAL_PLAN_MAX_CANDIDATES = int(os.getenv("MEAL_PLAN_MAX_CANDIDATES", "5000"))   # anche limite di "foods" per richiesta
+
 
 app = Flask(__name__, template_folder='../templates', static_folder='../static')
 
+# --- METRICHE DELLE RICHIESTE ---
+# Durata per rotta (il modello della rotta, non il percorso, così le serie restano poche).
+# Per le risposte in streaming la durata arriva fino all'invio degli header.
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+# --- CACHE HTTP E COMPRESSIONE ---
+# Registrato dopo le metriche, quindi eseguito prima (Flask chiama gli after_request in ordine inverso):
+# le metriche vedono lo status finale, compresi i 304. Gli stream (SSE) e i file statici passano invariati.
+@app.after_request
+def _apply_http_caching(response):
+    if response.is_streamed or response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else None
+    status, headers, body = finalize_response(response.status_code, response.get_data(), response.content_type,
+                                              request.headers, route, request.method)
+    response.status_code = status
+    response.set_data(body)
+    for name, value in headers:
+        if name == "Vary":
+            response.vary.add(value)
+        else:
+            response.headers[name] = value
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
 @app.route('/')
 def index_page():
     return render_template('index.html', message="Benvenuto nel tuo Allenatore Alimentare!")
 
+RATE_LIMITED_MESSAGE = "Troppe richieste al database alimentare esterno, riprovare più tardi"
+
+def _rate_limited(upstream: str):
+    # Richiesta rifiutata dal pianificatore (limite di OpenFoodFacts): errore transitorio, non 500
+    return jsonify({"error": RATE_LIMITED_MESSAGE}), 503, {"Retry-After": str(retry_after_seconds(upstream))}
+
 @app.route('/api/search_food', methods=['GET'])
 def api_search_food():
     search_query = request.args.get('query', '') 
     if not search_query:
         return jsonify({"error": "La query di ricerca non può essere vuota"}), 400
-    if search_products_by_name is None:
+    if search_products is None:
         return jsonify({"error": "Servizio di ricerca prodotti non disponibile (import fallito)."}), 500
-    print(f"API: Ricevuta ricerca per: '{search_query}'")
-    results = search_products_by_name(query=search_query, page_size=10, lang="it")
+    results, error = search_products(query=search_query, page_size=10, lang="it")
+    if error == ERROR_RATE_LIMITED:
+        return _rate_limited("off_search")
     if results is None:
-        print(f"API: Errore cercando '{search_query}' con OpenFoodFacts.")
+        log.warning("Errore nella ricerca con OpenFoodFacts", query=search_query, error=error)
         return jsonify({"error": "Errore comunicazione database alimentare esterno"}), 500
-    print(f"API: Trovati {len(results)} risultati per '{search_query}'.")
+    log.debug("Ricerca completata", query=search_query, results=len(results))
     return jsonify(results)
 
-# --- ENDPOINT CALCOLO FABBISOGNO MODIFICATO PER USARE GEMINI ---
+@app.route('/api/autocomplete', methods=['GET'])
+def api_autocomplete():
+    prefix = request.args.get('prefix', '')
+    if not prefix.strip():
+        return jsonify({"error": "Il prefisso non può essere vuoto"}), 400
+    limit = request.args.get('limit', AUTOCOMPLETE_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+    return jsonify({"prefix": prefix, "suggestions": get_autocomplete_index().suggest(prefix, limit=limit)})
+
+@app.route('/api/products/batch', methods=['POST'])
+def api_products_batch():
+    if not request.is_json:
+        return jsonify({"error": "Richiesta deve essere JSON"}), 400
+    if get_products_by_barcodes is None:
+        return jsonify({"error": "Servizio di ricerca prodotti non disponibile (import fallito)."}), 500
+
+    payload = request.get_json(silent=True)
+    barcodes = payload.get("barcodes") if isinstance(payload, dict) else None
+    if not isinstance(barcodes, list) or not barcodes:
+        return jsonify({"error": "Il campo 'barcodes' deve essere una lista non vuota"}), 400
+    if len(barcodes) > OFF_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"Troppi barcode: massimo {OFF_BATCH_MAX_ITEMS} per richiesta"}), 400
+
+    results = get_products_by_barcodes(barcodes)
+    found = sum(1 for item in results if item["product"] is not None)
+    log.debug("Richiesta batch completata", barcodes=len(barcodes), found=found)
+    # Risultati parziali: la risposta è 200 anche se alcuni barcode falliscono, l'errore è per singolo elemento
+    return jsonify({"results": results, "found": found, "errors": len(results) - found})
+
+@app.route('/api/product/<barcode>', methods=['GET'])
+def api_product(barcode):
+    if lookup_product is None:
+        return jsonify({"error": "Servizio di ricerca prodotti non disponibile (import fallito)."}), 500
+    product, error = lookup_product(barcode)
+    if product is not None:
+        return jsonify(product)
+    if error == ERROR_INVALID_BARCODE:
+        return jsonify({"error": "Il barcode deve contenere solo cifre"}), 400
+    if error == ERROR_NOT_FOUND:
+        return jsonify({"error": "Prodotto non trovato"}), 404
+    if error == ERROR_RATE_LIMITED:
+        return _rate_limited("off_barcode")
+    log.warning("Errore nella lettura del prodotto da OpenFoodFacts", barcode=barcode, error=error)
+    return jsonify({"error": "Errore comunicazione database alimentare esterno"}), 502
+
+# Miniature delle immagini dei prodotti: scaricate una volta, ridotte e servite dalla cache su disco
+@app.route('/api/thumb', methods=['GET'])
+def api_thumb():
+    image_url = request.args.get('url', '')
+    if not image_url:
+        return jsonify({"error": "Il parametro 'url' è obbligatorio"}), 400
+    size = request.args.get('size', THUMB_DEFAULT_SIZE, type=int)
+    if size not in THUMB_SIZES:
+        return jsonify({"error": f"Dimensione non supportata: valori ammessi {', '.join(map(str, THUMB_SIZES))}"}), 400
+    try:
+        content, content_type = get_thumbnail_cache().get(image_url, size)
+    except ThumbnailError as e:
+        return jsonify({"error": e.message}), e.status
+    return Response(content, mimetype=content_type)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def api_cache_stats():
+    if get_cache_stats is None:
+        return jsonify({"error": "Cache prodotti non disponibile (import fallito)."}), 500
+    stats = {"products": get_cache_stats(), "autocomplete": get_autocomplete_index().stats(),
+             "upstream": get_scheduler_stats(), "thumbnails": get_thumbnail_cache().stats()}
+    if get_advice_cache_stats is not None:
+        stats["gemini"] = get_advice_cache_stats()
+    return jsonify(stats)
+
+# --- ENDPOINT CALCOLO FABBISOGNO ---
+# I numeri sono calcolati localmente (formule deterministiche, sotto il millisecondo);
+# Gemini è opzionale e viene interpellato solo per la nota testuale se richiesto con ?notes=ai
+# o con "ai_notes": true nel JSON. Se Gemini non risponde si usa la nota locale.
 @app.route('/api/calculate_needs', methods=['POST'])
 def api_calculate_needs():
     if not request.is_json:
         return jsonify({"error": "Richiesta deve essere JSON"}), 400
 
-    user_data = request.get_json()
-    print(f"API: Ricevuti dati utente per calcolo fabbisogno: {user_data}")
-
-    # Controlla se la funzione di Gemini è stata importata correttamente
-    if get_nutritional_advice_from_gemini is None:
-        # Questo succede se l'import iniziale è fallito
-        print("API ERRORE: La funzione 'get_nutritional_advice_from_gemini' non è disponibile (import fallito).")
-        return jsonify({"error": "Servizio di consulenza nutrizionale non disponibile (configurazione interna)."}), 500
-
-    # Chiama la funzione del servizio Gemini
-    print("API: Chiamata a get_nutritional_advice_from_gemini in corso...")
-    advice = get_nutritional_advice_from_gemini(user_data)
-
-    if advice is None:
-        # Questo potrebbe accadere se c'è un errore non gestito internamente in get_nutritional_advice_from_gemini
-        # o se la funzione è stata definita per restituire None in certi casi di errore non API.
-        print("API ERRORE: la funzione get_nutritional_advice_from_gemini ha restituito None inaspettatamente.")
-        return jsonify({"error": "Errore imprevisto durante l'elaborazione della richiesta di consulenza nutrizionale."}), 500
-    
-    # Se 'advice' contiene una chiave 'error' (come definito in gemini_service.py)
-    if isinstance(advice, dict) and "error" in advice:
-        print(f"API: Errore ricevuto da gemini_service: {advice['error']}")
-        # Restituiamo 503 Service Unavailable se l'errore proviene dal servizio Gemini
-        # o se la chiave API non è configurata.
-        return jsonify(advice), 503 
-
-    print(f"API: Consiglio da Gemini ricevuto: {advice}")
+    user_data = request.get_json(silent=True)
+    if not isinstance(user_data, dict):
+        return jsonify({"error": "Il corpo della richiesta deve essere un oggetto JSON"}), 400
+    log.debug("Dati utente per il calcolo del fabbisogno", user_data=user_data)
+
+    try:
+        needs = calculate_needs(user_data)
+    except ValueError as e:
+        log.debug("Dati utente non validi", error=str(e))
+        return jsonify({"error": str(e)}), 400
+
+    advice = dict(needs, notes=describe_needs(needs), notes_source="local", source="local")
+    wants_ai_notes = request.args.get('notes') == 'ai' or user_data.get('ai_notes') is True
+    if wants_ai_notes:
+        if get_nutritional_notes_from_gemini is None:
+            log.warning("Note IA richieste ma il servizio Gemini non è disponibile (import fallito)")
+            advice["notes_error"] = "Servizio di consulenza nutrizionale non disponibile."
+        else:
+            ai_notes = get_nutritional_notes_from_gemini(user_data, needs)
+            if "error" in ai_notes:
+                log.warning("Errore ricevuto da gemini_service", error=ai_notes["error"])
+                advice["notes_error"] = ai_notes["error"]
+            else:
+                advice["notes"] = ai_notes["notes"]
+                advice["notes_source"] = "gemini"
+
+    log.debug("Fabbisogno calcolato", calories=advice["calories"], notes_source=advice["notes_source"])
     return jsonify(advice)
-# --- FINE ENDPOINT MODIFICATO ---
+# --- FINE ENDPOINT CALCOLO FABBISOGNO ---
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# --- ENDPOINT CALCOLO FABBISOGNO IN STREAMING (Server-Sent Events) ---
+# Eventi inviati, nell'ordine:
+#   targets      -> numeri calcolati localmente, subito
+#   notes        -> {"delta": testo} per ogni frammento della nota di Gemini (uno solo se la nota è locale o in cache)
+#   notes_error  -> {"error": ...} se Gemini fallisce; segue la nota locale come evento notes
+#   done         -> {"notes_source": "gemini" | "local"}
+@app.route('/api/calculate_needs/stream', methods=['POST'])
+def api_calculate_needs_stream():
+    if not request.is_json:
+        return jsonify({"error": "Richiesta deve essere JSON"}), 400
+
+    user_data = request.get_json(silent=True)
+    if not isinstance(user_data, dict):
+        return jsonify({"error": "Il corpo della richiesta deve essere un oggetto JSON"}), 400
+
+    try:
+        needs = calculate_needs(user_data)
+    except ValueError as e:
+        log.debug("Dati utente non validi", error=str(e))
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        yield _sse_event("targets", dict(needs, source="local"))
+
+        if stream_nutritional_notes_from_gemini is not None:
+            streamed_any = False
+            for event in stream_nutritional_notes_from_gemini(user_data, needs):
+                if "error" in event:
+                    yield _sse_event("notes_error", {"error": event["error"]})
+                    break
+                streamed_any = True
+                yield _sse_event("notes", {"delta": event["notes"]})
+            else:
+                if streamed_any:
+                    yield _sse_event("done", {"notes_source": "gemini"})
+                    return
+
+        yield _sse_event("notes", {"delta": describe_needs(needs)})
+        yield _sse_event("done", {"notes_source": "local"})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+# --- FINE ENDPOINT STREAMING ---
+
+# --- ENDPOINT PIANO ALIMENTARE ---
+# Alimenti candidati, nell'ordine: "foods" (prodotti nella forma di /api/search_food, con opzionali
+# price_per_kg, min_g, max_g), "barcodes" (letti con il batch OpenFoodFacts) oppure il catalogo locale.
+@app.route('/api/meal_plan', methods=['POST'])
+def api_meal_plan():
+    if not request.is_json:
+        return jsonify({"error": "Richiesta deve essere JSON"}), 400
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Il corpo della richiesta deve essere un oggetto JSON"}), 400
+    try:
+        options = parse_meal_plan_request(data)
+    except ValueError as e:
+        log.debug("Richiesta piano alimentare non valida", error=str(e))
+        return jsonify({"error": str(e)}), 400
+
+    foods = data.get("foods")
+    barcodes = data.get("barcodes")
+    if foods is not None:
+        if not isinstance(foods, list) or not foods:
+            return jsonify({"error": "Il campo 'foods' deve essere una lista non vuota"}), 400
+        if len(foods) > MEAL_PLAN_MAX_CANDIDATES:
+            return jsonify({"error": f"Troppi alimenti: massimo {MEAL_PLAN_MAX_CANDIDATES} per richiesta"}), 400
+    elif barcodes is not None:
+        if not isinstance(barcodes, list) or not barcodes:
+            return jsonify({"error": "Il campo 'barcodes' deve essere una lista non vuota"}), 400
+        if len(barcodes) > OFF_BATCH_MAX_ITEMS:
+            return jsonify({"error": f"Troppi barcode: massimo {OFF_BATCH_MAX_ITEMS} per richiesta"}), 400
+        if get_products_by_barcodes is None:
+            return jsonify({"error": "Servizio di ricerca prodotti non disponibile (import fallito)."}), 500
+        foods = [item["product"] for item in get_products_by_barcodes(barcodes) if item["product"] is not None]
+    else:
+        if local_catalog_products is None:
+            return jsonify({"error": "Catalogo locale non disponibile (import fallito)."}), 500
+        foods = local_catalog_products(MEAL_PLAN_MAX_CANDIDATES)
+
+    try:
+        plan = plan_meals(foods, **options)
+    except ValueError as e:
+        log.debug("Piano alimentare non calcolabile", error=str(e))
+        return jsonify({"error": str(e)}), 422
+    log.debug("Piano alimentare calcolato", days=options["days"], candidates=plan["candidates"],
+             within_tolerance=plan["within_tolerance"])
+    return jsonify(plan)
+# --- FINE ENDPOINT PIANO ALIMENTARE ---
+
+# --- ENDPOINT PROFILO E DIARIO ALIMENTARE ---
+# Il profilo salva i dati del form e gli obiettivi calcolati; ogni voce del diario aggiorna i totali
+# del giorno e della settimana, così "today" e "trend" non dipendono dalla lunghezza dello storico.
+# Ogni richiesta porta il token dell'utente ("Authorization: Bearer <token>"): il primo salvataggio del
+# profilo lo crea e lo restituisce nel campo "token", l'unica volta in cui è visibile (un profilo salvato
+# prima dei token lo riceve al prossimo salvataggio).
+PROFILE_TOKEN_ERROR = "Token del profilo mancante o non valido"
+
+def _bearer_token() -> str | None:
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return None
+    return token.strip() or None
+
+def _authorize_profile(user_id: str, claim: bool = False):
+    """
+    (archivio, token appena creato, risposta di errore) per una rotta del profilo. Con `claim` un utente
+    che non ha ancora un token lo riceve ora; altrimenti serve il suo token.
+    """
+    try:
+        store = get_profile_store()
+        if store.check_token(user_id, _bearer_token()):
+            return store, None, None
+        issued = store.issue_token(user_id) if claim else None
+    except ProfileStoreNotConfigured as e:
+        log.error("Archivio dei profili non configurato", error=str(e))
+        return None, None, (jsonify({"error": "Archivio dei profili non configurato sul server"}), 503)
+    except ValueError as e:
+        return None, None, (jsonify({"error": str(e)}), 400)
+    if issued is None:
+        return None, None, (jsonify({"error": PROFILE_TOKEN_ERROR}), 401)
+    return store, issued, None
+
+def _profile_route(handler):
+    """Rotte del diario e di lettura del profilo: handler(archivio, user_id, ...) solo con il token dell'utente."""
+    @functools.wraps(handler)
+    def wrapper(user_id, *args, **kwargs):
+        store, _, error = _authorize_profile(user_id)
+        return error if error is not None else handler(store, user_id, *args, **kwargs)
+    return wrapper
+
+@app.route('/api/profile/<user_id>', methods=['POST'])
+def api_save_profile(user_id):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Il corpo della richiesta deve essere un oggetto JSON"}), 400
+    try:
+        # dati validati prima di creare il token: un salvataggio rifiutato non consuma il profilo
+        targets = calculate_needs(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    store, issued, error = _authorize_profile(user_id, claim=True)
+    if error is not None:
+        return error
+    profile = store.save_profile(user_id, data, targets=targets)
+    return jsonify(profile if issued is None else dict(profile, token=issued))
+
+@app.route('/api/profile/<user_id>', methods=['GET'])
+@_profile_route
+def api_get_profile(store, user_id):
+    profile = store.get_profile(user_id)
+    if profile is None:
+        return jsonify({"error": "Profilo non trovato"}), 404
+    return jsonify(profile)
+
+@app.route('/api/profile/<user_id>/log', methods=['POST'])
+@_profile_route
+def api_log_food(store, user_id):
+    item = request.get_json(silent=True)
+    if not isinstance(item, dict):
+        return jsonify({"error": "Il corpo della richiesta deve essere un oggetto JSON"}), 400
+    try:
+        entry = store.log_food(user_id, item, day=item.get("day"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"entry": entry, "today": store.remaining_today(user_id, entry["day"])}), 201
+
+@app.route('/api/profile/<user_id>/log/<int:entry_id>', methods=['DELETE'])
+@_profile_route
+def api_delete_food(store, user_id, entry_id):
+    if not store.delete_entry(user_id, entry_id):
+        return jsonify({"error": "Voce del diario non trovata"}), 404
+    return jsonify({"deleted": entry_id})
+
+@app.route('/api/profile/<user_id>/today', methods=['GET'])
+@_profile_route
+def api_remaining_today(store, user_id):
+    try:
+        return jsonify(store.remaining_today(user_id, request.args.get('day')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/profile/<user_id>/trend', methods=['GET'])
+@_profile_route
+def api_weekly_trend(store, user_id):
+    weeks = request.args.get('weeks', DEFAULT_TREND_WEEKS, type=int)
+    try:
+        trend = store.weekly_trend(user_id, weeks, request.args.get('day'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"user_id": user_id, "weeks": trend})
+# --- FINE ENDPOINT PROFILO E DIARIO ALIMENTARE ---
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
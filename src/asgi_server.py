@@ -0,0 +1,343 @@
+# src/asgi_server.py
+#
+# Modalità di servizio asincrona (ASGI), con le stesse rotte e gli stessi contratti JSON di api_server.py.
+# Le rotte che attendono servizi esterni (ricerca e batch OpenFoodFacts, note di Gemini) sono native
+# asincrone, con una scadenza per richiesta: allo scadere la chiamata upstream viene cancellata.
+# Tutte le altre rotte (pagina principale, streaming SSE, file statici) sono servite dall'app Flask
+# tramite un ponte WSGI eseguito in un pool di thread.
+#
+# Avvio (uvicorn è opzionale, non serve al server sincrono):
+#     uvicorn src.asgi_server:app --host 0.0.0.0 --port 8000
+# oppure
+#     python src/asgi_server.py
+
+import asyncio
+import contextvars
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from src import api_server
+from src.api.http_caching import finalize_response
+from src.core.nutritional_calculator import calculate_needs, describe_needs
+from src.integrations.autocomplete_index import get_autocomplete_index
+from src.integrations.http_client import close_async_client, open_async_client
+from src.integrations.telemetry import get_logger, observe_request
+from src.integrations.thumbnails import get_thumbnail_cache
+from src.integrations.upstream_scheduler import get_scheduler_stats
+
+log = get_logger("asgi")
+
+try:
+    from src.integrations.openfoodfacts_client import (
+        async_search_products, async_get_products_by_barcodes, retry_after_seconds, OFF_BATCH_MAX_ITEMS,
+        ERROR_RATE_LIMITED
+    )
+    log.debug("Client asincrono OpenFoodFacts importato")
+except ImportError as e:
+    log.critical("ImportError durante l'import del client asincrono OpenFoodFacts", error=str(e))
+    async_search_products = None
+    async_get_products_by_barcodes = None
+
+# --- CONFIGURAZIONE ---
+ASGI_REQUEST_DEADLINE = float(os.getenv('ASGI_REQUEST_DEADLINE', '10'))   # secondi per ricerca e batch OpenFoodFacts
+ASGI_NOTES_DEADLINE = float(os.getenv('ASGI_NOTES_DEADLINE', '25'))       # secondi per la nota di Gemini
+ASGI_THREADPOOL_SIZE = int(os.getenv('ASGI_THREADPOOL_SIZE', '32'))       # thread per Flask (fallback) e Gemini
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_THREADPOOL_SIZE, thread_name_prefix="asgi-worker")
+
+
+class AsgiRequest:
+    """Richiesta HTTP già letta per intero (le rotte native ricevono corpi JSON piccoli)."""
+
+    def __init__(self, scope: dict, body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query_string = scope.get("query_string", b"")
+        self.args = {key: values[0] for key, values in parse_qs(self.query_string.decode("latin-1")).items()}
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+        self.body = body
+
+    @property
+    def is_json(self) -> bool:
+        mimetype = self.headers.get("content-type", "").split(";")[0].strip().lower()
+        return mimetype == "application/json" or (mimetype.startswith("application/") and mimetype.endswith("+json"))
+
+    def get_json(self):
+        """Corpo decodificato come JSON, None se non valido (come request.get_json(silent=True) di Flask)."""
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _send_json(send, status: int, payload, request: AsgiRequest, extra_headers: dict | None = None) -> int:
+    """Invia la risposta JSON con cache HTTP e compressione (come l'app Flask); restituisce lo status inviato."""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    status, headers, body = finalize_response(status, body, "application/json", request.headers, request.path,
+                                              request.method)
+    headers += list((extra_headers or {}).items())
+    headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+    return status
+
+
+# --- ROTTE NATIVE ASINCRONE ---
+# Ogni handler restituisce (status, payload JSON) oppure (status, payload JSON, header aggiuntivi);
+# messaggi ed esiti sono quelli di api_server.py.
+
+async def search_food(request: AsgiRequest):
+    search_query = request.args.get('query', '')
+    if not search_query:
+        return 400, {"error": "La query di ricerca non può essere vuota"}
+    if async_search_products is None:
+        return 500, {"error": "Servizio di ricerca prodotti non disponibile (import fallito)."}
+    results, error = await async_search_products(query=search_query, page_size=10, lang="it")
+    if error == ERROR_RATE_LIMITED:
+        return 503, {"error": api_server.RATE_LIMITED_MESSAGE}, {"Retry-After": str(retry_after_seconds("off_search"))}
+    if results is None:
+        log.warning("Errore nella ricerca con OpenFoodFacts", query=search_query, error=error)
+        return 500, {"error": "Errore comunicazione database alimentare esterno"}
+    log.debug("Ricerca completata", query=search_query, results=len(results))
+    return 200, results
+
+
+async def autocomplete(request: AsgiRequest):
+    prefix = request.args.get('prefix', '')
+    if not prefix.strip():
+        return 400, {"error": "Il prefisso non può essere vuoto"}
+    try:
+        limit = int(request.args.get('limit', api_server.AUTOCOMPLETE_DEFAULT_LIMIT))
+    except ValueError:
+        limit = api_server.AUTOCOMPLETE_DEFAULT_LIMIT
+    limit = max(1, min(limit, api_server.AUTOCOMPLETE_MAX_LIMIT))
+    return 200, {"prefix": prefix, "suggestions": get_autocomplete_index().suggest(prefix, limit=limit)}
+
+
+async def products_batch(request: AsgiRequest):
+    if not request.is_json:
+        return 400, {"error": "Richiesta deve essere JSON"}
+    if async_get_products_by_barcodes is None:
+        return 500, {"error": "Servizio di ricerca prodotti non disponibile (import fallito)."}
+
+    payload = request.get_json()
+    barcodes = payload.get("barcodes") if isinstance(payload, dict) else None
+    if not isinstance(barcodes, list) or not barcodes:
+        return 400, {"error": "Il campo 'barcodes' deve essere una lista non vuota"}
+    if len(barcodes) > OFF_BATCH_MAX_ITEMS:
+        return 400, {"error": f"Troppi barcode: massimo {OFF_BATCH_MAX_ITEMS} per richiesta"}
+
+    results = await async_get_products_by_barcodes(barcodes)
+    found = sum(1 for item in results if item["product"] is not None)
+    log.debug("Richiesta batch completata", barcodes=len(barcodes), found=found)
+    return 200, {"results": results, "found": found, "errors": len(results) - found}
+
+
+async def calculate_needs_route(request: AsgiRequest):
+    if not request.is_json:
+        return 400, {"error": "Richiesta deve essere JSON"}
+
+    user_data = request.get_json()
+    if not isinstance(user_data, dict):
+        return 400, {"error": "Il corpo della richiesta deve essere un oggetto JSON"}
+    log.debug("Dati utente per il calcolo del fabbisogno", user_data=user_data)
+
+    try:
+        needs = calculate_needs(user_data)
+    except ValueError as e:
+        log.debug("Dati utente non validi", error=str(e))
+        return 400, {"error": str(e)}
+
+    advice = dict(needs, notes=describe_needs(needs), notes_source="local", source="local")
+    wants_ai_notes = request.args.get('notes') == 'ai' or user_data.get('ai_notes') is True
+    if wants_ai_notes:
+        get_notes = api_server.get_nutritional_notes_from_gemini
+        if get_notes is None:
+            log.warning("Note IA richieste ma il servizio Gemini non è disponibile (import fallito)")
+            advice["notes_error"] = "Servizio di consulenza nutrizionale non disponibile."
+        else:
+            # L'SDK di Gemini è sincrono: la chiamata gira in un thread e la richiesta smette di attenderla
+            # alla scadenza (la nota, se arriva dopo, finisce comunque nella cache dei consigli).
+            loop = asyncio.get_running_loop()
+            try:
+                ai_notes = await asyncio.wait_for(
+                    loop.run_in_executor(_executor, get_notes, user_data, needs), ASGI_NOTES_DEADLINE
+                )
+            except asyncio.TimeoutError:
+                log.warning("Gemini non ha risposto in tempo, uso la nota locale", deadline=ASGI_NOTES_DEADLINE)
+                ai_notes = {"error": "Il servizio di consulenza nutrizionale non ha risposto in tempo."}
+            if "error" in ai_notes:
+                log.warning("Errore ricevuto da gemini_service", error=ai_notes["error"])
+                advice["notes_error"] = ai_notes["error"]
+            else:
+                advice["notes"] = ai_notes["notes"]
+                advice["notes_source"] = "gemini"
+
+    log.debug("Fabbisogno calcolato", calories=advice["calories"], notes_source=advice["notes_source"])
+    return 200, advice
+
+
+async def cache_stats(request: AsgiRequest):
+    if api_server.get_cache_stats is None:
+        return 500, {"error": "Cache prodotti non disponibile (import fallito)."}
+    stats = {"products": api_server.get_cache_stats(), "autocomplete": get_autocomplete_index().stats(),
+             "upstream": get_scheduler_stats(), "thumbnails": get_thumbnail_cache().stats()}
+    if api_server.get_advice_cache_stats is not None:
+        stats["gemini"] = api_server.get_advice_cache_stats()
+    return 200, stats
+
+
+# (metodo, percorso) -> (handler, scadenza in secondi; None = nessuna scadenza oltre a quelle interne)
+ROUTES = {
+    ("GET", "/api/search_food"): (search_food, ASGI_REQUEST_DEADLINE),
+    ("GET", "/api/autocomplete"): (autocomplete, None),
+    ("POST", "/api/products/batch"): (products_batch, ASGI_REQUEST_DEADLINE),
+    ("POST", "/api/calculate_needs"): (calculate_needs_route, None),
+    ("GET", "/api/cache/stats"): (cache_stats, None),
+}
+
+
+# --- PONTE WSGI (rotte non native) ---
+
+def _wsgi_environ(scope: dict, body: bytes) -> dict:
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(body)),
+    }
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif key != "CONTENT_LENGTH":
+            key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _serve_wsgi(wsgi_app, scope: dict, body: bytes, send) -> None:
+    """Esegue l'app WSGI in un thread e inoltra la risposta un frammento alla volta (lo streaming SSE resta tale)."""
+    loop = asyncio.get_running_loop()
+    response_start = {}
+
+    def start_response(status, headers, exc_info=None):
+        response_start["status"] = int(status.split(" ", 1)[0])
+        response_start["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    # Tutti i passi della stessa richiesta girano nello stesso contesto: Flask (stream_with_context)
+    # tiene il contesto della richiesta in contextvars, anche se i passi cambiano thread.
+    context = contextvars.copy_context()
+
+    def run(fn, *args):
+        return loop.run_in_executor(_executor, context.run, fn, *args)
+
+    iterable = await run(wsgi_app, _wsgi_environ(scope, body), start_response)
+    iterator = iter(iterable)
+    done = object()
+    try:
+        chunk = await run(next, iterator, done)
+        await send({"type": "http.response.start", "status": response_start["status"],
+                    "headers": response_start["headers"]})
+        while chunk is not done:
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await run(next, iterator, done)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        close = getattr(iterable, "close", None)
+        if close is not None:
+            await run(close)
+
+
+# --- APPLICAZIONE ASGI ---
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await open_async_client()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """Applicazione ASGI: rotte native asincrone, tutto il resto delegato all'app Flask."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    body = await _read_body(receive)
+    route = ROUTES.get((scope["method"], scope["path"]))
+    if route is None:
+        await _serve_wsgi(api_server.app, scope, body, send)
+        return
+
+    # Le rotte delegate a Flask sono misurate dall'app Flask; qui solo quelle native
+    started = time.perf_counter()
+    handler, deadline = route
+    request = AsgiRequest(scope, body)
+    extra_headers = None
+    try:
+        status, payload, *extra = await asyncio.wait_for(handler(request), deadline)
+        extra_headers = extra[0] if extra else None
+    except asyncio.TimeoutError:
+        # wait_for cancella l'handler: le richieste upstream ancora in corso vengono interrotte
+        log.warning("Scadenza superata, richiesta annullata", method=scope["method"], path=scope["path"],
+                    deadline=deadline)
+        status, payload = 504, {"error": "Il servizio esterno non ha risposto in tempo"}
+    except Exception as e:
+        log.error("Eccezione non gestita", method=scope["method"], path=scope["path"], error=str(e), exc_info=True)
+        status, payload = 500, {"error": "Errore interno del server"}
+    status = await _send_json(send, status, payload, request, extra_headers)
+    observe_request(scope["path"], scope["method"], status, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        log.error("uvicorn non è installato. Installalo con 'pip install uvicorn' "
+                  "oppure usa un altro server ASGI con 'src.asgi_server:app'.")
+        sys.exit(1)
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '8000')))
@@ -0,0 +1,252 @@
+# src/core/nutritional_calculator.py
+
+import re
+import unicodedata
+
+import numpy as np
+
+# Moltiplicatori del metabolismo basale per livello di attività (stesse chiavi del form e di activity_level_map)
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "extra_active": 1.9,
+}
+
+FORMULA_MIFFLIN_ST_JEOR = "mifflin_st_jeor"
+FORMULA_HARRIS_BENEDICT = "harris_benedict"
+FORMULA_KATCH_MCARDLE = "katch_mcardle"
+FORMULA_AUTO = "auto"  # Katch-McArdle se è nota la massa grassa, altrimenti Mifflin-St Jeor
+FORMULAS = (FORMULA_AUTO, FORMULA_MIFFLIN_ST_JEOR, FORMULA_HARRIS_BENEDICT, FORMULA_KATCH_MCARDLE)
+
+GOAL_LOSE = "lose"
+GOAL_MAINTAIN = "maintain"
+GOAL_GAIN = "gain"
+GOALS = (GOAL_LOSE, GOAL_MAINTAIN, GOAL_GAIN)
+
+# Parametri per obiettivo, nello stesso ordine di GOALS (usati come tabelle dal calcolo vettoriale)
+GOAL_ENERGY_FACTORS = np.array([0.80, 1.00, 1.10])      # correzione del dispendio giornaliero
+GOAL_PROTEIN_G_PER_KG = np.array([2.0, 1.6, 1.8])        # grammi di proteine per kg di peso corporeo
+GOAL_FAT_ENERGY_SHARE = np.array([0.25, 0.30, 0.25])     # quota delle calorie da grassi
+
+MIN_CALORIES_MALE = 1500
+MIN_CALORIES_FEMALE = 1200
+KCAL_PER_G_PROTEIN = 4
+KCAL_PER_G_CARBS = 4
+KCAL_PER_G_FAT = 9
+
+_MALE_VALUES = {"male", "m", "maschio", "uomo"}
+_FEMALE_VALUES = {"female", "f", "femmina", "donna"}
+# Parole intere o radici ("*" finale); più parole = frase consecutiva. Si cerca prima la perdita di peso,
+# così "massa grassa" non è letta come "massa" (aumento)
+_GOAL_KEYWORDS = {
+    GOAL_LOSE: ("perd*", "dimagr*", "calare", "calo", "cala", "definiz*", "ridur*", "massa grass*", "lose", "losing",
+                "cut", "cutting", "weight loss", "slim*"),
+    GOAL_GAIN: ("massa", "aument*", "ingrass*", "bulk*", "gain*", "muscol*"),
+}
+_GOAL_DESCRIPTIONS = {
+    GOAL_LOSE: "perdita di peso graduale (-20% sul dispendio giornaliero)",
+    GOAL_MAINTAIN: "mantenimento del peso",
+    GOAL_GAIN: "aumento della massa muscolare (+10% sul dispendio giornaliero)",
+}
+_FORMULA_NAMES = {
+    FORMULA_MIFFLIN_ST_JEOR: "Mifflin-St Jeor",
+    FORMULA_HARRIS_BENEDICT: "Harris-Benedict (rev. Roza-Shizgal)",
+    FORMULA_KATCH_MCARDLE: "Katch-McArdle",
+}
+
+
+# --- FORMULE DEL METABOLISMO BASALE (accettano scalari o array NumPy) ---
+
+def bmr_mifflin_st_jeor(weight_kg, height_cm, age_years, is_male):
+    """Mifflin-St Jeor (1990): 10*peso + 6.25*altezza - 5*età + 5 (uomo) / -161 (donna)."""
+    return 10.0 * weight_kg + 6.25 * height_cm - 5.0 * age_years + np.where(is_male, 5.0, -161.0)
+
+
+def bmr_harris_benedict(weight_kg, height_cm, age_years, is_male):
+    """Harris-Benedict rivista da Roza e Shizgal (1984)."""
+    male = 88.362 + 13.397 * weight_kg + 4.799 * height_cm - 5.677 * age_years
+    female = 447.593 + 9.247 * weight_kg + 3.098 * height_cm - 4.330 * age_years
+    return np.where(is_male, male, female)
+
+
+def bmr_katch_mcardle(weight_kg, body_fat_percent):
+    """Katch-McArdle: 370 + 21.6 * massa magra (kg). Richiede la percentuale di massa grassa."""
+    lean_mass = weight_kg * (1.0 - body_fat_percent / 100.0)
+    return 370.0 + 21.6 * lean_mass
+
+
+# --- CALCOLO VETTORIALE ---
+
+def calculate_needs_batch(age, weight, height, is_male, activity_multiplier, goal_index,
+                          body_fat=None, formula: str = FORMULA_AUTO) -> dict:
+    """
+    Calcola fabbisogno calorico e macronutrienti per molti profili in una sola chiamata.
+
+    Args:
+        age, weight, height: array (anni, kg, cm).
+        is_male: array booleano.
+        activity_multiplier: array di moltiplicatori (vedi ACTIVITY_MULTIPLIERS).
+        goal_index: array di indici in GOALS (0 = perdere peso, 1 = mantenimento, 2 = aumento massa).
+        body_fat: array opzionale della percentuale di massa grassa (NaN se non nota).
+        formula: una delle FORMULAS.
+
+    Returns:
+        dict: array float64 "bmr", "tdee", "calories", "protein", "carbs", "fat" (grammi al giorno).
+    """
+    if not isinstance(formula, str) or formula not in FORMULAS:
+        raise ValueError(f"Formula non supportata: '{formula}'")
+    age = np.asarray(age, dtype=np.float64)
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    is_male = np.asarray(is_male, dtype=bool)
+    activity_multiplier = np.asarray(activity_multiplier, dtype=np.float64)
+    goal_index = np.asarray(goal_index, dtype=np.intp)
+    body_fat = np.full(weight.shape, np.nan) if body_fat is None else np.asarray(body_fat, dtype=np.float64)
+
+    if formula == FORMULA_HARRIS_BENEDICT:
+        bmr = bmr_harris_benedict(weight, height, age, is_male)
+    elif formula == FORMULA_KATCH_MCARDLE:
+        if np.isnan(body_fat).any():
+            raise ValueError("La formula Katch-McArdle richiede la percentuale di massa grassa per ogni profilo")
+        bmr = bmr_katch_mcardle(weight, body_fat)
+    else:
+        bmr = bmr_mifflin_st_jeor(weight, height, age, is_male)
+        if formula == FORMULA_AUTO:
+            has_body_fat = ~np.isnan(body_fat)
+            bmr = np.where(has_body_fat, bmr_katch_mcardle(weight, np.nan_to_num(body_fat)), bmr)
+
+    tdee = bmr * activity_multiplier
+    min_calories = np.where(is_male, MIN_CALORIES_MALE, MIN_CALORIES_FEMALE)
+    calories = np.maximum(tdee * GOAL_ENERGY_FACTORS[goal_index], min_calories)
+
+    protein = GOAL_PROTEIN_G_PER_KG[goal_index] * weight
+    fat = calories * GOAL_FAT_ENERGY_SHARE[goal_index] / KCAL_PER_G_FAT
+    carbs = np.maximum(calories - protein * KCAL_PER_G_PROTEIN - fat * KCAL_PER_G_FAT, 0.0) / KCAL_PER_G_CARBS
+    return {"bmr": bmr, "tdee": tdee, "calories": calories, "protein": protein, "carbs": carbs, "fat": fat}
+
+
+# --- CALCOLO PER UN SINGOLO UTENTE (dati del form) ---
+
+def _fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", str(text).strip().lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _keyword_matches(words: list[str], keyword: str) -> bool:
+    parts = keyword.split()
+    for start in range(len(words) - len(parts) + 1):
+        if all(words[start + i].startswith(part[:-1]) if part.endswith("*") else words[start + i] == part
+               for i, part in enumerate(parts)):
+            return True
+    return False
+
+
+def parse_goal(objectives: str | None) -> str:
+    """Deduce l'obiettivo (GOALS) dal testo libero del form; in assenza di indicazioni è il mantenimento."""
+    text = _fold(objectives or "")
+    if text in GOALS:
+        return text
+    words = re.findall(r"[a-z]+", text)
+    for goal in (GOAL_LOSE, GOAL_GAIN):
+        if any(_keyword_matches(words, keyword) for keyword in _GOAL_KEYWORDS[goal]):
+            return goal
+    return GOAL_MAINTAIN
+
+
+def _parse_number(user_data: dict, key: str, label: str, minimum: float, maximum: float) -> float:
+    value = user_data.get(key)
+    try:
+        number = float(str(value).replace(",", "."))
+    except (TypeError, ValueError):
+        raise ValueError(f"Valore non valido per {label}: {value!r}")
+    if not minimum <= number <= maximum:
+        raise ValueError(f"{label} fuori intervallo ({minimum}-{maximum}): {value!r}")
+    return number
+
+
+def parse_profile(user_data: dict) -> dict:
+    """
+    Valida e normalizza i dati del form (i valori numerici arrivano come stringhe).
+
+    Raises:
+        ValueError: con un messaggio leggibile se un campo manca o non è valido.
+    """
+    gender = _fold(user_data.get("gender", ""))
+    if gender in _MALE_VALUES:
+        is_male = True
+    elif gender in _FEMALE_VALUES:
+        is_male = False
+    else:
+        raise ValueError(f"Valore non valido per sesso biologico: {user_data.get('gender')!r}")
+
+    activity_level = user_data.get("activity_level")
+    if not isinstance(activity_level, str) or activity_level not in ACTIVITY_MULTIPLIERS:
+        raise ValueError(f"Livello di attività non valido: {activity_level!r}")
+
+    formula = user_data.get("formula") or FORMULA_AUTO
+    if not isinstance(formula, str) or formula not in FORMULAS:
+        raise ValueError(f"Formula non supportata: {formula!r}")
+
+    body_fat = None
+    if user_data.get("body_fat") not in (None, ""):
+        body_fat = _parse_number(user_data, "body_fat", "massa grassa (%)", 3, 70)
+    if formula == FORMULA_KATCH_MCARDLE and body_fat is None:
+        raise ValueError("La formula Katch-McArdle richiede la percentuale di massa grassa (body_fat)")
+
+    return {
+        "age": _parse_number(user_data, "age", "età", 1, 120),
+        "weight": _parse_number(user_data, "weight", "peso", 1, 400),
+        "height": _parse_number(user_data, "height", "altezza", 30, 272),
+        "is_male": is_male,
+        "activity_level": activity_level,
+        "goal": parse_goal(user_data.get("goal") or user_data.get("objectives")),
+        "body_fat": body_fat,
+        "formula": formula,
+    }
+
+
+def calculate_needs(user_data: dict) -> dict:
+    """
+    Calcola localmente fabbisogno calorico e macronutrienti a partire dai dati del form.
+
+    Args:
+        user_data (dict): Dati dell'utente (age, weight, height, gender, activity_level, objectives,
+                          opzionali body_fat e formula).
+
+    Returns:
+        dict: calories, protein, carbs, fat (interi, come la risposta di Gemini) più bmr, tdee, goal e formula.
+
+    Raises:
+        ValueError: se i dati dell'utente non sono validi.
+    """
+    profile = parse_profile(user_data)
+    result = calculate_needs_batch(
+        [profile["age"]], [profile["weight"]], [profile["height"]], [profile["is_male"]],
+        [ACTIVITY_MULTIPLIERS[profile["activity_level"]]], [GOALS.index(profile["goal"])],
+        body_fat=[np.nan if profile["body_fat"] is None else profile["body_fat"]],
+        formula=profile["formula"],
+    )
+    formula = profile["formula"]
+    if formula == FORMULA_AUTO:
+        formula = FORMULA_MIFFLIN_ST_JEOR if profile["body_fat"] is None else FORMULA_KATCH_MCARDLE
+    return {
+        "calories": int(round(result["calories"][0])),
+        "protein": int(round(result["protein"][0])),
+        "carbs": int(round(result["carbs"][0])),
+        "fat": int(round(result["fat"][0])),
+        "bmr": int(round(result["bmr"][0])),
+        "tdee": int(round(result["tdee"][0])),
+        "goal": profile["goal"],
+        "formula": formula,
+    }
+
+
+def describe_needs(needs: dict) -> str:
+    """Nota testuale deterministica, usata quando non si chiedono note all'IA."""
+    return (
+        f"Stima calcolata con la formula {_FORMULA_NAMES[needs['formula']]}: metabolismo basale {needs['bmr']} kcal, "
+        f"dispendio giornaliero {needs['tdee']} kcal. Obiettivo considerato: {_GOAL_DESCRIPTIONS[needs['goal']]}. "
+        "Monitora il peso per qualche settimana e aggiusta le calorie se necessario."
+    )
@@ -0,0 +1,353 @@
+# src/core/recipe_manager.py
+#
+# Piani alimentari: dagli obiettivi giornalieri (calorie, proteine, carboidrati, grassi) alle porzioni
+# di alimenti concreti. Gli alimenti candidati formano una matrice densa dei nutrienti per grammo;
+# per ogni giorno si scelgono gli alimenti con una selezione greedy in cui il punteggio di TUTTI i
+# candidati è calcolato in blocco con NumPy, poi le porzioni vengono ottimizzate insieme (minimi
+# quadrati pesati con limiti minimo/massimo per porzione). Con minimize_cost si cerca, tra i piani
+# entro le tolleranze, quello più economico.
+
+import math
+
+import numpy as np
+
+from src.core.nutritional_calculator import calculate_needs
+
+NUTRIENTS = ("calories", "protein", "carbs", "fat")
+PRODUCT_NUTRIENT_KEYS = ("calories_100g", "protein_100g", "carbs_100g", "fat_100g")
+
+# --- PARAMETRI ---
+DEFAULT_TOLERANCES = {"calories": 0.05, "protein": 0.10, "carbs": 0.10, "fat": 0.10}   # scarto relativo ammesso
+DEFAULT_DAYS = 7
+MAX_DAYS = 31
+DEFAULT_FOODS_PER_DAY = 5
+MAX_FOODS_PER_DAY = 12
+DEFAULT_MIN_PORTION_G = 20.0
+DEFAULT_MAX_PORTION_G = 300.0
+MAX_KCAL_PER_100G = 950.0        # oltre (grassi puri = 900) il dato del prodotto è sicuramente errato
+VARIETY_DECAY = 0.5              # il punteggio di un alimento già usato nel piano si dimezza a ogni uso
+COST_WEIGHTS = (8.0, 4.0, 2.0, 1.0, 0.5, 0.25, 0.0)   # pesi del costo provati dal più alto, finché il piano resta entro le tolleranze
+SOLVER_ITERATIONS = 300
+SOLVER_PRECISION_G = 0.01
+
+
+class FoodMatrix:
+    """
+    Alimenti candidati in forma di array: nutrienti per grammo (n x 4, ordine NUTRIENTS), costo per
+    grammo (NaN se non noto) e limiti di porzione in grammi. I prodotti incompleti sono scartati.
+    """
+
+    def __init__(self, products: list[dict], min_portion_g: float = DEFAULT_MIN_PORTION_G,
+                 max_portion_g: float = DEFAULT_MAX_PORTION_G):
+        kept, rows, costs, lower, upper = [], [], [], [], []
+        for product in products:
+            if not isinstance(product, dict):
+                continue
+            values = [_as_number(product.get(key)) for key in PRODUCT_NUTRIENT_KEYS]
+            if any(value is None or value < 0 for value in values) or values[0] > MAX_KCAL_PER_100G or not any(values):
+                continue
+            minimum = _as_number(product.get("min_g"))
+            maximum = _as_number(product.get("max_g"))
+            minimum = min_portion_g if minimum is None else max(minimum, 0.0)
+            maximum = max_portion_g if maximum is None else maximum
+            if maximum <= 0 or maximum < minimum:
+                continue
+            price_per_kg = _as_number(product.get("price_per_kg"))
+            kept.append(product)
+            rows.append(values)
+            costs.append(math.nan if price_per_kg is None else price_per_kg / 1000.0)
+            lower.append(minimum)
+            upper.append(maximum)
+        self.products = kept
+        self.excluded = len(products) - len(kept)
+        self.per_gram = np.array(rows, dtype=np.float64).reshape(-1, len(NUTRIENTS)) / 100.0
+        self.cost_per_gram = np.array(costs, dtype=np.float64)
+        self.min_g = np.array(lower, dtype=np.float64)
+        self.max_g = np.array(upper, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def only(self, mask: np.ndarray) -> "FoodMatrix":
+        """Sottoinsieme degli alimenti selezionati da `mask` (gli scartati si sommano a quelli già esclusi)."""
+        subset = FoodMatrix.__new__(FoodMatrix)
+        subset.products = [product for product, keep in zip(self.products, mask.tolist()) if keep]
+        subset.excluded = self.excluded + int((~mask).sum())
+        subset.per_gram = self.per_gram[mask]
+        subset.cost_per_gram = self.cost_per_gram[mask]
+        subset.min_g = self.min_g[mask]
+        subset.max_g = self.max_g[mask]
+        return subset
+
+
+def _as_number(value) -> float | None:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(str(value).replace(",", "."))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+# --- OTTIMIZZAZIONE ---
+
+def fit_portions(per_gram: np.ndarray, targets: np.ndarray, weights: np.ndarray, lower: np.ndarray,
+                 upper: np.ndarray, linear: np.ndarray | None = None, start: np.ndarray | None = None) -> np.ndarray:
+    """
+    Porzioni x (grammi) che minimizzano sum_j weights_j * (sum_i x_i * per_gram_ij - targets_j)^2 + linear . x
+    con lower <= x <= upper (gradiente proiettato accelerato, FISTA: il problema è convesso e piccolo).
+
+    Args:
+        per_gram: matrice k x 4 dei nutrienti per grammo degli alimenti scelti.
+        linear: termine lineare per alimento (il costo pesato), opzionale.
+    """
+    hessian = 2.0 * (per_gram * weights) @ per_gram.T
+    gradient_at_zero = -2.0 * (per_gram * weights) @ targets
+    if linear is not None:
+        gradient_at_zero = gradient_at_zero + linear
+    # Precondizionamento diagonale (z = scale * x): gli alimenti hanno densità molto diverse (olio
+    # contro verdura) e senza scala la discesa sarebbe lentissima; i limiti restano un box.
+    scale = np.sqrt(np.maximum(np.diag(hessian), 1e-12))
+    hessian = hessian / np.outer(scale, scale)
+    gradient_at_zero = gradient_at_zero / scale
+    lower, upper = lower * scale, upper * scale
+    lipschitz = float(np.linalg.eigvalsh(hessian)[-1]) if len(hessian) else 0.0
+    if lipschitz <= 0:
+        return lower / scale
+    step = 1.0 / lipschitz
+    precision = SOLVER_PRECISION_G * scale
+    z = np.clip(lower if start is None else start * scale, lower, upper)
+    y, momentum = z, 1.0
+    for _ in range(SOLVER_ITERATIONS):
+        z_next = np.clip(y - step * (hessian @ y + gradient_at_zero), lower, upper)
+        change = z_next - z
+        if np.all(np.abs(change) < precision):
+            return z_next / scale
+        if (y - z_next) @ change > 0:
+            # Il passo accelerato sta risalendo l'obiettivo: si riparte senza inerzia
+            momentum = 1.0
+        momentum_next = (1.0 + math.sqrt(1.0 + 4.0 * momentum * momentum)) / 2.0
+        y = z_next + ((momentum - 1.0) / momentum_next) * change
+        z, momentum = z_next, momentum_next
+    return z / scale
+
+
+def _choose_foods(foods: FoodMatrix, targets: np.ndarray, weights: np.ndarray, count: int,
+                  cost_scale: np.ndarray | None, uses: np.ndarray) -> tuple[list[int], np.ndarray]:
+    """
+    Selezione greedy di `count` alimenti: a ogni passo, per tutti i candidati insieme, si calcola la
+    porzione singola ottima (limitata a [min_g, max_g]) rispetto a ciò che manca agli obiettivi e di
+    quanto ridurrebbe l'errore pesato (meno il costo, se richiesto); si prende il migliore.
+    """
+    per_gram = foods.per_gram
+    curvature = (per_gram * per_gram) @ weights              # sum_j a_ij^2 w_j, per alimento
+    variety = VARIETY_DECAY ** uses
+    residual = targets.copy()
+    chosen, portions = [], []
+    available = np.ones(len(foods), dtype=bool)
+    for _ in range(count):
+        alignment = per_gram @ (weights * residual)          # sum_j a_ij w_j r_j, per alimento
+        if cost_scale is not None:
+            alignment = alignment - cost_scale / 2.0
+        portion = np.clip(alignment / np.maximum(curvature, 1e-12), foods.min_g, foods.max_g)
+        gain = 2.0 * portion * alignment - portion * portion * curvature
+        gain = np.where(gain > 0, gain * variety, gain)
+        gain[~available] = -np.inf
+        best = int(np.argmax(gain))
+        if gain[best] <= 0:
+            break
+        chosen.append(best)
+        portions.append(portion[best])
+        available[best] = False
+        residual = residual - portion[best] * per_gram[best]
+    return chosen, np.array(portions)
+
+
+def _plan_day(foods: FoodMatrix, targets: np.ndarray, weights: np.ndarray, count: int,
+              cost_scale: np.ndarray | None, uses: np.ndarray) -> tuple[list[int], np.ndarray]:
+    chosen, portions = _choose_foods(foods, targets, weights, count, cost_scale, uses)
+    if not chosen:
+        return chosen, portions
+    linear = None if cost_scale is None else cost_scale[chosen]
+    grams = fit_portions(foods.per_gram[chosen], targets, weights, foods.min_g[chosen], foods.max_g[chosen],
+                         linear=linear, start=portions)
+    return chosen, np.round(grams)
+
+
+def _deviation(totals: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    return (totals - targets) / targets
+
+
+def plan_meals(products: list[dict], targets: dict, days: int = DEFAULT_DAYS,
+               foods_per_day: int = DEFAULT_FOODS_PER_DAY, tolerances: dict | None = None,
+               min_portion_g: float = DEFAULT_MIN_PORTION_G, max_portion_g: float = DEFAULT_MAX_PORTION_G,
+               minimize_cost: bool = False) -> dict:
+    """
+    Crea un piano di `days` giorni con `foods_per_day` alimenti al giorno scelti tra `products`.
+
+    Args:
+        products: prodotti nella forma del client OpenFoodFacts (calories_100g, protein_100g, carbs_100g,
+                  fat_100g), con opzionali price_per_kg, min_g e max_g.
+        targets: obiettivi giornalieri {"calories", "protein", "carbs", "fat"} (kcal e grammi).
+        tolerances: scarto relativo ammesso per nutriente (default DEFAULT_TOLERANCES).
+        minimize_cost: tra i piani entro le tolleranze preferisce il più economico; si usano solo
+                       i prodotti con price_per_kg.
+
+    Returns:
+        dict: giorni con alimenti, grammi, totali e scarti, più un riepilogo (pronto per jsonify).
+
+    Raises:
+        ValueError: se non ci sono alimenti utilizzabili.
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    target_vector = np.array([float(targets[name]) for name in NUTRIENTS])
+    tolerance_vector = np.array([float(tolerances[name]) for name in NUTRIENTS])
+    # Errore normalizzato: 1 per nutriente significa esattamente al limite della tolleranza
+    weights = 1.0 / (tolerance_vector * target_vector) ** 2
+
+    foods = FoodMatrix(products, min_portion_g, max_portion_g)
+    if minimize_cost:
+        foods = foods.only(~np.isnan(foods.cost_per_gram))
+    if not len(foods):
+        raise ValueError("Nessun alimento utilizzabile: servono calorie, proteine, carboidrati e grassi per 100 g"
+                         + (" e il prezzo al kg (price_per_kg)" if minimize_cost else ""))
+
+    cost_weights = (0.0,)
+    cost_per_unit = None
+    if minimize_cost:
+        # Costo "tipico" della giornata: quanto costerebbero le calorie obiettivo con un alimento di prezzo mediano
+        kcal_per_gram = foods.per_gram[:, 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            typical = np.nanmedian(np.where(kcal_per_gram > 0, foods.cost_per_gram / kcal_per_gram, np.nan))
+        typical_day_cost = float(typical) * target_vector[0] if np.isfinite(typical) and typical > 0 else 1.0
+        cost_per_unit = foods.cost_per_gram / typical_day_cost
+        cost_weights = COST_WEIGHTS
+
+    uses = np.zeros(len(foods))
+    no_uses = np.zeros(len(foods))
+    plan_days = []
+    for day in range(days):
+        # Prima la varietà e il costo, poi si rinuncia a entrambi pur di restare entro le tolleranze;
+        # se nessun tentativo ci riesce si tiene quello con lo scarto peggiore più piccolo.
+        best = None
+        for variety_uses in (uses, no_uses):
+            for cost_weight in cost_weights:
+                cost_scale = cost_per_unit * cost_weight if cost_weight else None
+                chosen, grams = _plan_day(foods, target_vector, weights, foods_per_day, cost_scale, variety_uses)
+                totals = grams @ foods.per_gram[chosen] if chosen else np.zeros(len(NUTRIENTS))
+                worst = float(np.max(np.abs(_deviation(totals, target_vector)) / tolerance_vector))
+                if best is None or worst < best[0]:
+                    best = (worst, chosen, grams, totals)
+                if worst <= 1.0 + 1e-9:
+                    break
+            if best[0] <= 1.0 + 1e-9:
+                break
+        worst, chosen, grams, totals = best
+        uses[chosen] += 1
+        plan_days.append(_day_summary(day + 1, foods, chosen, grams, totals, target_vector, worst <= 1.0 + 1e-9,
+                                      minimize_cost))
+
+    total_cost = sum(day["cost"] for day in plan_days) if minimize_cost else None
+    return {
+        "targets": {name: round(float(value), 1) for name, value in zip(NUTRIENTS, target_vector)},
+        "tolerances": {name: float(value) for name, value in zip(NUTRIENTS, tolerance_vector)},
+        "days": plan_days,
+        "within_tolerance": all(day["within_tolerance"] for day in plan_days),
+        "total_cost": None if total_cost is None else round(total_cost, 2),
+        "candidates": len(foods),
+        "excluded": foods.excluded,
+    }
+
+
+def _day_summary(day: int, foods: FoodMatrix, chosen: list[int], grams: np.ndarray, totals: np.ndarray,
+                 targets: np.ndarray, within: bool, with_cost: bool) -> dict:
+    items = []
+    for index, portion in zip(chosen, grams.tolist()):
+        if portion <= 0:
+            continue
+        product = foods.products[index]
+        nutrients = foods.per_gram[index] * portion
+        item = {"name": product.get("name"), "brands": product.get("brands"), "barcode": product.get("barcode"),
+                "grams": int(portion)}
+        item.update({name: round(float(value), 1) for name, value in zip(NUTRIENTS, nutrients)})
+        if with_cost:
+            item["cost"] = round(float(foods.cost_per_gram[index] * portion), 2)
+        items.append(item)
+    cost = float(foods.cost_per_gram[chosen] @ grams) if with_cost and chosen else 0.0
+    return {
+        "day": day,
+        "items": items,
+        "totals": {name: round(float(value), 1) for name, value in zip(NUTRIENTS, totals)},
+        "deviation": {name: round(float(value), 3) for name, value in zip(NUTRIENTS, _deviation(totals, targets))},
+        "within_tolerance": within,
+        "cost": round(cost, 2) if with_cost else None,
+    }
+
+
+# --- RICHIESTA DELL'API ---
+
+def _parse_bounded(data: dict, key: str, label: str, default, minimum, maximum, cast=float):
+    value = data.get(key)
+    if value in (None, ""):
+        return default
+    number = _as_number(value)
+    if number is None or not minimum <= number <= maximum or (cast is int and number != int(number)):
+        raise ValueError(f"Valore non valido per {label} ({minimum}-{maximum}): {value!r}")
+    return cast(number)
+
+
+def _parse_flag(data: dict, key: str, label: str, default: bool) -> bool:
+    value = data.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise ValueError(f"Valore non valido per {label} (true o false): {value!r}")
+
+
+def parse_meal_plan_request(data: dict) -> dict:
+    """
+    Valida la richiesta di /api/meal_plan e restituisce gli argomenti di plan_meals (senza i prodotti).
+
+    Gli obiettivi arrivano da "targets" ({"calories", "protein", "carbs", "fat"}) oppure sono calcolati
+    da "profile" (gli stessi dati di /api/calculate_needs).
+
+    Raises:
+        ValueError: con un messaggio leggibile se un campo manca o non è valido.
+    """
+    if isinstance(data.get("targets"), dict):
+        targets = {name: _parse_bounded(data["targets"], name, name, None, 1, 20000) for name in NUTRIENTS}
+        missing = [name for name, value in targets.items() if value is None]
+        if missing:
+            raise ValueError(f"Obiettivi mancanti: {', '.join(missing)}")
+    elif isinstance(data.get("profile"), dict):
+        needs = calculate_needs(data["profile"])
+        targets = {name: needs[name] for name in NUTRIENTS}
+    else:
+        raise ValueError("Servono gli obiettivi ('targets') oppure i dati del profilo ('profile')")
+
+    tolerance = data.get("tolerance")
+    if isinstance(tolerance, dict):
+        tolerances = {name: _parse_bounded(tolerance, name, f"tolleranza {name}", DEFAULT_TOLERANCES[name], 0.001, 1)
+                      for name in NUTRIENTS}
+    else:
+        common = _parse_bounded(data, "tolerance", "tolleranza", None, 0.001, 1)
+        tolerances = {name: common for name in NUTRIENTS} if common is not None else dict(DEFAULT_TOLERANCES)
+
+    min_portion = _parse_bounded(data, "min_portion_g", "porzione minima (g)", DEFAULT_MIN_PORTION_G, 0, 2000)
+    max_portion = _parse_bounded(data, "max_portion_g", "porzione massima (g)", DEFAULT_MAX_PORTION_G, 1, 2000)
+    if max_portion < min_portion:
+        raise ValueError("La porzione massima non può essere minore di quella minima")
+    return {
+        "targets": targets,
+        "days": _parse_bounded(data, "days", "giorni", DEFAULT_DAYS, 1, MAX_DAYS, cast=int),
+        "foods_per_day": _parse_bounded(data, "foods_per_day", "alimenti al giorno", DEFAULT_FOODS_PER_DAY,
+                                        1, MAX_FOODS_PER_DAY, cast=int),
+        "tolerances": tolerances,
+        "min_portion_g": min_portion,
+        "max_portion_g": max_portion,
+        "minimize_cost": _parse_flag(data, "minimize_cost", "minimize_cost", False),
+    }
@@ -0,0 +1,506 @@
+# src/core/user_profile.py
+#
+# Profili utente e diario alimentare su SQLite (WAL). Ogni voce del diario aggiorna, nella stessa
+# transazione, i totali del giorno (daily_totals) e della settimana (weekly_totals): "quanto resta
+# per oggi" legge una riga per chiave primaria e l'andamento settimanale una riga per settimana,
+# qualunque sia la lunghezza dello storico, senza risommare il diario.
+#
+# I profili (dati del form e obiettivi calcolati) stanno in una cache LRU in memoria. Le modifiche
+# sono scritte su disco in differita (write-behind) da un thread, tutte in una transazione, ogni
+# PROFILE_FLUSH_INTERVAL secondi e alla chiusura; con intervallo 0 la scrittura è immediata.
+#
+# Più worker (processi) possono usare lo stesso file: le scritture partono con BEGIN IMMEDIATE e
+# attendono il lock fino a USER_DB_BUSY_TIMEOUT secondi, così gli incrementi dei totali non si
+# perdono. Un profilo modificato da un altro worker è visto qui entro PROFILE_CACHE_TTL secondi.
+#
+# Ogni utente ha un token di accesso, creato al primo salvataggio del profilo e restituito solo allora
+# (nel database resta l'hash). L'archivio condiviso richiede USER_DB_PATH: la cartella temporanea non
+# è un default accettabile, perché sulle piattaforme serverless (es. Vercel) viene svuotata.
+
+import atexit
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from src.core.nutritional_calculator import calculate_needs
+from src.core.recipe_manager import NUTRIENTS, PRODUCT_NUTRIENT_KEYS
+from src.integrations.telemetry import get_logger
+
+log = get_logger("profiles")
+
+# --- CONFIGURAZIONE ---
+USER_DB_PATH = os.getenv('USER_DB_PATH', '')     # file SQLite su un disco persistente (obbligatorio)
+USER_DB_BUSY_TIMEOUT = float(os.getenv('USER_DB_BUSY_TIMEOUT', '10'))
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', '10000'))
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', '30'))            # secondi
+PROFILE_FLUSH_INTERVAL = float(os.getenv('PROFILE_FLUSH_INTERVAL', '1.0'))  # secondi, 0 = scrittura immediata
+DEFAULT_TREND_WEEKS = 4
+MAX_TREND_WEEKS = 52
+MAX_PORTION_G = 5000.0
+MAX_ITEM_CALORIES = 10000.0
+MAX_NAME_LENGTH = 200
+MAX_BARCODE_LENGTH = 64
+
+_USER_ID_RE = re.compile(r"[A-Za-z0-9_.@-]{1,64}")
+_TOTAL_COLUMNS = ", ".join(NUTRIENTS)
+
+
+# --- VOCI DEL DIARIO ---
+
+def _number(value, label: str, maximum: float) -> float:
+    try:
+        number = float(str(value).replace(",", "."))
+    except (TypeError, ValueError):
+        raise ValueError(f"Valore non valido per {label}: {value!r}")
+    if not 0 <= number <= maximum:
+        raise ValueError(f"{label} fuori intervallo (0-{maximum:g}): {value!r}")
+    return number
+
+
+def portion_nutrients(item: dict) -> dict:
+    """
+    Nutrienti (NUTRIENTS) di una voce del diario: valori assoluti ("calories", "protein", ...) oppure,
+    come i prodotti di /api/search_food, valori per 100 g ("calories_100g", ...) con i grammi in "grams".
+
+    Raises:
+        ValueError: se la voce non ha calorie o un valore non è valido.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("La voce del diario deve essere un oggetto JSON")
+    if item.get("calories") not in (None, ""):
+        return {nutrient: _number(item.get(nutrient) or 0, nutrient, MAX_ITEM_CALORIES) for nutrient in NUTRIENTS}
+    if item.get(PRODUCT_NUTRIENT_KEYS[0]) in (None, ""):
+        raise ValueError("La voce del diario deve indicare le calorie ('calories' o 'calories_100g' con 'grams')")
+    grams = _number(item.get("grams"), "grammi", MAX_PORTION_G)
+    return {nutrient: _number(item.get(key) or 0, key, MAX_ITEM_CALORIES) * grams / 100.0
+            for nutrient, key in zip(NUTRIENTS, PRODUCT_NUTRIENT_KEYS)}
+
+
+def _optional_text(value, label: str, max_length: int) -> str | None:
+    """Testo facoltativo di una voce del diario: stringa (al più `max_length` caratteri) o None."""
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"Valore non valido per {label}: deve essere un testo")
+    if len(value) > max_length:
+        raise ValueError(f"{label} troppo lungo (massimo {max_length} caratteri)")
+    return value
+
+
+def parse_day(day: str | None = None) -> str:
+    """Giorno ISO (YYYY-MM-DD) validato; None è oggi (ora locale)."""
+    if day is None:
+        return time.strftime("%Y-%m-%d")
+    try:
+        return datetime.date.fromisoformat(str(day)).isoformat()
+    except ValueError:
+        raise ValueError(f"Data non valida (atteso YYYY-MM-DD): {day!r}")
+
+
+def week_start(day: str) -> str:
+    """Lunedì della settimana ISO che contiene `day`: la chiave di weekly_totals."""
+    date = datetime.date.fromisoformat(day)
+    return (date - datetime.timedelta(days=date.weekday())).isoformat()
+
+
+def _check_user_id(user_id: str) -> str:
+    if not isinstance(user_id, str) or not _USER_ID_RE.fullmatch(user_id):
+        raise ValueError(f"Identificativo utente non valido: {user_id!r}")
+    return user_id
+
+
+def _totals(row) -> dict:
+    return {nutrient: round(value, 1) for nutrient, value in zip(NUTRIENTS, row)}
+
+
+def _token_hash(token: str) -> str:
+    # il token è casuale a 256 bit: basta un hash veloce, senza sale
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class ProfileStoreNotConfigured(RuntimeError):
+    """USER_DB_PATH non è impostato: l'archivio condiviso dei profili non è disponibile."""
+
+
+# --- ARCHIVIO ---
+
+class ProfileStore:
+    """Profili con cache write-behind e diario alimentare con totali giornalieri e settimanali incrementali."""
+
+    def __init__(self, db_path: str, cache_size: int = PROFILE_CACHE_SIZE,
+                 cache_ttl: float = PROFILE_CACHE_TTL, flush_interval: float = PROFILE_FLUSH_INTERVAL):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()            # connessione SQLite
+        self._cache_lock = threading.Lock()      # cache dei profili e modifiche da scrivere
+        self._cache = OrderedDict()              # user_id -> (profilo, istante di caricamento)
+        self._dirty = {}                         # user_id -> profilo non ancora scritto su disco
+        self._flusher = None
+        self._closed = threading.Event()
+        self._counters = {"logged": 0, "deleted": 0, "cache_hits": 0, "cache_misses": 0, "flushes": 0,
+                          "flushed_profiles": 0, "flush_errors": 0}
+        # isolation_level=None: le transazioni sono aperte esplicitamente con BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=USER_DB_BUSY_TIMEOUT,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                " user_id TEXT PRIMARY KEY,"
+                " data TEXT NOT NULL,"
+                " targets TEXT,"
+                " updated_at REAL NOT NULL) WITHOUT ROWID")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS food_log ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user_id TEXT NOT NULL,"
+                " day TEXT NOT NULL,"
+                " logged_at REAL NOT NULL,"
+                " name TEXT,"
+                " barcode TEXT,"
+                " grams REAL,"
+                " calories REAL NOT NULL, protein REAL NOT NULL, carbs REAL NOT NULL, fat REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_food_log_user_day ON food_log (user_id, day)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS daily_totals ("
+                " user_id TEXT NOT NULL,"
+                " day TEXT NOT NULL,"
+                " calories REAL NOT NULL, protein REAL NOT NULL, carbs REAL NOT NULL, fat REAL NOT NULL,"
+                " items INTEGER NOT NULL,"
+                " PRIMARY KEY (user_id, day)) WITHOUT ROWID")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS weekly_totals ("
+                " user_id TEXT NOT NULL,"
+                " week TEXT NOT NULL,"
+                " calories REAL NOT NULL, protein REAL NOT NULL, carbs REAL NOT NULL, fat REAL NOT NULL,"
+                " items INTEGER NOT NULL,"
+                " days INTEGER NOT NULL,"
+                " PRIMARY KEY (user_id, week)) WITHOUT ROWID")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS profile_tokens ("
+                " user_id TEXT PRIMARY KEY,"
+                " token_hash TEXT NOT NULL,"
+                " created_at REAL NOT NULL) WITHOUT ROWID")
+
+    @contextmanager
+    def _transaction(self):
+        """Transazione di scrittura: BEGIN IMMEDIATE prende subito il lock del file (attende gli altri worker)."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        """Ferma il thread di scrittura, scrive i profili in sospeso e chiude il database."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    # --- Token di accesso ---
+
+    def issue_token(self, user_id: str) -> str | None:
+        """
+        Crea il token di accesso dell'utente se non ne ha ancora uno (anche tra più worker ne vince uno solo).
+        Il token è restituito solo qui; None se l'utente ne ha già uno.
+        """
+        _check_user_id(user_id)
+        token = secrets.token_urlsafe(32)
+        with self._transaction() as conn:
+            created = conn.execute("INSERT OR IGNORE INTO profile_tokens VALUES (?, ?, ?)",
+                                   (user_id, _token_hash(token), time.time())).rowcount
+        return token if created else None
+
+    def check_token(self, user_id: str, token: str | None) -> bool:
+        """True se `token` è il token di accesso dell'utente (confronto a tempo costante)."""
+        _check_user_id(user_id)
+        if not token:
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT token_hash FROM profile_tokens WHERE user_id = ?", (user_id,)).fetchone()
+        return row is not None and hmac.compare_digest(row[0], _token_hash(token))
+
+    # --- Profili (cache write-behind) ---
+
+    def save_profile(self, user_id: str, data: dict, targets: dict | None = None) -> dict:
+        """
+        Salva i dati del form di un utente. Senza `targets` gli obiettivi giornalieri sono calcolati con
+        calculate_needs. Il profilo è subito visibile da questo processo; su disco arriva al prossimo flush.
+
+        Raises:
+            ValueError: se l'utente o i dati non sono validi.
+        """
+        _check_user_id(user_id)
+        if not isinstance(data, dict):
+            raise ValueError("I dati del profilo devono essere un oggetto JSON")
+        profile = {"user_id": user_id, "data": data, "targets": targets if targets is not None else calculate_needs(data),
+                   "updated_at": time.time()}
+        with self._cache_lock:
+            self._dirty[user_id] = profile
+            self._remember(user_id, profile)
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._start_flusher()
+        return profile
+
+    def get_profile(self, user_id: str) -> dict | None:
+        """Profilo dalla cache (entro cache_ttl) o dal database; None se l'utente non ha un profilo."""
+        _check_user_id(user_id)
+        with self._cache_lock:
+            profile = self._dirty.get(user_id)
+            if profile is not None:
+                self._counters["cache_hits"] += 1
+                return profile
+            cached = self._cache.get(user_id)
+            if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+                self._cache.move_to_end(user_id)
+                self._counters["cache_hits"] += 1
+                return cached[0]
+            self._counters["cache_misses"] += 1
+        with self._lock:
+            row = self._conn.execute("SELECT data, targets, updated_at FROM profiles WHERE user_id = ?",
+                                     (user_id,)).fetchone()
+        if row is None:
+            return None
+        profile = {"user_id": user_id, "data": json.loads(row[0]),
+                   "targets": json.loads(row[1]) if row[1] is not None else None, "updated_at": row[2]}
+        with self._cache_lock:
+            if user_id in self._dirty:      # salvato da questo processo durante la lettura
+                return self._dirty[user_id]
+            self._remember(user_id, profile)
+        return profile
+
+    def _remember(self, user_id: str, profile: dict) -> None:
+        self._cache[user_id] = (profile, time.monotonic())
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            # I profili ancora da scrivere restano in _dirty anche se escono dalla cache
+            self._cache.popitem(last=False)
+
+    def flush(self) -> int:
+        """Scrive su disco i profili modificati, in una sola transazione. Restituisce quanti sono stati scritti."""
+        with self._cache_lock:
+            pending, self._dirty = self._dirty, {}
+        if not pending:
+            return 0
+        rows = [(profile["user_id"], json.dumps(profile["data"], ensure_ascii=False),
+                 json.dumps(profile["targets"], ensure_ascii=False), profile["updated_at"])
+                for profile in pending.values()]
+        try:
+            with self._transaction() as conn:
+                # Vince la modifica più recente anche se un altro worker ha scritto nel frattempo
+                conn.executemany(
+                    "INSERT INTO profiles (user_id, data, targets, updated_at) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, targets = excluded.targets,"
+                    " updated_at = excluded.updated_at WHERE excluded.updated_at >= profiles.updated_at",
+                    rows)
+        except sqlite3.Error as e:
+            log.error("Scrittura dei profili fallita, nuovo tentativo al prossimo flush", profiles=len(rows),
+                      error=str(e))
+            with self._cache_lock:
+                self._counters["flush_errors"] += 1
+                for user_id, profile in pending.items():
+                    self._dirty.setdefault(user_id, profile)
+            return 0
+        with self._cache_lock:
+            self._counters["flushes"] += 1
+            self._counters["flushed_profiles"] += len(rows)
+        return len(rows)
+
+    def _start_flusher(self) -> None:
+        if self._flusher is not None or self._closed.is_set():
+            return
+        with self._cache_lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="profile-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    # --- Diario alimentare ---
+
+    def log_food(self, user_id: str, item: dict, day: str | None = None, logged_at: float | None = None) -> dict:
+        """
+        Registra una voce del diario e aggiorna i totali del giorno e della settimana nella stessa transazione.
+
+        Args:
+            item: nome, barcode opzionale e nutrienti (vedi portion_nutrients).
+            day: giorno della voce (YYYY-MM-DD), default oggi.
+
+        Returns:
+            dict: la voce registrata, con "id", "day" e i nutrienti della porzione.
+
+        Raises:
+            ValueError: se l'utente, il giorno o la voce non sono validi.
+        """
+        _check_user_id(user_id)
+        nutrients = portion_nutrients(item)
+        day = parse_day(day)
+        week = week_start(day)
+        values = [nutrients[nutrient] for nutrient in NUTRIENTS]
+        name = _optional_text(item.get("name"), "nome", MAX_NAME_LENGTH)
+        barcode = _optional_text(item.get("barcode"), "barcode", MAX_BARCODE_LENGTH)
+        grams = _number(item["grams"], "grammi", MAX_PORTION_G) if item.get("grams") not in (None, "") else None
+        logged_at = time.time() if logged_at is None else logged_at
+        with self._transaction() as conn:
+            entry_id = conn.execute(
+                f"INSERT INTO food_log (user_id, day, logged_at, name, barcode, grams, {_TOTAL_COLUMNS})"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, day, logged_at, name, barcode, grams, *values)).lastrowid
+            new_day = conn.execute("INSERT OR IGNORE INTO daily_totals VALUES (?, ?, 0, 0, 0, 0, 0)",
+                                   (user_id, day)).rowcount
+            conn.execute(
+                "UPDATE daily_totals SET calories = calories + ?, protein = protein + ?, carbs = carbs + ?,"
+                " fat = fat + ?, items = items + 1 WHERE user_id = ? AND day = ?",
+                (*values, user_id, day))
+            conn.execute(
+                "INSERT INTO weekly_totals VALUES (?, ?, ?, ?, ?, ?, 1, ?)"
+                " ON CONFLICT (user_id, week) DO UPDATE SET calories = calories + excluded.calories,"
+                " protein = protein + excluded.protein, carbs = carbs + excluded.carbs, fat = fat + excluded.fat,"
+                " items = items + 1, days = days + excluded.days",
+                (user_id, week, *values, new_day))
+        with self._cache_lock:
+            self._counters["logged"] += 1
+        return {"id": entry_id, "user_id": user_id, "day": day, "name": name, "barcode": barcode, "grams": grams,
+                **{nutrient: round(value, 1) for nutrient, value in nutrients.items()}}
+
+    def delete_entry(self, user_id: str, entry_id: int) -> bool:
+        """Elimina una voce del diario togliendola dai totali. False se la voce non esiste (o è di un altro utente)."""
+        _check_user_id(user_id)
+        with self._transaction() as conn:
+            row = conn.execute(f"SELECT day, {_TOTAL_COLUMNS} FROM food_log WHERE id = ? AND user_id = ?",
+                               (entry_id, user_id)).fetchone()
+            if row is None:
+                return False
+            day, values = row[0], row[1:]
+            conn.execute("DELETE FROM food_log WHERE id = ?", (entry_id,))
+            conn.execute(
+                "UPDATE daily_totals SET calories = calories - ?, protein = protein - ?, carbs = carbs - ?,"
+                " fat = fat - ?, items = items - 1 WHERE user_id = ? AND day = ?",
+                (*values, user_id, day))
+            emptied_day = conn.execute("DELETE FROM daily_totals WHERE user_id = ? AND day = ? AND items <= 0",
+                                       (user_id, day)).rowcount
+            conn.execute(
+                "UPDATE weekly_totals SET calories = calories - ?, protein = protein - ?, carbs = carbs - ?,"
+                " fat = fat - ?, items = items - 1, days = days - ? WHERE user_id = ? AND week = ?",
+                (*values, emptied_day, user_id, week_start(day)))
+            conn.execute("DELETE FROM weekly_totals WHERE user_id = ? AND week = ? AND items <= 0",
+                         (user_id, week_start(day)))
+        with self._cache_lock:
+            self._counters["deleted"] += 1
+        return True
+
+    def day_entries(self, user_id: str, day: str | None = None) -> list[dict]:
+        """Voci del diario di un giorno, in ordine di registrazione."""
+        _check_user_id(user_id)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT id, day, logged_at, name, barcode, grams, {_TOTAL_COLUMNS} FROM food_log"
+                " WHERE user_id = ? AND day = ? ORDER BY id", (user_id, parse_day(day)))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    # --- Interrogazioni sui totali (una lettura per chiave, indipendente dallo storico) ---
+
+    def remaining_today(self, user_id: str, day: str | None = None) -> dict:
+        """
+        Consumato e residuo del giorno rispetto agli obiettivi del profilo ("remaining" negativo = obiettivo
+        superato). Senza profilo "targets" e "remaining" sono None.
+        """
+        day = parse_day(day)
+        profile = self.get_profile(user_id)
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_TOTAL_COLUMNS}, items FROM daily_totals WHERE user_id = ? AND day = ?",
+                                     (user_id, day)).fetchone()
+        consumed = _totals(row[:-1]) if row is not None else dict.fromkeys(NUTRIENTS, 0.0)
+        targets = profile["targets"] if profile is not None else None
+        remaining = None
+        if targets is not None:
+            remaining = {nutrient: round(targets[nutrient] - consumed[nutrient], 1) for nutrient in NUTRIENTS}
+        return {"user_id": user_id, "day": day, "items": row[-1] if row is not None else 0, "consumed": consumed,
+                "targets": {nutrient: targets[nutrient] for nutrient in NUTRIENTS} if targets is not None else None,
+                "remaining": remaining}
+
+    def weekly_trend(self, user_id: str, weeks: int = DEFAULT_TREND_WEEKS, day: str | None = None) -> list[dict]:
+        """
+        Ultime `weeks` settimane (fino a quella di `day`, default oggi), dalla più vecchia: totali, giorni con
+        almeno una voce e media giornaliera su quei giorni. Le settimane senza voci hanno totali a zero.
+        """
+        _check_user_id(user_id)
+        weeks = max(1, min(int(weeks), MAX_TREND_WEEKS))
+        last = datetime.date.fromisoformat(week_start(parse_day(day)))
+        keys = [(last - datetime.timedelta(weeks=offset)).isoformat() for offset in range(weeks - 1, -1, -1)]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT week, {_TOTAL_COLUMNS}, items, days FROM weekly_totals"
+                " WHERE user_id = ? AND week >= ? AND week <= ?", (user_id, keys[0], keys[-1])).fetchall()
+        found = {row[0]: row[1:] for row in rows}
+        trend = []
+        for key in keys:
+            row = found.get(key)
+            totals = _totals(row[:len(NUTRIENTS)]) if row is not None else dict.fromkeys(NUTRIENTS, 0.0)
+            days = row[-1] if row is not None else 0
+            trend.append({"week": key, "items": row[-2] if row is not None else 0, "days_logged": days,
+                          "totals": totals,
+                          "daily_average": {nutrient: round(value / days, 1) if days else 0.0
+                                            for nutrient, value in totals.items()}})
+        return trend
+
+    def stats(self) -> dict:
+        with self._cache_lock:
+            return {"cached_profiles": len(self._cache), "pending_profiles": len(self._dirty), **self._counters}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    """
+    Archivio condiviso, creato al primo utilizzo su USER_DB_PATH; i profili in sospeso sono scritti all'uscita.
+
+    Raises:
+        ProfileStoreNotConfigured: se USER_DB_PATH non è impostato.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if not USER_DB_PATH:
+                    raise ProfileStoreNotConfigured(
+                        "USER_DB_PATH non impostato: indicare un file SQLite su un disco persistente")
+                _store = ProfileStore(USER_DB_PATH)
+                atexit.register(_store.close)
+    return _store
+
+
+def set_profile_store(store: ProfileStore | None) -> None:
+    """Sostituisce l'archivio condiviso (None lo ricrea al prossimo utilizzo). Il precedente non viene chiuso."""
+    global _store
+    with _store_lock:
+        _store = store
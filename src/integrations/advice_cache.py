@@ -0,0 +1,123 @@
+# src/integrations/advice_cache.py
+
+import math
+import re
+import threading
+import unicodedata
+from typing import Callable
+
+from src.integrations.local_cache import LocalCache, SingleFlight, STATE_MISS
+
+# Ampiezza dei "secchi" usati per rendere equivalenti profili quasi identici
+AGE_BUCKET_YEARS = 2
+WEIGHT_BUCKET_KG = 2
+HEIGHT_BUCKET_CM = 2
+BODY_FAT_BUCKET_PERCENT = 2
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def _normalize_text(text) -> str:
+    decomposed = unicodedata.normalize("NFKD", str(text or "").lower())
+    folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(_NON_WORD_RE.sub(" ", folded).split())
+
+
+def _bucket(value, width: float) -> str:
+    try:
+        number = float(str(value).replace(",", "."))
+    except (TypeError, ValueError):
+        return _normalize_text(value) or "nd"
+    if not math.isfinite(number):
+        # "nan", "inf", 1e999: non hanno un intervallo, si usa il testo come per i valori non numerici
+        return _normalize_text(value) or "nd"
+    return str(int(number // width * width))
+
+
+def canonical_profile_key(user_data: dict) -> str:
+    """
+    Chiave canonica di un profilo: valori numerici raggruppati in intervalli, testo libero normalizzato.
+
+    Profili che differiscono solo per pochi decimali, maiuscole, accenti o punteggiatura
+    producono la stessa chiave e quindi condividono la risposta del modello.
+    """
+    parts = [
+        f"age={_bucket(user_data.get('age'), AGE_BUCKET_YEARS)}",
+        f"weight={_bucket(user_data.get('weight'), WEIGHT_BUCKET_KG)}",
+        f"height={_bucket(user_data.get('height'), HEIGHT_BUCKET_CM)}",
+        f"gender={_normalize_text(user_data.get('gender'))}",
+        f"activity={_normalize_text(user_data.get('activity_level'))}",
+        f"objectives={_normalize_text(user_data.get('objectives'))}",
+        f"profession={_normalize_text(user_data.get('profession'))}",
+    ]
+    if user_data.get("body_fat") not in (None, ""):
+        parts.append(f"body_fat={_bucket(user_data.get('body_fat'), BODY_FAT_BUCKET_PERCENT)}")
+    return "|".join(parts)
+
+
+class AdviceCache:
+    """
+    Cache delle risposte del modello per profilo canonico, con deduplica delle richieste in corso.
+
+    Le risposte di errore (dict con chiave "error") non vengono mai memorizzate.
+    """
+
+    def __init__(self, db_path: str | None = None, max_items: int = 512, ttl: float = 24 * 3600):
+        self.ttl = ttl
+        self._cache = LocalCache(db_path=db_path, max_memory_items=max_items)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._model_calls = 0
+
+    def get_or_generate(self, namespace: str, user_data: dict, generate: Callable[[], dict]) -> dict:
+        """
+        Restituisce la risposta in cache per il profilo o la genera con `generate`.
+
+        Se più richieste identiche arrivano insieme, `generate` viene eseguita una sola volta.
+        """
+        key = canonical_profile_key(user_data)
+        lookup = self._cache.get(namespace, key)
+        if lookup.state != STATE_MISS:
+            return dict(lookup.value)
+
+        def generate_and_store() -> dict:
+            with self._lock:
+                self._model_calls += 1
+            result = generate()
+            if isinstance(result, dict) and "error" not in result:
+                self._cache.set(namespace, key, result, ttl=self.ttl)
+            return result
+
+        return dict(self._flight.do(f"{namespace}|{key}", generate_and_store))
+
+    def get(self, namespace: str, user_data: dict) -> dict | None:
+        """Restituisce la risposta in cache per il profilo, senza generarla (None se assente)."""
+        lookup = self._cache.get(namespace, canonical_profile_key(user_data))
+        return None if lookup.state == STATE_MISS else dict(lookup.value)
+
+    def store(self, namespace: str, user_data: dict, value: dict) -> None:
+        """Memorizza una risposta prodotta fuori da get_or_generate (es. assemblata da uno stream)."""
+        with self._lock:
+            self._model_calls += 1
+        self._cache.set(namespace, canonical_profile_key(user_data), value, ttl=self.ttl)
+
+    def stats(self) -> dict:
+        """Hit rate della cache e numero di chiamate al modello risparmiate (hit + richieste accorpate)."""
+        cache_stats = self._cache.stats()
+        flight_stats = self._flight.stats()
+        with self._lock:
+            model_calls = self._model_calls
+        return {
+            "hits": cache_stats["hits"],
+            "misses": cache_stats["misses"],
+            "hit_ratio": cache_stats["hit_ratio"],
+            "memory_items": cache_stats["memory_items"],
+            "disk_enabled": cache_stats["disk_enabled"],
+            "coalesced": flight_stats["coalesced"],
+            "in_flight": flight_stats["in_flight"],
+            "model_calls": model_calls,
+            "saved_calls": cache_stats["hits"] + flight_stats["coalesced"],
+        }
+
+    def clear(self) -> None:
+        self._cache.clear()
@@ -0,0 +1,188 @@
+# src/integrations/autocomplete_index.py
+
+import heapq
+import os
+import re
+import threading
+from bisect import bisect_left
+
+from src.integrations.local_data import DATA_DIR, iter_data_products
+from src.integrations.offline_index import fold_text
+from src.integrations.telemetry import get_logger
+
+log = get_logger("autocomplete")
+
+# --- CONFIGURAZIONE ---
+AUTOCOMPLETE_MAX_ENTRIES = int(os.getenv('AUTOCOMPLETE_MAX_ENTRIES', '20000'))   # prodotti distinti tenuti in memoria
+AUTOCOMPLETE_DATA_DIR = os.getenv('AUTOCOMPLETE_DATA_DIR', DATA_DIR)
+AUTOCOMPLETE_MAX_SCAN = 20000          # chiavi esaminate al massimo per un prefisso molto corto
+AUTOCOMPLETE_SUFFIX_WORDS = 3          # oltre al nome intero si indicizzano le parole successive alla prima ("greco" -> "Yogurt greco")
+EVICTION_RATIO = 0.1                   # quota di voci meno popolari rimosse quando si supera il limite
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str | None) -> str:
+    """Testo confrontabile: minuscolo, senza accenti e punteggiatura, spazi singoli."""
+    return " ".join(_WORD_RE.findall(fold_text(text or "")))
+
+
+class AutocompleteIndex:
+    """
+    Indice dei prefissi per l'autocompletamento: un array ordinato di chiavi normalizzate
+    interrogato con ricerca binaria, più la popolarità di ogni prodotto per l'ordinamento.
+
+    Ogni prodotto distinto (nome + marca) ha più chiavi: il nome, "marca nome" e le ultime parole
+    del nome, così "greco" e "fage" trovano anche "Yogurt greco" di Fage. Superato `max_entries`
+    vengono rimossi i prodotti meno popolari (e, a parità, quelli visti meno di recente).
+    """
+
+    def __init__(self, max_entries: int = AUTOCOMPLETE_MAX_ENTRIES, max_scan: int = AUTOCOMPLETE_MAX_SCAN):
+        self.max_entries = max_entries
+        self.max_scan = max_scan
+        self._lock = threading.Lock()
+        self._keys: list[str] = []          # chiavi ordinate
+        self._key_ids: list[int] = []       # id del prodotto per ogni chiave (stessa posizione)
+        self._entries: dict[int, list] = {} # id -> [nome, marca, barcode, popolarità, ultimo_accesso]
+        self._ids: dict[tuple[str, str], int] = {}
+        self._next_id = 0
+        self._tick = 0
+        self._evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add_product(self, name: str | None, brand: str | None = None, barcode: str | None = None,
+                    weight: int = 1) -> None:
+        """Registra un prodotto visto (o ne aumenta la popolarità di `weight` se è già presente)."""
+        with self._lock:
+            self._add(name, brand, barcode, weight)
+            if len(self._entries) > self.max_entries:
+                self._evict()
+
+    def add_products(self, products: list[dict], weight: int = 1) -> None:
+        """Registra i prodotti restituiti dal client OpenFoodFacts (chiavi "name", "brands", "barcode")."""
+        with self._lock:
+            for product in products:
+                self._add(product.get("name"), product.get("brands"), product.get("barcode"), weight)
+            if len(self._entries) > self.max_entries:
+                self._evict()
+
+    def _add(self, name, brand, barcode, weight) -> None:
+        normalized_name = normalize(name)
+        if not normalized_name:
+            return
+        brand = (brand or "").split(",")[0].strip()
+        normalized_brand = normalize(brand)
+        self._tick += 1
+        identity = (normalized_name, normalized_brand)
+        entry_id = self._ids.get(identity)
+        if entry_id is not None:
+            entry = self._entries[entry_id]
+            entry[3] += weight
+            entry[4] = self._tick
+            if barcode and not entry[2]:
+                entry[2] = str(barcode)
+            return
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._ids[identity] = entry_id
+        self._entries[entry_id] = [str(name).strip(), brand or None, str(barcode) if barcode else None, weight, self._tick]
+        for key in self._keys_for(normalized_name, normalized_brand):
+            position = bisect_left(self._keys, key)
+            self._keys.insert(position, key)
+            self._key_ids.insert(position, entry_id)
+
+    @staticmethod
+    def _keys_for(normalized_name: str, normalized_brand: str) -> set[str]:
+        keys = {normalized_name}
+        if normalized_brand:
+            keys.add(f"{normalized_brand} {normalized_name}")
+        words = normalized_name.split(" ")
+        for start in range(1, min(len(words), AUTOCOMPLETE_SUFFIX_WORDS + 1)):
+            keys.add(" ".join(words[start:]))
+        return keys
+
+    def _evict(self) -> None:
+        target = int(self.max_entries * (1 - EVICTION_RATIO))
+        evicted = heapq.nsmallest(len(self._entries) - target, self._entries,
+                                  key=lambda entry_id: (self._entries[entry_id][3], self._entries[entry_id][4]))
+        for entry_id in evicted:
+            name, brand = self._entries.pop(entry_id)[:2]
+            self._ids.pop((normalize(name), normalize(brand)), None)
+        kept = [(key, entry_id) for key, entry_id in zip(self._keys, self._key_ids) if entry_id in self._entries]
+        self._keys = [key for key, _ in kept]
+        self._key_ids = [entry_id for _, entry_id in kept]
+        self._evictions += len(evicted)
+
+    def suggest(self, prefix: str, limit: int = 8) -> list[dict]:
+        """
+        Prodotti i cui nomi (o "marca nome", o parole del nome) iniziano con `prefix`, i più popolari per primi.
+
+        Returns:
+            list[dict]: al massimo `limit` elementi {"name", "brand", "barcode", "popularity"}.
+        """
+        normalized_prefix = normalize(prefix)
+        if not normalized_prefix or limit <= 0:
+            return []
+        with self._lock:
+            start = bisect_left(self._keys, normalized_prefix)
+            end = bisect_left(self._keys, normalized_prefix + "\uffff", lo=start)
+            candidates = set(self._key_ids[start:min(end, start + self.max_scan)])
+            best = heapq.nlargest(limit, candidates,
+                                  key=lambda entry_id: (self._entries[entry_id][3], self._entries[entry_id][4]))
+            return [
+                {"name": name, "brand": brand, "barcode": barcode, "popularity": popularity}
+                for name, brand, barcode, popularity, _ in (self._entries[entry_id] for entry_id in best)
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "keys": len(self._keys),
+                    "max_entries": self.max_entries, "evictions": self._evictions}
+
+
+# --- CARICAMENTO DEI FILE IN data/ ---
+
+def load_data_dir(index: AutocompleteIndex, directory: str = AUTOCOMPLETE_DATA_DIR) -> int:
+    """
+    Aggiunge all'indice i prodotti dei file JSON/JSONL/CSV/TSV in `directory` (ricorsivamente).
+
+    I file vuoti o non leggibili vengono saltati. Restituisce il numero di prodotti letti.
+    """
+    loaded = 0
+    for product in iter_data_products(directory, context="autocompletamento"):
+        index.add_product(product["name"], product["brands"], product["barcode"])
+        loaded += 1
+    return loaded
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_autocomplete_index() -> AutocompleteIndex:
+    """Indice condiviso, creato al primo utilizzo con i prodotti dei file in AUTOCOMPLETE_DATA_DIR."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = AutocompleteIndex()
+                loaded = load_data_dir(index)
+                if loaded:
+                    log.info("Autocompletamento inizializzato", products=loaded, path=AUTOCOMPLETE_DATA_DIR)
+                _index = index
+    return _index
+
+
+def set_autocomplete_index(index: AutocompleteIndex | None) -> None:
+    """Sostituisce l'indice condiviso (None lo ricrea al prossimo utilizzo)."""
+    global _index
+    with _index_lock:
+        _index = index
+
+
+def record_products(products: list[dict]) -> None:
+    """Listener per openfoodfacts_client.add_product_listener: ogni prodotto visto aumenta la sua popolarità."""
+    get_autocomplete_index().add_products(products)
@@ -0,0 +1,363 @@
+# src/integrations/catalog_enrichment.py
+#
+# Arricchimento in blocco di un catalogo (CSV/TSV/JSON/JSONL, es. prodotti_conad_diet.csv) con i dati
+# nutrizionali di OpenFoodFacts. Il file di ingresso è letto in streaming; le voci sono risolte da un
+# pool limitato di thread (per barcode, oppure per nome con la ricerca OFF) e i risultati sono scritti
+# man mano, nell'ordine del file, in CSV o JSONL.
+#
+# Ogni `checkpoint_every` voci l'uscita viene scritta su disco e un file di checkpoint accanto all'uscita
+# registra quante voci sono fatte e quanti byte di uscita le contengono. Dopo un'interruzione la nuova
+# esecuzione tronca l'uscita all'ultimo checkpoint (eliminando righe scritte a metà), risolve di nuovo
+# le voci già scritte con un errore temporaneo, salta le altre voci già fatte e continua da lì.
+#
+# Le richieste passano dalla cache e dal pianificatore di openfoodfacts_client con priorità batch: il
+# limite di richieste di OFF vale anche qui e le ricerche interattive dello stesso processo passano avanti.
+# Quando il pianificatore rifiuta una richiesta la voce aspetta il gettone successivo invece di fallire.
+
+import csv
+import io
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+
+from src.integrations.data_scraper import MATCH_MIN_OVERLAP
+from src.integrations.local_data import iter_file_records, record_identity
+from src.integrations.offline_index import tokenize
+from src.integrations.openfoodfacts_client import (
+    ERROR_CONNECTION, ERROR_HTTP, ERROR_NOT_FOUND, ERROR_RATE_LIMITED, ERROR_TIMEOUT, OFF_BATCH_CONCURRENCY,
+    lookup_product, retry_after_seconds, search_products
+)
+from src.integrations.telemetry import get_logger
+from src.integrations.upstream_scheduler import PRIORITY_BATCH, priority_scope
+
+log = get_logger("enrichment")
+
+# --- CONFIGURAZIONE ---
+ENRICH_CHECKPOINT_EVERY = int(os.getenv('ENRICH_CHECKPOINT_EVERY', '100'))
+ENRICH_RETRIES = int(os.getenv('ENRICH_RETRIES', '2'))
+ENRICH_RETRY_DELAY = float(os.getenv('ENRICH_RETRY_DELAY', '2.0'))     # secondi, moltiplicati per il tentativo
+ENRICH_RATE_LIMIT_WAIT = float(os.getenv('ENRICH_RATE_LIMIT_WAIT', '600'))   # attesa massima (s) per voce se OFF limita
+ENRICH_SEARCH_PAGE_SIZE = 5
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+RETRY_SUFFIX = ".retry.tmp"
+OUTPUT_FORMATS = ("csv", "jsonl")
+
+# Esito di una voce
+STATUS_FOUND = "found"
+STATUS_NOT_FOUND = "not_found"
+STATUS_ERROR = "error"
+STATUS_SKIPPED = "skipped"        # né barcode né nome
+STATUSES = (STATUS_FOUND, STATUS_NOT_FOUND, STATUS_ERROR, STATUS_SKIPPED)
+
+# Errori temporanei: la voce viene ritentata prima di essere scritta come errore, e di nuovo alla ripresa
+RETRYABLE_ERRORS = (ERROR_RATE_LIMITED, ERROR_TIMEOUT, ERROR_CONNECTION, ERROR_HTTP)
+
+OUTPUT_FIELDS = ("row", "input_barcode", "input_name", "input_brand", "status", "error", "match_source", "barcode",
+                 "name", "brands", "calories_100g", "protein_100g", "carbs_100g", "fat_100g")
+_CSV_HEADER = ",".join(OUTPUT_FIELDS).encode("utf-8") + b"\r\n"
+_PRODUCT_FIELDS = ("barcode", "name", "brands", "calories_100g", "protein_100g", "carbs_100g", "fat_100g")
+
+
+# --- RISOLUZIONE DI UNA VOCE ---
+
+def best_name_match(name: str, brand: str | None, products: list[dict]) -> dict | None:
+    """Il primo prodotto che contiene almeno MATCH_MIN_OVERLAP delle parole di nome e marca (come data_scraper)."""
+    words = set(tokenize(f"{name} {brand or ''}"))
+    if not words:
+        return None
+    for product in products:
+        found = set(tokenize(f"{product.get('name') or ''} {product.get('brands') or ''}"))
+        if len(words & found) >= MATCH_MIN_OVERLAP * len(words):
+            return product
+    return None
+
+
+def _lookup_once(barcode: str | None, name: str | None, brand: str | None) -> tuple[dict | None, str | None, str | None]:
+    """(prodotto, fonte dell'abbinamento, errore) con un solo tentativo: prima il barcode, poi il nome."""
+    error = None
+    if barcode and barcode.isdigit():
+        product, error = lookup_product(barcode)
+        if product is not None:
+            return product, "barcode", None
+        if error != ERROR_NOT_FOUND and not name:
+            return None, None, error
+    if name:
+        products, error = search_products(" ".join(filter(None, (name, brand))), page_size=ENRICH_SEARCH_PAGE_SIZE)
+        if products is None:
+            return None, None, error
+        product = best_name_match(name, brand, products)
+        if product is not None:
+            return product, "name", None
+        return None, None, ERROR_NOT_FOUND
+    return None, None, error or ERROR_NOT_FOUND
+
+
+def resolve_record(row: int, record: dict, retries: int = ENRICH_RETRIES, retry_delay: float = ENRICH_RETRY_DELAY,
+                   rate_limit_wait: float = ENRICH_RATE_LIMIT_WAIT) -> dict:
+    """
+    Riga di uscita (OUTPUT_FIELDS) di un record del file: il prodotto OFF trovato per barcode o per nome,
+    oppure l'esito. Gli errori temporanei (RETRYABLE_ERRORS) sono ritentati `retries` volte; una richiesta
+    rifiutata dal pianificatore aspetta il gettone successivo (fino a `rate_limit_wait` secondi in tutto)
+    senza consumare tentativi.
+    """
+    barcode, name, brand = record_identity(record)
+    result = dict.fromkeys(OUTPUT_FIELDS)
+    result.update(row=row, input_barcode=barcode, input_name=name, input_brand=brand)
+    if not barcode and not name:
+        result["status"] = STATUS_SKIPPED
+        return result
+
+    attempt, rate_limited_for = 0, 0.0
+    with priority_scope(PRIORITY_BATCH):
+        while True:
+            product, match_source, error = _lookup_once(barcode, name, brand)
+            if error == ERROR_RATE_LIMITED and rate_limited_for < rate_limit_wait:
+                # con un nome l'ultima richiesta è sempre la ricerca, altrimenti la lettura per barcode
+                delay = retry_after_seconds("off_search" if name else "off_barcode")
+                time.sleep(delay)
+                rate_limited_for += delay
+                continue
+            if error not in RETRYABLE_ERRORS or attempt == retries:
+                break
+            attempt += 1
+            time.sleep(retry_delay * attempt)
+    if product is not None:
+        result.update({field: product.get(field) for field in _PRODUCT_FIELDS}, status=STATUS_FOUND,
+                      match_source=match_source)
+    else:
+        result.update(status=STATUS_NOT_FOUND if error == ERROR_NOT_FOUND else STATUS_ERROR,
+                      error=None if error == ERROR_NOT_FOUND else error)
+    return result
+
+
+# --- USCITA E CHECKPOINT ---
+
+def checkpoint_path(output_path: str) -> str:
+    return output_path + CHECKPOINT_SUFFIX
+
+
+def read_checkpoint(output_path: str) -> dict | None:
+    try:
+        with open(checkpoint_path(output_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_checkpoint(output_path: str, state: dict) -> None:
+    # Scrittura atomica: un'interruzione lascia il checkpoint precedente, mai uno a metà
+    temporary = checkpoint_path(output_path) + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, checkpoint_path(output_path))
+
+
+def output_format(output_path: str, fmt: str | None = None) -> str:
+    fmt = (fmt or ("csv" if output_path.lower().endswith(".csv") else "jsonl")).lower()
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Formato di uscita non supportato: {fmt!r} (ammessi: {', '.join(OUTPUT_FORMATS)})")
+    return fmt
+
+
+def _format_row(result: dict, fmt: str) -> str:
+    if fmt == "jsonl":
+        return json.dumps(result, ensure_ascii=False) + "\n"
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(["" if result[field] is None else result[field] for field in OUTPUT_FIELDS])
+    return buffer.getvalue()
+
+
+def _read_rows(output_path: str, fmt: str):
+    """Righe già scritte nell'uscita, come dizionari di OUTPUT_FIELDS (dal CSV: None per i campi vuoti)."""
+    with open(output_path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "jsonl":
+            for line in f:
+                yield json.loads(line)
+        else:
+            for values in csv.DictReader(f):
+                yield {field: values[field] or None for field in OUTPUT_FIELDS}
+
+
+def _needs_retry(result: dict) -> bool:
+    return result["status"] == STATUS_ERROR and result["error"] in RETRYABLE_ERRORS
+
+
+def count_records(input_path: str) -> int:
+    """Voci del file, lette in streaming (serve solo per percentuale ed ETA)."""
+    return sum(1 for _ in iter_file_records(input_path))
+
+
+# --- ESECUZIONE ---
+
+def _completed(result: dict) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _in_order(futures, window: int):
+    """Risultati di `futures` (generatore che avvia le voci man mano) nell'ordine, con al più `window` voci in volo."""
+    pending = deque()
+    while True:
+        while len(pending) < window:
+            future = next(futures, None)
+            if future is None:
+                break
+            pending.append(future)
+        if not pending:
+            return
+        yield pending.popleft().result()
+
+
+def _retry_failed_rows(input_path: str, output_path: str, state: dict, fmt: str, executor: ThreadPoolExecutor,
+                       window: int, resolver) -> int:
+    """
+    Risolve di nuovo le voci già scritte con un errore temporaneo e riscrive l'uscita con i nuovi esiti;
+    restituisce quante voci sono state ritentate. L'uscita riscritta sostituisce quella vecchia solo dopo
+    che il checkpoint la registra (vedi _finish_retry), così un'interruzione non lascia i due file disallineati.
+    """
+    if not any(_needs_retry(result) for result in _read_rows(output_path, fmt)):
+        return 0
+    retried = 0
+
+    def futures():
+        nonlocal retried
+        records = iter_file_records(input_path)
+        for result in _read_rows(output_path, fmt):
+            record = next(records)
+            if _needs_retry(result):
+                retried += 1
+                yield executor.submit(resolver, int(result["row"]), record)
+            else:
+                yield _completed(result)
+
+    counts = dict.fromkeys(STATUSES, 0)
+    with open(output_path + RETRY_SUFFIX, "wb") as output:
+        if fmt == "csv":
+            output.write(_CSV_HEADER)
+        for result in _in_order(futures(), window):
+            output.write(_format_row(result, fmt).encode("utf-8"))
+            counts[result["status"]] += 1
+        output.flush()
+        os.fsync(output.fileno())
+        state.update(output_bytes=output.tell(), counts=counts, replacing=True, updated_at=time.time())
+    _write_checkpoint(output_path, state)
+    _finish_retry(output_path, state)
+    log.info("Voci con errori temporanei ritentate", output=output_path, retried=retried)
+    return retried
+
+
+def _finish_retry(output_path: str, state: dict) -> None:
+    # Il checkpoint registra già l'uscita riscritta: la si mette al posto di quella vecchia (se non è già lì)
+    if os.path.exists(output_path + RETRY_SUFFIX):
+        os.replace(output_path + RETRY_SUFFIX, output_path)
+    state["replacing"] = False
+    _write_checkpoint(output_path, state)
+
+
+def enrich_file(input_path: str, output_path: str, workers: int = OFF_BATCH_CONCURRENCY, fmt: str | None = None,
+                checkpoint_every: int = ENRICH_CHECKPOINT_EVERY, restart: bool = False, total: int | None = None,
+                resolver=resolve_record, progress=None) -> dict:
+    """
+    Arricchisce `input_path` scrivendo una riga per voce in `output_path`, riprendendo dall'ultimo
+    checkpoint se esiste (a meno di `restart`).
+
+    Args:
+        workers: voci risolte in parallelo; in coda ce ne sono al massimo 4 * workers (memoria costante).
+        total: voci del file, se già note (altrimenti contate con count_records).
+        resolver: funzione (riga, record) -> riga di uscita, default resolve_record.
+        progress: funzione opzionale (fatte, totale, conteggi) chiamata dopo ogni voce scritta.
+
+    Returns:
+        dict: processed, total, resumed_from, retried (voci con un errore temporaneo risolte di nuovo alla ripresa),
+              conteggi per stato, seconds e items_per_second (di questa esecuzione).
+
+    Raises:
+        ValueError: se il checkpoint è di un altro file di ingresso, il file è cambiato o l'uscita è più corta
+                    di quanto registrato (serve `restart`).
+    """
+    fmt = output_format(output_path, fmt)
+    input_size = os.path.getsize(input_path)
+    state = None if restart else read_checkpoint(output_path)
+    if state is not None and (state["input"] != os.path.abspath(input_path) or state["input_size"] != input_size
+                              or state["format"] != fmt):
+        raise ValueError(f"Il checkpoint di {output_path} è di un altro file di ingresso o formato, "
+                         "oppure il file è cambiato: riavviare da capo (restart)")
+    if state is not None and state.get("replacing"):
+        # Interruzione mentre l'uscita riscritta dai nuovi tentativi prendeva il posto di quella vecchia
+        _finish_retry(output_path, state)
+    if state is not None and (not os.path.exists(output_path) or os.path.getsize(output_path) < state["output_bytes"]):
+        raise ValueError(f"{output_path} è più corto dell'ultimo checkpoint: riavviare da capo (restart)")
+    if state is None:
+        state = {"input": os.path.abspath(input_path), "input_size": input_size, "format": fmt, "processed": 0,
+                 "output_bytes": 0, "completed": False, "counts": dict.fromkeys(STATUSES, 0)}
+    resumed_from = state["processed"]
+    total = count_records(input_path) if total is None else total
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if resumed_from:
+        log.info("Ripresa dall'ultimo checkpoint", output=output_path, processed=resumed_from, total=total)
+    started = time.perf_counter()
+    window = 4 * max(1, workers)       # voci in volo: la memoria resta costante
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="enrich")
+    output = None
+    retried = 0
+    try:
+        if resumed_from:
+            # Le righe scritte dopo l'ultimo checkpoint (magari a metà) vengono scartate e ricalcolate
+            with open(output_path, "r+b") as previous:
+                previous.truncate(state["output_bytes"])
+            retried = _retry_failed_rows(input_path, output_path, state, fmt, executor, window, resolver)
+        # anche senza voci fatte il checkpoint può contenere l'intestazione CSV: "wb" la cancellerebbe e
+        # truncate() riempirebbe di NUL i byte mancanti
+        output = open(output_path, "r+b" if state["output_bytes"] else "wb")
+        output.truncate(state["output_bytes"])
+        output.seek(state["output_bytes"])
+        if state["output_bytes"] == 0 and fmt == "csv":
+            output.write(_CSV_HEADER)
+
+        def save_checkpoint(completed: bool = False):
+            output.flush()
+            os.fsync(output.fileno())
+            state.update(output_bytes=output.tell(), completed=completed, updated_at=time.time())
+            _write_checkpoint(output_path, state)
+
+        written_since_checkpoint = 0
+        records = enumerate(islice(iter_file_records(input_path), resumed_from, None), start=resumed_from)
+        try:
+            # I risultati si scrivono nell'ordine del file
+            for result in _in_order((executor.submit(resolver, *item) for item in records), window):
+                output.write(_format_row(result, fmt).encode("utf-8"))
+                state["processed"] += 1
+                state["counts"][result["status"]] += 1
+                written_since_checkpoint += 1
+                if written_since_checkpoint >= checkpoint_every:
+                    save_checkpoint()
+                    written_since_checkpoint = 0
+                if progress is not None:
+                    progress(state["processed"], total, state["counts"])
+            save_checkpoint(completed=True)
+        except BaseException:
+            # Interruzione (errore o Ctrl+C): si salva quanto già scritto, la prossima esecuzione riparte da lì
+            save_checkpoint()
+            raise
+    finally:
+        # le voci ancora in coda vengono annullate
+        executor.shutdown(wait=True, cancel_futures=True)
+        if output is not None:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    done = state["processed"] - resumed_from + retried
+    summary = {"input": input_path, "output": output_path, "processed": state["processed"], "total": total,
+               "resumed_from": resumed_from, "retried": retried, **state["counts"], "seconds": round(elapsed, 2),
+               "items_per_second": round(done / elapsed, 1) if elapsed > 0 else 0.0}
+    log.info("Arricchimento completato", **summary)
+    return summary
@@ -0,0 +1,541 @@
+# src/integrations/data_scraper.py
+#
+# Ingestione dei volantini (testo) e dei cataloghi dietetici (CSV/TSV) in una tabella SQLite di prezzi
+# e promozioni, indicizzata per barcode, nome normalizzato e periodo di validità.
+#
+# I file sono letti una riga alla volta e le voci passano da una tabella temporanea di SQLite: la
+# memoria resta costante anche con file di centinaia di MB. Ogni voce ha una chiave stabile (nome,
+# barcode, formato, periodo di validità) e un hash del contenuto; reingerendo un file si scrivono solo le voci nuove o
+# cambiate, si cancellano quelle sparite e un file identico all'ultima volta non viene nemmeno letto.
+#
+# Formato dei volantini, una voce per riga (le righe senza prezzo sono titoli di sezione):
+#   Valido dal 04/01/2024 al 17/01/2024
+#   Pasta di semola Barilla 500 g € 0,89 invece di € 1,29
+#   Yogurt greco 0% Fage 170 g 1,19 € (7,00 €/kg)
+#   Parmigiano Reggiano DOP 24 mesi al kg € 13,90
+#   8001234567890 Tonno Rio Mare 3 x 80 g € 3,49 3x2
+#
+# Uso: python -m src.integrations.data_scraper ingest [file o cartelle...]
+#      python -m src.integrations.data_scraper prices [--barcode 800...] [--name "pasta"] [--date 2024-01-10]
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+from src.integrations.autocomplete_index import normalize
+from src.integrations.local_data import DATA_DIR, iter_file_records, product_from_record
+from src.integrations.offline_index import tokenize
+from src.integrations.telemetry import get_logger
+
+log = get_logger("prices")
+
+# --- CONFIGURAZIONE ---
+PRICE_DB_PATH = os.getenv('PRICE_DB_PATH', os.path.join(tempfile.gettempdir(), "allenatore_prezzi.sqlite3"))
+PRICE_DATA_DIR = os.getenv('PRICE_DATA_DIR', DATA_DIR)
+INGEST_BATCH_SIZE = 1000
+FILE_HASH_CHUNK = 1 << 20
+PRICE_DB_CACHE_KB = 32768          # cache delle pagine SQLite: limite fisso, non cresce con la dimensione dei file
+MATCH_MIN_OVERLAP = 0.6          # quota delle parole della voce che devono comparire nel prodotto OFF trovato
+FLYER_EXTENSIONS = (".txt",)
+CATALOG_EXTENSIONS = (".csv", ".tsv")
+
+ENTRY_FIELDS = ("name", "brand", "barcode", "quantity_g", "price", "regular_price", "price_per_kg",
+                "promotion", "valid_from", "valid_to")
+
+# --- PARSING DELLE RIGHE DEI VOLANTINI ---
+_AMOUNT = r"(\d{1,5}(?:[.,]\d{1,2})?)"
+_AMOUNT_RE = re.compile(_AMOUNT)
+_SPACES_RE = re.compile(r"\s+")
+_NAME_JUNK_RE = re.compile(r"[€()*|]|\beuro\b", re.I)
+_VALIDITY_RE = re.compile(r"\bdal\s+(\d{1,2})[/.-](\d{1,2})(?:[/.-](\d{2,4}))?\s+al\s+(\d{1,2})[/.-](\d{1,2})(?:[/.-](\d{2,4}))?",
+                          re.I)
+_BARCODE_RE = re.compile(r"\b(\d{13}|\d{8})\b")
+_UNIT_PRICE_RE = re.compile(rf"\(?\s*(?:€\s*)?{_AMOUNT}\s*(?:€|euro)?\s*/\s*(?:kg|l|lt|litro)\b\s*\)?"
+                            rf"|\(?\s*€\s*/\s*(?:kg|l|lt|litro)\s*{_AMOUNT}\s*\)?", re.I)
+_REGULAR_PRICE_RE = re.compile(r"\b(?:invece di|anzich[eé]|prezzo pieno|era)\s*:?\s*(?:€\s*)?(\d{1,5}[.,]\d{2})\s*(?:€|euro\b)?",
+                               re.I)
+_REGULAR_PRICE_MARKERS = ("invece", "anzich", "pieno", "era")
+_PROMOTION_RE = re.compile(r"-\s?\d{1,2}\s?%|\bsconto\s+\d{1,2}\s?%|\bprendi\s+\d\s+paghi\s+\d\b"
+                           r"|\b\d\s?x\s?\d\b(?![.,]\d)(?!\s*(?:g|gr|kg|ml|cl|l|lt)\b)", re.I)   # "6x1,5 l" è un formato
+# Un numero seguito da "€ 2,10" non è un prezzo ("Uova x6 € 2,10"): il prezzo è l'importo dopo il simbolo
+_PRICE_RE = re.compile(rf"€\s*{_AMOUNT}|{_AMOUNT}\s*(?:€|euro\b)(?!\s*\d)", re.I)
+_PER_KG_RE = re.compile(r"\b(?:al|il)\s+(?:kg|chilo|litro|lt)\b", re.I)
+_QUANTITY_RE = re.compile(r"\b(?:(\d+)\s*x\s*)?(\d+(?:[.,]\d+)?)\s*(kg|g|gr|grammi|l|lt|ml|cl)\b", re.I)
+_YEAR_RE = re.compile(r"(20\d{2})")
+# Grammi per unità; per i liquidi si assume densità 1 (basta per confrontare i prezzi al kg/litro)
+_UNIT_GRAMS = {"kg": 1000.0, "g": 1.0, "gr": 1.0, "grammi": 1.0, "l": 1000.0, "lt": 1000.0, "ml": 1.0, "cl": 10.0}
+
+# Colonne dei cataloghi (oltre a nome, marca e barcode riconosciuti da local_data)
+_CATALOG_FIELDS = {
+    "price": ("prezzo", "price", "prezzo_offerta"),
+    "regular_price": ("prezzo_pieno", "regular_price", "prezzo_listino"),
+    "price_per_kg": ("prezzo_kg", "prezzo_al_kg", "price_per_kg"),
+    "quantity": ("formato", "quantita", "quantity", "peso"),
+    "promotion": ("promo", "promozione", "promotion"),
+    "valid_from": ("valido_dal", "valid_from"),
+    "valid_to": ("valido_al", "valid_to"),
+}
+
+
+def _amount(text: str | None) -> float | None:
+    if text is None:
+        return None
+    match = _AMOUNT_RE.search(str(text))
+    return float(match.group(1).replace(",", ".")) if match else None
+
+
+def _iso_date(day: str, month: str, year: str | None, default_year: int) -> str | None:
+    year_number = int(year) if year else default_year
+    if year_number < 100:
+        year_number += 2000
+    try:
+        return time.strftime("%Y-%m-%d", time.strptime(f"{year_number}-{int(month)}-{int(day)}", "%Y-%m-%d"))
+    except ValueError:
+        return None
+
+
+def _parse_date(text: str | None, default_year: int) -> str | None:
+    if not text:
+        return None
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", text.strip()):
+        return text.strip()
+    match = re.fullmatch(r"\s*(\d{1,2})[/.-](\d{1,2})(?:[/.-](\d{2,4}))?\s*", text)
+    return _iso_date(*match.groups(), default_year) if match else None
+
+
+def parse_validity(line: str, default_year: int) -> tuple[str, str] | None:
+    """Periodo di validità ("Valido dal 04/01 al 17/01/2024") come coppia di date ISO, o None."""
+    match = _VALIDITY_RE.search(line)
+    if not match:
+        return None
+    day_from, month_from, year_from, day_to, month_to, year_to = match.groups()
+    valid_to = _iso_date(day_to, month_to, year_to, default_year)
+    valid_from = _iso_date(day_from, month_from, year_from or year_to, default_year)
+    if valid_from and valid_to and valid_from > valid_to and not year_from:
+        # "dal 28/12 al 10/01/2024": il periodo inizia nell'anno precedente
+        valid_from = f"{int(valid_from[:4]) - 1}{valid_from[4:]}"
+    return (valid_from, valid_to) if valid_from and valid_to else None
+
+
+def _quantity_grams(text: str | None) -> tuple[float | None, str]:
+    """Formato in grammi ("3 x 80 g" -> 240) e testo senza il formato."""
+    if not text:
+        return None, text or ""
+    match = _QUANTITY_RE.search(text)
+    if not match:
+        return None, text
+    count, amount, unit = match.groups()
+    grams = float(amount.replace(",", ".")) * _UNIT_GRAMS[unit.lower()] * (int(count) if count else 1)
+    return (grams if grams > 0 else None), text[:match.start()] + " " + text[match.end():]
+
+
+def _finish_entry(entry: dict) -> dict:
+    if entry["price_per_kg"] is None and entry["price"] is not None and entry["quantity_g"]:
+        entry["price_per_kg"] = round(entry["price"] * 1000.0 / entry["quantity_g"], 2)
+    if not entry["promotion"] and entry["regular_price"] and entry["price"] and entry["regular_price"] > entry["price"]:
+        entry["promotion"] = f"-{round((1 - entry['price'] / entry['regular_price']) * 100)}%"
+    return entry
+
+
+def parse_flyer_line(line: str, validity: tuple[str, str] | None = None) -> dict | None:
+    """
+    Una voce di volantino: nome, formato, prezzo, prezzo pieno, prezzo al kg, promozione e barcode
+    se presente. None per righe vuote, commenti e righe senza prezzo (titoli di sezione).
+    """
+    text = line.strip()
+    if not text or text.startswith("#"):
+        return None
+
+    # I controlli sulle sottostringhe evitano le regex più costose sulla maggior parte delle righe
+    lowered = text.lower()
+    barcode = None
+    match = _BARCODE_RE.search(text)
+    if match:
+        barcode = match.group(1)
+        text = text[:match.start()] + " " + text[match.end():]
+
+    price_per_kg = None
+    if "/" in text:
+        match = _UNIT_PRICE_RE.search(text)
+        if match:
+            price_per_kg = _amount(match.group(1) or match.group(2))
+            text = text[:match.start()] + " " + text[match.end():]
+
+    regular_price = None
+    if any(marker in lowered for marker in _REGULAR_PRICE_MARKERS):
+        match = _REGULAR_PRICE_RE.search(text)
+        if match:
+            regular_price = _amount(match.group(1))
+            text = text[:match.start()] + " " + text[match.end():]
+
+    promotions = []
+    if "%" in text or "x" in lowered or "prendi" in lowered:
+        promotions = [_SPACES_RE.sub("", promo.lower()) for promo in _PROMOTION_RE.findall(text)]
+        if promotions:
+            text = _PROMOTION_RE.sub(" ", text)
+
+    prices = list(_PRICE_RE.finditer(text))
+    if prices:
+        match = prices[-1]
+        price = _amount(match.group(1) or match.group(2))
+        text = text[:match.start()] + " " + text[match.end():]
+    else:
+        # "Banane € 1,49/kg": il prezzo al kg è l'unico prezzo, come per "al kg € 13,90"
+        price = price_per_kg
+    if not price:
+        return None
+
+    if (" al " in lowered or " il " in lowered) and _PER_KG_RE.search(text):
+        price_per_kg = price_per_kg or price
+        text = _PER_KG_RE.sub(" ", text)
+    quantity_g, text = _quantity_grams(text)
+
+    name = _SPACES_RE.sub(" ", _NAME_JUNK_RE.sub(" ", text)).strip(" -:·,.")
+    if not name:
+        return None
+    valid_from, valid_to = validity or (None, None)
+    return _finish_entry({
+        "name": name, "brand": None, "barcode": barcode, "quantity_g": quantity_g, "price": price,
+        "regular_price": regular_price, "price_per_kg": price_per_kg, "promotion": " ".join(promotions) or None,
+        "valid_from": valid_from, "valid_to": valid_to,
+    })
+
+
+def _file_year(path: str) -> int:
+    match = _YEAR_RE.search(os.path.basename(path))
+    return int(match.group(1)) if match else time.localtime().tm_year
+
+
+def iter_flyer_entries(path: str, counters: dict | None = None):
+    """Voci di un volantino in testo, lette riga per riga; le righe "Valido dal ... al ..." valgono per le successive."""
+    default_year = _file_year(path)
+    validity = None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            entry = parse_flyer_line(line, validity)
+            if entry is not None:
+                yield entry
+                continue
+            period = parse_validity(line, default_year)
+            if period is not None:
+                validity = period
+            elif counters is not None and line.strip() and not line.lstrip().startswith("#"):
+                counters["skipped_lines"] = counters.get("skipped_lines", 0) + 1
+
+
+def _record_field(record: dict, fields: tuple) -> str | None:
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ""):
+            return str(value)
+    return None
+
+
+def iter_catalog_entries(path: str, counters: dict | None = None):
+    """Voci di un catalogo CSV/TSV (letto riga per riga da local_data); le righe senza nome o prezzo sono saltate."""
+    default_year = _file_year(path)
+    for record in iter_file_records(path):
+        product = product_from_record(record)
+        price = _amount(_record_field(record, _CATALOG_FIELDS["price"]))
+        if product is None or not price:
+            if counters is not None:
+                counters["skipped_lines"] = counters.get("skipped_lines", 0) + 1
+            continue
+        quantity_g, _ = _quantity_grams(_record_field(record, _CATALOG_FIELDS["quantity"]))
+        yield _finish_entry({
+            "name": product["name"], "brand": product["brands"], "barcode": product["barcode"],
+            "quantity_g": quantity_g, "price": price,
+            "regular_price": _amount(_record_field(record, _CATALOG_FIELDS["regular_price"])),
+            "price_per_kg": _amount(_record_field(record, _CATALOG_FIELDS["price_per_kg"])),
+            "promotion": _record_field(record, _CATALOG_FIELDS["promotion"]),
+            "valid_from": _parse_date(_record_field(record, _CATALOG_FIELDS["valid_from"]), default_year),
+            "valid_to": _parse_date(_record_field(record, _CATALOG_FIELDS["valid_to"]), default_year),
+        })
+
+
+def iter_price_entries(path: str, counters: dict | None = None):
+    """Voci di prezzo di un file, in base all'estensione (volantino .txt o catalogo .csv/.tsv)."""
+    if path.lower().endswith(FLYER_EXTENSIONS):
+        return iter_flyer_entries(path, counters)
+    if path.lower().endswith(CATALOG_EXTENSIONS):
+        return iter_catalog_entries(path, counters)
+    raise ValueError(f"Formato non supportato: {path}")
+
+
+def entry_key(entry: dict) -> str:
+    """
+    Chiave stabile di una voce nel suo file: lo stesso prodotto nello stesso formato e nello stesso periodo di
+    validità, a prescindere dal prezzo (una promo e il prezzo della settimana dopo restano due voci).
+    """
+    quantity = "" if entry["quantity_g"] is None else f"{entry['quantity_g']:g}"
+    return "|".join((normalize(entry["name"]), normalize(entry["brand"]), entry["barcode"] or "", quantity,
+                     entry["valid_from"] or "", entry["valid_to"] or ""))
+
+
+def _entry_payload(entry: dict) -> str:
+    return json.dumps([entry[field] for field in ENTRY_FIELDS], ensure_ascii=False, separators=(",", ":"))
+
+
+def content_hash(entry: dict) -> str:
+    return hashlib.sha1(_entry_payload(entry).encode("utf-8")).hexdigest()
+
+
+# --- ABBINAMENTO AI PRODOTTI OPENFOODFACTS ---
+
+def match_local_product(entry: dict) -> dict | None:
+    """
+    Prodotto OFF corrispondente alla voce, cercato nell'indice locale (nessuna chiamata di rete).
+    Accettato solo se contiene almeno MATCH_MIN_OVERLAP delle parole della voce.
+    """
+    from src.integrations.openfoodfacts_client import local_search_products
+
+    words = set(tokenize(f"{entry['name']} {entry['brand'] or ''}"))
+    if not words:
+        return None
+    for product in local_search_products(" ".join(sorted(words, key=len, reverse=True)[:6]), page_size=1):
+        found = set(tokenize(f"{product.get('name') or ''} {product.get('brands') or ''}"))
+        if product.get("barcode") and len(words & found) >= MATCH_MIN_OVERLAP * len(words):
+            return product
+    return None
+
+
+# --- TABELLA DEI PREZZI ---
+
+class PriceStore:
+    """Tabella SQLite dei prezzi e delle promozioni, con ingestione incrementale per file."""
+
+    def __init__(self, db_path: str = PRICE_DB_PATH, data_dir: str = PRICE_DATA_DIR):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA cache_size=-{PRICE_DB_CACHE_KB}")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS prices ("
+            " source TEXT NOT NULL,"
+            " entry_key TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " normalized_name TEXT NOT NULL,"
+            " brand TEXT,"
+            " barcode TEXT,"
+            " match_source TEXT,"
+            " matched_name TEXT,"
+            " quantity_g REAL,"
+            " price REAL NOT NULL,"
+            " regular_price REAL,"
+            " price_per_kg REAL,"
+            " promotion TEXT,"
+            " valid_from TEXT,"
+            " valid_to TEXT,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (source, entry_key)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS idx_prices_barcode ON prices (barcode);"
+            "CREATE INDEX IF NOT EXISTS idx_prices_name ON prices (normalized_name);"
+            "CREATE INDEX IF NOT EXISTS idx_prices_valid_to ON prices (valid_to);"
+            "CREATE TABLE IF NOT EXISTS ingested_files ("
+            " source TEXT PRIMARY KEY,"
+            " file_hash TEXT NOT NULL,"
+            " entries INTEGER NOT NULL,"
+            " ingested_at REAL NOT NULL);"
+            "CREATE TEMP TABLE IF NOT EXISTS staging ("
+            " entry_key TEXT PRIMARY KEY,"
+            " content_hash TEXT NOT NULL,"
+            " data TEXT NOT NULL) WITHOUT ROWID;"
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _source(self, path: str) -> str:
+        path = os.path.abspath(path)
+        data_dir = os.path.abspath(self.data_dir) if self.data_dir else None
+        if data_dir and os.path.commonpath([path, data_dir]) == data_dir:
+            return os.path.relpath(path, data_dir)
+        return path
+
+    @staticmethod
+    def _file_hash(path: str) -> str:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(FILE_HASH_CHUNK), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def ingest_file(self, path: str, matcher=match_local_product) -> dict:
+        """
+        Ingerisce un volantino o un catalogo in modo incrementale.
+
+        Args:
+            matcher: funzione voce -> prodotto OFF (dict con barcode e name) o None, chiamata solo per le
+                     voci nuove o cambiate senza barcode; None disattiva l'abbinamento.
+
+        Returns:
+            dict: conteggi inserted/updated/unchanged/deleted/skipped_lines/duplicates/matched e "skipped" se
+            il file è identico all'ultima ingestione; delle voci duplicate (stessa chiave) resta l'ultima.
+        """
+        source = self._source(path)
+        file_hash = self._file_hash(path)
+        counters = {"source": source, "inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0,
+                    "skipped_lines": 0, "duplicates": 0, "matched": 0, "skipped": False}
+        with self._lock:
+            row = self._conn.execute("SELECT file_hash, entries FROM ingested_files WHERE source = ?",
+                                     (source,)).fetchone()
+            if row is not None and row[0] == file_hash:
+                counters.update(unchanged=row[1], skipped=True)
+                return counters
+            try:
+                read = self._stage(iter_price_entries(path, counters))
+                self._apply_changes(source, counters, matcher)
+                staged = self._conn.execute("SELECT COUNT(*) FROM staging").fetchone()[0]
+                counters["duplicates"] = read - staged
+                if counters["duplicates"]:
+                    log.warning("Voci duplicate nel file prezzi, tenuta l'ultima", source=source,
+                                duplicates=counters["duplicates"])
+                counters["unchanged"] = staged - counters["inserted"] - counters["updated"]
+                counters["deleted"] = self._conn.execute(
+                    "DELETE FROM prices WHERE source = ? AND entry_key NOT IN (SELECT entry_key FROM staging)",
+                    (source,)).rowcount
+                self._conn.execute("INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?, ?)",
+                                   (source, file_hash, staged, time.time()))
+                self._conn.execute("DELETE FROM staging")
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                self._conn.execute("DELETE FROM staging")
+                self._conn.commit()
+                raise
+        return counters
+
+    def _stage(self, entries) -> int:
+        """Carica le voci nella tabella temporanea e restituisce quante ne ha lette (duplicati compresi)."""
+        self._conn.execute("DELETE FROM staging")
+        batch = []
+        read = 0
+        for entry in entries:
+            read += 1
+            payload = _entry_payload(entry)
+            batch.append((entry_key(entry), hashlib.sha1(payload.encode("utf-8")).hexdigest(), payload))
+            if len(batch) >= INGEST_BATCH_SIZE:
+                self._conn.executemany("INSERT OR REPLACE INTO staging VALUES (?, ?, ?)", batch)
+                batch = []
+        self._conn.executemany("INSERT OR REPLACE INTO staging VALUES (?, ?, ?)", batch)
+        return read
+
+    def _apply_changes(self, source: str, counters: dict, matcher) -> None:
+        """Scrive le voci nuove o con hash diverso, a pagine di INGEST_BATCH_SIZE per tenere la memoria costante."""
+        last_key = ""
+        while True:
+            rows = self._conn.execute(
+                "SELECT s.entry_key, s.content_hash, s.data, p.entry_key IS NOT NULL"
+                " FROM staging s LEFT JOIN prices p ON p.source = ? AND p.entry_key = s.entry_key"
+                " WHERE s.entry_key > ? AND (p.entry_key IS NULL OR p.content_hash != s.content_hash)"
+                " ORDER BY s.entry_key LIMIT ?",
+                (source, last_key, INGEST_BATCH_SIZE),
+            ).fetchall()
+            if not rows:
+                return
+            now = time.time()
+            batch = []
+            for key, digest, data, existed in rows:
+                last_key = key
+                entry = dict(zip(ENTRY_FIELDS, json.loads(data)))
+                barcode, match_source, matched_name = entry["barcode"], "file" if entry["barcode"] else None, None
+                if barcode is None and matcher is not None:
+                    product = matcher(entry)
+                    if product is not None:
+                        barcode, match_source, matched_name = product["barcode"], "name", product.get("name")
+                        counters["matched"] += 1
+                counters["updated" if existed else "inserted"] += 1
+                batch.append((source, key, digest, entry["name"], key.split("|", 1)[0], entry["brand"], barcode,
+                              match_source, matched_name, entry["quantity_g"], entry["price"], entry["regular_price"],
+                              entry["price_per_kg"], entry["promotion"], entry["valid_from"], entry["valid_to"], now))
+            self._conn.executemany("INSERT OR REPLACE INTO prices VALUES "
+                                   "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+    def ingest_paths(self, paths: list[str], matcher=match_local_product) -> list[dict]:
+        """Ingerisce file e cartelle (ricorsivamente); i file non leggibili sono segnalati e saltati."""
+        results = []
+        for path in paths:
+            if os.path.isdir(path):
+                files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+                               if name.lower().endswith(FLYER_EXTENSIONS + CATALOG_EXTENSIONS))
+            else:
+                files = [path]
+            for file_path in files:
+                try:
+                    results.append(self.ingest_file(file_path, matcher=matcher))
+                except (OSError, ValueError, sqlite3.Error) as e:
+                    log.warning("File prezzi ignorato", path=file_path, error=str(e))
+        return results
+
+    def find_prices(self, barcode: str | None = None, name: str | None = None, on_date: str | None = None,
+                    limit: int = 20) -> list[dict]:
+        """
+        Prezzi per barcode o per prefisso del nome normalizzato, dal più conveniente al kg.
+        Con `on_date` (YYYY-MM-DD) solo le voci valide in quel giorno (quelle senza periodo valgono sempre).
+        """
+        clauses, params = [], []
+        if barcode:
+            clauses.append("barcode = ?")
+            params.append(barcode)
+        if name:
+            prefix = normalize(name)
+            clauses.append("normalized_name >= ? AND normalized_name < ?")
+            params += [prefix, prefix + "\uffff"]
+        if on_date:
+            clauses.append("(valid_from IS NULL OR valid_from <= ?) AND (valid_to IS NULL OR valid_to >= ?)")
+            params += [on_date, on_date]
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT * FROM prices{where} ORDER BY price_per_kg IS NULL, price_per_kg, price LIMIT ?",
+                (*params, limit),
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, matched, promotions = self._conn.execute(
+                "SELECT COUNT(*), COUNT(barcode), COUNT(promotion) FROM prices").fetchone()
+            files = self._conn.execute("SELECT COUNT(*) FROM ingested_files").fetchone()[0]
+        return {"entries": entries, "with_barcode": matched, "promotions": promotions, "files": files}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingestione di volantini e cataloghi nella tabella dei prezzi.")
+    parser.add_argument("--db", default=PRICE_DB_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Ingerisce file o cartelle (default: la cartella dei dati).")
+    ingest_parser.add_argument("paths", nargs="*")
+    ingest_parser.add_argument("--no-match", action="store_true", help="non abbinare le voci ai prodotti OFF")
+    prices_parser = subparsers.add_parser("prices", help="Cerca nella tabella dei prezzi.")
+    prices_parser.add_argument("--barcode")
+    prices_parser.add_argument("--name")
+    prices_parser.add_argument("--date")
+    prices_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    store = PriceStore(args.db)
+    if args.command == "ingest":
+        started = time.perf_counter()
+        for result in store.ingest_paths(args.paths or [PRICE_DATA_DIR], matcher=None if args.no_match else match_local_product):
+            print(json.dumps(result, ensure_ascii=False))
+        log.info("Ingestione completata", seconds=round(time.perf_counter() - started, 1), **store.stats())
+    else:
+        for price in store.find_prices(args.barcode, args.name, args.date, args.limit):
+            print(json.dumps(price, ensure_ascii=False))
@@ -1,78 +1,208 @@
 # src/integrations/gemini_service.py
 
-import google.generativeai as genai
+# L'SDK google.generativeai (grpc, protobuf, google-api-core) NON viene importato qui:
+# è caricato alla prima chiamata al modello da _get_model(), così l'avvio del server
+# e le route che non usano Gemini non ne pagano il costo.
 import os
 import json # Importa json per il parsing e per il test
+import threading
+
+from src.integrations.advice_cache import AdviceCache
+from src.integrations.telemetry import UpstreamCall, get_logger
+from src.integrations.upstream_scheduler import UpstreamBusy, get_scheduler
+
+log = get_logger("gemini")
 
 # --- CONFIGURAZIONE CHIAVE API ---
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
-gemini_sdk_configured = False
 if not GEMINI_API_KEY:
-    print("ATTENZIONE: La variabile d'ambiente GEMINI_API_KEY non è impostata.")
-    print("Il servizio Gemini non funzionerà senza una chiave API valida.")
-else:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        gemini_sdk_configured = True
-        print("INFO: SDK Gemini configurato con successo.")
-    except Exception as e:
-        print(f"ERRORE: Configurazione SDK Gemini fallita: {e}")
-        # gemini_sdk_configured rimane False
+    log.warning("La variabile d'ambiente GEMINI_API_KEY non è impostata: il servizio Gemini non funzionerà "
+                "senza una chiave API valida")
+
+_model = None
+_sdk_error = None
+_sdk_lock = threading.Lock()
 
 MODEL_NAME = "gemini-1.5-flash-latest"
 
+# --- CACHE DELLE RISPOSTE ---
+# GEMINI_CACHE_PATH vuoto = solo memoria; un percorso abilita la persistenza su disco (SQLite)
+GEMINI_CACHE_PATH = os.getenv('GEMINI_CACHE_PATH', '')
+GEMINI_CACHE_TTL = int(os.getenv('GEMINI_CACHE_TTL', str(24 * 3600)))
+GEMINI_CACHE_MAX_ITEMS = int(os.getenv('GEMINI_CACHE_MAX_ITEMS', '512'))
+
+advice_cache = AdviceCache(db_path=GEMINI_CACHE_PATH or None, max_items=GEMINI_CACHE_MAX_ITEMS, ttl=GEMINI_CACHE_TTL)
+
+
+def _get_model():
+    """
+    Importa e configura l'SDK alla prima chiamata e restituisce il modello, creato una sola volta
+    e riusato dalle richieste successive.
+
+    Returns:
+        Il GenerativeModel condiviso, oppure None se la chiave manca o la configurazione è fallita.
+    """
+    global _model, _sdk_error
+    if _model is not None or _sdk_error is not None:
+        return _model
+    with _sdk_lock:
+        if _model is None and _sdk_error is None:
+            if not GEMINI_API_KEY:
+                _sdk_error = "API Key mancante"
+                return None
+            try:
+                import google.generativeai as genai
+                genai.configure(api_key=GEMINI_API_KEY)
+                _model = genai.GenerativeModel(MODEL_NAME)
+                log.info("SDK Gemini configurato", model=MODEL_NAME)
+            except Exception as e:
+                _sdk_error = str(e)
+                log.error("Configurazione SDK Gemini fallita", error=str(e))
+    return _model
+
+
+def set_model(model) -> None:
+    """Sostituisce il modello condiviso (None lo ricrea al prossimo utilizzo); utile nei test."""
+    global _model, _sdk_error
+    with _sdk_lock:
+        _model = model
+        _sdk_error = None
+
+
+def get_advice_cache_stats() -> dict:
+    """Hit rate della cache delle risposte di Gemini e chiamate al modello risparmiate."""
+    return advice_cache.stats()
+
+
+# Tipi di errore delle chiamate al modello (etichetta "type" di allenatore_upstream_errors_total)
+ERROR_TIMEOUT = "timeout"
+ERROR_JSON = "json_decode"
+ERROR_INVALID_RESPONSE = "invalid_response"
+ERROR_EMPTY_RESPONSE = "empty_response"
+ERROR_API = "api_error"
+ERROR_RATE_LIMITED = "rate_limited"
+
+RATE_LIMITED_MESSAGE = "Troppe richieste al servizio di IA in questo momento, riprova tra poco."
+
+
+def _api_error_type(error: Exception) -> str:
+    text = str(error)
+    if "DEADLINE_EXCEEDED" in text:
+        return ERROR_TIMEOUT
+    if "RESOURCE_EXHAUSTED" in text or text.startswith("429"):
+        return ERROR_RATE_LIMITED
+    return ERROR_API
+
+
+def _finish_failed_call(call: UpstreamCall, error: Exception) -> None:
+    error_type = _api_error_type(error)
+    if error_type == ERROR_RATE_LIMITED:
+        get_scheduler("gemini").throttled()   # quota superata: il pianificatore sospende le chiamate
+    call.finish(error_type)
+
+
+def _admit(operation: str) -> dict | None:
+    """
+    Attende il turno nella coda di Gemini (vedi upstream_scheduler); None se la chiamata può partire,
+    altrimenti il dizionario di errore da restituire. Le richieste identiche sono già accorpate da advice_cache.
+    """
+    try:
+        get_scheduler("gemini").acquire()
+        return None
+    except UpstreamBusy as e:
+        log.warning("Richiesta a Gemini rifiutata dal pianificatore", operation=operation, reason=e.reason,
+                    retry_after=round(e.retry_after, 1))
+        return {"error": RATE_LIMITED_MESSAGE}
+
+
+def _start_call(upstream: str, prompt: str) -> UpstreamCall:
+    call = UpstreamCall(upstream)
+    call.request_bytes = len(prompt.encode("utf-8"))
+    log.debug("Prompt inviato a Gemini", model=MODEL_NAME, upstream=upstream, prompt=prompt)
+    return call
+
+# Mappatura dei livelli di attività per renderli più comprensibili a Gemini (opzionale, ma può aiutare)
+activity_level_map = {
+    "sedentary": "Sedentario (poco o nessun esercizio)",
+    "light": "Leggermente attivo (esercizio leggero/sport 1-3 giorni/sett.)",
+    "moderate": "Moderatamente attivo (esercizio moderato/sport 3-5 giorni/sett.)",
+    "active": "Molto attivo (esercizio intenso/sport 6-7 giorni/sett.)",
+    "extra_active": "Estremamente attivo (esercizio molto intenso/lavoro fisico)"
+}
+
+
+def _user_data_prompt_lines(user_data: dict) -> list[str]:
+    # Sanificazione e preparazione dei dati utente per il prompt
+    # Assicuriamoci che i valori siano presenti e abbiano un fallback 'N/D' (Non Disponibile)
+    age = user_data.get('age', 'N/D')
+    weight = user_data.get('weight', 'N/D')
+    height = user_data.get('height', 'N/D')
+    gender = user_data.get('gender', 'N/D')
+    activity_level_key = user_data.get('activity_level', 'N/D')
+    profession = user_data.get('profession', 'Nessuna professione specificata')
+    objectives = user_data.get('objectives', 'N/D')
+    activity_level_description = activity_level_map.get(activity_level_key, activity_level_key)
+
+    return [
+        "\nDati Utente:",
+        f"- Età: {age} anni",
+        f"- Peso: {weight} kg",
+        f"- Altezza: {height} cm",
+        f"- Sesso Biologico: {gender}",
+        f"- Livello di Attività Fisica: {activity_level_description}",
+        f"- Dettaglio Attività/Professione: {profession}",
+        f"- Obiettivi Principali: {objectives}",
+    ]
+
+
+def _build_notes_prompt(user_data: dict, needs: dict) -> str:
+    prompt_parts = [
+        "Sei un esperto nutrizionista virtuale. Il fabbisogno dell'utente è già stato calcolato: il tuo compito è solo commentarlo.",
+        "Fornisci una breve nota o un consiglio personalizzato basato sugli obiettivi dell'utente.",
+        *_user_data_prompt_lines(user_data),
+        "\nFabbisogno calcolato:",
+        f"- Calorie: {needs.get('calories')} kcal",
+        f"- Proteine: {needs.get('protein')} g",
+        f"- Carboidrati: {needs.get('carbs')} g",
+        f"- Grassi: {needs.get('fat')} g",
+        "\nISTRUZIONI PER LA RISPOSTA:",
+        "Rispondi in italiano con un testo semplice di massimo 2-3 frasi, senza markdown e senza ripetere i numeri elencati.",
+    ]
+    return "\n".join(prompt_parts)
+
 def get_nutritional_advice_from_gemini(user_data: dict) -> dict: # Modificato per restituire sempre un dict
     """
     Invia i dati dell'utente a Gemini per ottenere consigli nutrizionali.
 
+    Le risposte sono memorizzate per profilo canonico (vedi advice_cache.canonical_profile_key)
+    e le richieste identiche concorrenti producono una sola chiamata al modello.
+
     Args:
         user_data (dict): Dati dell'utente.
 
     Returns:
         dict: Un dizionario con i consigli o un dizionario di errore.
     """
-    if not gemini_sdk_configured: # Controlla se la configurazione è andata a buon fine
+    return advice_cache.get_or_generate("advice", user_data, lambda: _generate_nutritional_advice(user_data))
+
+
+def _generate_nutritional_advice(user_data: dict) -> dict:
+    model = _get_model()
+    if model is None: # Controlla se la configurazione è andata a buon fine
         error_message = "Servizio Gemini non disponibile (configurazione SDK fallita o API Key mancante)."
-        print(f"ERRORE in get_nutritional_advice_from_gemini: {error_message}")
+        log.error(error_message, operation="advice")
         return {"error": error_message}
+    rejected = _admit("advice")
+    if rejected is not None:
+        return rejected
 
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        
-        # Sanificazione e preparazione dei dati utente per il prompt
-        # Assicuriamoci che i valori siano presenti e abbiano un fallback 'N/D' (Non Disponibile)
-        age = user_data.get('age', 'N/D')
-        weight = user_data.get('weight', 'N/D')
-        height = user_data.get('height', 'N/D')
-        gender = user_data.get('gender', 'N/D')
-        activity_level_key = user_data.get('activity_level', 'N/D')
-        profession = user_data.get('profession', 'Nessuna professione specificata')
-        objectives = user_data.get('objectives', 'N/D')
-
-        # Mappatura dei livelli di attività per renderli più comprensibili a Gemini (opzionale, ma può aiutare)
-        activity_level_map = {
-            "sedentary": "Sedentario (poco o nessun esercizio)",
-            "light": "Leggermente attivo (esercizio leggero/sport 1-3 giorni/sett.)",
-            "moderate": "Moderatamente attivo (esercizio moderato/sport 3-5 giorni/sett.)",
-            "active": "Molto attivo (esercizio intenso/sport 6-7 giorni/sett.)",
-            "extra_active": "Estremamente attivo (esercizio molto intenso/lavoro fisico)"
-        }
-        activity_level_description = activity_level_map.get(activity_level_key, activity_level_key)
-
-
         prompt_parts = [
             "Sei un esperto nutrizionista virtuale. Il tuo compito è analizzare i dati di un utente e fornire una stima del suo fabbisogno calorico giornaliero e una suddivisione consigliata dei macronutrienti (proteine, carboidrati, grassi) espressi in grammi.",
             "Considera tutti i parametri forniti per una stima il più accurata possibile.",
             "Fornisci anche una breve nota o un consiglio personalizzato basato sugli obiettivi dell'utente.",
-            "\nDati Utente:",
-            f"- Età: {age} anni",
-            f"- Peso: {weight} kg",
-            f"- Altezza: {height} cm",
-            f"- Sesso Biologico: {gender}",
-            f"- Livello di Attività Fisica: {activity_level_description}",
-            f"- Dettaglio Attività/Professione: {profession}",
-            f"- Obiettivi Principali: {objectives}",
+            *_user_data_prompt_lines(user_data),
             "\nISTRUZIONI PER LA RISPOSTA:",
             "Formatta la tua risposta ESCLUSIVAMENTE come un singolo oggetto JSON valido. Non includere spiegazioni testuali prima o dopo l'oggetto JSON, e non usare markdown (come ```json).",
             "L'oggetto JSON deve contenere le seguenti chiavi:",
@@ -85,42 +215,42 @@ def get_nutritional_advice_from_gemini(user_data: dict) -> dict: # Modificato pe
             "{\"calories\": 2200, \"protein\": 110, \"carbs\": 275, \"fat\": 73, \"notes\": \"Considerando il tuo obiettivo di mantenimento e il livello di attività moderato, questo apporto dovrebbe essere adeguato. Monitora il tuo peso e aggiusta le calorie se necessario.\"}"
         ]
         prompt = "\n".join(prompt_parts)
-        
-        print(f"\n--- PROMPT INVIATO A GEMINI ({MODEL_NAME}) ---")
-        print(prompt)
-        print("---------------------------------------\n")
+        call = _start_call("gemini_generate", prompt)
 
         # Configurazione della generazione per richiedere output JSON (se il modello lo supporta direttamente)
         # Per gemini-1.5-flash-latest, specificare response_mime_type è il modo migliore
-        generation_config = genai.types.GenerationConfig(
-            # candidate_count=1, # Solitamente non necessario per JSON
-            # temperature=0.7, # Puoi sperimentare con la temperatura
-            response_mime_type="application/json" # Richiede esplicitamente JSON
-        )
-        
-        response = model.generate_content(prompt, generation_config=generation_config)
-        
-        response_text = response.text # Con response_mime_type="application/json", il testo dovrebbe già essere JSON valido
+        generation_config = {
+            # "candidate_count": 1, # Solitamente non necessario per JSON
+            # "temperature": 0.7, # Puoi sperimentare con la temperatura
+            "response_mime_type": "application/json" # Richiede esplicitamente JSON
+        }
         
-        print(f"--- RISPOSTA GREZZA (già JSON) DA GEMINI ({MODEL_NAME}) ---")
-        print(response_text)
-        print("----------------------------------------\n")
+        try:
+            response = model.generate_content(prompt, generation_config=generation_config)
+            response_text = response.text # Con response_mime_type="application/json", il testo dovrebbe già essere JSON valido
+        except Exception as e:
+            _finish_failed_call(call, e)
+            raise
+        call.response_bytes = len(response_text.encode("utf-8"))
+        log.debug("Risposta grezza da Gemini", model=MODEL_NAME, response=response_text)
 
         try:
             advice = json.loads(response_text)
             # Validazione minima del JSON ricevuto
             required_keys = ["calories", "protein", "carbs", "fat", "notes"]
             if not all(key in advice for key in required_keys):
-                print("ERRORE: Il JSON da Gemini non contiene tutte le chiavi richieste.")
+                call.finish(ERROR_INVALID_RESPONSE)
+                log.warning("Il JSON da Gemini non contiene tutte le chiavi richieste")
                 return {"error": "Formato risposta da Gemini non valido."}
+            call.finish()
             return advice
         except json.JSONDecodeError as json_e:
-            print(f"ERRORE: Impossibile decodificare la risposta JSON da Gemini: {json_e}")
-            print(f"Testo ricevuto che ha causato l'errore: '{response_text}'")
+            call.finish(ERROR_JSON)
+            log.warning("Impossibile decodificare la risposta JSON da Gemini", error=str(json_e), body=response_text[:200])
             return {"error": "Risposta da Gemini non è un JSON valido."}
 
     except Exception as e:
-        print(f"ERRORE durante la comunicazione con Gemini API o nell'elaborazione: {e}")
+        log.error("Errore durante la comunicazione con Gemini API o nell'elaborazione", error=str(e))
         # Restituisci un dizionario di errore che il server API può inoltrare
         error_detail = str(e)
         # A volte gli errori di gRPC sono lunghi, potremmo volerli troncare o semplificare
@@ -132,11 +262,106 @@ def get_nutritional_advice_from_gemini(user_data: dict) -> dict: # Modificato pe
         return {"error": f"Errore nell'interazione con il servizio di IA: {error_detail}"}
 
 
+def get_nutritional_notes_from_gemini(user_data: dict, needs: dict) -> dict:
+    """
+    Chiede a Gemini solo la nota testuale per un fabbisogno già calcolato localmente.
+
+    Args:
+        user_data (dict): Dati dell'utente.
+        needs (dict): Risultato di nutritional_calculator.calculate_needs.
+
+    Returns:
+        dict: {"notes": testo} oppure un dizionario di errore.
+    """
+    return advice_cache.get_or_generate("notes", user_data, lambda: _generate_nutritional_notes(user_data, needs))
+
+
+def _generate_nutritional_notes(user_data: dict, needs: dict) -> dict:
+    model = _get_model()
+    if model is None:
+        error_message = "Servizio Gemini non disponibile (configurazione SDK fallita o API Key mancante)."
+        log.error(error_message, operation="notes")
+        return {"error": error_message}
+    rejected = _admit("notes")
+    if rejected is not None:
+        return rejected
+
+    prompt = _build_notes_prompt(user_data, needs)
+    call = _start_call("gemini_generate", prompt)
+    try:
+        response = model.generate_content(prompt)
+        text = response.text
+        call.response_bytes = len(text.encode("utf-8"))
+        notes = text.strip()
+        if not notes:
+            call.finish(ERROR_EMPTY_RESPONSE)
+            return {"error": "Risposta vuota da Gemini."}
+        call.finish()
+        return {"notes": notes}
+    except Exception as e:
+        _finish_failed_call(call, e)
+        log.error("Errore durante la richiesta delle note a Gemini", error=str(e))
+        return {"error": f"Errore nell'interazione con il servizio di IA: {e}"}
+
+
+def stream_nutritional_notes_from_gemini(user_data: dict, needs: dict):
+    """
+    Come get_nutritional_notes_from_gemini, ma restituisce la nota un pezzo alla volta
+    usando la generazione in streaming dell'SDK.
+
+    Se la nota è già in cache viene restituita in un unico pezzo; a stream completato
+    il testo intero viene memorizzato nella cache delle note.
+
+    Yields:
+        dict: {"notes": frammento_di_testo} per ogni pezzo ricevuto, oppure un solo {"error": messaggio}.
+    """
+    cached = advice_cache.get("notes", user_data)
+    if cached is not None:
+        yield {"notes": cached["notes"]}
+        return
+
+    model = _get_model()
+    if model is None:
+        error_message = "Servizio Gemini non disponibile (configurazione SDK fallita o API Key mancante)."
+        log.error(error_message, operation="notes_stream")
+        yield {"error": error_message}
+        return
+    rejected = _admit("notes_stream")
+    if rejected is not None:
+        yield rejected
+        return
+
+    # La durata misurata comprende l'invio dei pezzi al client (lo stream avanza solo quando vengono letti)
+    prompt = _build_notes_prompt(user_data, needs)
+    call = _start_call("gemini_stream", prompt)
+    chunks = []
+    try:
+        for chunk in model.generate_content(prompt, stream=True):
+            text = chunk.text
+            if text:
+                chunks.append(text)
+                yield {"notes": text}
+    except Exception as e:
+        _finish_failed_call(call, e)
+        log.error("Errore durante lo streaming delle note da Gemini", error=str(e))
+        yield {"error": f"Errore nell'interazione con il servizio di IA: {e}"}
+        return
+
+    notes = "".join(chunks).strip()
+    call.response_bytes = len(notes.encode("utf-8"))
+    if not notes:
+        call.finish(ERROR_EMPTY_RESPONSE)
+        yield {"error": "Risposta vuota da Gemini."}
+        return
+    call.finish()
+    advice_cache.store("notes", user_data, {"notes": notes})
+
+
 if __name__ == '__main__':
     if not GEMINI_API_KEY:
         print("Per eseguire il test di gemini_service.py, imposta la variabile d'ambiente GEMINI_API_KEY.")
     else:
-        if not gemini_sdk_configured:
+        if _get_model() is None:
             print("Configurazione SDK Gemini fallita. Impossibile eseguire il test.")
         else:
             print("\n--- Test di gemini_service.py ---")
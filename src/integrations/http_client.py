@@ -0,0 +1,258 @@
+# src/integrations/http_client.py
+
+import asyncio
+import itertools
+import os
+import ssl
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- CONFIGURAZIONE POOL HTTP ---
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))    # numero di host diversi tenuti in pool
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '16'))           # connessioni keep-alive per host
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.3'))    # attese: 0.3s, 0.6s, 1.2s, ...
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', '256'))  # richieste upstream concorrenti nel server ASGI
+# Il pool di httpcore scorre tutte le connessioni a ogni richiesta: con centinaia di connessioni
+# il costo diventa quadratico, quindi le connessioni sono divise su più client più piccoli.
+HTTP_ASYNC_POOL_SHARDS = int(os.getenv('HTTP_ASYNC_POOL_SHARDS', '16'))
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = {}
+_httpx = None
+_ssl_context = None
+
+
+def import_httpx():
+    """
+    Importa httpx al primo utilizzo della variante asincrona (il server sincrono non ne paga il costo).
+
+    Returns:
+        Il modulo httpx, oppure None se non è installato (la variante asincrona è opzionale).
+    """
+    global _httpx
+    if _httpx is None:
+        try:
+            import httpx
+        except ImportError:
+            return None
+        _httpx = httpx
+    return _httpx
+
+
+def create_session(retries: int = HTTP_RETRIES, backoff_factor: float = HTTP_BACKOFF_FACTOR,
+                   pool_connections: int = HTTP_POOL_CONNECTIONS, pool_maxsize: int = HTTP_POOL_MAXSIZE) -> requests.Session:
+    """
+    Crea una sessione requests con connessioni persistenti e retry con backoff esponenziale.
+
+    I retry riguardano solo le GET, gli errori di connessione/lettura e le risposte 5xx;
+    esauriti i tentativi viene restituita l'ultima risposta, così il chiamante gestisce lo status come prima.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Sessione condivisa da tutti i client sincroni (creata al primo utilizzo)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def set_session(session: requests.Session | None) -> None:
+    """Sostituisce la sessione condivisa (None la ricrea al prossimo utilizzo)."""
+    global _session
+    with _session_lock:
+        if _session is not None and _session is not session:
+            _session.close()
+        _session = session
+
+
+# --- VARIANTE ASINCRONA ---
+
+def get_ssl_context() -> ssl.SSLContext:
+    """
+    Contesto SSL condiviso da tutti i client asincroni: caricare i certificati costa decine di millisecondi,
+    quindi viene fatto una volta sola invece che per ogni shard.
+    """
+    global _ssl_context
+    if _ssl_context is None:
+        with _session_lock:
+            if _ssl_context is None:
+                try:
+                    import certifi
+                    _ssl_context = ssl.create_default_context(cafile=certifi.where())
+                except ImportError:
+                    _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+def _create_async_clients(httpx) -> tuple:
+    per_shard = max(1, HTTP_ASYNC_MAX_CONNECTIONS // max(1, HTTP_ASYNC_POOL_SHARDS))
+    limits = httpx.Limits(max_connections=per_shard, max_keepalive_connections=per_shard)
+    context = get_ssl_context()
+    clients = [
+        httpx.AsyncClient(limits=limits, verify=context,
+                          transport=httpx.AsyncHTTPTransport(limits=limits, verify=context, retries=HTTP_RETRIES))
+        for _ in range(max(1, HTTP_ASYNC_POOL_SHARDS))
+    ]
+    return clients, itertools.cycle(clients)
+
+
+async def open_async_client() -> None:
+    """
+    Crea i client asincroni del loop corrente (da chiamare allo startup del server), così la prima
+    richiesta non paga la loro creazione; il contesto SSL viene caricato fuori dall'event loop.
+    """
+    httpx = import_httpx()
+    if httpx is None:
+        return
+    await asyncio.to_thread(get_ssl_context)
+    loop = asyncio.get_running_loop()
+    shards = _async_clients.get(loop)
+    if shards is None or shards[0][0].is_closed:
+        _async_clients[loop] = _create_async_clients(httpx)
+
+
+def get_async_client():
+    """
+    Restituisce un client httpx.AsyncClient del loop corrente (HTTP_ASYNC_POOL_SHARDS client per event loop,
+    usati a rotazione, che si dividono HTTP_ASYNC_MAX_CONNECTIONS connessioni). Sono creati da
+    open_async_client allo startup, oppure qui al primo utilizzo.
+
+    Returns:
+        httpx.AsyncClient, oppure None se httpx non è installato.
+    """
+    httpx = import_httpx()
+    if httpx is None:
+        return None
+    loop = asyncio.get_running_loop()
+    shards = _async_clients.get(loop)
+    if shards is None or shards[0][0].is_closed:
+        shards = _create_async_clients(httpx)
+        _async_clients[loop] = shards
+    return next(shards[1])
+
+
+async def close_async_client() -> None:
+    """Chiude i client asincroni del loop corrente (da chiamare allo shutdown del server)."""
+    shards = _async_clients.pop(asyncio.get_running_loop(), None)
+    if shards is not None:
+        for client in shards[0]:
+            await client.aclose()
+
+
+async def async_get(url: str, params: dict | None = None, headers: dict | None = None, timeout: float = 10,
+                    retries: int | None = None, backoff_factor: float | None = None):
+    """
+    GET asincrona con la stessa politica di retry della sessione sincrona (5xx e timeout, backoff esponenziale).
+
+    Returns:
+        httpx.Response: l'ultima risposta ricevuta (anche 5xx, se i tentativi sono esauriti).
+
+    Raises:
+        RuntimeError: se httpx non è installato.
+        httpx.TimeoutException / httpx.TransportError: se anche l'ultimo tentativo fallisce.
+    """
+    client = get_async_client()
+    if client is None:
+        raise RuntimeError("httpx non è installato: la variante asincrona del client HTTP non è disponibile.")
+    httpx = import_httpx()
+    retries = HTTP_RETRIES if retries is None else retries
+    backoff_factor = HTTP_BACKOFF_FACTOR if backoff_factor is None else backoff_factor
+
+    attempt = 0
+    while True:
+        try:
+            response = await client.get(url, params=params, headers=headers, timeout=timeout)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                return response
+        except (httpx.TimeoutException, httpx.TransportError):
+            if attempt >= retries:
+                raise
+        await asyncio.sleep(backoff_factor * (2 ** attempt))
+        attempt += 1
+
+
+# --- RICHIESTE "HEDGED" ---
+
+class LatencyTracker:
+    """Finestra mobile delle ultime latenze di un upstream, per stimarne i percentili."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float) -> float | None:
+        """Percentile delle latenze registrate, None finché i campioni sono troppo pochi per essere indicativi."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < 20:
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+async def hedged(call, hedge_after: float | None):
+    """
+    Esegue `call()` (coroutine function che restituisce (codice_errore, valore)) e, se dopo
+    `hedge_after` secondi non ha ancora risposto, avvia una seconda richiesta identica.
+
+    Vince la prima risposta senza errore; l'altra richiesta viene cancellata.
+    Se entrambe falliscono viene restituito l'ultimo errore.
+
+    Returns:
+        tuple: (codice_errore, valore, hedged) dove hedged indica se è partita la seconda richiesta.
+    """
+    first = asyncio.ensure_future(call())
+    pending = {first}
+    try:
+        # Se il chiamante viene cancellato (es. scadenza della richiesta) anche le richieste in corso lo sono
+        if hedge_after is None:
+            error, value = await first
+            return error, value, False
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            error, value = first.result()
+            return error, value, False
+
+        pending.add(asyncio.ensure_future(call()))
+        outcome = (None, None)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcome = task.result()
+                if outcome[0] is None:
+                    return outcome[0], outcome[1], True
+        return outcome[0], outcome[1], True
+    finally:
+        for task in pending:
+            if not task.done():
+                task.cancel()
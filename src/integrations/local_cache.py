@@ -0,0 +1,393 @@
+# src/integrations/local_cache.py
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+from src.integrations.telemetry import get_logger
+
+log = get_logger("cache")
+
+# Stati possibili di una lettura dalla cache
+STATE_FRESH = "fresh"
+STATE_STALE = "stale"
+STATE_MISS = "miss"
+
+
+class CacheLookup(NamedTuple):
+    state: str
+    value: object = None
+    negative: bool = False
+
+
+class LocalCache:
+    """
+    Cache locale a due livelli: LRU in memoria davanti a un file SQLite su disco.
+
+    Ogni voce ha due scadenze: entro `fresh_until` è servita così com'è, fino a
+    `stale_until` è servita ma va rinfrescata (stale-while-revalidate), dopo è
+    considerata assente. I valori "negativi" (es. prodotto non trovato) sono
+    memorizzati con un TTL separato, di solito più breve.
+
+    Le voci oltre la finestra stale sono eliminate dal disco all'apertura e ogni
+    `purge_every` scritture (0 disattiva la pulizia periodica).
+    """
+
+    def __init__(self, db_path: str | None = None, max_memory_items: int = 1024,
+                 clock: Callable[[], float] = time.time, purge_every: int = 1000):
+        self.db_path = db_path
+        self.max_memory_items = max_memory_items
+        self.purge_every = purge_every
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[tuple[str, str], tuple] = OrderedDict()
+        self._refreshing: set[tuple[str, str]] = set()
+        self._conn = None
+        self._stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "writes": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "load_errors": 0,
+        }
+        if db_path:
+            self._open_db(db_path)
+            self.purge_expired()
+
+    # --- Persistenza su disco ---
+
+    def _open_db(self, db_path: str) -> None:
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT,"
+                " negative INTEGER NOT NULL DEFAULT 0,"
+                " stored_at REAL NOT NULL,"
+                " fresh_until REAL NOT NULL,"
+                " stale_until REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.commit()
+            self._conn = conn
+        except sqlite3.Error as e:
+            # Su filesystem in sola lettura (es. alcune piattaforme serverless) si resta solo in memoria
+            log.warning("Cache su disco non disponibile, uso solo la cache in memoria", path=db_path, error=str(e))
+            self._conn = None
+
+    def _read_disk(self, namespace: str, key: str) -> tuple | None:
+        if self._conn is None:
+            return None
+        try:
+            row = self._conn.execute(
+                "SELECT value, negative, fresh_until, stale_until FROM cache_entries"
+                " WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+        except sqlite3.Error as e:
+            log.error("Lettura della cache su disco fallita", error=str(e))
+            return None
+        if row is None:
+            return None
+        value = json.loads(row[0]) if row[0] is not None else None
+        return (value, bool(row[1]), row[2], row[3])
+
+    def _write_disk(self, namespace: str, key: str, entry: tuple, stored_at: float) -> None:
+        if self._conn is None:
+            return
+        value, negative, fresh_until, stale_until = entry
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries"
+                " (namespace, key, value, negative, stored_at, fresh_until, stale_until)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value, ensure_ascii=False), int(negative),
+                 stored_at, fresh_until, stale_until),
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            log.error("Scrittura della cache su disco fallita", error=str(e))
+
+    def purge_expired(self) -> int:
+        """Rimuove dal disco le voci oltre la finestra stale. Restituisce quante righe sono state eliminate."""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            try:
+                cursor = self._conn.execute("DELETE FROM cache_entries WHERE stale_until < ?", (self._clock(),))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                log.error("Pulizia della cache su disco fallita", error=str(e))
+                return 0
+            return cursor.rowcount
+
+    # --- Lettura / scrittura ---
+
+    def _remember(self, cache_key: tuple[str, str], entry: tuple) -> None:
+        self._memory[cache_key] = entry
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, namespace: str, key: str) -> CacheLookup:
+        """Legge una voce e ne classifica lo stato (fresh / stale / miss) aggiornando i contatori."""
+        cache_key = (namespace, key)
+        now = self._clock()
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            from_memory = entry is not None
+            if entry is None:
+                entry = self._read_disk(namespace, key)
+                if entry is not None:
+                    self._remember(cache_key, entry)
+            else:
+                self._memory.move_to_end(cache_key)
+            return self._classify(cache_key, entry, from_memory, now)
+
+    def _get_from_memory(self, namespace: str, key: str) -> CacheLookup | None:
+        """Come `get`, ma senza toccare il disco: None se la voce non è in memoria e va cercata su disco."""
+        cache_key = (namespace, key)
+        now = self._clock()
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is None:
+                if self._conn is not None:
+                    return None
+            else:
+                self._memory.move_to_end(cache_key)
+            return self._classify(cache_key, entry, True, now)
+
+    def _classify(self, cache_key: tuple[str, str], entry: tuple | None, from_memory: bool,
+                  now: float) -> CacheLookup:
+        # Da chiamare con il lock acquisito
+        if entry is None or now >= entry[3]:
+            if entry is not None:
+                self._memory.pop(cache_key, None)
+            self._stats["misses"] += 1
+            return CacheLookup(STATE_MISS)
+
+        value, negative, fresh_until, _ = entry
+        self._stats["hits"] += 1
+        self._stats["memory_hits" if from_memory else "disk_hits"] += 1
+        if negative:
+            self._stats["negative_hits"] += 1
+        if now >= fresh_until:
+            self._stats["stale"] += 1
+            return CacheLookup(STATE_STALE, value, negative)
+        return CacheLookup(STATE_FRESH, value, negative)
+
+    def set(self, namespace: str, key: str, value, ttl: float, stale_ttl: float = 0,
+            negative: bool = False) -> None:
+        """Memorizza `value` (serializzabile in JSON) per `ttl` secondi più `stale_ttl` di tolleranza."""
+        now = self._clock()
+        entry = (value, negative, now + ttl, now + ttl + stale_ttl)
+        with self._lock:
+            self._remember((namespace, key), entry)
+            self._write_disk(namespace, key, entry, now)
+            self._stats["writes"] += 1
+            purge = self._conn is not None and self.purge_every > 0 and self._stats["writes"] % self.purge_every == 0
+        if purge:
+            self.purge_expired()
+
+    def get_or_load(self, namespace: str, key: str, loader: Callable[[], tuple[str | None, object]],
+                    ttl: float, negative_ttl: float, stale_ttl: float = 0,
+                    is_negative: Callable[[object], bool] = lambda value: not value,
+                    refresh_loader: Callable[[], tuple[str | None, object]] | None = None):
+        """
+        Restituisce il valore in cache o lo carica con `loader`.
+
+        Args:
+            loader: funzione senza argomenti che restituisce (codice_errore, valore).
+                    Se codice_errore non è None il valore non viene memorizzato (errore transitorio).
+            ttl: durata in secondi di un valore positivo.
+            negative_ttl: durata in secondi di un valore negativo (vedi `is_negative`).
+            stale_ttl: finestra in cui un valore scaduto è servito mentre si aggiorna in background.
+            is_negative: stabilisce se un valore caricato va trattato come "non trovato".
+            refresh_loader: loader per l'aggiornamento in background dei valori stale (default `loader`).
+
+        Returns:
+            Il valore in cache (anche stale) oppure quello appena caricato.
+        """
+        lookup = self.get(namespace, key)
+        if lookup.state == STATE_FRESH:
+            return lookup.value
+        if lookup.state == STATE_STALE:
+            self._refresh_in_background(namespace, key, refresh_loader or loader, ttl, negative_ttl, stale_ttl,
+                                        is_negative)
+            return lookup.value
+        return self._store_loaded(namespace, key, loader(), ttl, negative_ttl, stale_ttl, is_negative)
+
+    async def aget_or_load(self, namespace: str, key: str, async_loader, ttl: float, negative_ttl: float,
+                           stale_ttl: float = 0, is_negative: Callable[[object], bool] = lambda value: not value,
+                           refresh_loader: Callable[[], tuple[str | None, object]] | None = None):
+        """
+        Variante di `get_or_load` per il codice asincrono: `async_loader` è una coroutine function.
+
+        L'aggiornamento dei valori stale avviene comunque in un thread, con `refresh_loader` (sincrono);
+        se non è indicato, il valore stale viene servito e ricaricato alla prima richiesta dopo la scadenza.
+        Le voci in memoria sono servite direttamente; letture e scritture su SQLite passano da un thread,
+        per non bloccare l'event loop (né tenervi il lock) durante l'accesso al disco.
+        """
+        lookup = self._get_from_memory(namespace, key)
+        if lookup is None:
+            lookup = await asyncio.to_thread(self.get, namespace, key)
+        if lookup.state == STATE_FRESH:
+            return lookup.value
+        if lookup.state == STATE_STALE:
+            if refresh_loader is not None:
+                self._refresh_in_background(namespace, key, refresh_loader, ttl, negative_ttl, stale_ttl, is_negative)
+            return lookup.value
+        outcome = await async_loader()
+        if self._conn is None:
+            return self._store_loaded(namespace, key, outcome, ttl, negative_ttl, stale_ttl, is_negative)
+        return await asyncio.to_thread(self._store_loaded, namespace, key, outcome, ttl, negative_ttl, stale_ttl,
+                                       is_negative)
+
+    def _store_loaded(self, namespace, key, outcome, ttl, negative_ttl, stale_ttl, is_negative):
+        error, value = outcome
+        if error is not None:
+            with self._lock:
+                self._stats["load_errors"] += 1
+            return value
+        negative = is_negative(value)
+        self.set(namespace, key, value, negative_ttl if negative else ttl,
+                 stale_ttl=0 if negative else stale_ttl, negative=negative)
+        return value
+
+    def _refresh_in_background(self, namespace, key, loader, ttl, negative_ttl, stale_ttl, is_negative) -> None:
+        cache_key = (namespace, key)
+        with self._lock:
+            if cache_key in self._refreshing:
+                return  # Un aggiornamento per questa chiave è già in corso
+            self._refreshing.add(cache_key)
+
+        def worker():
+            try:
+                error, value = loader()
+                if error is None:
+                    negative = is_negative(value)
+                    self.set(namespace, key, value, negative_ttl if negative else ttl,
+                             stale_ttl=0 if negative else stale_ttl, negative=negative)
+                with self._lock:
+                    self._stats["refreshes" if error is None else "refresh_errors"] += 1
+            except Exception as e:
+                log.error("Aggiornamento in background della cache fallito", key=cache_key, error=str(e))
+                with self._lock:
+                    self._stats["refresh_errors"] += 1
+            finally:
+                with self._lock:
+                    self._refreshing.discard(cache_key)
+
+        threading.Thread(target=worker, name=f"cache-refresh-{namespace}", daemon=True).start()
+
+    def values(self, namespace: str) -> list:
+        """Valori positivi non ancora scaduti di un namespace (memoria e disco), ad esempio per costruire indici locali."""
+        now = self._clock()
+        rows = []
+        with self._lock:
+            found = {key: entry[0] for (entry_namespace, key), entry in self._memory.items()
+                     if entry_namespace == namespace and not entry[1] and now < entry[3]}
+            if self._conn is not None:
+                try:
+                    rows = self._conn.execute(
+                        "SELECT key, value FROM cache_entries WHERE namespace = ? AND negative = 0 AND stale_until > ?",
+                        (namespace, now),
+                    ).fetchall()
+                except sqlite3.Error as e:
+                    log.error("Lettura della cache su disco fallita", error=str(e))
+        # La decodifica JSON dell'intera tabella avviene fuori dal lock, per non bloccare get/set
+        for key, value in rows:
+            if key not in found and value is not None:
+                found[key] = json.loads(value)
+        return list(found.values())
+
+    def stats(self) -> dict:
+        """Contatori di hit/miss/stale più la dimensione attuale della cache in memoria."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._memory)
+            stats["refreshing"] = len(self._refreshing)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["disk_enabled"] = self._conn is not None
+        return stats
+
+    def clear(self) -> None:
+        """Svuota memoria e disco (usato principalmente nei test)."""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM cache_entries")
+                self._conn.commit()
+
+
+class _InFlightCall:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Accorpa le chiamate concorrenti con la stessa chiave: la prima esegue la funzione,
+    le altre attendono e ricevono lo stesso risultato (o la stessa eccezione).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, _InFlightCall] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], object]):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
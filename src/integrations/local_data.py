@@ -0,0 +1,131 @@
+# src/integrations/local_data.py
+#
+# Lettura dei file di prodotti inclusi nel progetto (cartella data/): JSON, JSONL, CSV/TSV.
+# I record vengono normalizzati nella stessa forma dei prodotti restituiti da openfoodfacts_client.
+
+import csv
+import json
+import os
+
+from src.integrations.telemetry import get_logger
+
+log = get_logger("local_data")
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(PROJECT_ROOT_DIR, "data"))
+DATA_FILE_EXTENSIONS = (".json", ".jsonl", ".csv", ".tsv")
+
+_NAME_FIELDS = ("product_name_it", "product_name", "name", "nome", "prodotto")
+_BRAND_FIELDS = ("brands", "brand", "marca")
+_BARCODE_FIELDS = ("code", "barcode", "ean")
+_IMAGE_FIELDS = ("image_url", "immagine")
+# Chiave del prodotto normalizzato -> nomi di colonna accettati (formato OFF, formato del client, italiano)
+_NUTRIENT_FIELDS = {
+    "calories_100g": ("energy-kcal_100g", "calories_100g", "kcal", "calorie"),
+    "protein_100g": ("proteins_100g", "protein_100g", "proteine"),
+    "carbs_100g": ("carbohydrates_100g", "carbs_100g", "carboidrati"),
+    "fat_100g": ("fat_100g", "grassi"),
+}
+
+
+def _first_field(record: dict, fields: tuple) -> str | None:
+    for field in fields:
+        value = record.get(field)
+        if value not in (None, ""):
+            return str(value)
+    return None
+
+
+def _to_number(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(str(value).replace(",", "."))
+    except ValueError:
+        return None
+
+
+def iter_file_records(path: str):
+    """Record grezzi (dict) di un file JSON (lista o {"products": [...]}), JSONL o CSV/TSV. I file vuoti non producono nulla."""
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif path.endswith(".json"):
+            content = f.read().strip()
+            if not content:
+                return
+            data = json.loads(content)
+            yield from data.get("products", []) if isinstance(data, dict) else data
+        else:
+            sample = f.read(4096)
+            if not sample.strip():
+                return
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+            for row in csv.DictReader(f, dialect=dialect):
+                yield {(key or "").strip().lower(): value for key, value in row.items()}
+
+
+def record_identity(record: dict) -> tuple[str | None, str | None, str | None]:
+    """(barcode, nome, marca) di un record grezzo, con gli stessi nomi di colonna di product_from_record."""
+    if not isinstance(record, dict):
+        return None, None, None
+    name = _first_field(record, _NAME_FIELDS)
+    barcode = _first_field(record, _BARCODE_FIELDS)
+    return (barcode.strip() if barcode else None), (name.strip() if name else None), _first_field(record, _BRAND_FIELDS)
+
+
+def product_from_record(record: dict, api_source: str = "local_data") -> dict | None:
+    """Normalizza un record nel formato dei prodotti del client OFF; None se manca il nome."""
+    if not isinstance(record, dict):
+        return None
+    name = _first_field(record, _NAME_FIELDS)
+    if not name:
+        return None
+    nutriments = record.get("nutriments") if isinstance(record.get("nutriments"), dict) else record
+    product = {
+        "barcode": _first_field(record, _BARCODE_FIELDS),
+        "name": name.strip(),
+        "brands": _first_field(record, _BRAND_FIELDS),
+        "image_url": _first_field(record, _IMAGE_FIELDS),
+    }
+    for key, fields in _NUTRIENT_FIELDS.items():
+        product[key] = _to_number(_first_field(nutriments, fields))
+    product["api_source"] = api_source
+    return product
+
+
+def iter_data_products(directory: str = DATA_DIR, context: str = "dati locali"):
+    """
+    Prodotti normalizzati di tutti i file supportati in `directory` (ricorsivamente).
+
+    Un file con accanto la sua versione binaria aggiornata (.nfdb, vedi nutrition_db) viene letto
+    da quella, senza rileggere il sorgente. I file non leggibili vengono segnalati e saltati;
+    `context` compare nel messaggio.
+    """
+    # Import locale: nutrition_db usa a sua volta questo modulo per leggere i file sorgente
+    from src.integrations.nutrition_db import BINARY_EXTENSION, NutritionDB, binary_sibling
+
+    if not directory or not os.path.isdir(directory):
+        return
+    for root, _, files in os.walk(directory):
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            try:
+                if filename.lower().endswith(BINARY_EXTENSION):
+                    db = NutritionDB(path)
+                    yield from db.products()
+                    continue
+                if not filename.lower().endswith(DATA_FILE_EXTENSIONS) or binary_sibling(path) is not None:
+                    continue
+                for record in iter_file_records(path):
+                    product = product_from_record(record)
+                    if product is not None:
+                        yield product
+            except (OSError, ValueError, csv.Error) as e:
+                log.warning("File dati ignorato", path=path, context=context, error=str(e))
@@ -0,0 +1,547 @@
+# src/integrations/local_search.py
+#
+# Ricerca locale tollerante agli errori di battitura sui prodotti già presenti in locale
+# (cache di OpenFoodFacts, file in data/, prodotti visti durante l'esecuzione).
+#
+#   1. testo normalizzato: minuscolo, senza accenti e punteggiatura ("Caffè" -> "caffe");
+#   2. ogni parola della query viene confrontata con il vocabolario delle parole indicizzate: un indice
+#      di trigrammi di caratteri (" parmigiano " -> " pa", "par", "arm", ...) trova le parole che ne
+#      condividono molti, la distanza di Levenshtein decide quali sono varianti accettabili
+#      ("parmiggiano" -> "parmigiano", "cafe" -> "caffe"; più errori tollerati nelle parole lunghe);
+#   3. i candidati sono i documenti della parola più rara, ristretti a quelli che contengono anche le
+#      altre parole; punteggio BM25 (pesato per la similarità) calcolato in NumPy sulle liste di posting
+#      in formato CSR;
+#   4. i migliori candidati sono riordinati con la similarità parola per parola con la query.
+#
+# I prodotti aggiunti dopo la costruzione sono indicizzati in segmenti piccoli, fusi progressivamente
+# con quelli più grandi: l'aggiornamento è incrementale e non richiede di ricostruire tutto l'indice.
+
+import math
+import threading
+import time
+from array import array
+
+import numpy as np
+
+from src.integrations.autocomplete_index import normalize
+from src.integrations.telemetry import get_logger
+
+log = get_logger("local_search")
+
+# --- PARAMETRI ---
+BM25_K1 = 1.2
+BM25_B = 0.75
+LOCAL_SEARCH_CANDIDATES = 64        # candidati BM25 riordinati con la similarità parola per parola
+LOCAL_SEARCH_MIN_SIMILARITY = 0.6   # similarità minima (0-1) perché un risultato sia restituito
+LOCAL_SEARCH_FLUSH_EVERY = 100000   # documenti in attesa oltre i quali si crea subito un segmento (altrimenti alla ricerca)
+WORD_VARIANTS = 16                  # parole del vocabolario confrontate con ogni parola della query
+DENSE_UNION_RATIO = 0.02            # oltre questa quota di posting/documenti le varianti si uniscono su un array denso
+FUZZY_WEIGHT = 0.7                  # peso della similarità nel punteggio finale (il resto è BM25 normalizzato)
+
+PRODUCT_FIELDS = ("barcode", "name", "brands", "image_url", "calories_100g", "protein_100g", "carbs_100g", "fat_100g")
+NUTRIENT_KEYS = PRODUCT_FIELDS[4:]
+
+
+def word_trigrams(word: str) -> list[str]:
+    """Trigrammi di una parola con un separatore ai bordi: "pane" -> [" pa", "pan", "ane", "ne "]."""
+    padded = f" {word} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def levenshtein(a: str, b: str) -> int:
+    """Distanza di Levenshtein con l'algoritmo bit-parallelo di Myers (una operazione su interi per carattere)."""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    m = len(b)
+    if m == 0:
+        return len(a)
+    peq = {}
+    for i, ch in enumerate(b):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    for ch in a:
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh = mh << 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+    return score
+
+
+def max_typos(word: str) -> int:
+    """Errori di battitura tollerati in una parola: nessuno sotto i 4 caratteri, uno sotto gli 8, poi due."""
+    return 0 if len(word) < 4 else 1 if len(word) < 8 else 2
+
+
+def typo_distance(a: str, b: str) -> int:
+    """Distanza di Levenshtein in cui lo scambio di due lettere vicine ("fraina" / "farina") conta come un solo errore."""
+    distance = levenshtein(a, b)
+    if distance == 2 and len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]:
+            return 1
+    return distance
+
+
+def word_similarity(query_word: str, doc_word: str, prefix: bool = False) -> float:
+    """
+    Similarità 0-1 tra una parola della query e una parola indicizzata; 0 se gli errori sono più di max_typos.
+
+    Con `prefix` (ultima parola della query, forse ancora da completare) basta che coincida l'inizio della
+    parola indicizzata: "parmig" -> "parmigiano" vale 0.9.
+    """
+    if query_word == doc_word:
+        return 1.0
+    allowed = max_typos(query_word)
+    if abs(len(query_word) - len(doc_word)) <= allowed:
+        distance = typo_distance(query_word, doc_word)
+        if distance <= allowed:
+            return 1.0 - distance / max(len(query_word), len(doc_word))
+    if prefix and len(doc_word) > len(query_word) >= 3:
+        # un inizio di parola corto con un errore corrisponde a troppe parole: qui si tollera un errore in meno
+        distance = typo_distance(query_word, doc_word[:len(query_word)])
+        if distance <= allowed - 1 or distance == 0:
+            return 0.9 * (1.0 - distance / len(query_word))
+    return 0.0
+
+
+def fuzzy_score(query_words: list[str], doc_words: list[str], variants: dict) -> float:
+    """
+    Media, sulle parole della query, della similarità con la variante migliore presente nel documento.
+
+    `variants` associa (parola della query, parola del vocabolario) alla loro similarità; le coppie
+    assenti non sono varianti e valgono 0, quindi qui non si calcolano distanze di edit.
+    """
+    if not query_words or not doc_words:
+        return 0.0
+    total = 0.0
+    for q in query_words:
+        total += max(variants.get((q, d), 0.0) for d in doc_words)
+    return total / len(query_words)
+
+
+class _Segment:
+    """
+    Documenti [offset, offset + size) in formato CSR: per la parola t, doc_ids[indptr[t]:indptr[t+1]]
+    con le frequenze (tf) e i pesi BM25 già normalizzati per la lunghezza del documento (manca solo l'idf).
+    """
+
+    __slots__ = ("offset", "size", "indptr", "doc_ids", "tf", "weights", "df")
+
+    def __init__(self, offset: int, size: int, term_ids: np.ndarray, doc_ids: np.ndarray, tf: np.ndarray,
+                 doc_len: np.ndarray, avg_len: float, vocab_size: int):
+        order = np.lexsort((doc_ids, term_ids))
+        term_ids, doc_ids, tf = term_ids[order], doc_ids[order], tf[order]
+        self.offset = offset
+        self.size = size
+        self.df = np.bincount(term_ids, minlength=vocab_size).astype(np.int64)
+        self.indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+        np.cumsum(self.df, out=self.indptr[1:])
+        self.doc_ids = doc_ids.astype(np.uint32)
+        self.tf = np.minimum(tf, 255).astype(np.uint8)
+        tf = self.tf.astype(np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[offset + self.doc_ids.astype(np.int64)] / max(avg_len, 1e-9))
+        self.weights = (tf * (BM25_K1 + 1) / (tf + norm)).astype(np.float32)
+
+    def postings(self, term_id: int) -> tuple[np.ndarray, np.ndarray]:
+        if term_id + 1 >= len(self.indptr):
+            return self.doc_ids[:0], self.weights[:0]
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.doc_ids[start:end], self.weights[start:end]
+
+    def doc_freq(self, term_id: int) -> int:
+        return int(self.df[term_id]) if term_id < len(self.df) else 0
+
+    def to_coo(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(parola, documento relativo a offset, tf), per fondere due segmenti."""
+        term_ids = np.repeat(np.arange(len(self.df), dtype=np.int64), self.df)
+        return term_ids, self.doc_ids.astype(np.int64), self.tf.astype(np.int64)
+
+
+def _grow(values: np.ndarray, needed: int) -> np.ndarray:
+    """Array con capacità almeno `needed` righe (raddoppiata), per aggiungere colonne senza copie a ogni inserimento."""
+    if needed <= len(values):
+        return values
+    grown = np.empty((max(needed, 2 * len(values), 1024),) + values.shape[1:], dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
+
+
+class LocalSearchIndex:
+    """
+    Motore di ricerca locale sulle parole di nome e marca, con varianti trovate per trigrammi e
+    distanza di edit, punteggio BM25 e riordino per similarità.
+
+    I documenti nuovi formano segmenti piccoli; due segmenti adiacenti di dimensione simile vengono
+    fusi (come in un contatore binario), quindi i segmenti restano O(log N) e ogni documento viene
+    riscritto O(log N) volte. I risultati hanno la stessa forma di quelli di search_products_by_name
+    (api_source "local_search").
+
+    I documenti non si eliminano: con `max_documents` l'indice pieno scarta i prodotti nuovi (contati in
+    "dropped") e chi lo usa lo ricostruisce (vedi openfoodfacts_client).
+    """
+
+    def __init__(self, flush_every: int = LOCAL_SEARCH_FLUSH_EVERY, max_documents: int | None = None):
+        self.flush_every = flush_every
+        self.max_documents = max_documents
+        self._lock = threading.RLock()
+        # Vocabolario delle parole e indice trigramma -> parole che lo contengono
+        self._words: list[str] = []
+        self._word_ids: dict[str, int] = {}
+        self._trigram_words: dict[str, array] = {}
+        self._word_trigram_count = array("i")
+        self._keys: dict[str, int] = {}     # barcode (o nome|marca) -> id documento, per non duplicare
+        # Colonne dei documenti (gli array NumPy hanno capacità maggiore di len(self._names))
+        self._names: list[str] = []
+        self._brands: list[str | None] = []
+        self._barcodes: list[str | None] = []
+        self._images: list[str | None] = []
+        self._nutrients = np.empty((0, len(NUTRIENT_KEYS)), dtype=np.float32)
+        self._doc_len = np.empty(0, dtype=np.float32)
+        self._doc_terms = array("i")        # parole di ogni documento, una dopo l'altra
+        self._doc_terms_end = array("q")    # fine delle parole del documento i in _doc_terms
+        self._total_len = 0.0
+        # Segmenti indicizzati e coppie (parola, documento) in attesa
+        self._segments: list[_Segment] = []
+        self._indexed = 0
+        self._pending_terms = array("i")
+        self._pending_docs = array("i")
+        self._merges = 0
+        self._dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    # --- Inserimento ---
+
+    def add_products(self, products: list[dict]) -> int:
+        """Aggiunge i prodotti non ancora presenti (stesso barcode o stesso nome e marca). Restituisce quanti sono nuovi."""
+        with self._lock:
+            added = 0
+            for product in products:
+                if self.is_full():
+                    self._dropped += 1
+                else:
+                    added += self._add(product)
+            if len(self._names) - self._indexed >= self.flush_every:
+                self._flush()
+        return added
+
+    def is_full(self) -> bool:
+        return self.max_documents is not None and len(self._names) >= self.max_documents
+
+    def _word_id(self, word: str) -> int:
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = self._word_ids[word] = len(self._words)
+            self._words.append(word)
+            trigrams = set(word_trigrams(word))
+            for trigram in trigrams:
+                words = self._trigram_words.get(trigram)
+                if words is None:
+                    words = self._trigram_words[trigram] = array("i")
+                words.append(word_id)
+            self._word_trigram_count.append(len(trigrams))
+        return word_id
+
+    def _add(self, product: dict) -> int:
+        name = product.get("name")
+        normalized_name = normalize(name)
+        if not normalized_name:
+            return 0
+        brands = product.get("brands")
+        key = str(product.get("barcode") or "") or f"{normalized_name}|{normalize(brands)}"
+        if key in self._keys:
+            return 0
+        doc_id = len(self._names)
+        self._keys[key] = doc_id
+        self._names.append(str(name).strip())
+        self._brands.append(brands or None)
+        self._barcodes.append(str(product["barcode"]) if product.get("barcode") else None)
+        self._images.append(product.get("image_url") or None)
+
+        words = normalized_name.split(" ")
+        normalized_brand = normalize((brands or "").split(",")[0])
+        if normalized_brand:
+            words.extend(normalized_brand.split(" "))
+        term_ids = [self._word_id(word) for word in words]
+        self._pending_terms.extend(term_ids)
+        self._pending_docs.extend([doc_id] * len(term_ids))
+        self._doc_terms.extend(term_ids)
+        self._doc_terms_end.append(len(self._doc_terms))
+
+        self._doc_len = _grow(self._doc_len, doc_id + 1)
+        self._doc_len[doc_id] = len(term_ids)
+        self._total_len += len(term_ids)
+        self._nutrients = _grow(self._nutrients, doc_id + 1)
+        self._nutrients[doc_id] = [_as_float(product.get(key)) for key in NUTRIENT_KEYS]
+        return 1
+
+    def _avg_len(self) -> float:
+        return self._total_len / len(self._names) if self._names else 1.0
+
+    def _flush(self) -> None:
+        """Indicizza i documenti in attesa in un nuovo segmento e fonde i segmenti di dimensione simile."""
+        if self._indexed == len(self._names):
+            return
+        offset = self._indexed
+        size = len(self._names) - offset
+        docs = np.frombuffer(self._pending_docs, dtype=np.int32).astype(np.int64) - offset
+        pairs = np.frombuffer(self._pending_terms, dtype=np.int32).astype(np.int64) * size + docs
+        unique_pairs, tf = np.unique(pairs, return_counts=True)
+        del docs, pairs
+        self._segments.append(_Segment(offset, size, unique_pairs // size, unique_pairs % size, tf,
+                                       self._doc_len, self._avg_len(), len(self._words)))
+        self._pending_terms = array("i")
+        self._pending_docs = array("i")
+        self._indexed = len(self._names)
+        while len(self._segments) >= 2 and self._segments[-2].size <= 2 * self._segments[-1].size:
+            self._merge_last_two()
+
+    def _merge_last_two(self) -> None:
+        older, newer = self._segments[-2], self._segments[-1]
+        older_terms, older_docs, older_tf = older.to_coo()
+        newer_terms, newer_docs, newer_tf = newer.to_coo()
+        merged = _Segment(
+            older.offset, older.size + newer.size,
+            np.concatenate([older_terms, newer_terms]),
+            np.concatenate([older_docs, newer_docs + (newer.offset - older.offset)]),
+            np.concatenate([older_tf, newer_tf]),
+            self._doc_len, self._avg_len(), len(self._words),
+        )
+        self._segments[-2:] = [merged]
+        self._merges += 1
+
+    def optimize(self) -> None:
+        """Indicizza i documenti in attesa e fonde tutti i segmenti in uno (dopo un caricamento massivo)."""
+        with self._lock:
+            self._flush()
+            while len(self._segments) >= 2:
+                self._merge_last_two()
+
+    # --- Ricerca ---
+
+    def _word_variants(self, query_word: str, prefix: bool = False) -> dict[int, float]:
+        """
+        Parole del vocabolario che sono varianti di `query_word` (vedi word_similarity) -> similarità (0-1).
+
+        Si confrontano con la distanza di edit solo le WORD_VARIANTS parole con più trigrammi in comune
+        (indice di Jaccard), così il costo non dipende dalla dimensione del vocabolario.
+        """
+        variants = {}
+        exact = self._word_ids.get(query_word)
+        if exact is not None:
+            variants[exact] = 1.0
+        trigrams = set(word_trigrams(query_word))
+        parts = [np.frombuffer(self._trigram_words[t], dtype=np.int32) for t in trigrams if t in self._trigram_words]
+        if not parts:
+            return variants
+        shared = np.bincount(np.concatenate(parts))
+        del parts   # le viste sugli array("i") impedirebbero di aggiungere parole
+        word_ids = np.flatnonzero(shared)
+        common = shared[word_ids]
+        word_counts = np.frombuffer(self._word_trigram_count, dtype=np.int32)[word_ids]
+        jaccard = common / (len(trigrams) + word_counts - common)
+        del word_counts
+        if len(word_ids) > WORD_VARIANTS:
+            top = np.argpartition(jaccard, -WORD_VARIANTS)[-WORD_VARIANTS:]
+            word_ids = word_ids[top]
+        for word_id in word_ids.tolist():
+            if word_id not in variants:
+                similarity = word_similarity(query_word, self._words[word_id], prefix)
+                if similarity:
+                    variants[word_id] = similarity
+        return variants
+
+    def _query_terms(self, query_words: list[str], variants: dict) -> list[list[tuple[int, float]]]:
+        """
+        Per ogni parola della query che ha varianti nel vocabolario, la lista (variante, similarità * idf),
+        dalla parola più rara (meno documenti in totale) alla più comune.
+
+        L'ultima parola può essere ancora da completare e accetta anche le parole che iniziano così.
+        `variants` raccoglie (parola della query, variante) -> similarità per il riordino finale.
+        """
+        total_docs = len(self._names)
+        groups = []
+        for position, query_word in enumerate(query_words):
+            prefix = position == len(query_words) - 1
+            terms, group_df = [], 0
+            for word_id, similarity in self._word_variants(query_word, prefix).items():
+                variants[(query_word, self._words[word_id])] = similarity
+                df = sum(segment.doc_freq(word_id) for segment in self._segments)
+                if df:
+                    idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                    terms.append((word_id, similarity * idf))
+                    group_df += df
+            if terms:
+                groups.append((group_df, position, terms))
+        groups.sort()
+        return [terms for _, _, terms in groups]
+
+    @staticmethod
+    def _score_segment(segment: _Segment, groups: list[list[tuple[int, float]]], candidates: int):
+        """
+        Migliori `candidates` documenti del segmento: (id documento, punteggio BM25).
+
+        Si parte dai documenti della parola più rara e si restringe con le altre, cercando i candidati
+        (ordinati) nelle liste di posting (ordinate) con searchsorted: il costo dipende dalla parola più
+        rara, non da quelle comuni. Una parola che non compare in nessun candidato viene ignorata, così
+        una parola sbagliata o assente dai prodotti non svuota i risultati.
+        """
+        docs = scores = None
+        for terms in groups:
+            if docs is None:
+                docs, scores = LocalSearchIndex._union_postings(segment, terms)
+                if not len(docs):
+                    docs = scores = None
+                continue
+            matched = np.zeros(len(docs), dtype=np.float32)
+            for term_id, query_weight in terms:
+                doc_ids, weights = segment.postings(term_id)
+                if not len(doc_ids):
+                    continue
+                positions = np.minimum(np.searchsorted(doc_ids, docs), len(doc_ids) - 1)
+                found = doc_ids[positions] == docs
+                matched[found] += weights[positions[found]] * np.float32(query_weight)
+            keep = matched > 0
+            if keep.any():
+                docs, scores = docs[keep], scores[keep] + matched[keep]
+        if docs is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if len(scores) > candidates:
+            top = np.argpartition(scores, -candidates)[-candidates:]
+            docs, scores = docs[top], scores[top]
+        return docs.astype(np.int64) + segment.offset, scores
+
+    @staticmethod
+    def _union_postings(segment: _Segment, terms: list[tuple[int, float]]) -> tuple[np.ndarray, np.ndarray]:
+        """Documenti (ordinati, senza ripetizioni) che contengono almeno una delle varianti, con la somma dei pesi."""
+        doc_parts, weight_parts = [], []
+        for term_id, query_weight in terms:
+            doc_ids, weights = segment.postings(term_id)
+            if len(doc_ids):
+                doc_parts.append(doc_ids)
+                weight_parts.append(weights * np.float32(query_weight))
+        if len(doc_parts) <= 1:
+            return (doc_parts[0], weight_parts[0]) if doc_parts else (segment.doc_ids[:0], segment.weights[:0])
+        doc_ids = np.concatenate(doc_parts)
+        weights = np.concatenate(weight_parts)
+        if len(doc_ids) > DENSE_UNION_RATIO * segment.size:
+            # molti posting: accumulo su array densi, evita di ordinare
+            totals = np.bincount(doc_ids, weights=weights, minlength=segment.size)
+            present = np.zeros(segment.size, dtype=bool)
+            present[doc_ids] = True
+            docs = np.flatnonzero(present)
+            return docs.astype(np.uint32), totals[docs].astype(np.float32)
+        docs, inverse = np.unique(doc_ids, return_inverse=True)
+        return docs, np.bincount(inverse, weights=weights).astype(np.float32)
+
+    def search(self, query: str, page_size: int = 5, candidates: int = LOCAL_SEARCH_CANDIDATES) -> list[dict]:
+        """
+        Cerca prodotti per nome (e marca), tollerando accenti mancanti ed errori di battitura.
+
+        Returns:
+            list[dict]: al massimo `page_size` prodotti nella forma di search_products_by_name.
+        """
+        normalized_query = normalize(query)
+        if not normalized_query:
+            return []
+        query_words = normalized_query.split(" ")
+        with self._lock:
+            self._flush()
+            variants = {}
+            groups = self._query_terms(query_words, variants)
+            if not groups:
+                return []
+            scored = [self._score_segment(segment, groups, candidates) for segment in self._segments]
+            doc_ids = np.concatenate([docs for docs, _ in scored])
+            bm25 = np.concatenate([scores for _, scores in scored])
+            if len(doc_ids) > candidates:
+                top = np.argpartition(bm25, -candidates)[-candidates:]
+                doc_ids, bm25 = doc_ids[top], bm25[top]
+            if not len(doc_ids):
+                return []
+
+            # le parole che non somigliano a nessuna parola indicizzata non distinguono i documenti
+            found_words = {query_word for query_word, _ in variants}
+            matched_words = [query_word for query_word in query_words if query_word in found_words]
+            best_bm25 = float(bm25.max())
+            ranked = []
+            for doc_id, score in zip(doc_ids.tolist(), bm25.tolist()):
+                similarity = fuzzy_score(matched_words, self._doc_words(doc_id), variants)
+                if similarity >= LOCAL_SEARCH_MIN_SIMILARITY:
+                    ranked.append((FUZZY_WEIGHT * similarity + (1 - FUZZY_WEIGHT) * score / best_bm25, -doc_id))
+            ranked.sort(reverse=True)
+            return [self._product(-negative_id) for _, negative_id in ranked[:page_size]]
+
+    def _doc_words(self, doc_id: int) -> list[str]:
+        start = self._doc_terms_end[doc_id - 1] if doc_id else 0
+        return [self._words[term_id] for term_id in self._doc_terms[start:self._doc_terms_end[doc_id]]]
+
+    def _product(self, doc_id: int) -> dict:
+        product = {
+            "barcode": self._barcodes[doc_id],
+            "name": self._names[doc_id],
+            "brands": self._brands[doc_id],
+            "image_url": self._images[doc_id],
+        }
+        for key, value in zip(NUTRIENT_KEYS, self._nutrients[doc_id].tolist()):
+            product[key] = None if math.isnan(value) else round(value, 3)
+        product["api_source"] = "local_search"
+        return product
+
+    def products_with_nutrients(self, limit: int) -> list[dict]:
+        """Gli ultimi `limit` prodotti indicizzati con tutti i valori nutrizionali (candidati per i piani alimentari)."""
+        with self._lock:
+            complete = ~np.isnan(self._nutrients[:len(self._names)]).any(axis=1)
+            return [self._product(doc_id) for doc_id in np.flatnonzero(complete)[-limit:].tolist()] if limit > 0 else []
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._names),
+                "words": len(self._words),
+                "segments": len(self._segments),
+                "pending_documents": len(self._names) - self._indexed,
+                "postings": sum(len(segment.doc_ids) for segment in self._segments),
+                "merges": self._merges,
+                "max_documents": self.max_documents,
+                "dropped": self._dropped,
+            }
+
+
+def _as_float(value) -> float:
+    try:
+        return math.nan if value is None else float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def build_local_search_index(product_sources) -> LocalSearchIndex:
+    """Crea un indice con i prodotti di più sorgenti (iterabili di dict) e lo compatta in un solo segmento."""
+    started = time.perf_counter()
+    index = LocalSearchIndex()
+    for source in product_sources:
+        batch = []
+        for product in source:
+            batch.append(product)
+            if len(batch) >= 10000:
+                index.add_products(batch)
+                batch = []
+        index.add_products(batch)
+    index.optimize()
+    if len(index):
+        log.info("Indice di ricerca locale costruito", products=len(index), seconds=round(time.perf_counter() - started, 1))
+    return index
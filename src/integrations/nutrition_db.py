@@ -0,0 +1,339 @@
+# src/integrations/nutrition_db.py
+#
+# Tabella nutrizionale di riferimento (data/nutritional_database_example.json) in un formato binario
+# compatto, aperto con mmap: l'avvio costa O(1) qualunque sia il numero di prodotti, i processi che
+# aprono lo stesso file condividono le pagine e le letture per riga o per barcode non copiano i dati.
+# I file JSON piccoli restano supportati, caricati in memoria con la stessa interfaccia.
+#
+# Formato binario (un solo file .nfdb, little-endian, sezioni allineate a 8 byte):
+#   header          -> magic b"NFDB", versione u32, righe u64, stringhe u64, barcode indicizzati u64,
+#                      offset u64 delle sei sezioni seguenti
+#   nutrients       -> float32 [righe x 4] (kcal, proteine, carboidrati, grassi per 100 g; NaN se mancante)
+#   string_ids      -> uint32 [righe x 4] (barcode, nome, marca, immagine) nella tabella delle stringhe
+#   barcode_keys    -> uint64 [barcode] barcode numerici ordinati, per la ricerca binaria
+#   barcode_rows    -> uint32 [barcode] riga di ogni chiave
+#   string_offsets  -> uint64 [stringhe + 1]
+#   string_data     -> testo UTF-8 delle stringhe distinte (internate); la stringa 0 è "" (valore assente)
+#
+# Uso: python -m src.integrations.nutrition_db convert data/nutritional_database_example.json [out.nfdb]
+#      python -m src.integrations.nutrition_db lookup file.nfdb 8001234567890
+
+import argparse
+import json
+import math
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+
+import numpy as np
+
+from src.integrations.local_data import DATA_DIR, iter_file_records, product_from_record
+from src.integrations.telemetry import get_logger
+
+log = get_logger("nutrition_db")
+
+NUTRITION_DB_PATH = os.getenv('NUTRITION_DB_PATH', os.path.join(DATA_DIR, "nutritional_database_example.json"))
+
+BINARY_EXTENSION = ".nfdb"
+MAGIC = b"NFDB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIQQQ6Q")
+NUTRIENT_KEYS = ("calories_100g", "protein_100g", "carbs_100g", "fat_100g")
+STRING_COLUMNS = ("barcode", "name", "brands", "image_url")
+MAX_BARCODE_DIGITS = 19          # i barcode più lunghi non entrano in un uint64 e non vengono indicizzati
+
+_nutrition_db = None
+_nutrition_db_loaded = False
+_nutrition_db_lock = threading.Lock()
+
+
+def _barcode_key(barcode: str | None) -> int | None:
+    if not barcode or not (barcode.isascii() and barcode.isdigit()) or len(barcode) > MAX_BARCODE_DIGITS:
+        return None
+    return int(barcode)
+
+
+def _nutrient_value(value: float) -> float | None:
+    return None if math.isnan(value) else round(value, 3)
+
+
+class _NutritionTable:
+    """Interfaccia comune: prodotti per riga o per barcode, nella forma dei prodotti del client OFF."""
+
+    nutrients: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.nutrients)
+
+    def get_by_barcode(self, barcode: str) -> dict | None:
+        row = self.row_of(str(barcode).strip())
+        return None if row is None else self.get_product(row)
+
+    def products(self):
+        for row in range(len(self)):
+            yield self.get_product(row)
+
+    def _product(self, row: int, strings: list) -> dict:
+        product = {column: value or None for column, value in zip(STRING_COLUMNS, strings)}
+        for key, value in zip(NUTRIENT_KEYS, self.nutrients[row].tolist()):
+            product[key] = _nutrient_value(value)
+        product["api_source"] = "nutrition_db"
+        return product
+
+
+class NutritionDB(_NutritionTable):
+    """Tabella binaria in sola lettura mappata in memoria; le colonne sono viste NumPy sul file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self._mmap) < HEADER.size:
+                raise ValueError(f"'{path}' non è un database nutrizionale binario")
+            magic, version, rows, strings, barcodes, *offsets = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise ValueError(f"'{path}' non è un database nutrizionale binario")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Versione del formato non supportata: {version}")
+            sections = (rows * 4 * len(NUTRIENT_KEYS), rows * 4 * len(STRING_COLUMNS), barcodes * 8, barcodes * 4,
+                        (strings + 1) * 8, 0)
+            if any(offset + size > len(self._mmap) for offset, size in zip(offsets, sections)):
+                raise ValueError(f"'{path}' è troncato o danneggiato")
+            buffer = self._mmap
+            self.nutrients = np.frombuffer(buffer, np.float32, rows * len(NUTRIENT_KEYS), offsets[0]).reshape(
+                rows, len(NUTRIENT_KEYS))
+            self._string_ids = np.frombuffer(buffer, np.uint32, rows * len(STRING_COLUMNS), offsets[1]).reshape(
+                rows, len(STRING_COLUMNS))
+            self._barcode_keys = np.frombuffer(buffer, np.uint64, barcodes, offsets[2])
+            self._barcode_rows = np.frombuffer(buffer, np.uint32, barcodes, offsets[3])
+            self._string_offsets = np.frombuffer(buffer, np.uint64, strings + 1, offsets[4])
+            self._string_data = offsets[5]
+        except ValueError:
+            self.close()
+            raise
+        self.strings = strings
+
+    def close(self) -> None:
+        # Le viste NumPy tengono riferimenti al buffer: si chiude solo se non ne restano in giro
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def string(self, string_id: int) -> str:
+        start, end = self._string_offsets[string_id:string_id + 2].tolist()
+        return self._mmap[self._string_data + start:self._string_data + end].decode("utf-8")
+
+    def row_of(self, barcode: str) -> int | None:
+        """Riga del prodotto con il barcode indicato (ricerca binaria sull'indice ordinato), o None."""
+        key = _barcode_key(barcode)
+        if key is None:
+            return None
+        position = int(np.searchsorted(self._barcode_keys, np.uint64(key)))
+        # chiavi uguali con zeri iniziali diversi ("0123" e "123"): si confronta il testo
+        while position < len(self._barcode_keys) and int(self._barcode_keys[position]) == key:
+            row = int(self._barcode_rows[position])
+            if self.string(int(self._string_ids[row, 0])) == barcode:
+                return row
+            position += 1
+        return None
+
+    def get_product(self, row: int) -> dict:
+        return self._product(row, [self.string(string_id) for string_id in self._string_ids[row].tolist()])
+
+
+class JsonNutritionDB(_NutritionTable):
+    """La stessa tabella caricata da un file JSON/JSONL/CSV: comoda per file piccoli, tutta in memoria."""
+
+    def __init__(self, path: str):
+        self.path = path
+        rows, nutrients = [], array("f")
+        self._barcode_rows = {}
+        for record in iter_file_records(path):
+            product = product_from_record(record)
+            if product is None:
+                continue
+            if product["barcode"] and product["barcode"] not in self._barcode_rows:
+                self._barcode_rows[product["barcode"]] = len(rows)
+            rows.append([product[column] or "" for column in STRING_COLUMNS])
+            nutrients.extend(math.nan if product[key] is None else product[key] for key in NUTRIENT_KEYS)
+        self._rows = rows
+        self.nutrients = np.frombuffer(nutrients, dtype=np.float32).reshape(len(rows), len(NUTRIENT_KEYS))
+
+    def close(self) -> None:
+        pass
+
+    def row_of(self, barcode: str) -> int | None:
+        return self._barcode_rows.get(barcode)
+
+    def get_product(self, row: int) -> dict:
+        return self._product(row, self._rows[row])
+
+
+# --- CONVERSIONE ---
+
+def convert_to_binary(source_path: str, out_path: str | None = None) -> dict:
+    """
+    Converte un file di prodotti (JSON, JSONL, CSV/TSV) nel formato binario.
+
+    Le colonne vengono scritte in file temporanei man mano che si leggono i record e poi
+    concatenate; il file finale sostituisce quello vecchio in modo atomico, così i processi che
+    lo hanno già mappato continuano a leggere la versione precedente.
+
+    Returns:
+        dict: righe, stringhe distinte, barcode indicizzati, dimensioni dei file e percorso di uscita.
+    """
+    out_path = out_path or os.path.splitext(source_path)[0] + BINARY_EXTENSION
+    work_dir = tempfile.mkdtemp(prefix="nfdb_", dir=os.path.dirname(os.path.abspath(out_path)))
+    try:
+        interned = {"": 0}
+        string_offsets = array("Q", [0, 0])     # la stringa 0 ("") occupa zero byte
+        barcode_keys, barcode_rows = array("Q"), array("I")
+        rows = 0
+        paths = {name: os.path.join(work_dir, name) for name in ("nutrients", "string_ids", "string_data")}
+        with open(paths["nutrients"], "wb") as nutrients_file, open(paths["string_ids"], "wb") as ids_file, \
+                open(paths["string_data"], "wb") as strings_file:
+            for record in iter_file_records(source_path):
+                product = product_from_record(record)
+                if product is None:
+                    continue
+                array("f", [math.nan if product[key] is None else product[key] for key in NUTRIENT_KEYS]
+                      ).tofile(nutrients_file)
+                ids = array("I")
+                for column in STRING_COLUMNS:
+                    value = product[column] or ""
+                    string_id = interned.get(value)
+                    if string_id is None:
+                        string_id = interned[value] = len(interned)
+                        encoded = value.encode("utf-8")
+                        strings_file.write(encoded)
+                        string_offsets.append(string_offsets[-1] + len(encoded))
+                    ids.append(string_id)
+                ids.tofile(ids_file)
+                key = _barcode_key(product["barcode"])
+                if key is not None:
+                    barcode_keys.append(key)
+                    barcode_rows.append(rows)
+                rows += 1
+
+        keys = np.frombuffer(barcode_keys, dtype=np.uint64) if barcode_keys else np.zeros(0, np.uint64)
+        order = np.argsort(keys, kind="stable")    # a parità di barcode vince la prima riga
+        sections = [
+            paths["nutrients"], paths["string_ids"],
+            keys[order], np.frombuffer(barcode_rows, dtype=np.uint32)[order] if barcode_rows else np.zeros(0, np.uint32),
+            np.frombuffer(string_offsets, dtype=np.uint64), paths["string_data"],
+        ]
+
+        temp_out = os.path.join(work_dir, "out" + BINARY_EXTENSION)
+        with open(temp_out, "wb") as out:
+            out.write(b"\0" * HEADER.size)
+            offsets = []
+            for section in sections:
+                out.write(b"\0" * (-out.tell() % 8))
+                offsets.append(out.tell())
+                if isinstance(section, str):
+                    with open(section, "rb") as part:
+                        shutil.copyfileobj(part, out, 1 << 20)
+                else:
+                    out.write(section.tobytes())
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, FORMAT_VERSION, rows, len(interned), len(keys), *offsets))
+        os.replace(temp_out, out_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = {"rows": rows, "strings": len(interned), "barcodes": len(keys), "out_path": out_path,
+               "source_bytes": os.path.getsize(source_path), "binary_bytes": os.path.getsize(out_path)}
+    log.info("Database nutrizionale convertito", path=out_path, products=rows, strings=len(interned),
+             bytes=summary["binary_bytes"], source_bytes=summary["source_bytes"])
+    return summary
+
+
+# --- CARICAMENTO ---
+
+def binary_sibling(path: str) -> str | None:
+    """La versione binaria di un file sorgente (stesso nome, estensione .nfdb) se esiste ed è aggiornata."""
+    candidate = os.path.splitext(path)[0] + BINARY_EXTENSION
+    if candidate == path or not os.path.exists(candidate):
+        return None
+    if os.path.exists(path) and os.path.getmtime(candidate) < os.path.getmtime(path):
+        return None
+    return candidate
+
+
+def load_nutrition_db(path: str) -> _NutritionTable | None:
+    """
+    Apre il database nutrizionale: il formato binario se `path` è un .nfdb o ha accanto la sua
+    versione binaria aggiornata, altrimenti il file sorgente in memoria. None se manca o non è leggibile.
+    """
+    if not path:
+        return None
+    binary = path if path.endswith(BINARY_EXTENSION) else binary_sibling(path)
+    try:
+        if binary is not None:
+            return NutritionDB(binary)
+        if os.path.exists(path):
+            return JsonNutritionDB(path)
+    except (OSError, ValueError) as e:
+        log.error("Impossibile aprire il database nutrizionale", path=binary or path, error=str(e))
+    return None
+
+
+def get_nutrition_db() -> _NutritionTable | None:
+    """Restituisce il database nutrizionale configurato (aperto una sola volta), oppure None."""
+    global _nutrition_db, _nutrition_db_loaded
+    with _nutrition_db_lock:
+        if not _nutrition_db_loaded:
+            _nutrition_db = load_nutrition_db(NUTRITION_DB_PATH)
+            _nutrition_db_loaded = True
+            if _nutrition_db is not None and len(_nutrition_db):
+                log.info("Database nutrizionale aperto", path=_nutrition_db.path, products=len(_nutrition_db))
+        return _nutrition_db
+
+
+def set_nutrition_db(db: _NutritionTable | None) -> None:
+    """Imposta il database nutrizionale da usare (None lo disattiva)."""
+    global _nutrition_db, _nutrition_db_loaded
+    with _nutrition_db_lock:
+        _nutrition_db = db
+        _nutrition_db_loaded = True
+
+
+def reset_nutrition_db() -> None:
+    """Riapre il database configurato al prossimo utilizzo (ad esempio dopo una conversione)."""
+    global _nutrition_db, _nutrition_db_loaded
+    with _nutrition_db_lock:
+        _nutrition_db = None
+        _nutrition_db_loaded = False
+
+
+def lookup_reference_product(barcode: str) -> dict | None:
+    """Prodotto della tabella di riferimento con il barcode indicato, senza rete né cache."""
+    db = get_nutrition_db()
+    return None if db is None else db.get_by_barcode(barcode)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Database nutrizionale in formato binario.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Converte un file JSON/JSONL/CSV nel formato binario.")
+    convert_parser.add_argument("source_path")
+    convert_parser.add_argument("out_path", nargs="?")
+    lookup_parser = subparsers.add_parser("lookup", help="Cerca un prodotto per barcode.")
+    lookup_parser.add_argument("db_path")
+    lookup_parser.add_argument("barcode")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        convert_to_binary(args.source_path, args.out_path)
+    else:
+        db = load_nutrition_db(args.db_path)
+        if db is None:
+            sys.exit(f"Nessun database leggibile in '{args.db_path}'.")
+        print(json.dumps(db.get_by_barcode(args.barcode), ensure_ascii=False))
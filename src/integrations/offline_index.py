@@ -0,0 +1,383 @@
+# src/integrations/offline_index.py
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+import numpy as np
+
+from src.integrations.telemetry import get_logger
+
+log = get_logger("offline_index")
+
+# Formato su disco (una directory):
+#   meta.json        -> versione, numero righe/token, campi
+#   nutrients.f32    -> float32 [righe x 4] (kcal, proteine, carboidrati, grassi per 100 g; NaN se mancante)
+#   strings.bin/.idx -> testo UTF-8 dei campi stringa e offset uint64 (righe x STRING_FIELDS + 1)
+#   vocab.bin/.idx   -> token ordinati alfabeticamente e relativi offset uint64
+#   postings.idx     -> per ogni token (nell'ordine del vocabolario) inizio uint64 e lunghezza nel file postings
+#   postings.u32     -> id delle righe che contengono il token
+INDEX_VERSION = 1
+STRING_FIELDS = ("code", "name", "name_en", "brands", "image_url")
+NUTRIENT_FIELDS = ("energy-kcal_100g", "proteins_100g", "carbohydrates_100g", "fat_100g")
+PRODUCT_KEYS = ("calories_100g", "protein_100g", "carbs_100g", "fat_100g")
+
+# Numero di file temporanei in cui vengono partizionate le coppie (token, riga) durante l'ingestione:
+# ogni partizione viene ordinata da sola, così la memoria resta limitata anche con dump molto grandi
+NUM_BUCKETS = 64
+FLUSH_EVERY_PAIRS = 1_000_000
+MAX_PREFIX_EXPANSIONS = 50
+
+STOPWORDS = frozenset({
+    "di", "da", "del", "della", "dei", "delle", "al", "alla", "con", "per", "in", "il", "la", "le",
+    "lo", "gli", "un", "una", "e", "ed", "the", "of", "and", "with", "a", "an", "to",
+})
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold_text(text: str) -> str:
+    """Minuscolo e senza accenti ("Caffè Crème" -> "caffe creme")."""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str | None) -> list[str]:
+    if not text:
+        return []
+    return [tok for tok in _TOKEN_RE.findall(fold_text(text)) if len(tok) > 1 and tok not in STOPWORDS]
+
+
+# --- LETTURA DEL DUMP ---
+
+def _open_text(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace", newline="")
+    return open(path, "r", encoding="utf-8", errors="replace", newline="")
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _record_from_off(product: dict, nutriments: dict) -> dict | None:
+    """Estrae dal prodotto OFF solo i campi che il client usa già; None se il prodotto non ha nome."""
+    name = product.get("product_name_it") or product.get("product_name") or product.get("product_name_en")
+    if not name:
+        return None
+    return {
+        "code": str(product.get("code") or ""),
+        "name": name,
+        "name_en": product.get("product_name_en") or "",
+        "brands": product.get("brands") or "",
+        "image_url": product.get("image_url") or "",
+        "nutrients": [_to_float(nutriments.get(field)) for field in NUTRIENT_FIELDS],
+    }
+
+
+def iter_dump_records(path: str):
+    """Legge in streaming un export OFF JSONL o CSV/TSV (anche .gz), una riga alla volta."""
+    base = path[:-3] if path.endswith(".gz") else path
+    with _open_text(path) as handle:
+        if base.endswith((".jsonl", ".json", ".ndjson")):
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    product = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                record = _record_from_off(product, product.get("nutriments") or {})
+                if record is not None:
+                    yield record
+        else:
+            csv.field_size_limit(sys.maxsize)
+            first_line = handle.readline()
+            delimiter = "\t" if "\t" in first_line else ","
+            header = next(csv.reader(io.StringIO(first_line), delimiter=delimiter), [])
+            for row in csv.DictReader(handle, fieldnames=header, delimiter=delimiter):
+                record = _record_from_off(row, row)
+                if record is not None:
+                    yield record
+
+
+# --- COSTRUZIONE DELL'INDICE ---
+
+def build_index(dump_path: str, out_dir: str, progress_every: int = 100_000) -> dict:
+    """
+    Costruisce l'indice offline a partire da un dump OpenFoodFacts.
+
+    Args:
+        dump_path: file JSONL o CSV/TSV, eventualmente compresso con gzip.
+        out_dir: directory di destinazione (viene sovrascritta).
+        progress_every: ogni quante righe stampare l'avanzamento (0 per disattivare).
+
+    Returns:
+        dict: i metadati scritti in meta.json.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="off_index_", dir=out_dir)
+    try:
+        vocab: dict[str, int] = {}
+        buckets = [array("I") for _ in range(NUM_BUCKETS)]
+        bucket_paths = [os.path.join(work_dir, f"pairs_{i:02d}.u32") for i in range(NUM_BUCKETS)]
+        pending_pairs = 0
+        rows = 0
+        string_offset = 0
+
+        with open(os.path.join(out_dir, "nutrients.f32"), "wb") as nutrients_file, \
+                open(os.path.join(out_dir, "strings.bin"), "wb") as strings_file, \
+                open(os.path.join(out_dir, "strings.idx"), "wb") as strings_idx_file:
+            offsets = array("Q", [0])
+            for record in iter_dump_records(dump_path):
+                array("f", record["nutrients"]).tofile(nutrients_file)
+                for field in STRING_FIELDS:
+                    encoded = record[field].encode("utf-8")
+                    strings_file.write(encoded)
+                    string_offset += len(encoded)
+                    offsets.append(string_offset)
+                if len(offsets) >= 65536:
+                    offsets.tofile(strings_idx_file)
+                    offsets = array("Q")
+
+                tokens = set(tokenize(record["name"]))
+                tokens.update(tokenize(record["name_en"]))
+                tokens.update(tokenize(record["brands"]))
+                for token in tokens:
+                    token_id = vocab.setdefault(token, len(vocab))
+                    bucket = buckets[token_id % NUM_BUCKETS]
+                    bucket.append(token_id)
+                    bucket.append(rows)
+                pending_pairs += len(tokens)
+                rows += 1
+
+                if pending_pairs >= FLUSH_EVERY_PAIRS:
+                    _flush_buckets(buckets, bucket_paths)
+                    pending_pairs = 0
+                if progress_every and rows % progress_every == 0:
+                    log.info("Indicizzazione in corso", products=rows, tokens=len(vocab))
+            offsets.tofile(strings_idx_file)
+        _flush_buckets(buckets, bucket_paths)
+
+        _write_postings(vocab, bucket_paths, out_dir)
+        _write_vocab(vocab, out_dir)
+
+        meta = {
+            "version": INDEX_VERSION,
+            "rows": rows,
+            "tokens": len(vocab),
+            "string_fields": list(STRING_FIELDS),
+            "nutrient_fields": list(NUTRIENT_FIELDS),
+            "source": os.path.basename(dump_path),
+        }
+        with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as meta_file:
+            json.dump(meta, meta_file, indent=2)
+        log.info("Indice offline creato", path=out_dir, products=rows, tokens=len(vocab))
+        return meta
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _flush_buckets(buckets: list[array], bucket_paths: list[str]) -> None:
+    for bucket, path in zip(buckets, bucket_paths):
+        if bucket:
+            with open(path, "ab") as handle:
+                bucket.tofile(handle)
+            del bucket[:]
+
+
+def _write_postings(vocab: dict[str, int], bucket_paths: list[str], out_dir: str) -> None:
+    """Ordina una partizione alla volta e scrive le posting list; l'indice viene poi riordinato per token."""
+    starts = np.zeros(len(vocab), dtype=np.uint64)
+    counts = np.zeros(len(vocab), dtype=np.uint64)
+    written = 0
+    with open(os.path.join(out_dir, "postings.u32"), "wb") as postings_file:
+        for path in bucket_paths:
+            if not os.path.exists(path):
+                continue
+            pairs = np.fromfile(path, dtype=np.uint32).reshape(-1, 2)
+            order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+            token_ids = pairs[order, 0]
+            pairs[order, 1].tofile(postings_file)
+            unique_ids, first_index, group_sizes = np.unique(token_ids, return_index=True, return_counts=True)
+            starts[unique_ids] = written + first_index
+            counts[unique_ids] = group_sizes
+            written += len(token_ids)
+            os.remove(path)
+
+    ordered_ids = np.array([vocab[token] for token in sorted(vocab)], dtype=np.int64)
+    table = np.empty((len(vocab), 2), dtype=np.uint64)
+    table[:, 0] = starts[ordered_ids]
+    table[:, 1] = counts[ordered_ids]
+    table.tofile(os.path.join(out_dir, "postings.idx"))
+
+
+def _write_vocab(vocab: dict[str, int], out_dir: str) -> None:
+    offsets = array("Q", [0])
+    with open(os.path.join(out_dir, "vocab.bin"), "wb") as vocab_file:
+        total = 0
+        for token in sorted(vocab):
+            encoded = token.encode("utf-8")
+            vocab_file.write(encoded)
+            total += len(encoded)
+            offsets.append(total)
+    with open(os.path.join(out_dir, "vocab.idx"), "wb") as idx_file:
+        offsets.tofile(idx_file)
+
+
+# --- LETTURA E RICERCA ---
+
+def _memmap(path: str, dtype) -> np.ndarray:
+    # np.memmap non accetta file vuoti: un indice senza righe restituisce un array vuoto
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class OfflineIndex:
+    """Indice locale in sola lettura, mappato in memoria: l'apertura costa O(1) indipendentemente dai prodotti."""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as meta_file:
+            self.meta = json.load(meta_file)
+        if self.meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Versione indice non supportata: {self.meta.get('version')}")
+        self.index_dir = index_dir
+        self.rows = self.meta["rows"]
+        self.nutrients = _memmap(os.path.join(index_dir, "nutrients.f32"), np.float32).reshape(-1, len(NUTRIENT_FIELDS))
+        self._strings = _memmap(os.path.join(index_dir, "strings.bin"), np.uint8)
+        self._string_offsets = _memmap(os.path.join(index_dir, "strings.idx"), np.uint64)
+        self._vocab = _memmap(os.path.join(index_dir, "vocab.bin"), np.uint8)
+        self._vocab_offsets = _memmap(os.path.join(index_dir, "vocab.idx"), np.uint64)
+        self._postings_table = _memmap(os.path.join(index_dir, "postings.idx"), np.uint64).reshape(-1, 2)
+        self._postings = _memmap(os.path.join(index_dir, "postings.u32"), np.uint32)
+        self.token_count = len(self._vocab_offsets) - 1
+
+    def _token_at(self, position: int) -> str:
+        start, end = int(self._vocab_offsets[position]), int(self._vocab_offsets[position + 1])
+        return self._vocab[start:end].tobytes().decode("utf-8")
+
+    def _find_token_range(self, prefix: str, exact: bool) -> range:
+        lo = bisect_left(range(self.token_count), prefix, key=self._token_at)
+        if exact:
+            found = lo < self.token_count and self._token_at(lo) == prefix
+            return range(lo, lo + 1) if found else range(0)
+        hi = lo
+        while hi < self.token_count and hi - lo < MAX_PREFIX_EXPANSIONS and self._token_at(hi).startswith(prefix):
+            hi += 1
+        return range(lo, hi)
+
+    def _postings_for(self, position: int) -> np.ndarray:
+        start, count = self._postings_table[position]
+        return self._postings[int(start):int(start) + int(count)]
+
+    def get_field(self, row: int, field: str) -> str:
+        slot = row * len(STRING_FIELDS) + STRING_FIELDS.index(field)
+        start, end = int(self._string_offsets[slot]), int(self._string_offsets[slot + 1])
+        return self._strings[start:end].tobytes().decode("utf-8")
+
+    def get_product(self, row: int, lang: str = "it") -> dict:
+        """Ricostruisce un prodotto con la stessa forma restituita da search_products_by_name."""
+        name = self.get_field(row, "name")
+        if lang == "en":
+            name = self.get_field(row, "name_en") or name
+        product = {
+            "barcode": self.get_field(row, "code") or None,
+            "name": name,
+            "brands": self.get_field(row, "brands") or None,
+            "image_url": self.get_field(row, "image_url") or None,
+        }
+        for key, value in zip(PRODUCT_KEYS, self.nutrients[row]):
+            product[key] = None if math.isnan(value) else round(float(value), 2)
+        product["api_source"] = "OpenFoodFacts_offline_index"
+        return product
+
+    def search(self, query: str, page_size: int = 5, lang: str = "it") -> list[dict]:
+        """
+        Cerca i prodotti che contengono i token della query (l'ultimo token vale anche come prefisso).
+
+        Il punteggio è la somma degli IDF dei token trovati; a parità di punteggio vengono preferiti
+        i prodotti con valori nutrizionali e con nomi più corti (più specifici).
+        """
+        tokens = tokenize(query)
+        if not tokens or self.rows == 0:
+            return []
+
+        weighted = []
+        for position, token in enumerate(tokens):
+            is_last = position == len(tokens) - 1
+            token_range = self._find_token_range(token, exact=not (is_last and len(token) >= 3))
+            if not len(token_range):
+                continue
+            if len(token_range) == 1:
+                postings = self._postings_for(token_range[0])  # già ordinata e senza duplicati
+            else:
+                postings = np.unique(np.concatenate([self._postings_for(p) for p in token_range]))
+            idf = math.log(1.0 + self.rows / (len(postings) + 0.5))
+            weighted.append((postings, idf))
+        if not weighted:
+            return []
+
+        rows = np.concatenate([postings for postings, _ in weighted])
+        weights = np.concatenate([np.full(len(postings), idf, dtype=np.float64) for postings, idf in weighted])
+        # bincount sugli id di riga evita di ordinare le posting list concatenate
+        all_scores = np.bincount(rows, weights=weights)
+        candidates = np.flatnonzero(all_scores)
+        scores = all_scores[candidates] + 0.01 * ~np.isnan(self.nutrients[candidates, 0])
+
+        keep = min(len(candidates), max(page_size * 4, page_size))
+        top = np.argpartition(-scores, keep - 1)[:keep] if keep < len(candidates) else np.arange(len(candidates))
+        ranked = sorted(
+            (-float(scores[i]), len(self.get_field(int(candidates[i]), "name")), int(candidates[i])) for i in top
+        )
+        return [self.get_product(row, lang) for _, _, row in ranked[:page_size]]
+
+
+def load_offline_index(index_dir: str) -> OfflineIndex | None:
+    """Apre l'indice se la directory contiene un indice valido, altrimenti restituisce None."""
+    if not index_dir or not os.path.exists(os.path.join(index_dir, "meta.json")):
+        return None
+    try:
+        return OfflineIndex(index_dir)
+    except (OSError, ValueError, KeyError) as e:
+        log.error("Impossibile aprire l'indice offline", path=index_dir, error=str(e))
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Indice locale dei prodotti OpenFoodFacts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Crea l'indice da un dump JSONL/CSV (anche .gz).")
+    build_parser.add_argument("dump_path")
+    build_parser.add_argument("out_dir")
+    search_parser = subparsers.add_parser("search", help="Esegue una ricerca sull'indice.")
+    search_parser.add_argument("index_dir")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--page-size", type=int, default=5)
+    search_parser.add_argument("--lang", default="it")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(args.dump_path, args.out_dir)
+    else:
+        index = load_offline_index(args.index_dir)
+        if index is None:
+            sys.exit(f"Nessun indice valido in '{args.index_dir}'.")
+        for product in index.search(args.query, page_size=args.page_size, lang=args.lang):
+            print(json.dumps(product, ensure_ascii=False))
@@ -1,83 +1,436 @@
 # src/integrations/openfoodfacts_client.py
 
+import asyncio
 import requests
 import json
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.integrations.http_client import LatencyTracker, async_get, get_session, hedged, import_httpx
+from src.integrations.local_cache import LocalCache
+from src.integrations.local_data import DATA_DIR, iter_data_products
+from src.integrations.local_search import build_local_search_index
+from src.integrations.nutrition_db import lookup_reference_product
+from src.integrations.offline_index import load_offline_index
+from src.integrations.telemetry import async_call_upstream, call_upstream, get_logger
+from src.integrations.upstream_scheduler import PRIORITY_BACKGROUND, PRIORITY_BATCH, UpstreamBusy, get_scheduler, \
+    parse_retry_after, priority_scope, with_priority
 
 USER_AGENT = "AllenatoreAlimentareApp/1.0 (Python; +tuo@dominio.com o link progetto)"
 BASE_URL_PRODUCT_V2 = "https://world.openfoodfacts.org/api/v2/product/"
 BASE_URL_SEARCH_CGI = "https://world.openfoodfacts.org/cgi/search.pl"
 
-print("Il file openfoodfacts_client.py è stato caricato!")
+# --- CONFIGURAZIONE CACHE PRODOTTI ---
+# OFF_CACHE_PATH vuoto disabilita la persistenza su disco (resta la LRU in memoria)
+OFF_CACHE_PATH = os.getenv('OFF_CACHE_PATH', os.path.join(tempfile.gettempdir(), "allenatore_off_cache.sqlite3"))
+OFF_CACHE_MEMORY_ITEMS = int(os.getenv('OFF_CACHE_MEMORY_ITEMS', '2048'))
+OFF_CACHE_PRODUCT_TTL = int(os.getenv('OFF_CACHE_PRODUCT_TTL', str(7 * 24 * 3600)))   # 7 giorni
+OFF_CACHE_SEARCH_TTL = int(os.getenv('OFF_CACHE_SEARCH_TTL', str(6 * 3600)))          # 6 ore
+OFF_CACHE_NEGATIVE_TTL = int(os.getenv('OFF_CACHE_NEGATIVE_TTL', str(3600)))          # 1 ora
+OFF_CACHE_STALE_TTL = int(os.getenv('OFF_CACHE_STALE_TTL', str(7 * 24 * 3600)))       # finestra stale-while-revalidate
+
+# --- CONFIGURAZIONE INDICE OFFLINE ---
+# Directory creata con `python -m src.integrations.offline_index build <dump> <dir>`.
+# Con OFF_OFFLINE_ONLY=1 la ricerca per nome non usa mai la rete.
+OFF_OFFLINE_INDEX_DIR = os.getenv('OFF_OFFLINE_INDEX_DIR', '')
+OFF_OFFLINE_ONLY = os.getenv('OFF_OFFLINE_ONLY', '0') == '1'
+
+# --- RICERCA LOCALE TOLLERANTE AGLI ERRORI ---
+# Indice sui prodotti già in locale (cache, file in LOCAL_SEARCH_DATA_DIR, risultati visti durante l'esecuzione).
+# OFF_LOCAL_SEARCH: "fallback" = usata quando la ricerca remota non trova nulla (o fallisce),
+# "first" = usata per prima, la rete solo se non trova nulla; "off" = disattivata.
+OFF_LOCAL_SEARCH = os.getenv('OFF_LOCAL_SEARCH', 'fallback').lower()
+LOCAL_SEARCH_DATA_DIR = os.getenv('LOCAL_SEARCH_DATA_DIR', DATA_DIR)
+# Prodotti visti durante l'esecuzione aggiunti all'indice oltre a quelli della costruzione; raggiunto il limite
+# l'indice viene ricostruito in background da cache e file, così i prodotti usciti dalla cache ne escono anche dall'indice
+OFF_LOCAL_SEARCH_MAX_ADDED = int(os.getenv('OFF_LOCAL_SEARCH_MAX_ADDED', '20000'))
+
+# --- RICHIESTE BATCH ---
+OFF_BATCH_MAX_ITEMS = int(os.getenv('OFF_BATCH_MAX_ITEMS', '50'))
+OFF_BATCH_CONCURRENCY = int(os.getenv('OFF_BATCH_CONCURRENCY', '8'))
+
+# --- RICERCHE "HEDGED" (solo variante asincrona) ---
+# Se una ricerca remota supera il percentile OFF_HEDGE_PERCENTILE delle latenze recenti
+# (mai prima di OFF_HEDGE_MIN_DELAY secondi) parte una seconda richiesta identica e vince la più veloce.
+# OFF_HEDGE_AFTER > 0 fissa la soglia in secondi; OFF_HEDGE_PERCENTILE=0 disattiva l'hedging.
+OFF_HEDGE_PERCENTILE = float(os.getenv('OFF_HEDGE_PERCENTILE', '95'))
+OFF_HEDGE_MIN_DELAY = float(os.getenv('OFF_HEDGE_MIN_DELAY', '0.3'))
+OFF_HEDGE_AFTER = float(os.getenv('OFF_HEDGE_AFTER', '0'))
+
+# Codici di errore restituiti dalle funzioni _fetch_* (None = risposta valida, anche se "non trovato")
+ERROR_NOT_FOUND = "not_found"
+ERROR_INVALID_BARCODE = "invalid_barcode"
+ERROR_HTTP = "http_error"
+ERROR_CONNECTION = "connection_error"
+ERROR_TIMEOUT = "timeout"
+ERROR_REQUEST = "request_error"
+ERROR_JSON = "json_decode"
+ERROR_UNEXPECTED = "unexpected_response"
+ERROR_RATE_LIMITED = "rate_limited"    # rifiutata dal pianificatore (upstream_scheduler) senza contattare OFF
+
+_product_cache = None
+_offline_index = None
+_offline_index_loaded = False
+_local_search_index = None
+_local_search_lock = threading.Lock()
+_local_search_rebuild = None
+_search_latency = LatencyTracker()
+_hedge_stats = {"hedged_searches": 0}
+_product_listeners = []
+
+log = get_logger("openfoodfacts")
+
+
+def get_product_cache() -> LocalCache:
+    """Restituisce la cache condivisa dei prodotti, creandola al primo utilizzo."""
+    global _product_cache
+    if _product_cache is None:
+        _product_cache = LocalCache(db_path=OFF_CACHE_PATH or None, max_memory_items=OFF_CACHE_MEMORY_ITEMS)
+    return _product_cache
+
+
+def set_product_cache(cache: LocalCache | None) -> None:
+    """Sostituisce la cache condivisa (None la ricrea al prossimo utilizzo con la configurazione di default)."""
+    global _product_cache
+    _product_cache = cache
+
+
+def get_offline_index():
+    """Restituisce l'indice offline configurato (caricato una sola volta), oppure None."""
+    global _offline_index, _offline_index_loaded
+    if not _offline_index_loaded:
+        _offline_index = load_offline_index(OFF_OFFLINE_INDEX_DIR)
+        _offline_index_loaded = True
+        if _offline_index is not None:
+            log.info("Indice offline caricato", path=OFF_OFFLINE_INDEX_DIR, products=_offline_index.rows)
+    return _offline_index
+
+
+def set_offline_index(index) -> None:
+    """Imposta l'indice offline da usare (None disattiva la ricerca offline)."""
+    global _offline_index, _offline_index_loaded
+    _offline_index = index
+    _offline_index_loaded = True
+
+
+def _cached_products():
+    """Prodotti nella cache: lookup per barcode e risultati delle ricerche."""
+    cache = get_product_cache()
+    yield from cache.values("product")
+    for results in cache.values("search"):
+        yield from results
+
+
+def get_local_search_index():
+    """
+    Restituisce l'indice di ricerca locale, costruito al primo utilizzo con i prodotti in cache e i
+    file dei dati; da quel momento vi si aggiungono i prodotti restituiti da ricerche e lookup
+    (fino a OFF_LOCAL_SEARCH_MAX_ADDED, poi l'indice viene ricostruito).
+    """
+    with _local_search_lock:
+        if _local_search_index is None:
+            _install_local_search_index(_build_local_search_index())
+        return _local_search_index
+
+
+def set_local_search_index(index) -> None:
+    """Imposta l'indice di ricerca locale (None lo ricostruisce al prossimo utilizzo)."""
+    with _local_search_lock:
+        _install_local_search_index(index)
+
+
+def _build_local_search_index():
+    index = build_local_search_index([
+        _cached_products(), iter_data_products(LOCAL_SEARCH_DATA_DIR, context="ricerca locale"),
+    ])
+    index.max_documents = len(index) + OFF_LOCAL_SEARCH_MAX_ADDED
+    return index
+
+
+def _install_local_search_index(index) -> None:
+    global _local_search_index
+    _local_search_index = index
+    if index is not None:
+        add_product_listener(_index_products)
+    else:
+        remove_product_listener(_index_products)
+
+
+def _index_products(products: list[dict]) -> None:
+    index = _local_search_index
+    if index is None:
+        return
+    index.add_products(products)
+    if index.is_full():
+        _start_local_search_rebuild(index)
+
+
+def _start_local_search_rebuild(full_index) -> None:
+    """Ricostruisce l'indice pieno in un thread (una ricostruzione alla volta); intanto risponde quello pieno."""
+    global _local_search_rebuild
+    with _local_search_lock:
+        if _local_search_index is not full_index or (_local_search_rebuild is not None and _local_search_rebuild.is_alive()):
+            return
+        _local_search_rebuild = threading.Thread(target=_rebuild_local_search_index, args=(full_index,),
+                                                 name="local-search-rebuild", daemon=True)
+        _local_search_rebuild.start()
+
+
+def _rebuild_local_search_index(full_index) -> None:
+    try:
+        index = _build_local_search_index()
+    except Exception as e:
+        log.error("Ricostruzione dell'indice di ricerca locale fallita", error=str(e))
+        return
+    with _local_search_lock:
+        if _local_search_index is full_index:     # nel frattempo non è stato sostituito
+            _install_local_search_index(index)
+    log.info("Indice di ricerca locale ricostruito", documents=len(index), dropped=full_index.stats()["dropped"])
+
+
+def local_search_products(query: str, page_size: int = 5) -> list[dict]:
+    """Ricerca tollerante agli errori sui prodotti locali (stessa forma dei risultati di search_products_by_name)."""
+    if OFF_LOCAL_SEARCH == "off":
+        return []
+    return get_local_search_index().search(query, page_size=page_size)
+
+
+def local_catalog_products(limit: int) -> list[dict]:
+    """Prodotti locali (cache e file dei dati) con tutti i valori nutrizionali: al massimo gli ultimi `limit` indicizzati."""
+    if OFF_LOCAL_SEARCH == "off":
+        return []
+    return get_local_search_index().products_with_nutrients(limit)
+
+
+def get_cache_stats() -> dict:
+    """Contatori hit/miss/stale della cache prodotti, per il tuning dei TTL."""
+    stats = get_product_cache().stats()
+    stats.update(_hedge_stats)
+    if _local_search_index is not None:
+        stats["local_search"] = _local_search_index.stats()
+    return stats
+
+
+def add_product_listener(listener) -> None:
+    """
+    Registra una funzione chiamata con la lista dei prodotti restituiti da ricerche e lookup
+    (anche quando arrivano dalla cache), ad esempio per alimentare l'autocompletamento.
+    """
+    if listener not in _product_listeners:
+        _product_listeners.append(listener)
+
+
+def remove_product_listener(listener) -> None:
+    if listener in _product_listeners:
+        _product_listeners.remove(listener)
 
-def get_product_by_barcode(barcode: str) -> dict | None:
+
+def _notify_products(products: list[dict] | None) -> None:
+    if not products:
+        return
+    for listener in list(_product_listeners):
+        try:
+            listener(products)
+        except Exception as e:
+            log.error("Listener dei prodotti fallito", error=str(e))
+
+
+def _normalize_search_key(query: str, page_size: int, lang: str) -> str:
+    normalized_query = " ".join(query.lower().split())
+    return f"{lang.strip().lower()}|{int(page_size)}|{normalized_query}"
+
+
+def get_product_by_barcode(barcode: str, use_cache: bool = True) -> dict | None:
+    """
+    Restituisce il prodotto con il barcode indicato, passando per la cache locale.
+
+    Un prodotto non trovato viene memorizzato come risultato negativo (TTL più breve);
+    gli errori di rete non vengono mai memorizzati.
+    """
+    return lookup_product(barcode, use_cache=use_cache)[0]
+
+
+def lookup_product(barcode: str, use_cache: bool = True) -> tuple[dict | None, str | None]:
+    """
+    Come get_product_by_barcode, ma distingue "non trovato" dagli errori.
+
+    Returns:
+        tuple: (prodotto, codice_errore). Il codice è None se il prodotto è stato trovato,
+               ERROR_NOT_FOUND se non esiste, altrimenti il tipo di errore (es. ERROR_TIMEOUT).
+    """
+    barcode = str(barcode).strip()
+    if not (barcode.isascii() and barcode.isdigit()):
+        return None, ERROR_INVALID_BARCODE
+    # La tabella nutrizionale di riferimento è locale (mmap): nessuna rete e nessuna cache
+    reference = lookup_reference_product(barcode)
+    if reference is not None:
+        return reference, None
+    if not use_cache:
+        error, product = _fetch_product_by_barcode(barcode)
+    else:
+        outcome = {"error": None}
+
+        def loader():
+            error, product = _fetch_product_by_barcode(barcode)
+            outcome["error"] = error
+            return error, product
+
+        product = get_product_cache().get_or_load(
+            "product", barcode, loader,
+            ttl=OFF_CACHE_PRODUCT_TTL,
+            negative_ttl=OFF_CACHE_NEGATIVE_TTL,
+            stale_ttl=OFF_CACHE_STALE_TTL,
+            is_negative=lambda product: product is None,
+            refresh_loader=lambda: with_priority(PRIORITY_BACKGROUND, _fetch_product_by_barcode, barcode),
+        )
+        error = outcome["error"]
+    if product is None and error is None:
+        error = ERROR_NOT_FOUND
+    if product is not None:
+        _notify_products([product])
+    return product, error
+
+
+def get_products_by_barcodes(barcodes: list[str], max_workers: int = OFF_BATCH_CONCURRENCY) -> list[dict]:
+    """
+    Risolve più barcode in parallelo con un numero limitato di richieste contemporanee.
+
+    I barcode duplicati vengono cercati una sola volta; l'ordine del risultato segue quello in ingresso.
+    Le richieste remote hanno priorità batch: le ricerche interattive concorrenti passano davanti.
+
+    Returns:
+        list[dict]: per ogni barcode {"barcode", "product", "error"}, con error None se trovato.
+    """
+    unique_barcodes = list(dict.fromkeys(str(barcode).strip() for barcode in barcodes))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_barcodes) or 1))) as executor:
+        resolved = dict(zip(unique_barcodes, executor.map(
+            lambda barcode: with_priority(PRIORITY_BATCH, lookup_product, barcode), unique_barcodes)))
+    return [_batch_item(str(barcode).strip(), *resolved[str(barcode).strip()]) for barcode in barcodes]
+
+
+def _batch_item(barcode: str, product: dict | None, error: str | None) -> dict:
+    return {"barcode": barcode, "product": product, "error": error}
+
+
+def _scheduled_call(upstream: str, key: str | None, request, *args):
+    """
+    call_upstream dietro il pianificatore del servizio: rispetta il limite di richieste e la priorità del
+    contesto, accorpa le chiamate concorrenti con la stessa chiave e trasforma un rifiuto (coda piena
+    o scadenza) in ERROR_RATE_LIMITED.
+    """
+    try:
+        return get_scheduler(upstream).run(key, lambda: call_upstream(upstream, request, *args))
+    except UpstreamBusy as e:
+        log.warning("Richiesta a Open Food Facts rifiutata dal pianificatore", upstream=upstream, key=key,
+                    reason=e.reason, retry_after=round(e.retry_after, 1))
+        return ERROR_RATE_LIMITED, None
+
+
+def _note_throttling(upstream: str, status_code: int, headers) -> None:
+    # HTTP 429: OFF chiede di rallentare, il pianificatore sospende le richieste per il tempo indicato
+    if status_code == 429:
+        get_scheduler(upstream).throttled(parse_retry_after(headers.get("Retry-After")))
+
+
+def retry_after_seconds(upstream: str) -> int:
+    """Valore per l'header Retry-After dopo un ERROR_RATE_LIMITED: secondi interi (almeno 1) prima del prossimo gettone."""
+    return max(1, math.ceil(get_scheduler(upstream).retry_after()))
+
+
+def _fetch_product_by_barcode(barcode: str) -> tuple[str | None, dict | None]:
+    """Chiamata diretta a Open Food Facts. Restituisce (codice_errore, prodotto); il codice è None se la risposta è valida."""
+    return _scheduled_call("off_barcode", barcode, _request_product_by_barcode, barcode)
+
+
+def _request_product_by_barcode(call, barcode: str) -> tuple[str | None, dict | None]:
     headers = {'User-Agent': USER_AGENT}
     url = f"{BASE_URL_PRODUCT_V2}{barcode}"
     params = {
         "fields": "product_name_it,product_name,nutriments,brands,code,image_url,status,status_verbose"
     }
 
-    print(f"\nINFO: Sto cercando il prodotto con barcode: {barcode}")
-    print(f"INFO: URL completo della richiesta: {url}")
-    # print(f"INFO: Parametri (campi richiesti): {params}") # Meno verboso
+    log.debug("Richiesta prodotto a Open Food Facts", barcode=barcode, url=url)
 
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=10)
+        response = get_session().get(url, headers=headers, params=params, timeout=10)
+        call.response_bytes = len(response.content)
         response.raise_for_status()
         data = response.json()
-
-        api_status = data.get("status")
-        api_status_verbose = data.get("status_verbose")
-
-        if api_status == 1 and "product" in data and data.get("product"):
-            product_info = data["product"]
-            if not product_info or not product_info.get("product_name_it", product_info.get("product_name")):
-                print(f"WARN: Prodotto con barcode {barcode} trovato con status=1 ma i dati del prodotto sono mancanti o incompleti.")
-                return None
-
-            print(f"INFO: Prodotto '{product_info.get('product_name_it', product_info.get('product_name'))}' trovato!")
-            nutriments = product_info.get("nutriments", {})
-            return {
-                "barcode": product_info.get("code"),
-                "name": product_info.get("product_name_it", product_info.get("product_name")),
-                "brands": product_info.get("brands"),
-                "image_url": product_info.get("image_url"),
-                "calories_100g": nutriments.get("energy-kcal_100g"),
-                "protein_100g": nutriments.get("proteins_100g"),
-                "carbs_100g": nutriments.get("carbohydrates_100g"),
-                "fat_100g": nutriments.get("fat_100g"),
-                "api_source": "OpenFoodFacts_v2_product"
-            }
-        elif api_status == 0 and api_status_verbose == "product not found":
-            print(f"INFO: Prodotto con barcode {barcode} non trovato (status 0, product not found).")
-            return None
-        else:
-            print(f"WARN: Prodotto con barcode {barcode} non trovato o risposta inattesa. Status API: {api_status}, Status Verbose: '{api_status_verbose}'")
-            # print(f"DEBUG: Dati completi ricevuti: {json.dumps(data, indent=2, ensure_ascii=False)}") # Per debug futuro se necessario
-            return None
+        return _product_from_payload(barcode, data)
 
     except requests.exceptions.HTTPError as http_err:
         if response.status_code == 404: # HTTP 404 significa Not Found
-            print(f"INFO: Prodotto con barcode {barcode} non trovato (HTTP 404).")
-            return None
+            log.debug("Prodotto non trovato (HTTP 404)", barcode=barcode)
+            return None, None
         else:
-            print(f"ERRORE HTTP: {http_err} - Status Code: {response.status_code}")
-            return None
+            _note_throttling(call.upstream, response.status_code, response.headers)
+            log.warning("Errore HTTP da Open Food Facts", barcode=barcode, status=response.status_code, error=str(http_err))
+            return ERROR_HTTP, None
     except requests.exceptions.ConnectionError as conn_err:
-        print(f"ERRORE DI CONNESSIONE: Impossibile connettersi a Open Food Facts. {conn_err}")
-        return None
+        log.warning("Impossibile connettersi a Open Food Facts", barcode=barcode, error=str(conn_err))
+        return ERROR_CONNECTION, None
     except requests.exceptions.Timeout as timeout_err:
-        print(f"ERRORE DI TIMEOUT: La richiesta a Open Food Facts ha impiegato troppo tempo. {timeout_err}")
-        return None
+        log.warning("Timeout della richiesta a Open Food Facts", barcode=barcode, error=str(timeout_err))
+        return ERROR_TIMEOUT, None
+    except requests.exceptions.JSONDecodeError:
+        log.warning("Risposta JSON non valida da Open Food Facts", barcode=barcode, body=response.text[:200])
+        return ERROR_JSON, None
     except requests.exceptions.RequestException as req_err:
-        print(f"ERRORE RICHIESTA GENERICA: {req_err}")
-        return None
+        log.warning("Errore nella richiesta a Open Food Facts", barcode=barcode, error=str(req_err))
+        return ERROR_REQUEST, None
     except json.JSONDecodeError:
-        print(f"ERRORE: Impossibile decodificare la risposta JSON da Open Food Facts per barcode {barcode}. Risposta: {response.text[:200]}...")
-        return None
-def search_products_by_name(query: str, page_size: int = 5, lang: str = "it") -> list[dict] | None:
+        log.warning("Risposta JSON non valida da Open Food Facts", barcode=barcode, body=response.text[:200])
+        return ERROR_JSON, None
+
+
+def _product_from_payload(barcode: str, data: dict) -> tuple[str | None, dict | None]:
+    """Normalizza la risposta JSON dell'endpoint prodotto (condiviso tra client sincrono e asincrono)."""
+    api_status = data.get("status")
+    api_status_verbose = data.get("status_verbose")
+
+    if api_status == 1 and "product" in data and data.get("product"):
+        product_info = data["product"]
+        if not product_info or not product_info.get("product_name_it", product_info.get("product_name")):
+            log.warning("Prodotto trovato con status=1 ma dati mancanti o incompleti", barcode=barcode)
+            return None, None
+
+        log.debug("Prodotto trovato", barcode=barcode)
+        nutriments = product_info.get("nutriments", {})
+        return None, {
+            "barcode": product_info.get("code"),
+            "name": product_info.get("product_name_it", product_info.get("product_name")),
+            "brands": product_info.get("brands"),
+            "image_url": product_info.get("image_url"),
+            "calories_100g": nutriments.get("energy-kcal_100g"),
+            "protein_100g": nutriments.get("proteins_100g"),
+            "carbs_100g": nutriments.get("carbohydrates_100g"),
+            "fat_100g": nutriments.get("fat_100g"),
+            "api_source": "OpenFoodFacts_v2_product"
+        }
+    elif api_status == 0 and api_status_verbose == "product not found":
+        log.debug("Prodotto non trovato (status 0)", barcode=barcode)
+        return None, None
+    else:
+        log.warning("Risposta inattesa da Open Food Facts", barcode=barcode, status=api_status,
+                    status_verbose=api_status_verbose)
+        return ERROR_UNEXPECTED, None
+
+
+def search_products_by_name(query: str, page_size: int = 5, lang: str = "it", use_cache: bool = True) -> list[dict] | None:
     """
     Cerca prodotti per nome su Open Food Facts usando l'endpoint CGI search.pl.
 
+    I risultati sono memorizzati nella cache locale per (query normalizzata, lingua, page_size):
+    una ricerca già vista risponde subito dalla cache e, se scaduta, viene aggiornata in background.
+    Se è configurato un indice offline, la ricerca viene servita da lì e l'API remota
+    è usata solo come fallback quando l'indice non trova nulla (mai, con OFF_OFFLINE_ONLY=1).
+    Secondo OFF_LOCAL_SEARCH, la ricerca locale tollerante agli errori di battitura risponde prima
+    della rete ("first") o quando la rete non trova nulla o fallisce ("fallback").
+
     Args:
         query (str): Il termine di ricerca per i prodotti (es. "pasta Barilla").
         page_size (int, optional): Quanti prodotti restituire al massimo. Default a 5.
@@ -88,11 +441,74 @@ def search_products_by_name(query: str, page_size: int = 5, lang: str = "it") ->
                            Restituisce una lista vuota se nessun prodotto è trovato.
                            Restituisce None se si verifica un errore durante la richiesta.
     """
-    headers = {'User-Agent': USER_AGENT}
-    
+    return search_products(query, page_size=page_size, lang=lang, use_cache=use_cache)[0]
+
+
+def search_products(query: str, page_size: int = 5, lang: str = "it",
+                    use_cache: bool = True) -> tuple[list[dict] | None, str | None]:
+    """
+    Come search_products_by_name, ma restituisce anche il motivo di un errore.
+
+    Returns:
+        tuple: (prodotti, codice_errore). Il codice è None se la ricerca è riuscita (anche senza risultati),
+               altrimenti il tipo di errore (es. ERROR_RATE_LIMITED se il pianificatore ha rifiutato la richiesta).
+    """
+    offline_index = get_offline_index()
+    if offline_index is not None:
+        offline_results = offline_index.search(query, page_size=page_size, lang=lang)
+        if offline_results or OFF_OFFLINE_ONLY:
+            _notify_products(offline_results)
+            return offline_results, None
+    elif OFF_OFFLINE_ONLY:
+        log.error("OFF_OFFLINE_ONLY attivo ma nessun indice offline disponibile")
+        return None, ERROR_UNEXPECTED
+
+    if OFF_LOCAL_SEARCH == "first":
+        local_results = local_search_products(query, page_size)
+        if local_results:
+            _notify_products(local_results)
+            return local_results, None
+
+    if not use_cache:
+        error, results = _fetch_search_results(query, page_size, lang)
+    else:
+        outcome = {"error": None}
+
+        def loader():
+            error, products = _fetch_search_results(query, page_size, lang)
+            outcome["error"] = error
+            return error, products
+
+        results = get_product_cache().get_or_load(
+            "search", _normalize_search_key(query, page_size, lang), loader,
+            ttl=OFF_CACHE_SEARCH_TTL,
+            negative_ttl=OFF_CACHE_NEGATIVE_TTL,
+            stale_ttl=OFF_CACHE_STALE_TTL,
+            is_negative=lambda products: not products,
+            refresh_loader=lambda: with_priority(PRIORITY_BACKGROUND, _fetch_search_results, query, page_size, lang),
+        )
+        error = outcome["error"]
+    local_results = None
+    if not results and OFF_LOCAL_SEARCH == "fallback":
+        local_results = local_search_products(query, page_size)
+    return _finish_search(results, error, local_results)
+
+
+def _finish_search(results: list[dict] | None, error: str | None,
+                   local_results: list[dict] | None) -> tuple[list[dict] | None, str | None]:
+    # con OFF_LOCAL_SEARCH="fallback" la ricerca locale sostituisce un risultato remoto vuoto o fallito
+    if local_results:
+        results, error = local_results, None
+    elif results is None and error is None:
+        error = ERROR_UNEXPECTED
+    _notify_products(results)
+    return results, error
+
+
+def _search_params(query: str, page_size: int, lang: str) -> dict:
     # Parametri per l'API di ricerca
     # Documentazione: https://wiki.openfoodfacts.org/API/Search
-    params = {
+    return {
         "search_terms": query,
         "search_simple": 1,      # Per una ricerca "semplice" sui termini
         "action": "process",     # Azione richiesta all'API
@@ -102,71 +518,281 @@ def search_products_by_name(query: str, page_size: int = 5, lang: str = "it") ->
         # Specifichiamo i campi che ci interessano per alleggerire la risposta
         "fields": "product_name_it,product_name,nutriments,brands,code,image_url"
     }
-    
+
+
+def _fetch_search_results(query: str, page_size: int, lang: str) -> tuple[str | None, list[dict] | None]:
+    """Chiamata diretta all'endpoint di ricerca. Restituisce (codice_errore, prodotti)."""
+    return _scheduled_call("off_search", _normalize_search_key(query, page_size, lang), _request_search_results,
+                           query, page_size, lang)
+
+
+def _request_search_results(call, query: str, page_size: int, lang: str) -> tuple[str | None, list[dict] | None]:
+    headers = {'User-Agent': USER_AGENT}
+    params = _search_params(query, page_size, lang)
     url = BASE_URL_SEARCH_CGI # Usiamo l'URL per la ricerca CGI
 
-    print(f"\nINFO: Sto cercando prodotti con query: '{query}' (lingua: {lang}, max {page_size} risultati)")
-    print(f"INFO: URL della richiesta: {url}")
-    # print(f"INFO: Parametri della ricerca: {params}") # Meno verboso
+    log.debug("Ricerca su Open Food Facts", query=query, lang=lang, page_size=page_size)
 
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=15) # Timeout un po' più lungo per la ricerca
+        response = get_session().get(url, headers=headers, params=params, timeout=15) # Timeout un po' più lungo per la ricerca
+        call.response_bytes = len(response.content)
         response.raise_for_status() # Controlla errori HTTP
         data = response.json()
-
-        # La risposta JSON per la ricerca ha una chiave "products" che è una lista
-        if "products" in data and data["products"]: # Controlla se la lista esiste e non è vuota
-            products_found = []
-            for product_data_api in data["products"]:
-                # Simile a get_product_by_barcode, estraiamo i dati che ci servono
-                # Potrebbe mancare product_name_it, quindi usiamo product_name come fallback
-                product_name = product_data_api.get("product_name_it", product_data_api.get("product_name"))
-                
-                # Ignoriamo prodotti senza nome, potrebbero essere dati spuri
-                if not product_name:
-                    continue
-
-                nutriments = product_data_api.get("nutriments", {})
-                
-                simplified_product = {
-                    "barcode": product_data_api.get("code"),
-                    "name": product_name,
-                    "brands": product_data_api.get("brands"),
-                    "image_url": product_data_api.get("image_url"),
-                    "calories_100g": nutriments.get("energy-kcal_100g"),
-                    "protein_100g": nutriments.get("proteins_100g"),
-                    "carbs_100g": nutriments.get("carbohydrates_100g"),
-                    "fat_100g": nutriments.get("fat_100g"),
-                    "api_source": "OpenFoodFacts_cgi_search"
-                }
-                products_found.append(simplified_product)
-            
-            print(f"INFO: Trovati {len(products_found)} prodotti per la query '{query}'.")
-            return products_found
-        else:
-            # Nessun prodotto trovato o la chiave "products" manca/è vuota
-            print(f"INFO: Nessun prodotto trovato per la query '{query}'.")
-            return [] # Restituisce una lista vuota se non ci sono prodotti
+        return None, _products_from_search_payload(query, data)
 
     except requests.exceptions.HTTPError as http_err:
         if response.status_code == 404: # Anche se raro per la ricerca, gestiamolo
-            print(f"INFO: Ricerca per '{query}' ha restituito HTTP 404.")
-            return [] # Trattiamo come nessun risultato
+            log.debug("Ricerca con risposta HTTP 404", query=query)
+            return None, [] # Trattiamo come nessun risultato
         else:
-            print(f"ERRORE HTTP durante la ricerca: {http_err} - Status Code: {response.status_code}")
-            return None
+            _note_throttling(call.upstream, response.status_code, response.headers)
+            log.warning("Errore HTTP durante la ricerca", query=query, status=response.status_code, error=str(http_err))
+            return ERROR_HTTP, None
     except requests.exceptions.ConnectionError as conn_err:
-        print(f"ERRORE DI CONNESSIONE durante la ricerca: Impossibile connettersi. {conn_err}")
-        return None
+        log.warning("Impossibile connettersi durante la ricerca", query=query, error=str(conn_err))
+        return ERROR_CONNECTION, None
     except requests.exceptions.Timeout as timeout_err:
-        print(f"ERRORE DI TIMEOUT durante la ricerca: {timeout_err}")
-        return None
+        log.warning("Timeout durante la ricerca", query=query, error=str(timeout_err))
+        return ERROR_TIMEOUT, None
+    except requests.exceptions.JSONDecodeError:
+        log.warning("Risposta JSON non valida dalla ricerca", query=query, body=response.text[:200])
+        return ERROR_JSON, None
     except requests.exceptions.RequestException as req_err:
-        print(f"ERRORE RICHIESTA GENERICA durante la ricerca: {req_err}")
-        return None
+        log.warning("Errore nella richiesta di ricerca", query=query, error=str(req_err))
+        return ERROR_REQUEST, None
     except json.JSONDecodeError:
-        print(f"ERRORE: Impossibile decodificare la risposta JSON dalla ricerca per '{query}'. Risposta: {response.text[:200]}...")
+        log.warning("Risposta JSON non valida dalla ricerca", query=query, body=response.text[:200])
+        return ERROR_JSON, None
+
+
+def _products_from_search_payload(query: str, data: dict) -> list[dict]:
+    """Normalizza la risposta JSON della ricerca (condiviso tra client sincrono e asincrono)."""
+    # La risposta JSON per la ricerca ha una chiave "products" che è una lista
+    if "products" in data and data["products"]: # Controlla se la lista esiste e non è vuota
+        products_found = []
+        for product_data_api in data["products"]:
+            # Simile a get_product_by_barcode, estraiamo i dati che ci servono
+            # Potrebbe mancare product_name_it, quindi usiamo product_name come fallback
+            product_name = product_data_api.get("product_name_it", product_data_api.get("product_name"))
+
+            # Ignoriamo prodotti senza nome, potrebbero essere dati spuri
+            if not product_name:
+                continue
+
+            nutriments = product_data_api.get("nutriments", {})
+
+            simplified_product = {
+                "barcode": product_data_api.get("code"),
+                "name": product_name,
+                "brands": product_data_api.get("brands"),
+                "image_url": product_data_api.get("image_url"),
+                "calories_100g": nutriments.get("energy-kcal_100g"),
+                "protein_100g": nutriments.get("proteins_100g"),
+                "carbs_100g": nutriments.get("carbohydrates_100g"),
+                "fat_100g": nutriments.get("fat_100g"),
+                "api_source": "OpenFoodFacts_cgi_search"
+            }
+            products_found.append(simplified_product)
+
+        log.debug("Risultati della ricerca", query=query, results=len(products_found))
+        return products_found
+    else:
+        # Nessun prodotto trovato o la chiave "products" manca/è vuota
+        log.debug("Nessun prodotto trovato", query=query)
+        return [] # Restituisce una lista vuota se non ci sono prodotti
+
+
+# --- VARIANTE ASINCRONA (usata dal server ASGI e dalle richieste batch asincrone) ---
+
+async def async_lookup_product(barcode: str) -> tuple[dict | None, str | None]:
+    """Versione asincrona di lookup_product: stessa cache, richieste tramite il client httpx condiviso."""
+    barcode = str(barcode).strip()
+    if not (barcode.isascii() and barcode.isdigit()):
+        return None, ERROR_INVALID_BARCODE
+    reference = lookup_reference_product(barcode)
+    if reference is not None:
+        return reference, None
+    outcome = {"error": None}
+
+    async def loader():
+        error, product = await _async_fetch_product_by_barcode(barcode)
+        outcome["error"] = error
+        return error, product
+
+    product = await get_product_cache().aget_or_load(
+        "product", barcode, loader,
+        ttl=OFF_CACHE_PRODUCT_TTL,
+        negative_ttl=OFF_CACHE_NEGATIVE_TTL,
+        stale_ttl=OFF_CACHE_STALE_TTL,
+        is_negative=lambda product: product is None,
+        refresh_loader=lambda: with_priority(PRIORITY_BACKGROUND, _fetch_product_by_barcode, barcode),
+    )
+    error = outcome["error"]
+    if product is None and error is None:
+        error = ERROR_NOT_FOUND
+    if product is not None:
+        _notify_products([product])
+    return product, error
+
+
+async def async_get_products_by_barcodes(barcodes: list[str], concurrency: int = OFF_BATCH_CONCURRENCY) -> list[dict]:
+    """Versione asincrona di get_products_by_barcodes, con fan-out limitato da un semaforo."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded_lookup(barcode):
+        # ogni lookup gira in un proprio task: la priorità impostata qui vale solo per lui
+        with priority_scope(PRIORITY_BATCH):
+            async with semaphore:
+                return await async_lookup_product(barcode)
+
+    unique_barcodes = list(dict.fromkeys(str(barcode).strip() for barcode in barcodes))
+    outcomes = await asyncio.gather(*(bounded_lookup(barcode) for barcode in unique_barcodes))
+    resolved = dict(zip(unique_barcodes, outcomes))
+    return [_batch_item(str(barcode).strip(), *resolved[str(barcode).strip()]) for barcode in barcodes]
+
+
+async def async_search_products_by_name(query: str, page_size: int = 5, lang: str = "it") -> list[dict] | None:
+    """Versione asincrona di search_products_by_name (indice offline, ricerca locale, cache e fallback remoto)."""
+    return (await async_search_products(query, page_size=page_size, lang=lang))[0]
+
+
+async def async_search_products(query: str, page_size: int = 5, lang: str = "it") -> tuple[list[dict] | None, str | None]:
+    """Versione asincrona di search_products: (prodotti, codice_errore)."""
+    offline_index = get_offline_index()
+    if offline_index is not None:
+        offline_results = offline_index.search(query, page_size=page_size, lang=lang)
+        if offline_results or OFF_OFFLINE_ONLY:
+            _notify_products(offline_results)
+            return offline_results, None
+    elif OFF_OFFLINE_ONLY:
+        log.error("OFF_OFFLINE_ONLY attivo ma nessun indice offline disponibile")
+        return None, ERROR_UNEXPECTED
+
+    # in un thread: al primo utilizzo l'indice locale viene costruito e non deve bloccare l'event loop
+    if OFF_LOCAL_SEARCH == "first":
+        local_results = await asyncio.to_thread(local_search_products, query, page_size)
+        if local_results:
+            _notify_products(local_results)
+            return local_results, None
+
+    # le ricerche identiche concorrenti sono accorpate prima dell'hedging, che invece duplica apposta la richiesta
+    search_key = _normalize_search_key(query, page_size, lang)
+    outcome = {"error": None}
+
+    async def loader():
+        error, products = await get_scheduler("off_search").coalesce_async(
+            search_key, lambda: _async_hedged_search(query, page_size, lang))
+        outcome["error"] = error
+        return error, products
+
+    results = await get_product_cache().aget_or_load(
+        "search", search_key, loader,
+        ttl=OFF_CACHE_SEARCH_TTL,
+        negative_ttl=OFF_CACHE_NEGATIVE_TTL,
+        stale_ttl=OFF_CACHE_STALE_TTL,
+        is_negative=lambda products: not products,
+        refresh_loader=lambda: with_priority(PRIORITY_BACKGROUND, _fetch_search_results, query, page_size, lang),
+    )
+    local_results = None
+    if not results and OFF_LOCAL_SEARCH == "fallback":
+        local_results = await asyncio.to_thread(local_search_products, query, page_size)
+    return _finish_search(results, outcome["error"], local_results)
+
+
+def _hedge_delay() -> float | None:
+    """Soglia oltre la quale duplicare una ricerca lenta (None = hedging disattivato o dati insufficienti)."""
+    if OFF_HEDGE_AFTER > 0:
+        return OFF_HEDGE_AFTER
+    if OFF_HEDGE_PERCENTILE <= 0:
         return None
+    threshold = _search_latency.percentile(OFF_HEDGE_PERCENTILE)
+    return None if threshold is None else max(threshold, OFF_HEDGE_MIN_DELAY)
+
+
+async def _async_hedged_search(query: str, page_size: int, lang: str) -> tuple[str | None, list[dict] | None]:
+    async def timed_search():
+        started = time.perf_counter()
+        outcome = await _async_fetch_search_results(query, page_size, lang)
+        if outcome[0] is None:
+            _search_latency.record(time.perf_counter() - started)
+        return outcome
+
+    error, products, was_hedged = await hedged(timed_search, _hedge_delay())
+    if was_hedged:
+        _hedge_stats["hedged_searches"] += 1
+        log.info("Ricerca lenta, inviata una seconda richiesta (hedging)", query=query)
+    return error, products
+
+
+async def _async_fetch_json(call, url: str, params: dict, timeout: float,
+                            context: str) -> tuple[str | None, int, dict | None]:
+    """GET asincrona con mappatura degli errori sugli stessi codici del client sincrono."""
+    httpx = import_httpx()
+    if httpx is None:
+        log.error("httpx non è installato, impossibile usare il client asincrono")
+        return ERROR_REQUEST, 0, None
+    try:
+        response = await async_get(url, params=params, headers={'User-Agent': USER_AGENT}, timeout=timeout)
+    except httpx.TimeoutException as timeout_err:
+        log.warning("Timeout della richiesta a Open Food Facts", context=context, error=str(timeout_err))
+        return ERROR_TIMEOUT, 0, None
+    except httpx.TransportError as conn_err:
+        log.warning("Impossibile connettersi a Open Food Facts", context=context, error=str(conn_err))
+        return ERROR_CONNECTION, 0, None
+    call.response_bytes = len(response.content)
+    if response.status_code >= 400:
+        _note_throttling(call.upstream, response.status_code, response.headers)
+        if response.status_code != 404:
+            log.warning("Errore HTTP da Open Food Facts", context=context, status=response.status_code)
+        return ERROR_HTTP, response.status_code, None
+    try:
+        return None, response.status_code, response.json()
+    except ValueError:
+        log.warning("Risposta JSON non valida da Open Food Facts", context=context, body=response.text[:200])
+        return ERROR_JSON, response.status_code, None
+
+
+async def _async_scheduled_call(upstream: str, key: str | None, request, *args):
+    """Variante asincrona di _scheduled_call."""
+    try:
+        return await get_scheduler(upstream).run_async(key, lambda: async_call_upstream(upstream, request, *args))
+    except UpstreamBusy as e:
+        log.warning("Richiesta a Open Food Facts rifiutata dal pianificatore", upstream=upstream, key=key,
+                    reason=e.reason, retry_after=round(e.retry_after, 1))
+        return ERROR_RATE_LIMITED, None
+
+
+async def _async_fetch_product_by_barcode(barcode: str) -> tuple[str | None, dict | None]:
+    return await _async_scheduled_call("off_barcode", barcode, _async_request_product_by_barcode, barcode)
+
+
+async def _async_request_product_by_barcode(call, barcode: str) -> tuple[str | None, dict | None]:
+    params = {"fields": "product_name_it,product_name,nutriments,brands,code,image_url,status,status_verbose"}
+    error, status_code, data = await _async_fetch_json(call, f"{BASE_URL_PRODUCT_V2}{barcode}", params, 10,
+                                                       f"barcode {barcode}")
+    if status_code == 404:
+        log.debug("Prodotto non trovato (HTTP 404)", barcode=barcode)
+        return None, None
+    if error is not None:
+        return error, None
+    return _product_from_payload(barcode, data)
+
+
+async def _async_fetch_search_results(query: str, page_size: int, lang: str) -> tuple[str | None, list[dict] | None]:
+    # nessun accorpamento qui: la copia "hedged" deve partire davvero (e consuma un gettone)
+    return await _async_scheduled_call("off_search", None, _async_request_search_results, query, page_size, lang)
+
+
+async def _async_request_search_results(call, query: str, page_size: int,
+                                        lang: str) -> tuple[str | None, list[dict] | None]:
+    params = _search_params(query, page_size, lang)
+    error, status_code, data = await _async_fetch_json(call, BASE_URL_SEARCH_CGI, params, 15, f"ricerca '{query}'")
+    if status_code == 404:
+        log.debug("Ricerca con risposta HTTP 404", query=query)
+        return None, []
+    if error is not None:
+        return error, None
+    return None, _products_from_search_payload(query, data)
 
 # FINE DELLA FUNZIONE search_products_by_name
 
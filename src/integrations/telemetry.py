@@ -0,0 +1,410 @@
+# src/integrations/telemetry.py
+#
+# Osservabilità del server: log strutturati con livelli e campionamento, e metriche in memoria
+# (istogrammi delle latenze per rotta e per servizio esterno, errori per tipo, dimensioni delle
+# risposte) esposte in formato testo Prometheus su /metrics.
+#
+# Il costo per evento è di pochi microsecondi: un messaggio sotto il livello configurato non
+# costruisce nessun record, e un'osservazione è una ricerca binaria sui bucket più un lock.
+#
+# Configurazione:
+#   LOG_LEVEL        -> DEBUG, INFO, WARNING, ERROR (default INFO)
+#   LOG_FORMAT       -> "text" (chiave=valore) oppure "json" (un oggetto per riga)
+#   LOG_SAMPLE_RATE  -> quota dei messaggi DEBUG/INFO emessi (0..1); avvisi ed errori sono sempre emessi
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1'))
+
+LOGGER_NAMESPACE = "allenatore"
+# Latenze in secondi: dalle risposte dalla cache (<1 ms) ai timeout delle API esterne (10-25 s)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_logging_configured = False
+_logging_lock = threading.Lock()
+
+
+# --- LOG STRUTTURATI ---
+
+# Attributi di ogni LogRecord: tutto il resto sono campi passati dal chiamante
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _record_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+def _format_value(value) -> str:
+    text = value if isinstance(value, str) else repr(value)
+    if not text or any(c in text for c in ' "=\n'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+class TextFormatter(logging.Formatter):
+    """`2024-01-04T10:00:00.123 INFO api: Messaggio chiave=valore ...`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+        name = record.name.removeprefix(LOGGER_NAMESPACE + ".")
+        line = f"{timestamp}.{int(record.msecs):03d} {record.levelname} {name}: {record.getMessage()}"
+        fields = _record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={_format_value(value)}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Un oggetto JSON per riga, con i campi del messaggio al primo livello."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": round(record.created, 3), "level": record.levelname,
+                 "logger": record.name.removeprefix(LOGGER_NAMESPACE + "."), "msg": record.getMessage()}
+        entry.update(_record_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str | None = None, fmt: str | None = None, stream=None) -> None:
+    """
+    (Ri)configura l'handler dei logger dell'applicazione. Chiamata automaticamente alla prima
+    get_logger() con i valori delle variabili d'ambiente; i test la usano per catturare l'output.
+    """
+    global _logging_configured
+    with _logging_lock:
+        root = logging.getLogger(LOGGER_NAMESPACE)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else TextFormatter())
+        root.addHandler(handler)
+        root.setLevel(level or LOG_LEVEL)
+        root.propagate = False
+        _logging_configured = True
+
+
+class StructuredLogger:
+    """
+    Logger con messaggio e campi separati: `log.info("Ricerca completata", query=q, results=n)`.
+
+    I messaggi sotto il livello configurato costano solo il controllo del livello; quelli DEBUG/INFO
+    sono emessi con probabilità `sample_rate` (i campionati contano in log_messages_sampled_out_total).
+    """
+
+    def __init__(self, logger: logging.Logger, sample_rate: float | None = None):
+        self.logger = logger
+        self.sample_rate = sample_rate
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def _log(self, level: int, message: str, fields: dict) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        rate = LOG_SAMPLE_RATE if self.sample_rate is None else self.sample_rate
+        if level < logging.WARNING and rate < 1 and random.random() >= rate:
+            LOG_SAMPLED_OUT.labels(logging.getLevelName(level)).inc()
+            return
+        exc_info = fields.pop("exc_info", None)
+        if not fields.keys().isdisjoint(_RECORD_ATTRIBUTES):
+            # "name", "msg", "args"... sono attributi del record: i campi omonimi prendono un suffisso
+            fields = {f"{key}_" if key in _RECORD_ATTRIBUTES else key: value for key, value in fields.items()}
+        self.logger.log(level, message, exc_info=exc_info, extra=fields, stacklevel=3)
+
+    def debug(self, message: str, **fields) -> None:
+        self._log(logging.DEBUG, message, fields)
+
+    def info(self, message: str, **fields) -> None:
+        self._log(logging.INFO, message, fields)
+
+    def warning(self, message: str, **fields) -> None:
+        self._log(logging.WARNING, message, fields)
+
+    def error(self, message: str, **fields) -> None:
+        self._log(logging.ERROR, message, fields)
+
+    def critical(self, message: str, **fields) -> None:
+        self._log(logging.CRITICAL, message, fields)
+
+
+def get_logger(name: str, sample_rate: float | None = None) -> StructuredLogger:
+    """Logger `allenatore.<name>`; al primo utilizzo configura l'handler secondo LOG_LEVEL e LOG_FORMAT."""
+    if not _logging_configured:
+        configure_logging()
+    return StructuredLogger(logging.getLogger(f"{LOGGER_NAMESPACE}.{name}"), sample_rate)
+
+
+# --- METRICHE ---
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Serie con i valori di etichetta indicati (creata al primo utilizzo)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: attese le etichette {self.labelnames}, ricevuti {values}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(value) for value in values), self._new_child())
+                self._children.setdefault(values, child)
+        return child
+
+    def _series(self) -> list:
+        # le chiavi con valori non stringa sono alias di quelle normalizzate: ogni serie una volta sola
+        with self._lock:
+            return sorted((key, child) for key, child in self._children.items()
+                          if all(isinstance(value, str) for value in key))
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._series():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_format_number(child.value)}"]
+
+
+class _GaugeChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_format_number(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: tuple):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)     # non cumulativi; l'ultimo è +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_number(bound)}"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}")
+        labels = _label_text(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_number(round(total, 6))}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metrica già registrata: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Tutte le metriche nel formato testo di Prometheus (versione 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        """Azzera tutte le serie (utile nei test)."""
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+REGISTRY = MetricsRegistry()
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "allenatore_http_request_duration_seconds", "Durata delle richieste HTTP per rotta.", ("route", "method", "status")))
+UPSTREAM_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "allenatore_upstream_request_duration_seconds", "Durata delle chiamate ai servizi esterni (retry inclusi).",
+    ("upstream", "outcome")))
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    "allenatore_upstream_errors_total", "Chiamate ai servizi esterni fallite, per tipo di errore.", ("upstream", "type")))
+UPSTREAM_RESPONSE_BYTES = REGISTRY.register(Histogram(
+    "allenatore_upstream_response_bytes", "Dimensione delle risposte dei servizi esterni.", ("upstream",), SIZE_BUCKETS))
+UPSTREAM_REQUEST_BYTES = REGISTRY.register(Histogram(
+    "allenatore_upstream_request_bytes", "Dimensione delle richieste ai servizi esterni (prompt di Gemini).",
+    ("upstream",), SIZE_BUCKETS))
+LOG_SAMPLED_OUT = REGISTRY.register(Counter(
+    "allenatore_log_messages_sampled_out_total", "Messaggi di log scartati dal campionamento.", ("level",)))
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+def observe_request(route: str, method: str, status: int, seconds: float) -> None:
+    HTTP_REQUEST_SECONDS.labels(route, method, status).observe(seconds)
+
+
+def observe_upstream(upstream: str, seconds: float, error: str | None = None,
+                     response_bytes: int | None = None, request_bytes: int | None = None) -> None:
+    """Registra una chiamata a un servizio esterno; `error` è il codice di errore del client (None = riuscita)."""
+    UPSTREAM_REQUEST_SECONDS.labels(upstream, "ok" if error is None else "error").observe(seconds)
+    if error is not None:
+        UPSTREAM_ERRORS.labels(upstream, error).inc()
+    if response_bytes is not None:
+        UPSTREAM_RESPONSE_BYTES.labels(upstream).observe(response_bytes)
+    if request_bytes is not None:
+        UPSTREAM_REQUEST_BYTES.labels(upstream).observe(request_bytes)
+
+
+class UpstreamCall:
+    """
+    Misura una chiamata a un servizio esterno: creata prima della richiesta, chiusa con finish(errore).
+    Chi legge la risposta imposta response_bytes (e request_bytes per i servizi con payload grandi).
+    """
+
+    __slots__ = ("upstream", "started", "response_bytes", "request_bytes")
+
+    def __init__(self, upstream: str):
+        self.upstream = upstream
+        self.started = time.perf_counter()
+        self.response_bytes = None
+        self.request_bytes = None
+
+    def finish(self, error: str | None = None) -> None:
+        observe_upstream(self.upstream, time.perf_counter() - self.started, error,
+                         self.response_bytes, self.request_bytes)
+
+
+def call_upstream(upstream: str, request, *args):
+    """
+    Esegue `request(call, *args)`, che restituisce (codice_errore, valore), misurandone durata ed esito.
+    Un'eccezione non gestita dal client è contata come errore di tipo "exception" e rilanciata.
+    """
+    call = UpstreamCall(upstream)
+    try:
+        outcome = request(call, *args)
+    except Exception:
+        call.finish("exception")
+        raise
+    call.finish(outcome[0])
+    return outcome
+
+
+async def async_call_upstream(upstream: str, request, *args):
+    """Come call_upstream, per le coroutine; le cancellazioni hanno outcome "cancelled" e non contano come errori."""
+    call = UpstreamCall(upstream)
+    try:
+        outcome = await request(call, *args)
+    except Exception:
+        call.finish("exception")
+        raise
+    except BaseException:
+        # cancellata (scadenza della richiesta o hedging): misurata, ma non è un errore del servizio
+        UPSTREAM_REQUEST_SECONDS.labels(upstream, "cancelled").observe(time.perf_counter() - call.started)
+        raise
+    call.finish(outcome[0])
+    return outcome
@@ -0,0 +1,286 @@
+# src/integrations/thumbnails.py
+#
+# Miniature delle immagini dei prodotti per /api/thumb. La pagina mostra le immagini a 50x50 ma
+# OpenFoodFacts restituisce l'URL della versione a 400 px (o più): qui ogni immagine viene scaricata
+# una sola volta, ridotta alla dimensione richiesta e salvata in una cache su disco di dimensione
+# limitata (THUMB_CACHE_MAX_BYTES, si eliminano le miniature usate meno di recente).
+#
+# - Si scaricano solo immagini dagli host di OpenFoodFacts (THUMB_ALLOWED_HOSTS), senza seguire
+#   redirect e fino a THUMB_MAX_SOURCE_BYTES: il proxy non può essere usato per raggiungere altri host.
+# - Degli URL di OFF (".../front_it.12.400.jpg") si scarica la variante pubblicata più piccola che
+#   basta per la miniatura (100, 200 o 400 px).
+# - Con Pillow installato la miniatura è ridimensionata esattamente e ricodificata in JPEG; senza
+#   Pillow si conserva la variante di OFF scaricata (già molto più leggera dell'originale).
+
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+
+from src.integrations.http_client import get_session
+from src.integrations.local_cache import SingleFlight
+from src.integrations.openfoodfacts_client import (
+    ERROR_CONNECTION, ERROR_HTTP, ERROR_NOT_FOUND, ERROR_REQUEST, ERROR_TIMEOUT, USER_AGENT
+)
+from src.integrations.telemetry import call_upstream, get_logger
+
+try:
+    from PIL import Image, ImageOps      # opzionale: senza, le miniature sono le varianti piccole di OFF
+except ImportError:
+    Image = None
+    ImageOps = None
+
+log = get_logger("thumbnails")
+
+# --- CONFIGURAZIONE ---
+THUMB_CACHE_DIR = os.getenv('THUMB_CACHE_DIR', os.path.join(tempfile.gettempdir(), "allenatore_thumbs"))
+THUMB_CACHE_MAX_BYTES = int(os.getenv('THUMB_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+THUMB_MAX_SOURCE_BYTES = int(os.getenv('THUMB_MAX_SOURCE_BYTES', str(5 * 1024 * 1024)))
+THUMB_TIMEOUT = float(os.getenv('THUMB_TIMEOUT', '10'))
+# Host ammessi: un nome esatto, oppure ".dominio" per tutti i suoi sottodomini
+THUMB_ALLOWED_HOSTS = tuple(host.strip().lower() for host in os.getenv(
+    'THUMB_ALLOWED_HOSTS', 'openfoodfacts.org,.openfoodfacts.org').split(",") if host.strip())
+THUMB_SIZES = (50, 100, 200)          # lato massimo in pixel (100 = 50 px su schermi ad alta densità)
+THUMB_DEFAULT_SIZE = 100
+THUMB_JPEG_QUALITY = 80
+
+OFF_IMAGE_VARIANTS = (100, 200, 400)  # lati delle versioni pubblicate da OFF accanto a "full"
+ERROR_NOT_IMAGE = "not_image"
+ERROR_TOO_LARGE = "too_large"
+_DOWNLOAD_CHUNK = 64 * 1024
+_IMAGE_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+_CONTENT_TYPES = {extension: content_type for content_type, extension in _IMAGE_EXTENSIONS.items()}
+_OFF_VARIANT_RE = re.compile(r"^(.+/images/products/.+\.)(\d+|full)(\.jpg)$")
+
+
+class ThumbnailError(Exception):
+    """Miniatura non disponibile: `status` è il codice HTTP da restituire al client."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def off_image_variant(url: str, size: int) -> str:
+    """Per un'immagine di OFF, l'URL della variante pubblicata più piccola con lato >= `size`; gli altri URL restano uguali."""
+    match = _OFF_VARIANT_RE.match(url)
+    if not match:
+        return url
+    variant = next((str(side) for side in OFF_IMAGE_VARIANTS if side >= size), "full")
+    return f"{match.group(1)}{variant}{match.group(3)}"
+
+
+def make_thumbnail(data: bytes, content_type: str, size: int) -> tuple[bytes, str]:
+    """Immagine ridotta a lato massimo `size` in JPEG (con Pillow); senza Pillow restituisce l'immagine com'è."""
+    if Image is None:
+        return data, content_type
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("RGB", (size, size))          # JPEG: decodifica già ridotta, molto più veloce
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            if image.mode in ("RGBA", "LA", "P"):
+                # JPEG non ha trasparenza: sfondo bianco come la pagina
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=THUMB_JPEG_QUALITY, optimize=True)
+            return output.getvalue(), "image/jpeg"
+    except (OSError, ValueError) as e:
+        raise ThumbnailError(502, "L'immagine del prodotto non è leggibile") from e
+
+
+class ThumbnailCache:
+    """Miniature su disco (una per URL e dimensione), con limite di byte e scarto LRU."""
+
+    def __init__(self, cache_dir: str = THUMB_CACHE_DIR, max_bytes: int = THUMB_CACHE_MAX_BYTES,
+                 allowed_hosts: tuple = THUMB_ALLOWED_HOSTS, max_source_bytes: int = THUMB_MAX_SOURCE_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.allowed_hosts = tuple(host.lower() for host in allowed_hosts)
+        self.max_source_bytes = max_source_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict()          # nome del file -> byte, dal meno recente
+        self._bytes = 0
+        self._single_flight = SingleFlight()
+        self._stats = {"hits": 0, "misses": 0, "downloads": 0, "download_errors": 0, "evictions": 0,
+                       "downloaded_bytes": 0, "served_bytes": 0}
+        # Le miniature già su disco (anche di esecuzioni precedenti) entrano nell'indice in ordine di uso
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._bytes += size
+        self._evict()
+
+    def is_allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        if parts.scheme not in ("http", "https") or not host:
+            return False
+        return any(host == allowed or (allowed.startswith(".") and host.endswith(allowed))
+                   for allowed in self.allowed_hosts)
+
+    def get(self, url: str, size: int = THUMB_DEFAULT_SIZE) -> tuple[bytes, str]:
+        """
+        Miniatura (byte, content type) dell'immagine `url`, dalla cache o scaricata e ridotta ora.
+
+        Raises:
+            ThumbnailError: 400/403 per URL non validi o di host non ammessi, 404 se l'immagine non esiste,
+                            502 se il download fallisce o il contenuto non è un'immagine.
+        """
+        if not self.is_allowed(url):
+            raise ThumbnailError(403, "Sono ammesse solo immagini di OpenFoodFacts")
+        key = hashlib.sha1(f"{size}|{url}".encode("utf-8")).hexdigest()
+        cached = self._read(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            self._stats["misses"] += 1
+        # Richieste concorrenti della stessa miniatura: un solo download
+        return self._single_flight.do(key, lambda: self._read(key, count=False) or self._create(key, url, size))
+
+    def _read(self, key: str, count: bool = True) -> tuple[bytes, str] | None:
+        with self._lock:
+            name = next((f"{key}.{extension}" for extension in _CONTENT_TYPES if f"{key}.{extension}" in self._index), None)
+            if name is None:
+                return None
+            self._index.move_to_end(name)
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)                   # l'ordine LRU sopravvive ai riavvii
+        except OSError:
+            # eliminata da un altro processo che usa la stessa cartella
+            with self._lock:
+                self._bytes -= self._index.pop(name, 0)
+            return None
+        with self._lock:
+            if count:
+                self._stats["hits"] += 1
+            self._stats["served_bytes"] += len(data)
+        return data, _CONTENT_TYPES[name.rsplit(".", 1)[1]]
+
+    def _create(self, key: str, url: str, size: int) -> tuple[bytes, str]:
+        error, downloaded = call_upstream("off_images", self._request_image, off_image_variant(url, size))
+        with self._lock:
+            self._stats["downloads" if error is None else "download_errors"] += 1
+            if downloaded is not None:
+                self._stats["downloaded_bytes"] += len(downloaded[0])
+        if error == ERROR_NOT_FOUND:
+            raise ThumbnailError(404, "Immagine del prodotto non trovata")
+        if error is not None:
+            raise ThumbnailError(502, "Immagine del prodotto non disponibile")
+
+        data, content_type = make_thumbnail(*downloaded, size)
+        self._store(f"{key}.{_IMAGE_EXTENSIONS[content_type]}", data)
+        with self._lock:
+            self._stats["served_bytes"] += len(data)
+        return data, content_type
+
+    def _request_image(self, call, url: str) -> tuple[str | None, tuple[bytes, str] | None]:
+        try:
+            # Nessun redirect: porterebbe fuori dagli host ammessi
+            response = get_session().get(url, headers={"User-Agent": USER_AGENT}, timeout=THUMB_TIMEOUT, stream=True,
+                                         allow_redirects=False)
+        except requests.exceptions.Timeout:
+            return ERROR_TIMEOUT, None
+        except requests.exceptions.ConnectionError:
+            return ERROR_CONNECTION, None
+        except requests.exceptions.RequestException:
+            return ERROR_REQUEST, None
+        with response:
+            if response.status_code == 404:
+                return ERROR_NOT_FOUND, None
+            if response.status_code != 200:
+                log.warning("Download dell'immagine fallito", url=url, status=response.status_code)
+                return ERROR_HTTP, None
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type not in _IMAGE_EXTENSIONS:
+                log.warning("Il contenuto scaricato non è un'immagine", url=url, content_type=content_type)
+                return ERROR_NOT_IMAGE, None
+            chunks, total = [], 0
+            try:
+                for chunk in response.iter_content(_DOWNLOAD_CHUNK):
+                    total += len(chunk)
+                    if total > self.max_source_bytes:
+                        log.warning("Immagine troppo grande", url=url, max_bytes=self.max_source_bytes)
+                        return ERROR_TOO_LARGE, None
+                    chunks.append(chunk)
+            except requests.exceptions.RequestException:
+                return ERROR_CONNECTION, None
+            call.response_bytes = total
+            return None, (b"".join(chunks), content_type)
+
+    def _store(self, name: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        path = os.path.join(self.cache_dir, name)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except OSError as e:
+            log.error("Scrittura della miniatura fallita", path=path, error=str(e))
+            return
+        with self._lock:
+            self._bytes += len(data) - self._index.pop(name, 0)
+            self._index[name] = len(data)
+        self._evict()
+
+    def _evict(self) -> None:
+        removed = []
+        with self._lock:
+            while self._bytes > self.max_bytes and self._index:
+                name, size = self._index.popitem(last=False)
+                self._bytes -= size
+                self._stats["evictions"] += 1
+                removed.append(name)
+        for name in removed:
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._index), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "resize": Image is not None, **self._stats}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """Cache condivisa delle miniature, creata al primo utilizzo in THUMB_CACHE_DIR."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ThumbnailCache()
+    return _cache
+
+
+def set_thumbnail_cache(cache: ThumbnailCache | None) -> None:
+    """Sostituisce la cache condivisa (None la ricrea al prossimo utilizzo)."""
+    global _cache
+    with _cache_lock:
+        _cache = cache
@@ -0,0 +1,449 @@
+# src/integrations/upstream_scheduler.py
+#
+# Pianificatore delle chiamate ai servizi esterni (OpenFoodFacts, Gemini). Ogni endpoint ha:
+#   - un token bucket con il limite di richieste al minuto del servizio (e un burst iniziale);
+#   - una coda con priorità: le richieste interattive passano davanti a quelle batch, e queste
+#     davanti agli aggiornamenti in background della cache;
+#   - una scadenza in coda per ogni chiamata: se il gettone non arriverebbe in tempo la chiamata
+#     fallisce subito (UpstreamBusy) invece di accumularsi;
+#   - l'accorpamento delle chiamate identiche concorrenti (una sola richiesta, stesso risultato per tutti).
+#
+# Uso: get_scheduler("off_search").run(chiave, lambda: richiesta())
+#      with priority_scope(PRIORITY_BATCH): ...   # priorità delle chiamate fatte nel blocco
+#
+# Profondità della coda, attese, richieste accorpate e rifiutate sono esposte su /metrics.
+#
+# Configurazione (richieste al minuto, 0 = nessun limite; OpenFoodFacts documenta 100/min per i
+# prodotti e 10/min per la ricerca, Gemini 15/min nel piano gratuito):
+#   OFF_PRODUCT_RATE_PER_MIN, OFF_PRODUCT_BURST, OFF_SEARCH_RATE_PER_MIN, OFF_SEARCH_BURST,
+#   GEMINI_RATE_PER_MIN, GEMINI_BURST
+#   UPSTREAM_DEADLINE_INTERACTIVE / _BATCH / _BACKGROUND -> attesa massima in coda (s) per priorità
+#   UPSTREAM_MAX_QUEUE -> chiamate in attesa oltre le quali le nuove sono rifiutate
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Callable
+
+from src.integrations.local_cache import SingleFlight
+from src.integrations.telemetry import REGISTRY, Counter, Gauge, Histogram, get_logger
+
+log = get_logger("scheduler")
+
+# --- CONFIGURAZIONE ---
+OFF_PRODUCT_RATE_PER_MIN = float(os.getenv('OFF_PRODUCT_RATE_PER_MIN', '100'))
+OFF_PRODUCT_BURST = int(os.getenv('OFF_PRODUCT_BURST', '20'))
+OFF_SEARCH_RATE_PER_MIN = float(os.getenv('OFF_SEARCH_RATE_PER_MIN', '10'))
+OFF_SEARCH_BURST = int(os.getenv('OFF_SEARCH_BURST', '5'))
+GEMINI_RATE_PER_MIN = float(os.getenv('GEMINI_RATE_PER_MIN', '15'))
+GEMINI_BURST = int(os.getenv('GEMINI_BURST', '5'))
+
+UPSTREAM_DEADLINE_INTERACTIVE = float(os.getenv('UPSTREAM_DEADLINE_INTERACTIVE', '3'))
+UPSTREAM_DEADLINE_BATCH = float(os.getenv('UPSTREAM_DEADLINE_BATCH', '30'))
+UPSTREAM_DEADLINE_BACKGROUND = float(os.getenv('UPSTREAM_DEADLINE_BACKGROUND', '120'))
+UPSTREAM_MAX_QUEUE = int(os.getenv('UPSTREAM_MAX_QUEUE', '256'))
+
+# Priorità (valore più basso = servita prima)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch", PRIORITY_BACKGROUND: "background"}
+DEFAULT_DEADLINES = {PRIORITY_INTERACTIVE: UPSTREAM_DEADLINE_INTERACTIVE, PRIORITY_BATCH: UPSTREAM_DEADLINE_BATCH,
+                     PRIORITY_BACKGROUND: UPSTREAM_DEADLINE_BACKGROUND}
+
+# Priorità delle chiamate fatte dal contesto corrente (thread o task asyncio): chi avvia lavoro batch o in
+# background la imposta con priority_scope, senza doverla passare attraverso tutte le funzioni del client
+_current_priority = contextvars.ContextVar("upstream_priority", default=PRIORITY_INTERACTIVE)
+
+# Motivi di rifiuto (etichetta "reason" di allenatore_scheduler_rejected_total)
+REJECTED_DEADLINE = "deadline"
+REJECTED_QUEUE_FULL = "queue_full"
+
+# Le coroutine in attesa non possono dormire su una Condition: ricontrollano la coda al più ogni tanto
+ASYNC_POLL_INTERVAL = 0.05
+
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "allenatore_scheduler_queue_depth", "Chiamate in attesa di un gettone, per servizio esterno.", ("upstream",)))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "allenatore_scheduler_wait_seconds", "Attesa in coda prima della chiamata al servizio esterno.",
+    ("upstream", "priority")))
+REJECTED = REGISTRY.register(Counter(
+    "allenatore_scheduler_rejected_total", "Chiamate rifiutate dal pianificatore senza contattare il servizio.",
+    ("upstream", "reason")))
+COALESCED = REGISTRY.register(Counter(
+    "allenatore_scheduler_coalesced_total", "Chiamate accorpate a una identica già in corso.", ("upstream",)))
+
+
+def current_priority() -> int:
+    return _current_priority.get()
+
+
+@contextlib.contextmanager
+def priority_scope(priority: int):
+    """Le chiamate pianificate nel blocco (stesso thread o task) hanno la priorità indicata."""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def with_priority(priority: int, fn: Callable, *args):
+    """Esegue fn(*args) con la priorità indicata (utile come loader o come funzione per un pool di thread)."""
+    with priority_scope(priority):
+        return fn(*args)
+
+
+class UpstreamBusy(Exception):
+    """La chiamata non può partire entro la sua scadenza (o la coda è piena): va trattata come errore transitorio."""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        super().__init__(f"{upstream}: chiamata rifiutata ({reason}), riprovare tra {retry_after:.1f}s")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket: `rate` gettoni al secondo fino a un massimo di `burst`. Con rate <= 0 non limita nulla.
+    Non è thread-safe: lo protegge il lock del pianificatore.
+    """
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = now
+        self._paused_until = 0.0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def wait_time(self, now: float, tokens: float = 1.0) -> float:
+        """Secondi prima che siano disponibili `tokens` gettoni (0 = subito)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        pause = max(0.0, self._paused_until - now)
+        return max(pause, (tokens - self._tokens) / self.rate if self._tokens < tokens else 0.0)
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return max(0.0, self._tokens)
+
+    def take(self, now: float) -> None:
+        if not self.unlimited:
+            self._refill(now)
+            self._tokens -= 1
+
+    def pause(self, now: float, seconds: float) -> None:
+        """Il servizio ha segnalato di rallentare (HTTP 429): nessun gettone per `seconds` secondi."""
+        self._refill(now)
+        self._tokens = min(self._tokens, 0.0)
+        self._paused_until = max(self._paused_until, now + seconds)
+
+
+class UpstreamScheduler:
+    """
+    Coda con priorità davanti a un servizio esterno, limitata da un token bucket.
+
+    I thread in attesa dormono su una Condition e vengono svegliati quando la testa della coda cambia;
+    le coroutine ricontrollano la coda con brevi sleep. Le chiamate accorpate attendono quella già in
+    corso alla sua priorità e non consumano gettoni.
+    """
+
+    def __init__(self, upstream: str, rate_per_minute: float, burst: int = 1, max_queue: int = UPSTREAM_MAX_QUEUE,
+                 deadlines: dict | None = None, clock: Callable[[], float] = time.monotonic):
+        self.upstream = upstream
+        self.max_queue = max_queue
+        self.deadlines = {**DEFAULT_DEADLINES, **(deadlines or {})}
+        self._clock = clock
+        self._bucket = TokenBucket(rate_per_minute / 60, burst, clock())
+        self._lock = threading.Lock()
+        self._head_changed = threading.Condition(self._lock)
+        self._waiting = []                      # heap di [priorità, sequenza]
+        self._sequence = itertools.count()
+        self._flight = SingleFlight()
+        self._async_flights = {}                # (event loop, chiave) -> {"task": Task condiviso, "waiters": n}
+        self._stats = {"admitted": 0, "coalesced": 0, "rejected_deadline": 0, "rejected_queue_full": 0,
+                       "throttled": 0, "wait_seconds": 0.0}
+
+    # --- Ammissione ---
+
+    def _deadline(self, priority: int, deadline: float | None) -> float:
+        return self.deadlines.get(priority, UPSTREAM_DEADLINE_BATCH) if deadline is None else deadline
+
+    def _resolve(self, priority: int | None, deadline: float | None) -> tuple[int, float]:
+        priority = current_priority() if priority is None else priority
+        return priority, self._deadline(priority, deadline)
+
+    def _reject(self, reason: str, retry_after: float) -> UpstreamBusy:
+        # con il lock acquisito
+        self._stats[f"rejected_{reason}"] += 1
+        REJECTED.labels(self.upstream, reason).inc()
+        return UpstreamBusy(self.upstream, reason, retry_after)
+
+    def _enqueue(self, priority: int, deadline: float, now: float) -> list | None:
+        """Con il lock: None se la chiamata è ammessa subito, altrimenti la voce messa in coda."""
+        if self._bucket.unlimited or (not self._waiting and self._bucket.wait_time(now) <= 0):
+            self._bucket.take(now)
+            return None
+        if len(self._waiting) >= self.max_queue:
+            raise self._reject(REJECTED_QUEUE_FULL, self._bucket.wait_time(now, len(self._waiting) + 1))
+        # stima dell'attesa: i gettoni per chi è già in coda con priorità uguale o maggiore, più il proprio
+        ahead = sum(1 for entry in self._waiting if entry[0] <= priority)
+        expected_wait = self._bucket.wait_time(now, ahead + 1)
+        if expected_wait > deadline:
+            raise self._reject(REJECTED_DEADLINE, expected_wait)
+        entry = [priority, next(self._sequence)]
+        heapq.heappush(self._waiting, entry)
+        QUEUE_DEPTH.labels(self.upstream).set(len(self._waiting))
+        return entry
+
+    def _try_admit(self, entry: list, now: float) -> float:
+        """Con il lock: 0 se `entry` ha ottenuto il gettone (ed è uscita dalla coda), altrimenti l'attesa stimata."""
+        wait = self._bucket.wait_time(now)
+        if self._waiting[0] is not entry or wait > 0:
+            return max(wait, 1e-3)
+        self._bucket.take(now)
+        heapq.heappop(self._waiting)
+        QUEUE_DEPTH.labels(self.upstream).set(len(self._waiting))
+        self._head_changed.notify_all()
+        return 0.0
+
+    def _leave(self, entry: list) -> None:
+        """Con il lock: toglie dalla coda una voce scaduta o cancellata."""
+        if entry in self._waiting:
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            QUEUE_DEPTH.labels(self.upstream).set(len(self._waiting))
+            self._head_changed.notify_all()
+
+    def _admitted(self, priority: int, waited: float) -> float:
+        with self._lock:
+            self._stats["admitted"] += 1
+            self._stats["wait_seconds"] += waited
+        QUEUE_WAIT_SECONDS.labels(self.upstream, PRIORITY_NAMES.get(priority, str(priority))).observe(waited)
+        return waited
+
+    def acquire(self, priority: int | None = None, deadline: float | None = None) -> float:
+        """
+        Attende un gettone rispettando la priorità.
+
+        Args:
+            priority: priorità della chiamata (default quella del contesto, vedi priority_scope).
+            deadline: attesa massima in coda in secondi (default secondo la priorità, vedi UPSTREAM_DEADLINE_*).
+
+        Returns:
+            float: i secondi trascorsi in coda.
+
+        Raises:
+            UpstreamBusy: se il gettone non arriverebbe (o non è arrivato) entro la scadenza, o se la coda è piena.
+        """
+        priority, deadline = self._resolve(priority, deadline)
+        started = self._clock()
+        with self._lock:
+            entry = self._enqueue(priority, deadline, started)
+            try:
+                while entry is not None:
+                    now = self._clock()
+                    wait = self._try_admit(entry, now)
+                    if not wait:
+                        break
+                    remaining = started + deadline - now
+                    if remaining <= 0:
+                        raise self._reject(REJECTED_DEADLINE, wait)
+                    self._head_changed.wait(min(wait, remaining))
+            except BaseException:
+                self._leave(entry)
+                raise
+        return self._admitted(priority, 0.0 if entry is None else self._clock() - started)
+
+    async def acquire_async(self, priority: int | None = None, deadline: float | None = None) -> float:
+        """Variante di `acquire` per le coroutine: l'attesa non blocca l'event loop."""
+        priority, deadline = self._resolve(priority, deadline)
+        started = self._clock()
+        with self._lock:
+            entry = self._enqueue(priority, deadline, started)
+        try:
+            while entry is not None:
+                now = self._clock()
+                with self._lock:
+                    wait = self._try_admit(entry, now)
+                    remaining = started + deadline - now
+                    if wait and remaining <= 0:
+                        raise self._reject(REJECTED_DEADLINE, wait)
+                if not wait:
+                    break
+                await asyncio.sleep(min(wait, remaining, ASYNC_POLL_INTERVAL))
+        except BaseException:
+            # scaduta o cancellata (scadenza della richiesta, hedging): libera il posto in coda
+            with self._lock:
+                self._leave(entry)
+            raise
+        return self._admitted(priority, 0.0 if entry is None else self._clock() - started)
+
+    def throttled(self, retry_after: float | None = None) -> None:
+        """
+        Il servizio ha risposto "troppe richieste": sospende i gettoni per `retry_after` secondi
+        (default: il tempo di un gettone, almeno un secondo).
+        """
+        now = self._clock()
+        with self._lock:
+            if self._bucket.unlimited:
+                return
+            seconds = retry_after if retry_after is not None else max(1.0, 1 / self._bucket.rate)
+            self._bucket.pause(now, seconds)
+            self._stats["throttled"] += 1
+        log.warning("Servizio esterno in throttling, richieste sospese", upstream=self.upstream, seconds=seconds)
+
+    def retry_after(self) -> float:
+        """Secondi stimati prima che una nuova chiamata ottenga il gettone, dopo quelle già in coda (0 = subito)."""
+        with self._lock:
+            return self._bucket.wait_time(self._clock(), len(self._waiting) + 1)
+
+    # --- Esecuzione ---
+
+    def coalesce(self, key: str, fn: Callable[[], object]):
+        """Esegue `fn()`; le chiamate concorrenti con la stessa chiave ricevono lo stesso risultato (o eccezione)."""
+        ran = False
+
+        def leader():
+            nonlocal ran
+            ran = True
+            return fn()
+
+        try:
+            return self._flight.do(key, leader)
+        finally:
+            if not ran:
+                with self._lock:
+                    self._stats["coalesced"] += 1
+                COALESCED.labels(self.upstream).inc()
+
+    def run(self, key: str | None, fn: Callable[[], object], priority: int | None = None,
+            deadline: float | None = None):
+        """
+        Esegue `fn()` appena c'è un gettone. Con una chiave, le chiamate identiche concorrenti
+        fanno una sola richiesta (key=None: nessun accorpamento).
+
+        Raises:
+            UpstreamBusy: vedi `acquire`.
+        """
+        def admitted_call():
+            self.acquire(priority, deadline)
+            return fn()
+
+        return admitted_call() if key is None else self.coalesce(key, admitted_call)
+
+    async def coalesce_async(self, key: str, fn):
+        """
+        Come `coalesce` per una coroutine function. La chiamata condivisa prosegue finché qualcuno la
+        attende: se chi l'ha avviata viene cancellato gli altri ricevono comunque il risultato, se vengono
+        cancellati tutti (es. scadenza della richiesta) viene cancellata anche la chiamata.
+        """
+        flight_key = (asyncio.get_running_loop(), key)
+        flight = self._async_flights.get(flight_key)
+        if flight is None:
+            flight = self._async_flights[flight_key] = {"task": asyncio.ensure_future(fn()), "waiters": 0}
+
+            def forget(done):
+                if self._async_flights.get(flight_key) is flight:
+                    del self._async_flights[flight_key]
+                if not done.cancelled():
+                    done.exception()  # evita l'avviso "exception was never retrieved" se nessuno la attende più
+
+            flight["task"].add_done_callback(forget)
+        else:
+            with self._lock:
+                self._stats["coalesced"] += 1
+            COALESCED.labels(self.upstream).inc()
+        flight["waiters"] += 1
+        try:
+            return await asyncio.shield(flight["task"])
+        finally:
+            flight["waiters"] -= 1
+            if not flight["waiters"] and not flight["task"].done():
+                # nessuno attende più: chi arriva ora avvia una chiamata nuova
+                if self._async_flights.get(flight_key) is flight:
+                    del self._async_flights[flight_key]
+                flight["task"].cancel()
+
+    async def run_async(self, key: str | None, fn, priority: int | None = None, deadline: float | None = None):
+        """Variante di `run` per le coroutine function."""
+        async def admitted_call():
+            await self.acquire_async(priority, deadline)
+            return await fn()
+
+        return await (admitted_call() if key is None else self.coalesce_async(key, admitted_call))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._waiting)
+            stats["available_tokens"] = None if self._bucket.unlimited else round(
+                self._bucket.available(self._clock()), 2)
+        stats["rate_per_minute"] = self._bucket.rate * 60
+        stats["avg_wait_seconds"] = round(stats.pop("wait_seconds") / stats["admitted"], 4) if stats["admitted"] else 0.0
+        return stats
+
+
+# --- PIANIFICATORI CONDIVISI ---
+
+# servizio esterno -> (richieste al minuto, burst)
+UPSTREAM_LIMITS = {
+    "off_barcode": (OFF_PRODUCT_RATE_PER_MIN, OFF_PRODUCT_BURST),
+    "off_search": (OFF_SEARCH_RATE_PER_MIN, OFF_SEARCH_BURST),
+    "gemini": (GEMINI_RATE_PER_MIN, GEMINI_BURST),
+}
+
+_schedulers: dict[str, UpstreamScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(upstream: str) -> UpstreamScheduler:
+    """Pianificatore condiviso di un servizio esterno (creato al primo utilizzo con i limiti di UPSTREAM_LIMITS)."""
+    scheduler = _schedulers.get(upstream)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.get(upstream)
+            if scheduler is None:
+                rate, burst = UPSTREAM_LIMITS.get(upstream, (0, 1))
+                scheduler = _schedulers[upstream] = UpstreamScheduler(upstream, rate, burst)
+    return scheduler
+
+
+def set_scheduler(upstream: str, scheduler: UpstreamScheduler | None) -> None:
+    """Sostituisce il pianificatore di un servizio (None lo ricrea al prossimo utilizzo); utile nei test e nei benchmark."""
+    with _schedulers_lock:
+        if scheduler is None:
+            _schedulers.pop(upstream, None)
+        else:
+            _schedulers[upstream] = scheduler
+
+
+def get_scheduler_stats() -> dict:
+    """Statistiche dei pianificatori già creati, per servizio esterno."""
+    with _schedulers_lock:
+        schedulers = dict(_schedulers)
+    return {upstream: scheduler.stats() for upstream, scheduler in sorted(schedulers.items())}
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Secondi indicati dall'header Retry-After (None se assente o in formato data)."""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
@@ -0,0 +1,92 @@
+# src/main.py
+#
+# Comandi da terminale dell'Allenatore Alimentare.
+#
+#   enrich: arricchisce un catalogo (CSV/TSV/JSON/JSONL) con i dati nutrizionali di OpenFoodFacts,
+#           con un pool di richieste parallele, uscita CSV o JSONL scritta man mano e ripresa
+#           automatica dall'ultimo checkpoint dopo un'interruzione (vedi catalog_enrichment).
+#
+# Uso: python -m src.main enrich data/dietetic_products_data/prodotti_conad_diet.csv -o arricchiti.jsonl
+#                                [--workers 8] [--format csv|jsonl] [--checkpoint-every 100] [--restart]
+#                                [--off-url http://127.0.0.1:8765]
+
+import argparse
+import os
+import sys
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+from src.integrations import openfoodfacts_client
+from src.integrations.catalog_enrichment import ENRICH_CHECKPOINT_EVERY, OUTPUT_FORMATS, count_records, \
+    enrich_file, read_checkpoint
+from src.integrations.telemetry import configure_logging, get_logger
+from src.ui.console_interface import ProgressReporter
+
+log = get_logger("main")
+
+
+def use_off_base_url(base_url: str) -> None:
+    """Punta il client a un server compatibile con OFF (es. un server finto locale per le prove)."""
+    base_url = base_url.rstrip("/")
+    openfoodfacts_client.BASE_URL_SEARCH_CGI = f"{base_url}/cgi/search.pl"
+    openfoodfacts_client.BASE_URL_PRODUCT_V2 = f"{base_url}/api/v2/product/"
+
+
+def run_enrich(args: argparse.Namespace, stream=None) -> dict:
+    if args.off_url:
+        use_off_base_url(args.off_url)
+    checkpoint = None if args.restart else read_checkpoint(args.output)
+    already_done = checkpoint["processed"] if checkpoint else 0
+    total = count_records(args.input)
+    reporter = ProgressReporter(os.path.basename(args.input), already_done=already_done, stream=stream)
+    if already_done:
+        reporter.stream.write(f"Ripresa da {args.output}: {already_done}/{total} voci già fatte\n")
+    try:
+        summary = enrich_file(args.input, args.output, workers=args.workers, fmt=args.format,
+                              checkpoint_every=args.checkpoint_every, restart=args.restart, total=total,
+                              progress=reporter)
+    except KeyboardInterrupt:
+        reporter.finish()
+        reporter.stream.write("Interrotto: rilanciare lo stesso comando per riprendere dall'ultimo checkpoint\n")
+        raise
+    reporter.finish(summary)
+    return summary
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m src.main", description="Allenatore Alimentare da terminale.")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="livello dei log (l'avanzamento è stampato comunque)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    enrich_parser = subparsers.add_parser("enrich", help="Arricchisce un catalogo con i dati di OpenFoodFacts.")
+    enrich_parser.add_argument("input", help="file CSV/TSV/JSON/JSONL con barcode e/o nome dei prodotti")
+    enrich_parser.add_argument("-o", "--output", required=True, help="file di uscita (.csv o .jsonl)")
+    enrich_parser.add_argument("--format", choices=OUTPUT_FORMATS, help="formato di uscita (default: dall'estensione)")
+    enrich_parser.add_argument("--workers", type=int, default=openfoodfacts_client.OFF_BATCH_CONCURRENCY,
+                               help="richieste in parallelo")
+    enrich_parser.add_argument("--checkpoint-every", type=int, default=ENRICH_CHECKPOINT_EVERY,
+                               help="voci tra due checkpoint")
+    enrich_parser.add_argument("--restart", action="store_true", help="ignora il checkpoint e riparte da capo")
+    enrich_parser.add_argument("--off-url", help="server compatibile con OpenFoodFacts da usare al posto di quello reale")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    configure_logging(level=args.log_level)
+    if args.command == "enrich":
+        try:
+            run_enrich(args)
+        except (OSError, ValueError) as e:
+            log.error("Arricchimento non eseguito", error=str(e))
+            print(f"Errore: {e}", file=sys.stderr)
+            return 1
+        except KeyboardInterrupt:
+            return 130
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# src/ui/console_interface.py
+#
+# Output a terminale dei comandi batch: una riga di avanzamento con percentuale, velocità (voci al
+# secondo, media mobile esponenziale) ed ETA, aggiornata al massimo ogni `interval` secondi. Su un
+# terminale la riga si sovrascrive; altrimenti (log, pipe) si scrive una riga per aggiornamento.
+
+import sys
+import time
+
+PROGRESS_INTERVAL = 0.5      # secondi tra due aggiornamenti
+RATE_SMOOTHING = 0.3         # peso dell'ultima misura nella media mobile della velocità
+
+
+def format_duration(seconds: float | None) -> str:
+    """Durata leggibile: "45s", "3m 05s", "2h 07m"; "--" se non stimabile."""
+    if seconds is None or seconds < 0 or seconds != seconds:
+        return "--"
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+class ProgressReporter:
+    """
+    Avanzamento di un lavoro con `total` voci, di cui `already_done` fatte in un'esecuzione precedente
+    (la velocità conta solo quelle di questa esecuzione). Si usa come `progress` di enrich_file.
+    """
+
+    def __init__(self, label: str = "", already_done: int = 0, stream=None, interval: float = PROGRESS_INTERVAL,
+                 clock=time.monotonic):
+        self.label = label
+        self.stream = stream if stream is not None else sys.stderr
+        self.interval = interval
+        self.clock = clock
+        self.started = clock()
+        self.rate = None
+        self._last_time = self.started
+        self._last_done = already_done
+        self._last_line = ""
+        self._interactive = hasattr(self.stream, "isatty") and self.stream.isatty()
+
+    def __call__(self, done: int, total: int | None, counts: dict | None = None) -> None:
+        now = self.clock()
+        if now - self._last_time < self.interval and (total is None or done < total):
+            return
+        if now > self._last_time:
+            measured = (done - self._last_done) / (now - self._last_time)
+            self.rate = measured if self.rate is None else RATE_SMOOTHING * measured + (1 - RATE_SMOOTHING) * self.rate
+        self._last_time, self._last_done = now, done
+        self._write(self.line(done, total, counts))
+
+    def eta(self, done: int, total: int | None) -> float | None:
+        if total is None or not self.rate:
+            return None
+        return max(total - done, 0) / self.rate
+
+    def line(self, done: int, total: int | None, counts: dict | None = None) -> str:
+        parts = [self.label] if self.label else []
+        if total:
+            parts.append(f"{done}/{total} ({done / total:.1%})")
+        else:
+            parts.append(str(done))
+        parts.append(f"{self.rate or 0.0:.1f} voci/s")
+        parts.append(f"ETA {format_duration(self.eta(done, total))}")
+        if counts:
+            parts.append(" ".join(f"{status} {count}" for status, count in counts.items() if count))
+        return "  ".join(parts)
+
+    def _write(self, line: str) -> None:
+        if self._interactive:
+            padding = " " * max(len(self._last_line) - len(line), 0)
+            self.stream.write(f"\r{line}{padding}")
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+        self._last_line = line
+
+    def finish(self, summary: dict | None = None) -> None:
+        """Chiude la riga di avanzamento e, se c'è, stampa il riepilogo finale."""
+        if self._interactive and self._last_line:
+            self.stream.write("\n")
+        if summary is not None:
+            elapsed = self.clock() - self.started
+            self.stream.write(format_summary(summary, elapsed) + "\n")
+        self.stream.flush()
+
+
+def format_summary(summary: dict, elapsed: float) -> str:
+    """Riepilogo di enrich_file in una riga."""
+    resumed = f", ripreso da {summary['resumed_from']}" if summary.get("resumed_from") else ""
+    retried = f", {summary['retried']} errori ritentati" if summary.get("retried") else ""
+    return (f"Completato: {summary['processed']}/{summary['total']} voci{resumed}{retried} "
+            f"in {format_duration(elapsed)} ({summary['items_per_second']} voci/s) - trovate {summary['found']}, non trovate {summary['not_found']}, "
+            f"errori {summary['error']}, saltate {summary['skipped']}. Uscita: {summary['output']}")
@@ -0,0 +1,14 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Come in src/api_server.py: la root del progetto deve essere nel path per importare `src.*`
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT_DIR)
+
+# I limiti di richieste di upstream_scheduler valgono per i servizi reali: nei test gli upstream sono
+# server locali (i test del pianificatore creano istanze proprie con i limiti che servono)
+for variable in ("OFF_PRODUCT_RATE_PER_MIN", "OFF_SEARCH_RATE_PER_MIN", "GEMINI_RATE_PER_MIN"):
+    os.environ.setdefault(variable, "0")
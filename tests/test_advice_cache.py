@@ -0,0 +1,129 @@
+# tests/test_advice_cache.py
+
+import threading
+import time
+
+from src.integrations.advice_cache import AdviceCache, canonical_profile_key
+from src.integrations.local_cache import SingleFlight
+
+PROFILE = {
+    "age": "46", "weight": "70.4", "height": "170", "gender": "male",
+    "activity_level": "light", "profession": "Commerciante", "objectives": "Perdere peso, gradualmente!",
+}
+
+
+def test_near_identical_profiles_share_the_key():
+    variant = dict(PROFILE, age=47, weight="71,2", height="171", gender="MALE",
+                   profession="  commerciante ", objectives="perdere   peso gradualmente")
+    assert canonical_profile_key(variant) == canonical_profile_key(PROFILE)
+
+
+def test_different_profiles_get_different_keys():
+    assert canonical_profile_key(dict(PROFILE, weight="90")) != canonical_profile_key(PROFILE)
+    assert canonical_profile_key(dict(PROFILE, activity_level="active")) != canonical_profile_key(PROFILE)
+    assert canonical_profile_key(dict(PROFILE, objectives="massa")) != canonical_profile_key(PROFILE)
+
+
+def test_non_finite_numbers_fall_back_to_text_buckets():
+    assert "weight=nan|" in canonical_profile_key(dict(PROFILE, weight="nan"))
+    assert "height=inf|" in canonical_profile_key(dict(PROFILE, height=float("inf")))
+    assert "age=1e999|" in canonical_profile_key(dict(PROFILE, age="1e999"))
+    assert "body_fat=inf" in canonical_profile_key(dict(PROFILE, body_fat="-inf"))
+
+
+def test_cached_response_saves_model_calls():
+    cache = AdviceCache()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return {"calories": 2000, "notes": "ok"}
+
+    first = cache.get_or_generate("advice", PROFILE, generate)
+    second = cache.get_or_generate("advice", dict(PROFILE, weight="70.9"), generate)
+    assert first == second
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["model_calls"] == 1
+    assert stats["saved_calls"] == 1
+
+
+def test_errors_are_not_cached():
+    cache = AdviceCache()
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return {"error": "timeout"}
+
+    cache.get_or_generate("advice", PROFILE, generate)
+    cache.get_or_generate("advice", PROFILE, generate)
+    assert len(calls) == 2
+
+
+def test_namespaces_are_separate():
+    cache = AdviceCache()
+    cache.get_or_generate("advice", PROFILE, lambda: {"notes": "a"})
+    assert cache.get_or_generate("notes", PROFILE, lambda: {"notes": "b"}) == {"notes": "b"}
+
+
+def test_disk_persistence(tmp_path):
+    db_path = str(tmp_path / "advice.sqlite3")
+    AdviceCache(db_path=db_path).get_or_generate("advice", PROFILE, lambda: {"notes": "salvata"})
+    restored = AdviceCache(db_path=db_path).get_or_generate("advice", PROFILE, lambda: {"notes": "nuova"})
+    assert restored == {"notes": "salvata"}
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    cache = AdviceCache()
+    calls = []
+    release = threading.Event()
+
+    def generate():
+        calls.append(1)
+        release.wait(2)
+        return {"notes": "unica chiamata"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_generate("advice", PROFILE, generate)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 2
+    while cache.stats()["coalesced"] < 7 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"notes": "unica chiamata"}] * 8
+    assert cache.stats()["saved_calls"] == 7
+
+
+def test_single_flight_propagates_errors_to_waiters():
+    flight = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("boom")
+
+    def call():
+        try:
+            flight.do("k", failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(1)
+    follower = threading.Thread(target=call)
+    follower.start()
+    leader.join()
+    follower.join()
+    assert errors == ["boom", "boom"]
+    assert flight.stats() == {"calls": 1, "coalesced": 1, "in_flight": 0}
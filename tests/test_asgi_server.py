@@ -0,0 +1,305 @@
+# tests/test_asgi_server.py
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from src import api_server, asgi_server
+from src.integrations import http_client, openfoodfacts_client
+from tests.test_http_client import stub_off  # noqa: F401  (fixture)
+
+STUB_RESULTS = [{"name": "Spaghetti", "brand": "Barilla", "barcode": "8001", "calories_100g": 359}]
+USER_DATA = {"age": "30", "gender": "male", "weight": "80", "height": "180",
+             "activity_level": "moderate", "objectives": "perdere peso"}
+
+
+async def call_asgi(method: str, path: str, query: str = "", body=None,
+                    request_headers: dict | None = None) -> tuple[int, dict, bytes]:
+    """Esegue una richiesta sull'app ASGI e restituisce (status, header, corpo completo)."""
+    raw_body = b"" if body is None else json.dumps(body).encode("utf-8")
+    headers = [(b"content-type", b"application/json")] if body is not None else []
+    headers += [(name.lower().encode(), value.encode()) for name, value in (request_headers or {}).items()]
+    scope = {"type": "http", "method": method, "path": path, "query_string": query.encode(),
+             "headers": headers, "http_version": "1.1", "scheme": "http", "server": ("testserver", 80)}
+    received = [{"type": "http.request", "body": raw_body, "more_body": False}]
+    messages = []
+
+    async def receive():
+        return received.pop(0) if received else {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_server.app(scope, receive, send)
+    start = messages[0]
+    content = b"".join(message.get("body", b"") for message in messages[1:])
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, content
+
+
+def asgi(method, path, query="", body=None):
+    status, headers, content = asyncio.run(call_asgi(method, path, query, body))
+    return status, headers, content
+
+
+def flask_response(method, path, query="", body=None):
+    client = api_server.app.test_client()
+    url = f"{path}?{query}" if query else path
+    response = client.open(url, method=method, json=body)
+    return response.status_code, response.get_json()
+
+
+def test_search_food_matches_sync_contract(monkeypatch):
+    async def fake_async_search(query, page_size, lang):
+        return STUB_RESULTS, None
+
+    monkeypatch.setattr(asgi_server, "async_search_products", fake_async_search)
+    monkeypatch.setattr(api_server, "search_products", lambda query, page_size, lang: (STUB_RESULTS, None))
+
+    for query in ("query=pasta", ""):
+        status, _, content = asgi("GET", "/api/search_food", query)
+        assert (status, json.loads(content)) == flask_response("GET", "/api/search_food", query)
+
+
+def test_search_food_upstream_error(monkeypatch):
+    async def failing_search(query, page_size, lang):
+        return None, openfoodfacts_client.ERROR_HTTP
+
+    monkeypatch.setattr(asgi_server, "async_search_products", failing_search)
+    status, _, content = asgi("GET", "/api/search_food", "query=pasta")
+    assert status == 500
+    assert json.loads(content) == {"error": "Errore comunicazione database alimentare esterno"}
+
+
+def test_calculate_needs_matches_sync_contract():
+    for body in (USER_DATA, dict(USER_DATA, age="abc"), dict(USER_DATA, activity_level=["x"]),
+                 ["non", "un", "oggetto"]):
+        status, headers, content = asgi("POST", "/api/calculate_needs", body=body)
+        assert headers["content-type"] == "application/json"
+        assert (status, json.loads(content)) == flask_response("POST", "/api/calculate_needs", body=body)
+
+
+def test_calculate_needs_ai_notes_deadline(monkeypatch):
+    def slow_notes(user_data, needs):
+        time.sleep(0.5)
+        return {"notes": "troppo tardi"}
+
+    monkeypatch.setattr(api_server, "get_nutritional_notes_from_gemini", slow_notes)
+    monkeypatch.setattr(asgi_server, "ASGI_NOTES_DEADLINE", 0.05)
+    status, _, content = asgi("POST", "/api/calculate_needs", "notes=ai", body=USER_DATA)
+    payload = json.loads(content)
+    assert status == 200
+    assert payload["notes_source"] == "local"
+    assert "notes_error" in payload
+
+
+def test_deadline_cancels_upstream_call(monkeypatch):
+    cancelled = []
+
+    async def hanging_search(query, page_size, lang):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+
+    monkeypatch.setattr(asgi_server, "async_search_products", hanging_search)
+    monkeypatch.setitem(asgi_server.ROUTES, ("GET", "/api/search_food"), (asgi_server.search_food, 0.05))
+
+    started = time.perf_counter()
+    status, _, content = asgi("GET", "/api/search_food", "query=pasta")
+    assert time.perf_counter() - started < 1
+    assert status == 504
+    assert "error" in json.loads(content)
+    assert cancelled == ["pasta"]
+
+
+def test_deadline_cancels_the_real_search_chain(stub_off, monkeypatch):  # noqa: F811
+    # async_search_products -> cache -> accorpamento del pianificatore -> hedged -> richiesta HTTP
+    stub_off.delay = 1.0
+    base_url = openfoodfacts_client.BASE_URL_PRODUCT_V2.split("/api/")[0]
+    monkeypatch.setattr(openfoodfacts_client, "BASE_URL_SEARCH_CGI", f"{base_url}/cgi/search.pl")
+    monkeypatch.setattr(openfoodfacts_client, "OFF_LOCAL_SEARCH", "off")
+    monkeypatch.setattr(openfoodfacts_client, "OFF_HEDGE_AFTER", 0.05)
+    openfoodfacts_client.set_offline_index(None)
+    monkeypatch.setitem(asgi_server.ROUTES, ("GET", "/api/search_food"), (asgi_server.search_food, 0.2))
+    outcomes = []
+    request_search = openfoodfacts_client._async_request_search_results
+
+    async def observed_request(call, query, page_size, lang):
+        try:
+            result = await request_search(call, query, page_size, lang)
+        except asyncio.CancelledError:
+            outcomes.append("cancelled")
+            raise
+        outcomes.append("finished")
+        return result
+
+    monkeypatch.setattr(openfoodfacts_client, "_async_request_search_results", observed_request)
+
+    async def run():
+        status, _, _ = await call_asgi("GET", "/api/search_food", "query=pasta")
+        await asyncio.sleep(1.3)            # una richiesta non cancellata finirebbe in questo intervallo
+        return status
+
+    assert asyncio.run(run()) == 504
+    assert outcomes == ["cancelled", "cancelled"]        # la richiesta originale e quella "hedged"
+
+
+def test_handles_hundreds_of_concurrent_requests(monkeypatch):
+    async def slow_search(query, page_size, lang):
+        await asyncio.sleep(0.2)
+        return STUB_RESULTS, None
+
+    monkeypatch.setattr(asgi_server, "async_search_products", slow_search)
+
+    async def run():
+        return await asyncio.gather(*(call_asgi("GET", "/api/search_food", f"query=q{i}") for i in range(300)))
+
+    started = time.perf_counter()
+    responses = asyncio.run(run())
+    assert time.perf_counter() - started < 1.5
+    assert all(status == 200 for status, _, _ in responses)
+
+
+def test_batch_endpoint_uses_async_client(stub_off):  # noqa: F811
+    stub_off.delay = 0.02
+
+    async def run():
+        try:
+            return await call_asgi("POST", "/api/products/batch", body={"barcodes": ["8001", "5000", "0000"]})
+        finally:
+            await http_client.close_async_client()
+
+    status, _, content = asyncio.run(run())
+    payload = json.loads(content)
+    assert status == 200
+    assert payload["found"] == 1
+    assert [item["error"] for item in payload["results"]] == [None, "http_error", "not_found"]
+    assert asgi("POST", "/api/products/batch", body={"barcodes": []})[0] == 400
+
+
+def test_other_routes_fall_back_to_flask():
+    status, headers, content = asgi("GET", "/")
+    assert status == 200
+    assert headers["content-type"].startswith("text/html")
+    assert b"<html" in content.lower()
+
+    status, headers, content = asgi("POST", "/api/calculate_needs/stream", body=USER_DATA)
+    assert status == 200
+    assert headers["content-type"].startswith("text/event-stream")
+    assert b"event: targets" in content and b"event: done" in content
+
+    assert asgi("GET", "/non-esiste")[0] == 404
+
+
+def test_lifespan_creates_and_closes_async_clients():
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+    contexts = set()
+
+    async def run():
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+            if message["type"] == "lifespan.startup.complete":
+                # i client esistono già prima della prima richiesta e condividono un solo contesto SSL
+                clients = http_client._async_clients[asyncio.get_running_loop()][0]
+                assert len(clients) == http_client.HTTP_ASYNC_POOL_SHARDS
+                contexts.update(id(client._transport._pool._ssl_context) for client in clients)
+
+        await asgi_server.app({"type": "lifespan"}, receive, send)
+        return asyncio.get_running_loop() in http_client._async_clients
+
+    assert asyncio.run(run()) is False
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert contexts == {id(http_client.get_ssl_context())}
+
+
+# --- HEDGING ---
+
+def test_hedged_request_returns_fastest_and_cancels_slow():
+    calls = []
+    cancelled = []
+
+    async def call():
+        attempt = len(calls)
+        calls.append(attempt)
+        try:
+            await asyncio.sleep(0.5 if attempt == 0 else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(attempt)
+            raise
+        return None, f"risposta {attempt}"
+
+    error, value, was_hedged = asyncio.run(http_client.hedged(call, 0.05))
+    assert (error, value, was_hedged) == (None, "risposta 1", True)
+    assert cancelled == [0]
+
+
+@pytest.mark.parametrize("cancel_after", [0.05, 0.15])
+def test_cancelling_hedged_request_cancels_its_calls(cancel_after):
+    # 0.05: durante l'attesa della prima richiesta; 0.15: con entrambe le richieste in corso
+    started, finished, cancelled = [], [], []
+
+    async def call():
+        attempt = len(started)
+        started.append(attempt)
+        try:
+            await asyncio.sleep(0.3)
+        except asyncio.CancelledError:
+            cancelled.append(attempt)
+            raise
+        finished.append(attempt)
+        return None, "risposta"
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(http_client.hedged(call, 0.1), cancel_after)
+        await asyncio.sleep(0.4)            # abbastanza perché una richiesta non cancellata finisca
+
+    asyncio.run(run())
+    assert finished == []
+    assert sorted(cancelled) == started and len(started) == (1 if cancel_after < 0.1 else 2)
+
+
+def test_hedged_request_without_threshold_is_single_call():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "timeout", None
+
+    assert asyncio.run(http_client.hedged(call, None)) == ("timeout", None, False)
+    assert asyncio.run(http_client.hedged(call, 1.0)) == ("timeout", None, False)
+    assert len(calls) == 2
+
+
+def test_hedged_request_waits_for_second_when_first_fails():
+    async def call_factory():
+        attempts = []
+
+        async def call():
+            attempts.append(1)
+            if len(attempts) == 1:
+                await asyncio.sleep(0.1)
+                return "http_error", None
+            await asyncio.sleep(0.2)
+            return None, "ok"
+
+        return await http_client.hedged(call, 0.05)
+
+    assert asyncio.run(call_factory()) == (None, "ok", True)
+
+
+def test_latency_tracker_percentile():
+    tracker = http_client.LatencyTracker(window=100)
+    assert tracker.percentile(95) is None
+    for i in range(100):
+        tracker.record(i / 100)
+    assert tracker.percentile(50) == pytest.approx(0.5, abs=0.01)
+    assert tracker.percentile(95) == pytest.approx(0.94, abs=0.01)
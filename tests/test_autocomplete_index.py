@@ -0,0 +1,128 @@
+# tests/test_autocomplete_index.py
+
+import json
+import random
+
+import pytest
+
+from src.integrations import autocomplete_index, openfoodfacts_client
+from src.integrations.autocomplete_index import AutocompleteIndex, load_data_dir
+from src.integrations.local_cache import LocalCache
+
+
+@pytest.fixture
+def shared_index():
+    index = AutocompleteIndex()
+    autocomplete_index.set_autocomplete_index(index)
+    yield index
+    autocomplete_index.set_autocomplete_index(None)
+
+
+def test_prefix_match_ranked_by_popularity():
+    index = AutocompleteIndex()
+    index.add_product("Pasta integrale", "Barilla", "1")
+    index.add_product("Pane carasau", None, "2")
+    index.add_product("Passata di pomodoro", "Mutti", "3", weight=5)
+    index.add_product("Yogurt greco", "Fage", "4")
+
+    # a parità di popolarità viene prima il prodotto visto più di recente
+    assert [s["name"] for s in index.suggest("pa")] == ["Passata di pomodoro", "Pane carasau", "Pasta integrale"]
+    assert [s["name"] for s in index.suggest("pas", limit=1)] == ["Passata di pomodoro"]
+    assert index.suggest("pas")[0] == {"name": "Passata di pomodoro", "brand": "Mutti", "barcode": "3", "popularity": 5}
+    assert index.suggest("zucchero") == []
+    assert index.suggest("   ") == []
+
+
+def test_matches_accents_brand_and_inner_words():
+    index = AutocompleteIndex()
+    index.add_product("Caffè macinato", "Lavazza, Qualità Rossa", "10")
+    index.add_product("Yogurt greco", "Fage", "11")
+
+    assert index.suggest("CAFFE")[0]["name"] == "Caffè macinato"
+    assert index.suggest("lavazza caf")[0]["brand"] == "Lavazza"
+    assert index.suggest("greco")[0]["name"] == "Yogurt greco"
+    assert index.suggest("fage y")[0]["barcode"] == "11"
+
+
+def test_repeated_products_increase_popularity():
+    index = AutocompleteIndex()
+    for _ in range(3):
+        index.add_products([{"name": "Mozzarella", "brands": "Granarolo", "barcode": "20"}])
+    index.add_products([{"name": "Mortadella", "brands": None, "barcode": "21"}])
+
+    assert [s["name"] for s in index.suggest("mo")] == ["Mozzarella", "Mortadella"]
+    assert index.suggest("mozz")[0]["popularity"] == 3
+    assert len(index) == 2
+
+
+def test_memory_is_bounded_by_evicting_least_popular():
+    index = AutocompleteIndex(max_entries=100)
+    index.add_product("Biscotti preferiti", weight=50)
+    for i in range(500):
+        index.add_product(f"Prodotto {i}")
+
+    stats = index.stats()
+    assert len(index) <= 100
+    assert stats["evictions"] >= 400
+    assert stats["keys"] <= 100 * 5
+    assert index.suggest("biscotti")[0]["name"] == "Biscotti preferiti"
+    assert index.suggest("prodotto 499")[0]["name"] == "Prodotto 499"
+
+
+def test_load_data_dir_reads_json_csv_and_skips_empty_files(tmp_path):
+    (tmp_path / "vuoto.json").write_text("")
+    (tmp_path / "vuoto.csv").write_text("")
+    (tmp_path / "volantino.txt").write_text("Offerta speciale")
+    (tmp_path / "prodotti.json").write_text(json.dumps([{"product_name": "Crackers", "brands": "Mulino", "code": "30"}]))
+    sub = tmp_path / "dietetici"
+    sub.mkdir()
+    (sub / "conad.csv").write_text("Nome;Marca;Barcode\nFette biscottate;Conad;31\n;Senza nome;32\n")
+
+    index = AutocompleteIndex()
+    assert load_data_dir(index, str(tmp_path)) == 2
+    assert index.suggest("crack")[0]["brand"] == "Mulino"
+    assert index.suggest("fette")[0]["barcode"] == "31"
+    assert load_data_dir(index, str(tmp_path / "non-esiste")) == 0
+
+
+def test_suggest_on_a_full_index():
+    # la latenza su un indice pieno si misura con benchmarks/bench_autocomplete.py
+    rng = random.Random(0)
+    words = ["pasta", "pane", "latte", "yogurt", "biscotti", "riso", "tonno", "olio", "caffe", "succo"]
+    index = AutocompleteIndex(max_entries=20000)
+    for i in range(20000):
+        index.add_product(f"{rng.choice(words)} {rng.choice(words)} {i}", f"marca{i % 300}", str(i),
+                          weight=rng.randint(1, 50))
+
+    suggestions = index.suggest("pas", limit=8)
+    assert len(suggestions) == 8
+    assert all("pasta" in item["name"] for item in suggestions)
+    popularity = [item["popularity"] for item in suggestions]
+    assert popularity == sorted(popularity, reverse=True)
+    by_brand = index.suggest("marca12")
+    assert by_brand and all(item["brand"].startswith("marca12") for item in by_brand)
+    assert index.suggest("z") == []
+
+
+def test_search_results_feed_the_endpoint(shared_index, monkeypatch):
+    from src import api_server
+
+    products = [{"barcode": "40", "name": "Spaghetti n.5", "brands": "Barilla"},
+                {"barcode": "41", "name": "Spaghettoni", "brands": "De Cecco"}]
+    monkeypatch.setattr(openfoodfacts_client, "_fetch_search_results", lambda query, page_size, lang: (None, products))
+    openfoodfacts_client.set_product_cache(LocalCache())
+    openfoodfacts_client.set_offline_index(None)
+    try:
+        openfoodfacts_client.search_products_by_name("spaghetti", page_size=10)
+        openfoodfacts_client.search_products_by_name("spaghetti", page_size=10)  # dalla cache: conta comunque come visto
+    finally:
+        openfoodfacts_client.set_product_cache(None)
+        openfoodfacts_client.set_offline_index(None)
+
+    client = api_server.app.test_client()
+    payload = client.get("/api/autocomplete?prefix=spagh&limit=1").get_json()
+    assert payload["prefix"] == "spagh"
+    assert payload["suggestions"] == [{"name": "Spaghettoni", "brand": "De Cecco", "barcode": "41", "popularity": 2}]
+    assert len(client.get("/api/autocomplete?prefix=spagh&limit=abc").get_json()["suggestions"]) == 2
+    assert client.get("/api/autocomplete?prefix=").status_code == 400
+    assert client.get("/api/cache/stats").get_json()["autocomplete"]["entries"] == 2
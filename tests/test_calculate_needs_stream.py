@@ -0,0 +1,110 @@
+# tests/test_calculate_needs_stream.py
+
+import json
+import threading
+
+import pytest
+
+from src import api_server
+from src.integrations import gemini_service
+
+USER = {"age": "30", "weight": "65", "height": "168", "gender": "female",
+        "activity_level": "moderate", "objectives": "mantenimento"}
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeStreamingModel:
+    """Imita GenerativeModel.generate_content(stream=True); può attendere un segnale prima del primo pezzo."""
+
+    def __init__(self, chunks, gate=None, fail_after=None):
+        self.chunks = chunks
+        self.gate = gate
+        self.fail_after = fail_after
+        self.calls = []
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls.append({"prompt": prompt, "stream": stream})
+        return self._iterate()
+
+    def _iterate(self):
+        if self.gate is not None:
+            assert self.gate.wait(2), "il test non ha sbloccato il modello"
+        for index, text in enumerate(self.chunks):
+            if self.fail_after is not None and index == self.fail_after:
+                raise RuntimeError("DEADLINE_EXCEEDED")
+            yield FakeChunk(text)
+
+
+def parse_events(raw: str) -> list[tuple[str, dict]]:
+    events = []
+    for frame in raw.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def fake_model():
+    gemini_service.advice_cache.clear()
+    holder = {}
+
+    def install(model):
+        gemini_service.set_model(model)
+        holder["model"] = model
+        return model
+
+    yield install
+    gemini_service.set_model(None)
+    gemini_service.advice_cache.clear()
+
+
+def test_targets_are_sent_before_the_model_answers(fake_model):
+    gate = threading.Event()
+    model = fake_model(FakeStreamingModel(["Ottimo ", "equilibrio."], gate=gate))
+    response = api_server.app.test_client().post("/api/calculate_needs/stream", json=USER, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+
+    stream = iter(response.response)
+    first_event = parse_events(next(stream).decode("utf-8"))[0]
+    assert first_event[0] == "targets"
+    assert first_event[1]["calories"] > 0
+    assert model.calls == []  # il modello non è ancora stato interpellato
+
+    gate.set()
+    events = parse_events(b"".join(stream).decode("utf-8"))
+    assert [name for name, _ in events] == ["notes", "notes", "done"]
+    assert "".join(data["delta"] for name, data in events if name == "notes") == "Ottimo equilibrio."
+    assert events[-1][1] == {"notes_source": "gemini"}
+    assert model.calls[0]["stream"] is True
+
+
+def test_streamed_notes_are_cached(fake_model):
+    model = fake_model(FakeStreamingModel(["Nota ", "in cache."]))
+    client = api_server.app.test_client()
+    client.post("/api/calculate_needs/stream", json=USER).get_data()
+    events = parse_events(client.post("/api/calculate_needs/stream", json=USER).get_data(as_text=True))
+
+    assert len(model.calls) == 1
+    assert [name for name, _ in events] == ["targets", "notes", "done"]
+    assert events[1][1]["delta"] == "Nota in cache."
+
+
+def test_model_error_falls_back_to_local_notes(fake_model):
+    fake_model(FakeStreamingModel(["Inizio ", "mai finito"], fail_after=1))
+    events = parse_events(api_server.app.test_client()
+                          .post("/api/calculate_needs/stream", json=USER).get_data(as_text=True))
+
+    names = [name for name, _ in events]
+    assert names == ["targets", "notes", "notes_error", "notes", "done"]
+    assert events[-1][1] == {"notes_source": "local"}
+
+
+def test_invalid_data_returns_json_error():
+    response = api_server.app.test_client().post("/api/calculate_needs/stream", json=dict(USER, gender="x"))
+    assert response.status_code == 400
+    assert "error" in response.get_json()
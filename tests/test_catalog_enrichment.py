@@ -0,0 +1,221 @@
+# tests/test_catalog_enrichment.py
+
+import csv
+import io
+import json
+import os
+
+import pytest
+
+from benchmarks.fakes import load_recordings, serve_fake_off_in_thread
+from src import main
+from src.integrations import catalog_enrichment, http_client, openfoodfacts_client
+from src.integrations.catalog_enrichment import OUTPUT_FIELDS, enrich_file, read_checkpoint, resolve_record
+from src.integrations.local_cache import LocalCache
+from src.ui.console_interface import ProgressReporter, format_duration
+from tests.test_http_client import stub_off  # noqa: F401  (fixture)
+
+
+def _write_catalog(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["barcode", "nome", "marca"])
+        writer.writerows(rows)
+    return str(path)
+
+
+def _read_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def _read_output(path):
+    if not str(path).endswith(".csv"):
+        return _read_jsonl(path)
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_items_are_resolved_by_barcode_then_by_name(stub_off, monkeypatch, tmp_path):  # noqa: F811
+    searched = []
+
+    def fake_search(query, page_size=5):
+        searched.append(query)
+        return [{"barcode": "8002", "name": "Yogurt greco", "brands": "Fage", "calories_100g": 54}], None
+
+    monkeypatch.setattr(catalog_enrichment, "search_products", fake_search)
+    catalog = _write_catalog(tmp_path / "catalogo.csv", [
+        ["8001", "", ""], ["9999", "", ""], ["", "Yogurt greco", "Fage"], ["", "Merendine al cacao", ""], ["", "", ""]])
+    summary = enrich_file(catalog, str(tmp_path / "arricchiti.jsonl"), workers=2)
+    rows = _read_jsonl(tmp_path / "arricchiti.jsonl")
+    assert [row["row"] for row in rows] == [0, 1, 2, 3, 4]
+    assert [row["status"] for row in rows] == ["found", "not_found", "found", "not_found", "skipped"]
+    assert (rows[0]["name"], rows[0]["match_source"]) == ("Spaghetti", "barcode")
+    assert (rows[2]["barcode"], rows[2]["match_source"], rows[2]["calories_100g"]) == ("8002", "name", 54)
+    assert searched == ["Yogurt greco Fage", "Merendine al cacao"]
+    assert (summary["found"], summary["not_found"], summary["skipped"], summary["processed"]) == (2, 2, 1, 5)
+    assert read_checkpoint(str(tmp_path / "arricchiti.jsonl"))["completed"]
+
+
+def test_transient_errors_are_retried_then_reported(stub_off):  # noqa: F811
+    stub_off.failures_before_success = {"8002": 3}      # più dei tentativi del client HTTP (retries=2)
+    assert resolve_record(0, {"barcode": "8002"}, retries=1, retry_delay=0)["status"] == "found"
+    failed = resolve_record(1, {"barcode": "5000"}, retries=1, retry_delay=0)
+    assert (failed["status"], failed["error"]) == ("error", openfoodfacts_client.ERROR_HTTP)
+
+
+def test_rate_limited_items_wait_for_a_token(monkeypatch):
+    yogurt = {"barcode": "8002", "name": "Yogurt greco", "brands": "Fage"}
+    outcomes = [(None, openfoodfacts_client.ERROR_RATE_LIMITED)] * 2 + [([yogurt], None)]
+    waits = []
+    monkeypatch.setattr(catalog_enrichment, "search_products", lambda query, page_size=5: outcomes.pop(0))
+    monkeypatch.setattr(catalog_enrichment, "retry_after_seconds", lambda upstream: waits.append(upstream) or 0)
+    record = {"nome": "Yogurt greco", "marca": "Fage"}
+    # le attese per il gettone non consumano i tentativi
+    assert resolve_record(0, record, retries=0)["status"] == "found"
+    assert waits == ["off_search", "off_search"]
+
+    outcomes.append((None, openfoodfacts_client.ERROR_RATE_LIMITED))
+    failed = resolve_record(1, record, retries=0, rate_limit_wait=0)
+    assert (failed["status"], failed["error"]) == ("error", openfoodfacts_client.ERROR_RATE_LIMITED)
+
+
+@pytest.mark.parametrize("output_name", ["arricchiti.csv", "arricchiti.jsonl"])
+def test_resume_retries_items_that_ended_in_transient_errors(tmp_path, output_name):
+    catalog = _write_catalog(tmp_path / "catalogo.csv", [[f"80{i}", "", ""] for i in range(6)])
+    output = str(tmp_path / output_name)
+    calls = []
+
+    def resolver(failing):
+        def resolve(row, record):
+            calls.append(row)
+            result = dict.fromkeys(OUTPUT_FIELDS)
+            result.update(row=row, input_barcode=record["barcode"], status="found", name=f"prodotto {row}")
+            if row == 5:
+                result.update(status="not_found", name=None)
+            elif row in failing:
+                result.update(status="error", error=openfoodfacts_client.ERROR_TIMEOUT, name=None)
+            return result
+        return resolve
+
+    assert enrich_file(catalog, output, resolver=resolver({1, 3, 4}))["error"] == 3
+    calls.clear()
+    summary = enrich_file(catalog, output, workers=2, resolver=resolver({4}))
+    assert sorted(calls) == [1, 3, 4]                  # né le voci trovate né quelle non trovate
+    assert (summary["retried"], summary["found"], summary["not_found"], summary["error"]) == (3, 4, 1, 1)
+    rows = _read_output(output)
+    assert [str(row["row"]) for row in rows] == [str(i) for i in range(6)]
+    assert [row["status"] for row in rows] == ["found"] * 4 + ["error", "not_found"]
+    assert rows[3]["name"] == "prodotto 3"
+    checkpoint = read_checkpoint(output)
+    assert checkpoint["counts"]["error"] == 1 and not checkpoint["replacing"]
+    assert checkpoint["output_bytes"] == os.path.getsize(output)
+
+
+def test_enrichment_resumes_after_a_crash(stub_off, tmp_path):  # noqa: F811
+    catalog = _write_catalog(tmp_path / "catalogo.csv", [[("8001", "8002", "7777")[i % 3], "", ""] for i in range(30)])
+    output = str(tmp_path / "arricchiti.jsonl")
+    calls = []
+
+    def crashing_resolver(row, record):
+        calls.append(row)
+        if len(calls) == 12:
+            raise RuntimeError("crash simulato")
+        return resolve_record(row, record)
+
+    with pytest.raises(RuntimeError):
+        enrich_file(catalog, output, workers=2, checkpoint_every=5, resolver=crashing_resolver)
+    checkpoint = read_checkpoint(output)
+    assert 0 < checkpoint["processed"] < 30 and not checkpoint["completed"]
+    with open(output, "ab") as f:
+        f.write(b'{"row": 99, "status": "fo')           # riga scritta a metà da un arresto brusco
+
+    resumed_calls = []
+
+    def counting_resolver(row, record):
+        resumed_calls.append(row)
+        return resolve_record(row, record)
+
+    summary = enrich_file(catalog, output, workers=3, checkpoint_every=5, resolver=counting_resolver)
+    rows = _read_jsonl(output)
+    assert [row["row"] for row in rows] == list(range(30))
+    assert sorted(resumed_calls) == list(range(checkpoint["processed"], 30))
+    assert summary["resumed_from"] == checkpoint["processed"]
+    assert (summary["found"], summary["not_found"]) == (20, 10)
+
+    # Esecuzione già completata: nessuna nuova richiesta
+    assert enrich_file(catalog, output, resolver=counting_resolver)["processed"] == 30
+    assert len(resumed_calls) == 30 - checkpoint["processed"]
+
+
+def test_resume_after_a_crash_on_the_first_item(stub_off, tmp_path):  # noqa: F811
+    catalog = _write_catalog(tmp_path / "catalogo.csv", [["8001", "", ""], ["8002", "", ""]])
+    output = str(tmp_path / "arricchiti.csv")
+
+    def crashing_resolver(row, record):
+        raise RuntimeError("crash simulato")
+
+    with pytest.raises(RuntimeError):
+        enrich_file(catalog, output, resolver=crashing_resolver)
+    checkpoint = read_checkpoint(output)
+    assert checkpoint["processed"] == 0 and checkpoint["output_bytes"] > 0      # solo l'intestazione
+
+    assert enrich_file(catalog, output)["found"] == 2
+    with open(output, "rb") as f:
+        content = f.read()
+    assert b"\x00" not in content
+    with open(output, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["row"], row["barcode"]) for row in rows] == [("0", "8001"), ("1", "8002")]
+
+
+def test_checkpoint_of_a_different_input_requires_restart(stub_off, tmp_path):  # noqa: F811
+    output = str(tmp_path / "arricchiti.csv")
+    enrich_file(_write_catalog(tmp_path / "a.csv", [["8001", "", ""]]), output)
+    other = _write_catalog(tmp_path / "b.csv", [["8002", "", ""], ["8001", "", ""]])
+    with pytest.raises(ValueError):
+        enrich_file(other, output)
+    assert enrich_file(other, output, restart=True)["found"] == 2
+    with open(output, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["row"], row["barcode"], row["status"]) for row in rows] == [("0", "8002", "found"), ("1", "8001", "found")]
+
+
+def test_cli_enriches_against_a_local_off_server(monkeypatch, tmp_path, capsys):
+    for name in ("BASE_URL_SEARCH_CGI", "BASE_URL_PRODUCT_V2"):
+        monkeypatch.setattr(openfoodfacts_client, name, getattr(openfoodfacts_client, name))
+    openfoodfacts_client.set_product_cache(LocalCache())
+    http_client.set_session(http_client.create_session(retries=0, backoff_factor=0.0))
+    server, base_url = serve_fake_off_in_thread()
+    barcodes = list(load_recordings()["product"])[:3]
+    catalog = _write_catalog(tmp_path / "catalogo.csv", [[barcode, "", ""] for barcode in barcodes]
+                             + [["", "Yogurt greco", ""], ["0000000000000", "", ""]])
+    output = str(tmp_path / "arricchiti.csv")
+    try:
+        assert main.main(["enrich", catalog, "-o", output, "--off-url", base_url, "--workers", "4"]) == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+        openfoodfacts_client.set_product_cache(None)
+        http_client.set_session(None)
+    with open(output, "r", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["status"] for row in rows] == ["found"] * 4 + ["not_found"]
+    assert [row["barcode"] for row in rows[:3]] == barcodes
+    assert rows[3]["match_source"] == "name" and rows[3]["brands"] == "Fage"
+    assert "Completato: 5/5 voci" in capsys.readouterr().err
+
+
+def test_progress_reports_throughput_and_eta():
+    now = [0.0]
+    stream = io.StringIO()
+    reporter = ProgressReporter("catalogo.csv", already_done=100, stream=stream, interval=1.0, clock=lambda: now[0])
+    now[0] = 2.0
+    reporter(120, 220, {"found": 15, "not_found": 5, "error": 0})
+    assert reporter.rate == 10.0
+    assert reporter.eta(120, 220) == 10.0
+    assert stream.getvalue().strip() == "catalogo.csv  120/220 (54.5%)  10.0 voci/s  ETA 10s  found 15 not_found 5"
+    now[0] = 2.5
+    reporter(125, 220)                      # entro l'intervallo: nessuna riga
+    assert len(stream.getvalue().splitlines()) == 1
+    assert (format_duration(185), format_duration(7620), format_duration(None)) == ("3m 05s", "2h 07m", "--")
@@ -0,0 +1,185 @@
+# tests/test_data_scraper.py
+
+import tracemalloc
+
+import pytest
+
+from src.integrations import data_scraper, openfoodfacts_client
+from src.integrations.data_scraper import PriceStore, match_local_product, parse_flyer_line, parse_validity
+from src.integrations.local_search import LocalSearchIndex
+
+FLYER = """\
+Volantino Conad - settimana 1
+Valido dal 04/01 al 17/01/2024
+
+PASTA E RISO
+Pasta di semola Barilla 500 g € 0,89 invece di € 1,29
+Riso Carnaroli Scotti 1 kg € 2,49 -20%
+
+LATTICINI
+Yogurt greco 0% Fage 170 g 1,19 € (7,00 €/kg)
+Parmigiano Reggiano DOP 24 mesi al kg € 13,90
+8001234567890 Tonno Rio Mare 3 x 80 g € 3,49 3x2
+"""
+
+CATALOG = """\
+nome;marca;ean;formato;prezzo;prezzo_pieno;valido_al
+Fette biscottate integrali;Conad;8003170000001;300 g;1,59;1,99;31/01/2024
+Crackers senza glutine;Schär;;210 g;2,89;;
+Senza prezzo;Conad;;100 g;;;
+"""
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PriceStore(db_path=str(tmp_path / "prezzi.sqlite3"), data_dir=str(tmp_path))
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("Pasta di semola Barilla 500 g € 0,89 invece di € 1,29",
+     {"name": "Pasta di semola Barilla", "quantity_g": 500, "price": 0.89, "regular_price": 1.29,
+      "price_per_kg": 1.78, "promotion": "-31%"}),
+    ("Yogurt greco 0% Fage 170 g 1,19 € (7,00 €/kg)",
+     {"name": "Yogurt greco 0% Fage", "quantity_g": 170, "price": 1.19, "price_per_kg": 7.0, "promotion": None}),
+    ("Parmigiano Reggiano DOP 24 mesi al kg € 13,90",
+     {"name": "Parmigiano Reggiano DOP 24 mesi", "quantity_g": None, "price": 13.9, "price_per_kg": 13.9}),
+    ("8001234567890 Tonno Rio Mare 3 x 80 g € 3,49 3x2",
+     {"name": "Tonno Rio Mare", "barcode": "8001234567890", "quantity_g": 240, "promotion": "3x2"}),
+    ("Birra Peroni 6x33 cl 3,99€", {"name": "Birra Peroni", "quantity_g": 1980, "price": 3.99}),
+    ("Olio extravergine Monini 1 l € 6,99 anziché 9,99", {"regular_price": 9.99, "promotion": "-30%"}),
+    ("Acqua minerale 6x1,5 l € 1,99",
+     {"name": "Acqua minerale", "quantity_g": 9000, "price": 1.99, "price_per_kg": 0.22, "promotion": None}),
+    ("Banane € 1,49/kg", {"name": "Banane", "quantity_g": None, "price": 1.49, "price_per_kg": 1.49}),
+    ("Prosciutto crudo 3,20 €/kg", {"name": "Prosciutto crudo", "price": 3.2, "price_per_kg": 3.2}),
+    ("Uova fresche x6 € 2,10", {"name": "Uova fresche x6", "price": 2.1, "quantity_g": None}),
+])
+def test_parse_flyer_line(line, expected):
+    entry = parse_flyer_line(line)
+    assert {key: entry[key] for key in expected} == expected
+
+
+def test_lines_without_price_and_validity_headers():
+    assert parse_flyer_line("LATTICINI") is None
+    assert parse_flyer_line("# commento € 1,00") is None
+    assert parse_validity("Valido dal 04/01 al 17/01/2024", 2023) == ("2024-01-04", "2024-01-17")
+    assert parse_validity("Offerte dal 28/12 al 10/01/2024", 2024) == ("2023-12-28", "2024-01-10")
+    assert parse_validity("Pasta € 1,00", 2024) is None
+
+
+def test_flyer_and_catalog_ingestion(tmp_path, store):
+    (tmp_path / "volantino_2024.txt").write_text(FLYER, encoding="utf-8")
+    (tmp_path / "catalogo.csv").write_text(CATALOG, encoding="utf-8")
+    matched = {"Riso Carnaroli Scotti": {"barcode": "8001111111111", "name": "Riso Carnaroli"}}
+
+    results = store.ingest_paths([str(tmp_path)], matcher=lambda entry: matched.get(entry["name"]))
+    by_source = {result["source"]: result for result in results}
+    assert by_source["volantino_2024.txt"]["inserted"] == 5
+    assert by_source["volantino_2024.txt"]["matched"] == 1
+    assert by_source["volantino_2024.txt"]["skipped_lines"] == 3    # titoli di sezione e intestazione
+    assert by_source["catalogo.csv"]["inserted"] == 2
+    assert by_source["catalogo.csv"]["skipped_lines"] == 1
+
+    riso = store.find_prices(barcode="8001111111111")
+    assert [(price["name"], price["match_source"], price["valid_to"]) for price in riso] == [
+        ("Riso Carnaroli Scotti", "name", "2024-01-17")]
+    fette = store.find_prices(barcode="8003170000001")[0]
+    assert (fette["brand"], fette["price_per_kg"], fette["promotion"], fette["match_source"]) == \
+        ("Conad", 5.3, "-20%", "file")
+    assert [price["name"] for price in store.find_prices(name="yogurt")] == ["Yogurt greco 0% Fage"]
+    # il volantino vale dal 4 al 17 gennaio, il catalogo fino al 31 (o sempre, senza date)
+    assert len(store.find_prices(on_date="2024-01-10")) == 7
+    assert {price["name"] for price in store.find_prices(on_date="2024-01-20")} == {
+        "Fette biscottate integrali", "Crackers senza glutine"}
+    assert store.stats() == {"entries": 7, "with_barcode": 3, "promotions": 4, "files": 2}
+
+
+def test_reingestion_touches_only_changed_entries(tmp_path, store):
+    path = tmp_path / "volantino_2024.txt"
+    path.write_text(FLYER, encoding="utf-8")
+    calls = []
+
+    def matcher(entry):
+        calls.append(entry["name"])
+        return None
+
+    assert store.ingest_file(str(path), matcher=matcher)["inserted"] == 5
+    assert len(calls) == 4        # il tonno ha già il barcode
+
+    calls.clear()
+    assert store.ingest_file(str(path), matcher=matcher)["skipped"] is True
+
+    changed = (FLYER.replace("€ 0,89 invece di € 1,29", "€ 0,79 invece di € 1,29")
+               .replace("Riso Carnaroli Scotti 1 kg € 2,49 -20%\n", "")
+               + "Caffè Lavazza Qualità Rossa 250 g € 2,99\n")
+    path.write_text(changed, encoding="utf-8")
+    result = store.ingest_file(str(path), matcher=matcher)
+    assert {key: result[key] for key in ("inserted", "updated", "unchanged", "deleted", "skipped")} == {
+        "inserted": 1, "updated": 1, "unchanged": 3, "deleted": 1, "skipped": False}
+    assert sorted(calls) == ["Caffè Lavazza Qualità Rossa", "Pasta di semola Barilla"]
+    assert store.find_prices(name="pasta di semola")[0]["price"] == 0.79
+    assert store.find_prices(name="riso") == []
+
+
+def test_same_product_in_two_validity_periods_keeps_both_prices(tmp_path, store):
+    path = tmp_path / "volantino.txt"
+    path.write_text("Valido dal 04/01 al 10/01/2024\n"
+                    "Pasta di semola Barilla 500 g € 0,89\n"
+                    "Valido dal 11/01 al 17/01/2024\n"
+                    "Pasta di semola Barilla 500 g € 0,99\n"
+                    "Pasta di semola Barilla 500 g € 1,09\n", encoding="utf-8")
+    result = store.ingest_file(str(path), matcher=None)
+    assert (result["inserted"], result["duplicates"]) == (2, 1)
+    assert [price["price"] for price in store.find_prices(name="pasta", on_date="2024-01-05")] == [0.89]
+    assert [price["price"] for price in store.find_prices(name="pasta", on_date="2024-01-12")] == [1.09]
+
+
+def test_failed_ingestion_leaves_the_table_unchanged(tmp_path, store):
+    path = tmp_path / "volantino.txt"
+    path.write_text(FLYER, encoding="utf-8")
+    store.ingest_file(str(path), matcher=None)
+    path.write_text(FLYER + "Caffè Lavazza 250 g € 2,99\n", encoding="utf-8")
+
+    def broken_matcher(entry):
+        raise RuntimeError("indice non disponibile")
+
+    with pytest.raises(RuntimeError):
+        store.ingest_file(str(path), matcher=broken_matcher)
+    assert store.stats()["entries"] == 5
+    assert store.ingest_file(str(path), matcher=None)["inserted"] == 1
+
+
+def test_entries_are_matched_to_products_of_the_local_index():
+    index = LocalSearchIndex()
+    index.add_products([
+        {"barcode": "8076809513753", "name": "Pasta di semola Spaghetti n.5", "brands": "Barilla"},
+        {"barcode": "8002270014901", "name": "Yogurt greco 0%", "brands": "Fage"},
+    ])
+    openfoodfacts_client.set_local_search_index(index)
+    try:
+        assert match_local_product(parse_flyer_line("Yogurt greco Fage 170 g 1,19 €"))["barcode"] == "8002270014901"
+        # troppe parole della voce mancano nel prodotto trovato: meglio nessun abbinamento
+        assert match_local_product(parse_flyer_line("Pasta fresca all'uovo Rana 250 g € 1,99")) is None
+    finally:
+        openfoodfacts_client.set_local_search_index(None)
+
+
+def test_memory_stays_flat_on_large_files(tmp_path, store, monkeypatch):
+    monkeypatch.setattr(data_scraper, "INGEST_BATCH_SIZE", 100)
+
+    def peak_memory(lines: int) -> int:
+        path = tmp_path / f"volantino_{lines}.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            for i in range(lines):
+                f.write(f"Prodotto {i} linea {i % 97} 500 g € {1 + i % 9},{i % 100:02d}\n")
+        tracemalloc.start()
+        try:
+            assert store.ingest_file(str(path), matcher=None)["inserted"] == lines
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # Con il triplo delle righe il picco di memoria non cresce: si tiene solo un lotto alla volta
+    small, large = peak_memory(2000), peak_memory(6000)
+    assert large < small * 1.2
@@ -0,0 +1,110 @@
+# tests/test_fakes.py
+
+import json
+
+import pytest
+
+from benchmarks import bench_load
+from benchmarks.fakes import FakeGeminiModel, FaultInjection, load_recordings, serve_fake_off_in_thread, use_fake_off
+from benchmarks.harness import compare_reports, percentiles
+from src import api_server
+from src.integrations import gemini_service, http_client, openfoodfacts_client
+
+
+@pytest.fixture
+def restore_off_client(monkeypatch):
+    # use_fake_off sostituisce gli URL del client e la cache: monkeypatch li ripristina alla fine
+    for name in ("BASE_URL_SEARCH_CGI", "BASE_URL_PRODUCT_V2"):
+        monkeypatch.setattr(openfoodfacts_client, name, getattr(openfoodfacts_client, name))
+    http_client.set_session(http_client.create_session(retries=0, backoff_factor=0.0))
+    yield
+    openfoodfacts_client.set_product_cache(None)
+    http_client.set_session(None)
+
+
+@pytest.fixture
+def fake_off(restore_off_client):
+    servers = []
+
+    def start(**faults):
+        server, base_url = serve_fake_off_in_thread(FaultInjection(**faults))
+        servers.append(server)
+        use_fake_off(base_url)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_fake_off_replays_recorded_responses(fake_off):
+    fake_off()
+    recordings = load_recordings()
+    barcode, payload = next(iter(recordings["product"].items()))
+
+    product, error = openfoodfacts_client.lookup_product(barcode)
+    assert error is None
+    assert product["barcode"] == barcode
+    assert product["calories_100g"] == payload["product"]["nutriments"]["energy-kcal_100g"]
+    assert openfoodfacts_client.lookup_product("0000000000000") == (None, openfoodfacts_client.ERROR_NOT_FOUND)
+
+    results = openfoodfacts_client.search_products_by_name("pasta", page_size=24, use_cache=False)
+    assert [item["barcode"] for item in results] == [
+        item["code"] for item in recordings["search"]["pasta"]["products"]
+        if item.get("product_name_it") or item.get("product_name")]
+
+
+def test_fake_off_injects_errors_and_malformed_responses(fake_off):
+    barcode = next(iter(load_recordings()["product"]))
+    fake_off(error_rate=1.0)
+    assert openfoodfacts_client.lookup_product(barcode, use_cache=False) == (None, openfoodfacts_client.ERROR_HTTP)
+    fake_off(malformed_rate=1.0)
+    assert openfoodfacts_client.lookup_product(barcode, use_cache=False) == (None, openfoodfacts_client.ERROR_JSON)
+
+
+def test_fake_gemini_error_degrades_to_local_notes():
+    gemini_service.set_model(FakeGeminiModel(FaultInjection(error_rate=1.0)))
+    gemini_service.advice_cache.clear()
+    try:
+        response = api_server.app.test_client().post("/api/calculate_needs?notes=ai", json={
+            "age": "30", "weight": "70", "height": "175", "gender": "male", "activity_level": "light"})
+    finally:
+        gemini_service.set_model(None)
+        gemini_service.advice_cache.clear()
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data["notes_source"] == "local"
+    assert "DEADLINE_EXCEEDED" in data["notes_error"]
+
+
+def test_fake_gemini_streams_and_answers_json():
+    model = FakeGeminiModel(chunk_words=3)
+    assert "".join(chunk.text for chunk in model.generate_content("prompt", stream=True)).strip() == model.NOTES
+    advice = json.loads(model.generate_content("prompt", generation_config={"response_mime_type": "application/json"}).text)
+    assert advice["notes"] == model.NOTES
+    assert model.calls == 2
+
+
+def test_load_benchmark_smoke_run(restore_off_client, tmp_path):
+    output = tmp_path / "load.json"
+    report = bench_load.main(["--clients", "4", "--requests", "12", "--ai-ratio", "0.5", "--off-latency", "0",
+                              "--off-jitter", "0", "--gemini-latency", "0", "--gemini-jitter", "0",
+                              "--json", str(output)])
+    assert json.loads(output.read_text(encoding="utf-8")) == report
+    assert report["run"]["python"]
+    assert [result["name"] for result in report["results"]] == [
+        "search_food/sync", "search_food/asgi", "calculate_needs/sync", "calculate_needs/asgi"]
+    for result in report["results"]:
+        assert result["requests"] == 12
+        assert result["errors"] == 0
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+
+
+def test_harness_percentiles_and_comparison():
+    assert percentiles([0.001 * i for i in range(1, 101)]) == {"p50_ms": 51.0, "p95_ms": 95.0, "p99_ms": 99.0}
+    previous = {"results": [{"name": "a", "throughput_rps": 100.0, "p99_ms": 20.0}]}
+    current = {"results": [{"name": "a", "throughput_rps": 120.0, "p99_ms": 30.0}, {"name": "b", "p99_ms": 1.0}]}
+    changes = {change["metric"]: change for change in compare_reports(previous, current)}
+    assert changes["throughput_rps"]["change_pct"] == 20.0 and changes["throughput_rps"]["better"]
+    assert changes["p99_ms"]["change_pct"] == 50.0 and not changes["p99_ms"]["better"]
@@ -0,0 +1,236 @@
+# tests/test_http_caching.py
+
+import asyncio
+import gzip
+import io
+import json
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src import api_server, asgi_server
+from src.api import http_caching
+from src.api.http_caching import choose_encoding, compute_etag, etag_matches, finalize_response
+from src.integrations import thumbnails
+from src.integrations.thumbnails import THUMB_ALLOWED_HOSTS, ThumbnailCache, ThumbnailError, off_image_variant
+from tests.test_asgi_server import call_asgi
+from tests.test_http_client import stub_off  # noqa: F401  (fixture)
+
+MANY_RESULTS = [{"name": f"Pasta integrale {i}", "brands": "Barilla", "barcode": f"80{i:04d}", "calories_100g": 350 + i}
+                for i in range(20)]
+FAKE_JPEG = b"\xff\xd8\xff\xe0" + b"0" * 1500
+
+
+class StubImages(BaseHTTPRequestHandler):
+    """Server locale di immagini: varianti in stile OFF, una pagina HTML, un redirect e un file enorme."""
+
+    protocol_version = "HTTP/1.1"
+    image = FAKE_JPEG
+    requested = []
+
+    def do_GET(self):
+        type(self).requested.append(self.path)
+        if self.path.startswith("/images/products/"):
+            self._send(200, "image/jpeg", type(self).image)
+        elif self.path == "/page.html":
+            self._send(200, "text/html; charset=utf-8", b"<html></html>")
+        elif self.path == "/huge.jpg":
+            self._send(200, "image/jpeg", b"0" * 200_000)
+        elif self.path == "/redirect.jpg":
+            self.send_response(302)
+            self.send_header("Location", "http://example.com/x.jpg")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self._send(404, "text/plain", b"not found")
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def image_server():
+    StubImages.image = FAKE_JPEG
+    StubImages.requested = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubImages)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def no_pillow(monkeypatch):
+    monkeypatch.setattr(thumbnails, "Image", None)
+
+
+def _image_url(base_url, name="front_it.3"):
+    return f"{base_url}/images/products/800/123/456/7890/{name}.400.jpg"
+
+
+def test_encoding_negotiation_and_etag_comparison(monkeypatch):
+    monkeypatch.setattr(http_caching, "brotli", None)
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding(None) is None
+    assert choose_encoding("*") == "gzip"
+    monkeypatch.setattr(http_caching, "brotli", types.SimpleNamespace(compress=lambda body, quality: b"br" + body))
+    assert choose_encoding("gzip, deflate, br") == "br"
+    assert choose_encoding("br;q=0.5, gzip") == "gzip"
+    status, headers, body = finalize_response(200, b"{}" * 1000, "application/json", {"accept-encoding": "br"})
+    assert (status, dict(headers)["Content-Encoding"], body[:2]) == (200, "br", b"br")
+
+    etag = compute_etag(b'{"a": 1}')
+    assert etag.startswith('W/"') and etag == compute_etag(b'{"a": 1}') != compute_etag(b'{"a": 2}')
+    assert etag_matches(f'"x", {etag[2:]}', etag) and etag_matches("*", etag)
+    assert not etag_matches('W/"altro"', etag) and not etag_matches(None, etag)
+
+
+def test_flask_search_is_compressed_and_revalidated(monkeypatch):
+    monkeypatch.setattr(api_server, "search_products", lambda query, page_size, lang: (MANY_RESULTS, None))
+    client = api_server.app.test_client()
+    response = client.get("/api/search_food?query=pasta", headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.headers["Cache-Control"].startswith("public, max-age=300")
+    assert int(response.headers["Content-Length"]) == len(response.data) < len(json.dumps(MANY_RESULTS))
+    assert json.loads(gzip.decompress(response.data)) == MANY_RESULTS
+
+    etag = response.headers["ETag"]
+    revalidated = client.get("/api/search_food?query=pasta", headers={"If-None-Match": etag})
+    assert (revalidated.status_code, revalidated.data, revalidated.headers["ETag"]) == (304, b"", etag)
+    # Senza Accept-Encoding: stesso ETag, corpo non compresso
+    plain = client.get("/api/search_food?query=pasta")
+    assert "Content-Encoding" not in plain.headers and plain.headers["ETag"] == etag
+    assert plain.get_json() == MANY_RESULTS
+
+
+def test_errors_and_small_responses_are_not_cached_or_compressed(monkeypatch):
+    monkeypatch.setattr(api_server, "search_products", lambda query, page_size, lang: (MANY_RESULTS[:1], None))
+    client = api_server.app.test_client()
+    small = client.get("/api/search_food?query=pasta", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers and "ETag" in small.headers
+    error = client.get("/api/search_food", headers={"Accept-Encoding": "gzip"})
+    assert error.status_code == 400
+    assert "ETag" not in error.headers and "Cache-Control" not in error.headers
+    stats = client.get("/api/cache/stats")
+    assert "ETag" not in stats.headers and "thumbnails" in stats.get_json()
+
+
+def test_asgi_search_is_compressed_and_revalidated(monkeypatch):
+    async def fake_async_search(query, page_size, lang):
+        return MANY_RESULTS, None
+
+    monkeypatch.setattr(asgi_server, "async_search_products", fake_async_search)
+    status, headers, content = asyncio.run(call_asgi("GET", "/api/search_food", "query=pasta",
+                                                     request_headers={"Accept-Encoding": "gzip"}))
+    assert (status, headers["content-encoding"], headers["vary"]) == (200, "gzip", "Accept-Encoding")
+    assert json.loads(gzip.decompress(content)) == MANY_RESULTS
+    status, headers, content = asyncio.run(call_asgi("GET", "/api/search_food", "query=pasta",
+                                                     request_headers={"If-None-Match": headers["etag"]}))
+    assert (status, content) == (304, b"")
+
+
+def test_product_endpoint_has_long_cache_headers(stub_off):  # noqa: F811
+    client = api_server.app.test_client()
+    response = client.get("/api/product/8001")
+    assert (response.status_code, response.get_json()["name"]) == (200, "Spaghetti")
+    assert response.headers["Cache-Control"].startswith("public, max-age=3600")
+    assert client.get("/api/product/8001", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert [client.get(f"/api/product/{code}").status_code for code in ("1234", "abc", "5000")] == [404, 400, 502]
+
+
+def test_off_image_urls_use_the_smallest_sufficient_variant():
+    url = "https://images.openfoodfacts.org/images/products/800/123/456/7890/front_it.12.400.jpg"
+    assert off_image_variant(url, 50) == url.replace(".400.jpg", ".100.jpg")
+    assert off_image_variant(url, 200) == url.replace(".400.jpg", ".200.jpg")
+    assert off_image_variant(url, 800) == url.replace(".400.jpg", ".full.jpg")
+    assert off_image_variant("https://example.com/foto.jpg", 100) == "https://example.com/foto.jpg"
+
+
+def test_thumbnails_are_downloaded_once_and_kept_on_disk(image_server, no_pillow, tmp_path):
+    cache = ThumbnailCache(str(tmp_path), allowed_hosts=("127.0.0.1",))
+    url = _image_url(image_server)
+    assert cache.get(url, 100) == (FAKE_JPEG, "image/jpeg")
+    assert cache.get(url, 100) == (FAKE_JPEG, "image/jpeg")
+    assert StubImages.requested == ["/images/products/800/123/456/7890/front_it.3.100.jpg"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["downloads"], stats["entries"]) == (1, 1, 1, 1)
+
+    # Una nuova istanza (riavvio) ritrova le miniature già su disco
+    assert ThumbnailCache(str(tmp_path), allowed_hosts=("127.0.0.1",)).get(url, 100)[0] == FAKE_JPEG
+    assert len(StubImages.requested) == 1
+
+
+def test_thumbnail_cache_evicts_least_recently_used(image_server, no_pillow, tmp_path):
+    cache = ThumbnailCache(str(tmp_path), max_bytes=int(len(FAKE_JPEG) * 2.5), allowed_hosts=("127.0.0.1",))
+    first, second, third = (_image_url(image_server, name) for name in ("a", "b", "c"))
+    cache.get(first)
+    cache.get(second)
+    cache.get(first)                        # "a" torna la più recente
+    cache.get(third)
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] <= cache.max_bytes
+    assert len(list(tmp_path.iterdir())) == 2
+    cache.get(first)
+    cache.get(second)                       # eliminata: scaricata di nuovo
+    assert [path.rsplit("/", 1)[1] for path in StubImages.requested] == ["a.100.jpg", "b.100.jpg", "c.100.jpg",
+                                                                         "b.100.jpg"]
+
+
+def test_thumbnail_downloads_are_restricted(image_server, no_pillow, tmp_path):
+    default_hosts = ThumbnailCache(str(tmp_path / "default"), allowed_hosts=THUMB_ALLOWED_HOSTS)
+    assert default_hosts.is_allowed("https://images.openfoodfacts.org/images/products/1/front.400.jpg")
+    assert not default_hosts.is_allowed("https://openfoodfacts.org.example.com/x.jpg")
+    assert not default_hosts.is_allowed("file:///etc/passwd")
+
+    cache = ThumbnailCache(str(tmp_path / "local"), allowed_hosts=("127.0.0.1",), max_source_bytes=100_000)
+    expected = {"http://example.com/x.jpg": 403, f"{image_server}/page.html": 502, f"{image_server}/missing.jpg": 404,
+                f"{image_server}/redirect.jpg": 502, f"{image_server}/huge.jpg": 502}
+    for url, status in expected.items():
+        with pytest.raises(ThumbnailError) as error:
+            cache.get(url)
+        assert error.value.status == status
+    assert "/x.jpg" not in StubImages.requested      # host non ammesso: nessuna richiesta
+    assert cache.stats()["entries"] == 0
+
+
+def test_thumb_endpoint_serves_cached_images(image_server, no_pillow, tmp_path):
+    thumbnails.set_thumbnail_cache(ThumbnailCache(str(tmp_path), allowed_hosts=("127.0.0.1",)))
+    try:
+        client = api_server.app.test_client()
+        url = _image_url(image_server)
+        response = client.get("/api/thumb", query_string={"url": url, "size": 50},
+                              headers={"Accept-Encoding": "gzip"})
+        assert (response.status_code, response.mimetype, response.data) == (200, "image/jpeg", FAKE_JPEG)
+        assert "Content-Encoding" not in response.headers
+        assert "immutable" in response.headers["Cache-Control"]
+        revalidated = client.get("/api/thumb", query_string={"url": url, "size": 50},
+                                 headers={"If-None-Match": response.headers["ETag"]})
+        assert revalidated.status_code == 304
+        assert client.get("/api/thumb", query_string={"url": url, "size": 75}).status_code == 400
+        assert client.get("/api/thumb").status_code == 400
+        assert client.get("/api/thumb", query_string={"url": "http://example.com/x.jpg"}).status_code == 403
+    finally:
+        thumbnails.set_thumbnail_cache(None)
+
+
+def test_thumbnails_are_resized_with_pillow(image_server, tmp_path):
+    image_module = pytest.importorskip("PIL.Image")
+    source = io.BytesIO()
+    image_module.new("RGB", (400, 300), (200, 30, 30)).save(source, "JPEG")
+    StubImages.image = source.getvalue()
+    content, content_type = ThumbnailCache(str(tmp_path), allowed_hosts=("127.0.0.1",)).get(_image_url(image_server), 100)
+    with image_module.open(io.BytesIO(content)) as thumbnail:
+        assert (content_type, thumbnail.format, thumbnail.size) == ("image/jpeg", "JPEG", (100, 75))
@@ -0,0 +1,164 @@
+# tests/test_http_client.py
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.integrations import http_client, openfoodfacts_client
+from src.integrations.local_cache import LocalCache
+
+STUB_PRODUCTS = {
+    "8001": {"code": "8001", "product_name_it": "Spaghetti", "brands": "Barilla",
+             "nutriments": {"energy-kcal_100g": 359, "proteins_100g": 12.5}},
+    "8002": {"code": "8002", "product_name_it": "Yogurt greco", "brands": "Fage",
+             "nutriments": {"energy-kcal_100g": 54, "proteins_100g": 10.3}},
+}
+
+
+class StubOpenFoodFacts(BaseHTTPRequestHandler):
+    """Server locale che imita l'endpoint prodotto di OFF, con errori 5xx e latenza configurabili."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+    delay = 0.0
+    failures_before_success = {}
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+    client_ports = []
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            cls.client_ports.append(self.client_address[1])
+        try:
+            time.sleep(cls.delay)
+            barcode = self.path.split("?")[0].rsplit("/", 1)[-1]
+            with cls.lock:
+                remaining = cls.failures_before_success.get(barcode, 0)
+                if remaining:
+                    cls.failures_before_success[barcode] = remaining - 1
+            if remaining or barcode == "5000":
+                self._send(500, {"error": "temporaneo"})
+            elif barcode in STUB_PRODUCTS:
+                self._send(200, {"status": 1, "product": STUB_PRODUCTS[barcode]})
+            else:
+                self._send(404, {"status": 0, "status_verbose": "product not found"})
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_off(monkeypatch):
+    StubOpenFoodFacts.delay = 0.0
+    StubOpenFoodFacts.failures_before_success = {}
+    StubOpenFoodFacts.max_in_flight = 0
+    StubOpenFoodFacts.client_ports = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenFoodFacts)
+    server.daemon_threads = True
+    server.block_on_close = False
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    monkeypatch.setattr(openfoodfacts_client, "BASE_URL_PRODUCT_V2", f"{base_url}/api/v2/product/")
+    monkeypatch.setattr(http_client, "HTTP_BACKOFF_FACTOR", 0.0)
+    http_client.set_session(http_client.create_session(retries=2, backoff_factor=0.0))
+    openfoodfacts_client.set_product_cache(LocalCache())
+    yield StubOpenFoodFacts
+    openfoodfacts_client.set_product_cache(None)
+    http_client.set_session(None)
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_reuses_keep_alive_connection(stub_off):
+    for barcode in ("8001", "8002", "8003"):
+        openfoodfacts_client.get_product_by_barcode(barcode)
+    assert len(set(stub_off.client_ports)) == 1
+
+
+def test_retries_transient_server_errors(stub_off):
+    stub_off.failures_before_success = {"8001": 2}
+    product, error = openfoodfacts_client.lookup_product("8001")
+    assert error is None
+    assert product["name"] == "Spaghetti"
+    assert len(stub_off.client_ports) == 3
+
+
+def test_lookup_distinguishes_not_found_and_errors(stub_off):
+    assert openfoodfacts_client.lookup_product("1234") == (None, openfoodfacts_client.ERROR_NOT_FOUND)
+    assert openfoodfacts_client.lookup_product("5000") == (None, openfoodfacts_client.ERROR_HTTP)
+    assert openfoodfacts_client.lookup_product("abc") == (None, openfoodfacts_client.ERROR_INVALID_BARCODE)
+
+
+def test_batch_lookup_is_concurrent_and_bounded(stub_off):
+    stub_off.delay = 0.05
+    barcodes = ["8001", "8002"] + [str(9000 + i) for i in range(10)]
+
+    started = time.perf_counter()
+    results = openfoodfacts_client.get_products_by_barcodes(barcodes, max_workers=4)
+    elapsed = time.perf_counter() - started
+
+    assert [item["barcode"] for item in results] == barcodes
+    assert results[0]["product"]["name"] == "Spaghetti"
+    assert results[2]["error"] == openfoodfacts_client.ERROR_NOT_FOUND
+    assert stub_off.max_in_flight <= 4
+    assert elapsed < 0.05 * len(barcodes) * 0.6
+
+
+def test_async_batch_lookup(stub_off):
+    stub_off.delay = 0.02
+    barcodes = ["8002", "8001", "8002", "4242"]
+
+    async def run():
+        try:
+            return await openfoodfacts_client.async_get_products_by_barcodes(barcodes, concurrency=2)
+        finally:
+            await http_client.close_async_client()
+
+    results = asyncio.run(run())
+    assert [item["barcode"] for item in results] == barcodes
+    assert results[0]["product"]["name"] == "Yogurt greco"
+    assert results[3]["error"] == openfoodfacts_client.ERROR_NOT_FOUND
+    assert stub_off.max_in_flight <= 2
+    assert len(stub_off.client_ports) == 3  # il duplicato viene risolto una sola volta
+
+
+def test_batch_endpoint_returns_partial_results(stub_off):
+    from src.api_server import app
+
+    client = app.test_client()
+    response = client.post("/api/products/batch", json={"barcodes": ["8001", "5000", "0000"]})
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload["found"] == 1
+    assert payload["errors"] == 2
+    assert [item["error"] for item in payload["results"]] == [None, "http_error", "not_found"]
+
+
+def test_batch_endpoint_validates_input(stub_off, monkeypatch):
+    from src import api_server
+
+    client = api_server.app.test_client()
+    assert client.post("/api/products/batch", json={"barcodes": []}).status_code == 400
+    assert client.post("/api/products/batch", json=[1, 2]).status_code == 400
+    monkeypatch.setattr(api_server, "OFF_BATCH_MAX_ITEMS", 2)
+    assert client.post("/api/products/batch", json={"barcodes": ["1", "2", "3"]}).status_code == 400
@@ -0,0 +1,213 @@
+# tests/test_local_cache.py
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.integrations import openfoodfacts_client
+from src.integrations.local_cache import LocalCache, STATE_FRESH, STATE_MISS, STATE_STALE
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def wait_until(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condizione non raggiunta entro il timeout")
+        time.sleep(0.01)
+
+
+def test_fresh_stale_and_expired_states():
+    clock = FakeClock()
+    cache = LocalCache(clock=clock)
+    cache.set("product", "123", {"name": "Pasta"}, ttl=10, stale_ttl=20)
+
+    assert cache.get("product", "123").state == STATE_FRESH
+    clock.now += 15
+    lookup = cache.get("product", "123")
+    assert lookup.state == STATE_STALE
+    assert lookup.value == {"name": "Pasta"}
+    clock.now += 20
+    assert cache.get("product", "123").state == STATE_MISS
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["stale"] == 1
+    assert stats["misses"] == 1
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LocalCache(max_memory_items=2)
+    cache.set("ns", "a", 1, ttl=60)
+    cache.set("ns", "b", 2, ttl=60)
+    cache.get("ns", "a")
+    cache.set("ns", "c", 3, ttl=60)
+
+    assert cache.get("ns", "b").state == STATE_MISS
+    assert cache.get("ns", "a").value == 1
+    assert cache.get("ns", "c").value == 3
+
+
+def test_disk_persistence_survives_new_instance(tmp_path):
+    db_path = str(tmp_path / "cache.sqlite3")
+    LocalCache(db_path=db_path).set("search", "it|10|pasta", [{"name": "Pasta"}], ttl=60)
+
+    cache = LocalCache(db_path=db_path)
+    lookup = cache.get("search", "it|10|pasta")
+    assert lookup.state == STATE_FRESH
+    assert lookup.value == [{"name": "Pasta"}]
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_values_lists_positive_unexpired_entries_from_memory_and_disk(tmp_path):
+    clock = FakeClock()
+    db_path = str(tmp_path / "cache.sqlite3")
+    LocalCache(db_path=db_path, clock=clock).set("product", "1", {"name": "Pasta"}, ttl=60)
+    cache = LocalCache(db_path=db_path, clock=clock)
+    cache.set("product", "2", {"name": "Riso"}, ttl=10)
+    cache.set("product", "3", None, ttl=60, negative=True)
+    cache.set("search", "it|5|pane", [{"name": "Pane"}], ttl=60)
+
+    assert sorted(value["name"] for value in cache.values("product")) == ["Pasta", "Riso"]
+    clock.now += 30
+    assert [value["name"] for value in cache.values("product")] == ["Pasta"]
+
+
+def test_expired_entries_are_purged_on_open_and_every_n_writes(tmp_path):
+    clock = FakeClock()
+    db_path = str(tmp_path / "cache.sqlite3")
+    cache = LocalCache(db_path=db_path, clock=clock, purge_every=3)
+    cache.set("product", "1", {"name": "Pasta"}, ttl=10)
+    cache.set("product", "2", {"name": "Riso"}, ttl=60)
+
+    def rows():
+        return cache._conn.execute("SELECT key FROM cache_entries ORDER BY key").fetchall()
+
+    clock.now += 30
+    assert rows() == [("1",), ("2",)]
+    cache.set("product", "3", {"name": "Pane"}, ttl=60)      # terza scrittura: pulizia
+    assert rows() == [("2",), ("3",)]
+
+    clock.now += 45
+    reopened = LocalCache(db_path=db_path, clock=clock)
+    assert reopened._conn.execute("SELECT key FROM cache_entries").fetchall() == [("3",)]
+
+
+def test_negative_results_use_negative_ttl():
+    clock = FakeClock()
+    cache = LocalCache(clock=clock)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return None, None
+
+    assert cache.get_or_load("product", "000", loader, ttl=100, negative_ttl=5) is None
+    assert cache.get_or_load("product", "000", loader, ttl=100, negative_ttl=5) is None
+    assert len(calls) == 1
+    assert cache.stats()["negative_hits"] == 1
+
+    clock.now += 6
+    cache.get_or_load("product", "000", loader, ttl=100, negative_ttl=5)
+    assert len(calls) == 2
+
+
+def test_errors_are_not_cached():
+    cache = LocalCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return "timeout", None
+
+    cache.get_or_load("search", "k", loader, ttl=100, negative_ttl=5)
+    cache.get_or_load("search", "k", loader, ttl=100, negative_ttl=5)
+    assert len(calls) == 2
+    assert cache.stats()["load_errors"] == 2
+
+
+def test_stale_value_is_served_and_refreshed_in_background():
+    clock = FakeClock()
+    cache = LocalCache(clock=clock)
+    cache.set("product", "123", {"name": "Vecchio"}, ttl=10, stale_ttl=100)
+    clock.now += 50
+
+    value = cache.get_or_load("product", "123", lambda: (None, {"name": "Nuovo"}),
+                              ttl=10, negative_ttl=5, stale_ttl=100)
+    assert value == {"name": "Vecchio"}
+
+    wait_until(lambda: cache.stats()["refreshes"] == 1)
+    assert cache.get("product", "123").value == {"name": "Nuovo"}
+
+
+def test_async_load_keeps_disk_access_off_the_event_loop(tmp_path, monkeypatch):
+    cache = LocalCache(db_path=str(tmp_path / "cache.sqlite3"))
+    disk_threads = []
+    for name in ("_read_disk", "_write_disk"):
+        original = getattr(cache, name)
+
+        def recorded(*args, _original=original):
+            disk_threads.append(threading.get_ident())
+            return _original(*args)
+
+        monkeypatch.setattr(cache, name, recorded)
+
+    async def loader():
+        return None, {"name": "Pasta"}
+
+    async def run():
+        first = await cache.aget_or_load("product", "123", loader, ttl=60, negative_ttl=5)
+        second = await cache.aget_or_load("product", "123", loader, ttl=60, negative_ttl=5)
+        return first, second
+
+    assert asyncio.run(run()) == ({"name": "Pasta"}, {"name": "Pasta"})
+    assert len(disk_threads) == 2               # lettura mancata e scrittura; il secondo hit è in memoria
+    assert threading.get_ident() not in disk_threads
+    assert cache.stats()["memory_hits"] == 1
+
+
+@pytest.fixture
+def memory_product_cache():
+    cache = LocalCache()
+    openfoodfacts_client.set_product_cache(cache)
+    yield cache
+    openfoodfacts_client.set_product_cache(None)
+
+
+def test_search_products_by_name_uses_normalized_cache_key(monkeypatch, memory_product_cache):
+    calls = []
+
+    def fake_fetch(query, page_size, lang):
+        calls.append(query)
+        return None, [{"barcode": "1", "name": "Pasta di semola"}]
+
+    monkeypatch.setattr(openfoodfacts_client, "_fetch_search_results", fake_fetch)
+
+    first = openfoodfacts_client.search_products_by_name("Pasta  Barilla", page_size=10, lang="it")
+    second = openfoodfacts_client.search_products_by_name("  pasta barilla ", page_size=10, lang="IT")
+    assert first == second
+    assert calls == ["Pasta  Barilla"]
+    assert openfoodfacts_client.get_cache_stats()["hits"] == 1
+
+
+def test_get_product_by_barcode_caches_not_found(monkeypatch, memory_product_cache):
+    calls = []
+
+    def fake_fetch(barcode):
+        calls.append(barcode)
+        return None, None
+
+    monkeypatch.setattr(openfoodfacts_client, "_fetch_product_by_barcode", fake_fetch)
+
+    assert openfoodfacts_client.get_product_by_barcode("8001234567890") is None
+    assert openfoodfacts_client.get_product_by_barcode("8001234567890") is None
+    assert calls == ["8001234567890"]
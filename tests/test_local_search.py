@@ -0,0 +1,247 @@
+# tests/test_local_search.py
+
+import asyncio
+import random
+
+import pytest
+
+from src.integrations import local_search, openfoodfacts_client
+from src.integrations.local_cache import LocalCache
+from src.integrations.local_search import LocalSearchIndex, levenshtein, typo_distance, word_similarity
+
+PRODUCTS = [
+    {"barcode": "1", "name": "Parmigiano Reggiano DOP 24 mesi", "brands": "Conad", "calories_100g": 392},
+    {"barcode": "2", "name": "Grana Padano", "brands": "Zanetti", "calories_100g": 384},
+    {"barcode": "3", "name": "Yogurt greco 0%", "brands": "Fage", "protein_100g": 10.3},
+    {"barcode": "4", "name": "Yogurt greco intero", "brands": "Fage", "protein_100g": 9},
+    {"barcode": "5", "name": "Caffè macinato Qualità Rossa", "brands": "Lavazza"},
+    {"barcode": "6", "name": "Mozzarella di bufala campana", "brands": "Granarolo", "fat_100g": 22.5},
+    {"barcode": "7", "name": "Pasta integrale", "brands": "Barilla", "carbs_100g": 64},
+    {"barcode": "8", "name": "Passata di pomodoro", "brands": "Mutti"},
+]
+
+
+@pytest.fixture
+def index():
+    index = LocalSearchIndex()
+    index.add_products(PRODUCTS)
+    return index
+
+
+@pytest.fixture
+def isolated_client(monkeypatch):
+    """Cache in memoria, niente indice offline e un indice locale con i prodotti di prova."""
+    openfoodfacts_client.set_product_cache(LocalCache())
+    openfoodfacts_client.set_offline_index(None)
+    index = LocalSearchIndex()
+    index.add_products(PRODUCTS)
+    openfoodfacts_client.set_local_search_index(index)
+    yield index
+    openfoodfacts_client.set_local_search_index(None)
+    openfoodfacts_client.set_product_cache(None)
+    openfoodfacts_client.set_offline_index(None)
+
+
+def names(results: list[dict]) -> list[str]:
+    return [product["name"] for product in results]
+
+
+def test_levenshtein_matches_the_textbook_algorithm():
+    def reference(a, b):
+        previous = list(range(len(b) + 1))
+        for i, ca in enumerate(a, 1):
+            current = [i]
+            for j, cb in enumerate(b, 1):
+                current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+            previous = current
+        return previous[-1]
+
+    rng = random.Random(0)
+    for _ in range(2000):
+        a = "".join(rng.choice("abcde") for _ in range(rng.randint(0, 12)))
+        b = "".join(rng.choice("abcde") for _ in range(rng.randint(0, 12)))
+        assert levenshtein(a, b) == reference(a, b), (a, b)
+
+
+def test_typo_rules_depend_on_word_length():
+    assert typo_distance("fraina", "farina") == 1           # lettere scambiate: un solo errore
+    assert word_similarity("parmiggiano", "parmigiano") > 0.9
+    assert word_similarity("mozarela", "mozzarella") > 0    # 8 lettere: due errori
+    assert word_similarity("pata", "pasta") > 0
+    assert word_similarity("rso", "riso") == 0              # parole corte: nessun errore
+    assert word_similarity("parmig", "parmigiano", prefix=True) == pytest.approx(0.9)
+    assert word_similarity("parmig", "parmigiano") == 0
+    assert word_similarity("yomo", "pomodoro", prefix=True) == 0
+
+
+def test_finds_products_despite_typos_and_missing_accents(index):
+    assert names(index.search("parmiggiano"))[0] == "Parmigiano Reggiano DOP 24 mesi"
+    assert names(index.search("cafe macinato"))[0] == "Caffè macinato Qualità Rossa"
+    assert names(index.search("mozarela bufala"))[0] == "Mozzarella di bufala campana"
+    assert names(index.search("PARMIG"))[0] == "Parmigiano Reggiano DOP 24 mesi"
+    assert names(index.search("lavaza"))[0] == "Caffè macinato Qualità Rossa"
+    assert index.search("zucchero") == []
+    assert index.search("  !! ") == []
+
+
+def test_all_query_words_count_for_the_ranking(index):
+    # i prodotti devono contenere tutte le parole della query (o loro varianti)
+    assert names(index.search("yogurt greco 0%")) == ["Yogurt greco 0%"]
+    assert names(index.search("yogurt greco intero")) == ["Yogurt greco intero"]
+    assert sorted(names(index.search("yogurt greco"))) == ["Yogurt greco 0%", "Yogurt greco intero"]
+    # una parola che non c'è in nessun prodotto non svuota i risultati
+    assert names(index.search("mozzarella xyzzy"))[0] == "Mozzarella di bufala campana"
+
+
+def test_results_have_the_search_products_by_name_shape(index):
+    product = index.search("mozzarella")[0]
+    assert product == {
+        "barcode": "6", "name": "Mozzarella di bufala campana", "brands": "Granarolo", "image_url": None,
+        "calories_100g": None, "protein_100g": None, "carbs_100g": None, "fat_100g": 22.5,
+        "api_source": "local_search",
+    }
+    assert set(product) == set(local_search.PRODUCT_FIELDS) | {"api_source"}
+    assert len(index.search("yogurt", page_size=1)) == 1
+
+
+def test_duplicates_are_ignored(index):
+    assert index.add_products([{"barcode": "1", "name": "Parmigiano Reggiano DOP 24 mesi"}]) == 0
+    assert index.add_products([{"name": "Pane carasau", "brands": "Sarda"}, {"name": "Pane carasau", "brands": "Sarda"},
+                               {"name": None}]) == 1
+    assert len(index) == len(PRODUCTS) + 1
+
+
+def test_incremental_segments_give_the_same_results_as_a_single_segment():
+    rng = random.Random(1)
+    words = ["pasta", "riso", "latte", "yogurt", "biscotti", "tonno", "olio", "caffe", "succo", "pane", "farina"]
+    products = [{"barcode": str(i), "name": f"{rng.choice(words)} {rng.choice(words)} linea{i}",
+                 "brands": f"marca{i % 17}"} for i in range(2000)]
+    incremental = LocalSearchIndex(flush_every=50)
+    for start in range(0, len(products), 37):
+        incremental.add_products(products[start:start + 37])
+    compact = LocalSearchIndex()
+    compact.add_products(products)
+    compact.optimize()
+
+    stats = incremental.stats()
+    assert stats["merges"] > 0
+    assert stats["segments"] <= 12
+    assert compact.stats()["segments"] == 1
+    for query in ("pasta riso", "biscoti marca3", "linea1234", "tono olio", "caffe"):
+        assert names(incremental.search(query)) == names(compact.search(query)), query
+
+    # i documenti in attesa sono cercabili subito, senza aspettare la soglia di flush
+    incremental.add_products([{"barcode": "nuovo", "name": "Tortellini ricotta e spinaci"}])
+    assert names(incremental.search("tortelini"))[0] == "Tortellini ricotta e spinaci"
+
+
+def test_sparse_and_dense_union_of_variants_agree(monkeypatch):
+    products = [{"barcode": str(i), "name": f"prodotto{i} {'pasta' if i % 2 else 'pastai'}"} for i in range(1000)]
+    results = []
+    for ratio in (0.0, 1.0):
+        monkeypatch.setattr(local_search, "DENSE_UNION_RATIO", ratio)
+        index = LocalSearchIndex()
+        index.add_products(products)
+        results.append([product["barcode"] for product in index.search("pasta", page_size=20)])
+    assert results[0] == results[1]
+    assert len(results[0]) == 20
+
+
+def test_search_falls_back_to_local_index_when_remote_finds_nothing(monkeypatch, isolated_client):
+    monkeypatch.setattr(openfoodfacts_client, "OFF_LOCAL_SEARCH", "fallback")
+    monkeypatch.setattr(openfoodfacts_client, "_fetch_search_results", lambda query, page_size, lang: (None, []))
+    results = openfoodfacts_client.search_products_by_name("parmiggiano")
+    assert names(results) == ["Parmigiano Reggiano DOP 24 mesi"]
+    assert results[0]["api_source"] == "local_search"
+
+    monkeypatch.setattr(openfoodfacts_client, "_fetch_search_results",
+                        lambda query, page_size, lang: (openfoodfacts_client.ERROR_CONNECTION, None))
+    assert names(openfoodfacts_client.search_products_by_name("grana padanno", use_cache=False)) == ["Grana Padano"]
+    assert openfoodfacts_client.search_products_by_name("zucchero", use_cache=False) is None
+
+    monkeypatch.setattr(openfoodfacts_client, "OFF_LOCAL_SEARCH", "off")
+    assert openfoodfacts_client.search_products_by_name("grana padanno", use_cache=False) is None
+
+
+def test_local_first_mode_skips_the_network(monkeypatch, isolated_client):
+    calls = []
+    monkeypatch.setattr(openfoodfacts_client, "OFF_LOCAL_SEARCH", "first")
+    monkeypatch.setattr(openfoodfacts_client, "_fetch_search_results",
+                        lambda query, page_size, lang: calls.append(query) or (None, [{"name": "Remoto"}]))
+    assert names(openfoodfacts_client.search_products_by_name("passata pomodoro")) == ["Passata di pomodoro"]
+    assert calls == []
+    assert names(openfoodfacts_client.search_products_by_name("zucchero")) == ["Remoto"]
+    assert calls == ["zucchero"]
+
+
+def test_async_search_uses_the_local_index(monkeypatch, isolated_client):
+    async def no_results(query, page_size, lang):
+        return None, []
+
+    monkeypatch.setattr(openfoodfacts_client, "OFF_LOCAL_SEARCH", "fallback")
+    monkeypatch.setattr(openfoodfacts_client, "_async_hedged_search", no_results)
+    results = asyncio.run(openfoodfacts_client.async_search_products_by_name("yogurt greko", page_size=1))
+    assert names(results) == ["Yogurt greco 0%"]
+
+
+def test_index_learns_products_from_remote_results(monkeypatch, isolated_client):
+    remote = [{"barcode": "50", "name": "Tortellini al prosciutto crudo", "brands": "Rana", "api_source": "search_cgi"}]
+    monkeypatch.setattr(openfoodfacts_client, "_fetch_search_results", lambda query, page_size, lang: (None, remote))
+    openfoodfacts_client.search_products_by_name("tortellini")
+
+    assert names(isolated_client.search("tortelini prosciuto")) == ["Tortellini al prosciutto crudo"]
+    assert openfoodfacts_client.get_cache_stats()["local_search"]["documents"] == len(PRODUCTS) + 1
+
+
+def test_index_is_built_from_cache_and_data_files(monkeypatch, tmp_path):
+    (tmp_path / "dietetici.csv").write_text("nome;marca;kcal\nFette biscottate integrali;Conad;380\n")
+    cache = LocalCache()
+    cache.set("product", "10", {"barcode": "10", "name": "Bresaola punta d'anca", "brands": "Rigamonti"}, ttl=60)
+    cache.set("search", "it|5|riso", [{"barcode": "11", "name": "Riso Carnaroli", "brands": "Scotti"}], ttl=60)
+    monkeypatch.setattr(openfoodfacts_client, "LOCAL_SEARCH_DATA_DIR", str(tmp_path))
+    openfoodfacts_client.set_product_cache(cache)
+    openfoodfacts_client.set_local_search_index(None)
+    try:
+        index = openfoodfacts_client.get_local_search_index()
+        assert openfoodfacts_client.get_local_search_index() is index
+        assert len(index) == 3
+        assert index.search("bresaola")[0]["barcode"] == "10"
+        assert index.search("carnaroli")[0]["brands"] == "Scotti"
+        assert index.search("fete biscotate")[0]["calories_100g"] == 380
+    finally:
+        openfoodfacts_client.set_local_search_index(None)
+        openfoodfacts_client.set_product_cache(None)
+
+
+def test_index_stops_at_max_documents():
+    capped = LocalSearchIndex(max_documents=3)
+    assert capped.add_products(PRODUCTS) == 3
+    assert capped.is_full() and len(capped) == 3
+    assert capped.stats()["dropped"] == len(PRODUCTS) - 3
+    assert capped.search("passata") == []
+
+
+def test_full_index_is_rebuilt_from_cache(monkeypatch, tmp_path):
+    cache = LocalCache()
+    cache.set("product", "10", {"barcode": "10", "name": "Bresaola punta d'anca", "brands": "Rigamonti"}, ttl=60)
+    monkeypatch.setattr(openfoodfacts_client, "LOCAL_SEARCH_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(openfoodfacts_client, "OFF_LOCAL_SEARCH_MAX_ADDED", 2)
+    openfoodfacts_client.set_product_cache(cache)
+    openfoodfacts_client.set_local_search_index(None)
+    try:
+        full = openfoodfacts_client.get_local_search_index()
+        assert (len(full), full.max_documents) == (1, 3)
+        # "11" è ancora in cache, gli altri ne sono già usciti: dopo la ricostruzione restano solo i prodotti in cache
+        cache.set("product", "11", {"barcode": "11", "name": "Riso Carnaroli", "brands": "Scotti"}, ttl=60)
+        openfoodfacts_client._notify_products([{"barcode": "11", "name": "Riso Carnaroli", "brands": "Scotti"},
+                                               {"barcode": "12", "name": "Pesto genovese", "brands": "Barilla"},
+                                               {"barcode": "13", "name": "Tonno all'olio", "brands": "Rio Mare"}])
+        assert full.is_full() and full.stats()["dropped"] == 1
+        openfoodfacts_client._local_search_rebuild.join(5)
+        rebuilt = openfoodfacts_client.get_local_search_index()
+        assert rebuilt is not full
+        assert (len(rebuilt), rebuilt.max_documents) == (2, 4)
+        assert rebuilt.search("riso")[0]["barcode"] == "11" and rebuilt.search("pesto") == []
+    finally:
+        openfoodfacts_client.set_local_search_index(None)
+        openfoodfacts_client.set_product_cache(None)
@@ -0,0 +1,104 @@
+# tests/test_nutrition_db.py
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from src.integrations import nutrition_db, openfoodfacts_client
+from src.integrations.local_data import iter_data_products
+from src.integrations.nutrition_db import JsonNutritionDB, NutritionDB, convert_to_binary, load_nutrition_db
+
+PRODUCTS = [
+    {"code": "8001234567890", "product_name": "Pasta di semola", "brands": "Barilla",
+     "nutriments": {"energy-kcal_100g": 359, "proteins_100g": 12.5, "carbohydrates_100g": 71.2, "fat_100g": 2}},
+    {"code": "8000500310427", "product_name": "Caffè Qualità Rossa", "brands": "Lavazza",
+     "image_url": "https://images.openfoodfacts.org/caffe.jpg"},
+    {"code": "0123", "product_name": "Con zero iniziale", "brands": "Barilla"},
+    {"code": "123", "product_name": "Senza zero iniziale", "brands": "Barilla"},
+    {"code": "8001234567890", "product_name": "Duplicato", "brands": "Barilla"},
+    {"product_name": "Senza barcode", "grassi": "22,5"},
+    {"brands": "Senza nome"},
+]
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "nutritional_database.json"
+    path.write_text(json.dumps({"products": PRODUCTS}), encoding="utf-8")
+    return str(path)
+
+
+def test_binary_and_json_loaders_agree(source):
+    convert_to_binary(source)
+    binary, plain = NutritionDB(source.replace(".json", ".nfdb")), JsonNutritionDB(source)
+    assert len(binary) == len(plain) == 6
+    assert [binary.get_product(row) for row in range(6)] == [plain.get_product(row) for row in range(6)]
+    assert binary.get_product(0) == {
+        "barcode": "8001234567890", "name": "Pasta di semola", "brands": "Barilla", "image_url": None,
+        "calories_100g": 359.0, "protein_100g": 12.5, "carbs_100g": 71.2, "fat_100g": 2.0, "api_source": "nutrition_db",
+    }
+    np.testing.assert_array_equal(binary.nutrients, plain.nutrients)
+
+
+def test_barcode_lookup(source):
+    convert_to_binary(source)
+    db = NutritionDB(source.replace(".json", ".nfdb"))
+    assert db.get_by_barcode("8001234567890")["name"] == "Pasta di semola"   # a parità di barcode vince il primo
+    assert db.get_by_barcode("0123")["name"] == "Con zero iniziale"
+    assert db.get_by_barcode(" 123 ")["name"] == "Senza zero iniziale"
+    assert db.get_by_barcode("999") is None
+    assert db.get_by_barcode("abc") is None
+    assert db.get_by_barcode("²") is None and db.get_by_barcode("١٢٣") is None   # cifre non ASCII
+
+
+def test_columns_are_read_only_views_of_the_mapped_file(source):
+    summary = convert_to_binary(source)
+    db = NutritionDB(summary["out_path"])
+    assert not db.nutrients.flags.owndata
+    assert not db.nutrients.flags.writeable
+    assert db.nutrients.dtype == np.float32
+    # "Barilla" compare quattro volte ma è memorizzata una sola volta
+    assert summary["strings"] < summary["rows"] * len(nutrition_db.STRING_COLUMNS)
+
+
+def test_loader_prefers_an_up_to_date_binary(source):
+    assert isinstance(load_nutrition_db(source), JsonNutritionDB)
+    convert_to_binary(source)
+    assert isinstance(load_nutrition_db(source), NutritionDB)
+
+    binary = source.replace(".json", ".nfdb")
+    os.utime(binary, (1, 1))   # il sorgente è più recente: la versione binaria è superata
+    assert isinstance(load_nutrition_db(source), JsonNutritionDB)
+    assert load_nutrition_db(source + ".mancante") is None
+
+
+def test_corrupted_binary_is_rejected(tmp_path):
+    path = tmp_path / "rotto.nfdb"
+    path.write_bytes(b"NFDB" + b"\x01\x00\x00\x00" + b"\xff" * 80)
+    assert load_nutrition_db(str(path)) is None
+    path.write_bytes(b"JSON")
+    assert load_nutrition_db(str(path)) is None
+
+
+def test_data_files_use_the_binary_version(tmp_path, source):
+    convert_to_binary(source)
+    products = list(iter_data_products(str(tmp_path)))
+    assert len(products) == 6
+    assert {product["api_source"] for product in products} == {"nutrition_db"}
+
+
+def test_barcode_lookup_uses_the_reference_table_before_the_network(monkeypatch, source):
+    def no_network(barcode):
+        raise AssertionError("rete non prevista")
+
+    monkeypatch.setattr(openfoodfacts_client, "_fetch_product_by_barcode", no_network)
+    nutrition_db.set_nutrition_db(load_nutrition_db(source))
+    try:
+        product, error = openfoodfacts_client.lookup_product("8000500310427")
+        assert error is None
+        assert product["brands"] == "Lavazza"
+        assert openfoodfacts_client.lookup_product("²") == (None, openfoodfacts_client.ERROR_INVALID_BARCODE)
+    finally:
+        nutrition_db.reset_nutrition_db()
@@ -0,0 +1,132 @@
+# tests/test_nutritional_calculator.py
+
+import numpy as np
+import pytest
+
+from src.core import nutritional_calculator as calc
+
+BASE_USER = {
+    "age": "46",
+    "weight": "70",
+    "height": "170",
+    "gender": "male",
+    "activity_level": "light",
+    "profession": "commerciante",
+    "objectives": "perdere peso gradualmente",
+}
+
+
+def test_bmr_formulas_reference_values():
+    assert calc.bmr_mifflin_st_jeor(70, 170, 46, True) == pytest.approx(1537.5)
+    assert calc.bmr_mifflin_st_jeor(60, 165, 30, False) == pytest.approx(1320.25)
+    assert calc.bmr_harris_benedict(70, 170, 46, True) == pytest.approx(1580.84, abs=0.01)
+    assert calc.bmr_harris_benedict(60, 165, 30, False) == pytest.approx(1383.68, abs=0.01)
+    assert calc.bmr_katch_mcardle(80, 20) == pytest.approx(370 + 21.6 * 64)
+
+
+@pytest.mark.parametrize("text, goal", [
+    ("perdere peso gradualmente", calc.GOAL_LOSE),
+    ("Dimagrire per l'estate", calc.GOAL_LOSE),
+    ("aumentare la massa muscolare", calc.GOAL_GAIN),
+    ("mantenimento", calc.GOAL_MAINTAIN),
+    ("", calc.GOAL_MAINTAIN),
+    ("gain", calc.GOAL_GAIN),
+    ("ridurre la massa grassa", calc.GOAL_LOSE),
+    ("meno massa grassa, più muscoli", calc.GOAL_LOSE),
+    ("calo di peso", calc.GOAL_LOSE),
+    ("fare le scale senza fiatone", calc.GOAL_MAINTAIN),
+    ("scala", calc.GOAL_MAINTAIN),
+    ("aumento di massa", calc.GOAL_GAIN),
+])
+def test_parse_goal(text, goal):
+    assert calc.parse_goal(text) == goal
+
+
+def test_calculate_needs_for_form_data():
+    needs = calc.calculate_needs(BASE_USER)
+    assert needs["formula"] == calc.FORMULA_MIFFLIN_ST_JEOR
+    assert needs["goal"] == calc.GOAL_LOSE
+    assert needs["bmr"] == 1538
+    assert needs["tdee"] == round(1537.5 * 1.375)
+    assert needs["calories"] == max(round(1537.5 * 1.375 * 0.8), calc.MIN_CALORIES_MALE)
+    assert needs["protein"] == 140
+    # Le calorie dei macronutrienti tornano con il totale (a meno degli arrotondamenti)
+    macro_kcal = needs["protein"] * 4 + needs["carbs"] * 4 + needs["fat"] * 9
+    assert macro_kcal == pytest.approx(needs["calories"], abs=15)
+
+
+def test_body_fat_selects_katch_mcardle():
+    needs = calc.calculate_needs(dict(BASE_USER, body_fat="20", objectives="mantenimento"))
+    assert needs["formula"] == calc.FORMULA_KATCH_MCARDLE
+    assert needs["bmr"] == round(370 + 21.6 * 56)
+
+
+def test_minimum_calories_floor():
+    needs = calc.calculate_needs({"age": 80, "weight": 40, "height": 150, "gender": "female",
+                                  "activity_level": "sedentary", "objectives": "perdere peso"})
+    assert needs["calories"] == calc.MIN_CALORIES_FEMALE
+    assert needs["carbs"] >= 0
+
+
+@pytest.mark.parametrize("override", [
+    {"age": "abc"},
+    {"weight": "0"},
+    {"gender": "N/D"},
+    {"activity_level": "couch"},
+    {"activity_level": ["moderate"]},
+    {"activity_level": {"livello": "moderate"}},
+    {"formula": "katch_mcardle"},
+])
+def test_invalid_input_raises_value_error(override):
+    with pytest.raises(ValueError):
+        calc.calculate_needs(dict(BASE_USER, **override))
+
+
+def test_batch_matches_single_profile_calculation():
+    rng = np.random.default_rng(42)
+    size = 500
+    age = rng.integers(18, 80, size)
+    weight = rng.uniform(45, 120, size)
+    height = rng.uniform(150, 200, size)
+    is_male = rng.random(size) < 0.5
+    activity_keys = rng.choice(list(calc.ACTIVITY_MULTIPLIERS), size)
+    goal_index = rng.integers(0, len(calc.GOALS), size)
+
+    batch = calc.calculate_needs_batch(
+        age, weight, height, is_male,
+        [calc.ACTIVITY_MULTIPLIERS[key] for key in activity_keys], goal_index,
+        formula=calc.FORMULA_HARRIS_BENEDICT,
+    )
+    for i in range(0, size, 50):
+        single = calc.calculate_needs({
+            "age": age[i], "weight": weight[i], "height": height[i],
+            "gender": "male" if is_male[i] else "female", "activity_level": activity_keys[i],
+            "goal": calc.GOALS[goal_index[i]], "formula": calc.FORMULA_HARRIS_BENEDICT,
+        })
+        assert single["calories"] == round(batch["calories"][i])
+        assert single["carbs"] == round(batch["carbs"][i])
+
+
+def test_katch_mcardle_batch_requires_body_fat():
+    with pytest.raises(ValueError):
+        calc.calculate_needs_batch([30], [70], [175], [True], [1.2], [1], formula=calc.FORMULA_KATCH_MCARDLE)
+
+
+def test_calculate_needs_endpoint_is_local():
+    from src.api_server import app
+
+    response = app.test_client().post("/api/calculate_needs", json=BASE_USER)
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload["source"] == "local"
+    assert payload["notes_source"] == "local"
+    assert payload["calories"] == calc.calculate_needs(BASE_USER)["calories"]
+    assert payload["notes"]
+
+
+def test_calculate_needs_endpoint_rejects_invalid_data():
+    from src.api_server import app
+
+    response = app.test_client().post("/api/calculate_needs", json=dict(BASE_USER, height="x"))
+    assert response.status_code == 400
+    assert "altezza" in response.get_json()["error"]
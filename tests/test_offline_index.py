@@ -0,0 +1,106 @@
+# tests/test_offline_index.py
+
+import gzip
+import json
+
+import pytest
+
+from src.integrations import offline_index, openfoodfacts_client
+from src.integrations.offline_index import build_index, load_offline_index
+
+SYNTHETIC_PRODUCTS = [
+    {"code": "8001", "product_name_it": "Spaghetti di semola", "product_name_en": "Durum wheat spaghetti",
+     "brands": "Barilla", "image_url": "https://img/8001.jpg",
+     "nutriments": {"energy-kcal_100g": 359, "proteins_100g": 12.5, "carbohydrates_100g": 71.2, "fat_100g": 2}},
+    {"code": "8002", "product_name": "Penne rigate integrali", "brands": "Barilla",
+     "nutriments": {"energy-kcal_100g": 348, "proteins_100g": 13, "carbohydrates_100g": 64, "fat_100g": 2.5}},
+    {"code": "8003", "product_name_it": "Parmigiano Reggiano DOP", "brands": "Parmareggio",
+     "nutriments": {"energy-kcal_100g": 392, "proteins_100g": 33, "carbohydrates_100g": 0, "fat_100g": 28}},
+    {"code": "8004", "product_name_it": "Caffè macinato crema e gusto", "brands": "Lavazza", "nutriments": {}},
+    {"code": "8005", "brands": "Senza nome"},
+]
+
+
+@pytest.fixture
+def jsonl_dump(tmp_path):
+    path = tmp_path / "off_dump.jsonl.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as handle:
+        for product in SYNTHETIC_PRODUCTS:
+            handle.write(json.dumps(product, ensure_ascii=False) + "\n")
+        handle.write("{riga non valida\n")
+    return str(path)
+
+
+@pytest.fixture
+def built_index(jsonl_dump, tmp_path, monkeypatch):
+    # Partizioni e soglia di flush minime per esercitare lo spill su disco
+    monkeypatch.setattr(offline_index, "NUM_BUCKETS", 3)
+    monkeypatch.setattr(offline_index, "FLUSH_EVERY_PAIRS", 2)
+    out_dir = str(tmp_path / "index")
+    build_index(jsonl_dump, out_dir, progress_every=0)
+    return load_offline_index(out_dir)
+
+
+def test_build_skips_products_without_name(built_index):
+    assert built_index.rows == 4
+
+
+def test_search_ranks_matching_products(built_index):
+    results = built_index.search("spaghetti barilla", page_size=5)
+    assert [product["barcode"] for product in results] == ["8001", "8002"]
+    assert results[0] == {
+        "barcode": "8001",
+        "name": "Spaghetti di semola",
+        "brands": "Barilla",
+        "image_url": "https://img/8001.jpg",
+        "calories_100g": 359.0,
+        "protein_100g": 12.5,
+        "carbs_100g": 71.2,
+        "fat_100g": 2.0,
+        "api_source": "OpenFoodFacts_offline_index",
+    }
+
+
+def test_search_folds_accents_and_matches_prefix(built_index):
+    assert [p["barcode"] for p in built_index.search("caffe")] == ["8004"]
+    assert [p["barcode"] for p in built_index.search("parmig")] == ["8003"]
+    assert built_index.search("caffe")[0]["calories_100g"] is None
+
+
+def test_search_uses_english_names(built_index):
+    results = built_index.search("durum wheat", lang="en")
+    assert results[0]["name"] == "Durum wheat spaghetti"
+
+
+def test_search_without_matches_returns_empty_list(built_index):
+    assert built_index.search("cioccolato") == []
+    assert built_index.search("di") == []
+
+
+def test_build_from_tsv_export(tmp_path):
+    dump_path = tmp_path / "off_export.csv"
+    dump_path.write_text(
+        "code\tproduct_name\tbrands\timage_url\tenergy-kcal_100g\tproteins_100g\tcarbohydrates_100g\tfat_100g\n"
+        "9001\tYogurt greco 0%\tFage\t\t54\t10.3\t3\t0\n"
+        "9002\tLatte parzialmente scremato\tGranarolo\t\t46\t3.3\t4.9\t1.5\n",
+        encoding="utf-8",
+    )
+    out_dir = str(tmp_path / "index")
+    build_index(str(dump_path), out_dir, progress_every=0)
+    results = load_offline_index(out_dir).search("yogurt greco")
+    assert results[0]["barcode"] == "9001"
+    assert results[0]["protein_100g"] == 10.3
+
+
+def test_client_serves_search_from_offline_index(built_index, monkeypatch):
+    def fail_remote(*args, **kwargs):
+        raise AssertionError("la ricerca non deve usare la rete")
+
+    monkeypatch.setattr(openfoodfacts_client, "_fetch_search_results", fail_remote)
+    monkeypatch.setattr(openfoodfacts_client, "OFF_OFFLINE_ONLY", True)
+    openfoodfacts_client.set_offline_index(built_index)
+    try:
+        assert openfoodfacts_client.search_products_by_name("penne")[0]["barcode"] == "8002"
+        assert openfoodfacts_client.search_products_by_name("cioccolato") == []
+    finally:
+        openfoodfacts_client.set_offline_index(None)
@@ -0,0 +1,154 @@
+# tests/test_recipe_manager.py
+
+import numpy as np
+import pytest
+
+from src import api_server
+from src.core import recipe_manager
+from src.core.recipe_manager import FoodMatrix, fit_portions, parse_meal_plan_request, plan_meals
+
+TARGETS = {"calories": 2000, "protein": 120, "carbs": 230, "fat": 65}
+
+FOODS = [
+    {"barcode": "1", "name": "Petto di pollo", "calories_100g": 110, "protein_100g": 23, "carbs_100g": 0, "fat_100g": 1.5,
+     "price_per_kg": 11.0},
+    {"barcode": "2", "name": "Riso basmati", "calories_100g": 350, "protein_100g": 8, "carbs_100g": 78, "fat_100g": 0.6,
+     "price_per_kg": 3.0},
+    {"barcode": "3", "name": "Pasta integrale", "calories_100g": 340, "protein_100g": 13, "carbs_100g": 64, "fat_100g": 2.5,
+     "price_per_kg": 2.2},
+    {"barcode": "4", "name": "Olio extravergine", "calories_100g": 900, "protein_100g": 0, "carbs_100g": 0, "fat_100g": 100,
+     "price_per_kg": 9.0, "max_g": 40},
+    {"barcode": "5", "name": "Yogurt greco 0%", "calories_100g": 57, "protein_100g": 10, "carbs_100g": 4, "fat_100g": 0,
+     "price_per_kg": 6.0},
+    {"barcode": "6", "name": "Mandorle", "calories_100g": 600, "protein_100g": 21, "carbs_100g": 5, "fat_100g": 52,
+     "price_per_kg": 18.0, "max_g": 50},
+    {"barcode": "7", "name": "Lenticchie", "calories_100g": 330, "protein_100g": 24, "carbs_100g": 50, "fat_100g": 2,
+     "price_per_kg": 4.0},
+    {"barcode": "8", "name": "Tonno al naturale", "calories_100g": 105, "protein_100g": 25, "carbs_100g": 0, "fat_100g": 1,
+     "price_per_kg": 16.0},
+    {"barcode": "9", "name": "Avena", "calories_100g": 370, "protein_100g": 13, "carbs_100g": 60, "fat_100g": 7,
+     "price_per_kg": 3.5},
+    {"barcode": "10", "name": "Banane", "calories_100g": 89, "protein_100g": 1.1, "carbs_100g": 23, "fat_100g": 0.3,
+     "price_per_kg": 1.8},
+]
+
+
+def synthetic_foods(count: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    protein, carbs, fat = rng.uniform(0, 30, count), rng.uniform(0, 80, count), rng.uniform(0, 40, count)
+    calories = protein * 4 + carbs * 4 + fat * 9
+    prices = rng.uniform(1, 25, count)
+    return [{"barcode": str(i), "name": f"alimento {i}", "calories_100g": float(calories[i]),
+             "protein_100g": float(protein[i]), "carbs_100g": float(carbs[i]), "fat_100g": float(fat[i]),
+             "price_per_kg": float(prices[i])} for i in range(count)]
+
+
+def test_food_matrix_skips_incomplete_or_implausible_products():
+    foods = FoodMatrix(FOODS + [
+        {"name": "Senza grassi dichiarati", "calories_100g": 50, "protein_100g": 1, "carbs_100g": 10, "fat_100g": None},
+        {"name": "Errato", "calories_100g": 4000, "protein_100g": 1, "carbs_100g": 1, "fat_100g": 1},
+        {"name": "Acqua", "calories_100g": 0, "protein_100g": 0, "carbs_100g": 0, "fat_100g": 0},
+        "non un prodotto",
+    ])
+    assert len(foods) == len(FOODS)
+    assert foods.excluded == 4
+    assert foods.per_gram.shape == (len(FOODS), 4)
+    assert foods.per_gram[0] == pytest.approx([1.10, 0.23, 0, 0.015])
+    assert foods.cost_per_gram[0] == pytest.approx(0.011)
+    assert foods.max_g[3] == 40 and foods.min_g[3] == recipe_manager.DEFAULT_MIN_PORTION_G
+
+
+def test_fit_portions_respects_bounds_and_matches_exact_solution():
+    per_gram = np.array([[1.0, 0.0], [0.0, 2.0]])
+    grams = fit_portions(per_gram, np.array([50.0, 80.0]), np.ones(2), np.zeros(2), np.full(2, 100.0))
+    assert grams == pytest.approx([50, 40], abs=0.1)
+    grams = fit_portions(per_gram, np.array([50.0, 80.0]), np.ones(2), np.zeros(2), np.array([100.0, 30.0]))
+    assert grams == pytest.approx([50, 30], abs=0.1)
+
+
+def test_week_plan_hits_the_targets_with_variety():
+    plan = plan_meals(FOODS, TARGETS, days=7, foods_per_day=5)
+    assert len(plan["days"]) == 7
+    assert plan["within_tolerance"] is True
+    for day in plan["days"]:
+        assert 1 <= len(day["items"]) <= 5
+        for name, target in TARGETS.items():
+            assert abs(day["totals"][name] - target) <= recipe_manager.DEFAULT_TOLERANCES[name] * target + 1
+        for item in day["items"]:
+            assert recipe_manager.DEFAULT_MIN_PORTION_G <= item["grams"] <= recipe_manager.DEFAULT_MAX_PORTION_G
+        assert day["cost"] is None
+    # l'olio ha un limite di 40 g per porzione
+    assert all(item["grams"] <= 40 for day in plan["days"] for item in day["items"] if item["barcode"] == "4")
+    # i giorni non sono tutti uguali
+    assert len({tuple(sorted(item["barcode"] for item in day["items"])) for day in plan["days"]}) > 1
+
+
+def test_minimize_cost_gives_a_cheaper_plan_within_tolerance():
+    foods = synthetic_foods(500, seed=3)
+    plain = plan_meals(foods, TARGETS, days=3)
+    cheap = plan_meals(foods, TARGETS, days=3, minimize_cost=True)
+    assert cheap["within_tolerance"] is True
+    plain_cost = sum(
+        next(f for f in foods if f["barcode"] == item["barcode"])["price_per_kg"] * item["grams"] / 1000
+        for day in plain["days"] for item in day["items"]
+    )
+    assert cheap["total_cost"] < plain_cost
+    assert cheap["total_cost"] == pytest.approx(sum(day["cost"] for day in cheap["days"]), abs=0.05)
+
+
+def test_minimize_cost_needs_prices():
+    with pytest.raises(ValueError, match="price_per_kg"):
+        plan_meals([{"name": "Pane", "calories_100g": 270, "protein_100g": 9, "carbs_100g": 50, "fat_100g": 3}],
+                   TARGETS, minimize_cost=True)
+
+
+def test_week_over_thousands_of_foods_stays_within_tolerance():
+    # il tempo di calcolo si misura con benchmarks/bench_meal_plan.py
+    plan = plan_meals(synthetic_foods(5000), TARGETS, days=7, minimize_cost=True)
+    assert plan["candidates"] == 5000
+    assert plan["within_tolerance"] is True
+    assert len(plan["days"]) == 7
+
+
+def test_parse_meal_plan_request():
+    options = parse_meal_plan_request({"targets": TARGETS, "days": "3", "tolerance": 0.2, "minimize_cost": True})
+    assert options["days"] == 3
+    assert options["tolerances"] == {name: 0.2 for name in recipe_manager.NUTRIENTS}
+    assert options["minimize_cost"] is True
+    assert parse_meal_plan_request({"targets": TARGETS, "minimize_cost": "false"})["minimize_cost"] is False
+    assert parse_meal_plan_request({"targets": TARGETS})["minimize_cost"] is False
+
+    from_profile = parse_meal_plan_request({"profile": {"age": 46, "weight": 70, "height": 170, "gender": "male",
+                                                        "activity_level": "light", "objectives": "mantenimento"}})
+    assert from_profile["targets"]["calories"] > 1500
+
+    for data, message in [({}, "targets"), ({"targets": {"calories": 2000}}, "protein"),
+                          ({"targets": TARGETS, "days": 0}, "giorni"),
+                          ({"targets": TARGETS, "foods_per_day": 2.5}, "alimenti al giorno"),
+                          ({"targets": TARGETS, "min_portion_g": 100, "max_portion_g": 50}, "porzione massima"),
+                          ({"targets": TARGETS, "minimize_cost": "no"}, "minimize_cost"),
+                          ({"targets": TARGETS, "minimize_cost": 1}, "minimize_cost")]:
+        with pytest.raises(ValueError, match=message):
+            parse_meal_plan_request(data)
+
+
+def test_meal_plan_endpoint(monkeypatch):
+    client = api_server.app.test_client()
+    response = client.post("/api/meal_plan", json={"targets": TARGETS, "days": 2, "foods": FOODS})
+    assert response.status_code == 200
+    assert len(response.get_json()["days"]) == 2
+
+    monkeypatch.setattr(api_server, "local_catalog_products", lambda limit: FOODS[:limit])
+    response = client.post("/api/meal_plan", json={"targets": TARGETS, "days": 1})
+    assert response.status_code == 200
+    assert response.get_json()["candidates"] == len(FOODS)
+
+    assert client.post("/api/meal_plan", json={"days": 2, "foods": FOODS}).status_code == 400
+    assert client.post("/api/meal_plan", json={"targets": TARGETS, "foods": []}).status_code == 400
+    response = client.post("/api/meal_plan", json={"targets": TARGETS, "foods": [{"name": "Vuoto"}]})
+    assert response.status_code == 422
+    unpriced = [{key: value for key, value in food.items() if key != "price_per_kg"} for food in FOODS]
+    response = client.post("/api/meal_plan", json={"targets": TARGETS, "foods": unpriced, "minimize_cost": "false"})
+    assert response.status_code == 200          # la stringa "false" non attiva il costo (servirebbe price_per_kg)
+    monkeypatch.setattr(api_server, "MEAL_PLAN_MAX_CANDIDATES", 2)
+    assert client.post("/api/meal_plan", json={"targets": TARGETS, "foods": FOODS}).status_code == 400
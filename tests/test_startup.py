@@ -0,0 +1,32 @@
+# tests/test_startup.py
+#
+# Regressioni sull'avvio a freddo: l'SDK Google non deve essere importato all'avvio né dalle
+# route che non usano l'IA, e i tempi devono restare entro un budget (configurabile via env
+# per macchine lente o CI condivise).
+
+import os
+
+import pytest
+
+from benchmarks.bench_startup import measure_startup
+
+IMPORT_BUDGET_S = float(os.getenv('STARTUP_IMPORT_BUDGET_S', '3.0'))
+FIRST_REQUEST_BUDGET_S = float(os.getenv('STARTUP_FIRST_REQUEST_BUDGET_S', '1.0'))
+
+
+@pytest.fixture(scope="module")
+def startup():
+    return measure_startup()
+
+
+def test_google_sdk_not_imported_on_startup_or_local_routes(startup):
+    assert startup["google_import_attempts"] == []
+
+
+def test_import_time_within_budget(startup):
+    assert startup["import_s"] < IMPORT_BUDGET_S
+
+
+def test_first_request_latency_within_budget(startup):
+    for route, seconds in startup["first_request_s"].items():
+        assert seconds < FIRST_REQUEST_BUDGET_S, route
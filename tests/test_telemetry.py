@@ -0,0 +1,146 @@
+# tests/test_telemetry.py
+
+import io
+import json
+
+import pytest
+
+from src import api_server
+from src.integrations import gemini_service, openfoodfacts_client, telemetry
+from src.integrations.telemetry import Counter, Histogram, get_logger
+from tests.test_asgi_server import asgi
+from tests.test_http_client import stub_off  # noqa: F401  (fixture)
+
+
+@pytest.fixture
+def log_output():
+    stream = io.StringIO()
+    telemetry.configure_logging(level="INFO", fmt="text", stream=stream)
+    yield stream
+    telemetry.configure_logging()
+
+
+def upstream_errors(upstream: str, error_type: str) -> float:
+    return telemetry.UPSTREAM_ERRORS.labels(upstream, error_type).value
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_latency_seconds", "Latenza di prova.", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.labels('/a"b').observe(value)
+    lines = histogram.render()
+    assert lines[:2] == ["# HELP test_latency_seconds Latenza di prova.", "# TYPE test_latency_seconds histogram"]
+    assert lines[2:] == [
+        'test_latency_seconds_bucket{route="/a\\"b",le="0.1"} 2',
+        'test_latency_seconds_bucket{route="/a\\"b",le="1"} 3',
+        'test_latency_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+        'test_latency_seconds_sum{route="/a\\"b"} 3.65',
+        'test_latency_seconds_count{route="/a\\"b"} 4',
+    ]
+
+
+def test_counter_label_values_are_normalized():
+    counter = Counter("test_total", "Contatore di prova.", ("status",))
+    counter.labels(200).inc()
+    counter.labels("200").inc(2)
+    assert counter.render()[2:] == ['test_total{status="200"} 3']
+    with pytest.raises(ValueError):
+        counter.labels("200", "extra")
+
+
+def test_structured_text_and_json_logs(log_output):
+    log = get_logger("prova")
+    log.info("Ricerca completata", query="pasta integrale", results=3, name="campo omonimo")
+    log.debug("non emesso")
+    line = log_output.getvalue().strip()
+    assert line.endswith('INFO prova: Ricerca completata query="pasta integrale" results=3 name_="campo omonimo"')
+
+    stream = io.StringIO()
+    telemetry.configure_logging(level="DEBUG", fmt="json", stream=stream)
+    log.debug("Prompt inviato", prompt="testo")
+    entry = json.loads(stream.getvalue())
+    assert {key: entry[key] for key in ("level", "logger", "msg", "prompt")} == {
+        "level": "DEBUG", "logger": "prova", "msg": "Prompt inviato", "prompt": "testo"}
+
+
+def test_sampling_drops_info_but_never_warnings(log_output):
+    log = get_logger("campionato", sample_rate=0.0)
+    sampled_out = telemetry.LOG_SAMPLED_OUT.labels("INFO")
+    before = sampled_out.value
+    for _ in range(10):
+        log.info("frequente")
+    log.warning("raro")
+    assert log_output.getvalue().count("frequente") == 0
+    assert "WARNING campionato: raro" in log_output.getvalue()
+    assert sampled_out.value - before == 10
+
+
+def test_instrumentation_records_without_logging_below_level(log_output):
+    # il costo per richiesta si misura con benchmarks/bench_telemetry.py
+    log = get_logger("overhead")
+    requests_before = telemetry.HTTP_REQUEST_SECONDS.labels("/api/overhead", "GET", 200).count
+    errors_before = upstream_errors("overhead", "timeout")
+    for _ in range(100):
+        telemetry.observe_request("/api/overhead", "GET", 200, 0.001)
+        telemetry.observe_upstream("overhead", 0.01, "timeout", 1024)
+        log.debug("sotto il livello configurato", query="pasta")
+    assert telemetry.HTTP_REQUEST_SECONDS.labels("/api/overhead", "GET", 200).count - requests_before == 100
+    assert upstream_errors("overhead", "timeout") - errors_before == 100
+    assert log_output.getvalue() == ""
+
+
+def test_metrics_endpoint_reports_route_latencies():
+    client = api_server.app.test_client()
+    assert client.get("/api/autocomplete?prefix=pa").status_code == 200
+    assert client.get("/api/autocomplete").status_code == 400
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert '# TYPE allenatore_http_request_duration_seconds histogram' in text
+    assert 'allenatore_http_request_duration_seconds_count{route="/api/autocomplete",method="GET",status="400"}' in text
+
+
+def test_asgi_native_routes_are_measured_once():
+    series = telemetry.HTTP_REQUEST_SECONDS.labels("/api/autocomplete", "GET", 200)
+    before = series.count
+    assert asgi("GET", "/api/autocomplete", "prefix=pa")[0] == 200
+    assert series.count - before == 1
+
+
+def test_upstream_calls_are_counted_by_outcome(stub_off):  # noqa: F811
+    sizes = telemetry.UPSTREAM_RESPONSE_BYTES.labels("off_barcode")
+    ok = telemetry.UPSTREAM_REQUEST_SECONDS.labels("off_barcode", "ok")
+    before = (sizes.count, ok.count, upstream_errors("off_barcode", "http_error"))
+
+    assert openfoodfacts_client.lookup_product("8001")[1] is None
+    assert openfoodfacts_client.lookup_product("1234")[1] == openfoodfacts_client.ERROR_NOT_FOUND
+    assert openfoodfacts_client.lookup_product("5000")[1] == openfoodfacts_client.ERROR_HTTP
+
+    assert ok.count - before[1] == 2                # il 404 è una risposta valida, non un errore
+    assert sizes.count - before[0] == 3
+    assert upstream_errors("off_barcode", "http_error") - before[2] == 1
+
+
+class FakeModel:
+    def __init__(self, text):
+        self.text = text
+
+    def generate_content(self, prompt, **kwargs):
+        return self
+
+
+def test_gemini_errors_are_counted_by_type(log_output):
+    before = upstream_errors("gemini_generate", "json_decode")
+    prompts = telemetry.UPSTREAM_REQUEST_BYTES.labels("gemini_generate")
+    prompts_before = prompts.count
+    gemini_service.set_model(FakeModel("non è JSON"))
+    try:
+        assert "error" in gemini_service._generate_nutritional_advice({"age": "30"})
+    finally:
+        gemini_service.set_model(None)
+    assert upstream_errors("gemini_generate", "json_decode") - before == 1
+    assert prompts.count - prompts_before == 1
+    # il prompt e la risposta grezza sono solo nei log DEBUG
+    assert "Sei un esperto nutrizionista" not in log_output.getvalue()
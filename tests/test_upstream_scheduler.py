@@ -0,0 +1,229 @@
+# tests/test_upstream_scheduler.py
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from src import api_server
+from src.integrations import gemini_service, openfoodfacts_client, upstream_scheduler
+from src.integrations.upstream_scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, UpstreamBusy, \
+    UpstreamScheduler, priority_scope
+from tests.test_asgi_server import call_asgi
+from tests.test_http_client import stub_off  # noqa: F401  (fixture)
+
+
+@pytest.fixture
+def scheduler_for():
+    replaced = []
+
+    def install(upstream, *args, **kwargs):
+        scheduler = UpstreamScheduler(upstream, *args, **kwargs)
+        upstream_scheduler.set_scheduler(upstream, scheduler)
+        replaced.append(upstream)
+        return scheduler
+
+    yield install
+    for upstream in replaced:
+        upstream_scheduler.set_scheduler(upstream, None)
+
+
+def test_token_bucket_allows_burst_then_paces():
+    scheduler = UpstreamScheduler("test", rate_per_minute=600, burst=2)   # un gettone ogni 0.1s
+    waits = [scheduler.acquire(deadline=5) for _ in range(3)]
+    assert waits[:2] == [0.0, 0.0]
+    assert 0.05 < waits[2] < 1.0
+    assert scheduler.stats()["admitted"] == 3
+
+
+def test_interactive_calls_overtake_queued_batch_work():
+    scheduler = UpstreamScheduler("test", rate_per_minute=300, burst=1)   # un gettone ogni 0.2s
+    scheduler.acquire()
+    admitted = []
+
+    def wait_for_token(name, priority):
+        scheduler.acquire(priority, deadline=10)
+        admitted.append(name)
+
+    batch = threading.Thread(target=wait_for_token, args=("batch", PRIORITY_BATCH))
+    batch.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=wait_for_token, args=("interactive", PRIORITY_INTERACTIVE))
+    interactive.start()
+    batch.join()
+    interactive.join()
+    assert admitted == ["interactive", "batch"]
+
+
+def test_calls_that_cannot_meet_their_deadline_fail_fast():
+    scheduler = UpstreamScheduler("test", rate_per_minute=60, burst=1)
+    scheduler.acquire()
+    started = time.perf_counter()
+    with pytest.raises(UpstreamBusy) as busy:
+        scheduler.acquire(deadline=0.2)
+    assert time.perf_counter() - started < 0.1
+    assert busy.value.reason == upstream_scheduler.REJECTED_DEADLINE
+    assert 0.5 < busy.value.retry_after <= 1.0
+
+    full = UpstreamScheduler("test", rate_per_minute=60, burst=1, max_queue=0)
+    full.acquire()
+    with pytest.raises(UpstreamBusy) as busy:
+        full.acquire(deadline=10)
+    assert busy.value.reason == upstream_scheduler.REJECTED_QUEUE_FULL
+    assert (scheduler.stats()["rejected_deadline"], full.stats()["rejected_queue_full"]) == (1, 1)
+
+
+def test_throttling_suspends_tokens():
+    scheduler = UpstreamScheduler("test", rate_per_minute=6000, burst=10)
+    scheduler.throttled(retry_after=5)
+    with pytest.raises(UpstreamBusy):
+        scheduler.acquire(deadline=1)
+    assert scheduler.stats()["throttled"] == 1
+
+
+def test_identical_concurrent_calls_are_coalesced():
+    scheduler = UpstreamScheduler("test", rate_per_minute=0)
+    calls = []
+    start = threading.Barrier(5)
+    results = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return "risultato"
+
+    def caller():
+        start.wait()
+        results.append(scheduler.run("pasta", fetch))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["risultato"] * 5
+    assert len(calls) == 1
+    assert scheduler.stats()["coalesced"] == 4
+
+
+def test_async_calls_are_coalesced_and_paced():
+    scheduler = UpstreamScheduler("test", rate_per_minute=600, burst=1)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        same = await asyncio.gather(*(scheduler.run_async("k", fetch, deadline=5) for _ in range(4)))
+        started = time.perf_counter()
+        await scheduler.run_async(None, fetch, deadline=5)
+        return same, time.perf_counter() - started
+
+    same, paced = asyncio.run(main())
+    assert same == [1, 1, 1, 1]
+    assert paced > 0.02     # il secondo gettone arriva dopo ~0.1s dal primo
+    assert scheduler.stats()["coalesced"] == 3
+
+
+def test_coalesced_async_call_is_cancelled_with_its_last_waiter():
+    scheduler = UpstreamScheduler("test_cancel", rate_per_minute=0)
+    outcomes = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            outcomes.append("cancelled")
+            raise
+        outcomes.append("finished")
+        return "risultato"
+
+    async def main():
+        first = asyncio.ensure_future(scheduler.run_async("k", fetch))
+        second = asyncio.ensure_future(scheduler.run_async("k", fetch))
+        await asyncio.sleep(0.05)
+        first.cancel()                      # l'altro attende ancora: la chiamata prosegue
+        shared = await second
+        lone = asyncio.ensure_future(scheduler.run_async("k", fetch))
+        await asyncio.sleep(0.05)
+        lone.cancel()                       # ultimo in attesa: la chiamata viene cancellata
+        await asyncio.sleep(0.3)
+        return shared, first.cancelled(), lone.cancelled()
+
+    assert asyncio.run(main()) == ("risultato", True, True)
+    assert outcomes == ["finished", "cancelled"]
+
+
+def test_priority_scope_applies_to_the_current_context():
+    scheduler = UpstreamScheduler("test_scope", rate_per_minute=0)
+    series = upstream_scheduler.QUEUE_WAIT_SECONDS.labels("test_scope", "batch")
+    with priority_scope(PRIORITY_BATCH):
+        scheduler.acquire()
+    scheduler.acquire()
+    assert series.count == 1
+    assert upstream_scheduler.current_priority() == PRIORITY_INTERACTIVE
+
+
+def test_off_lookups_fail_fast_when_rate_limited(stub_off, scheduler_for):  # noqa: F811
+    scheduler_for("off_barcode", rate_per_minute=60, burst=1, deadlines={PRIORITY_INTERACTIVE: 0.1})
+    assert openfoodfacts_client.lookup_product("8001")[1] is None
+    served = len(stub_off.client_ports)
+    assert openfoodfacts_client.lookup_product("8002") == (None, openfoodfacts_client.ERROR_RATE_LIMITED)
+    assert len(stub_off.client_ports) == served      # rifiutata senza contattare OFF
+    response = api_server.app.test_client().get("/api/product/8003")
+    assert (response.status_code, response.headers["Retry-After"]) == (503, "1")
+    # il prodotto già in cache non consuma gettoni
+    assert openfoodfacts_client.lookup_product("8001")[0]["name"] == "Spaghetti"
+
+
+def test_rate_limited_searches_answer_503_with_retry_after(scheduler_for, monkeypatch):
+    scheduler = scheduler_for("off_search", rate_per_minute=6, burst=1, deadlines={PRIORITY_INTERACTIVE: 0.1})
+    scheduler.acquire()                              # il prossimo gettone arriva tra 10 secondi
+    monkeypatch.setattr(openfoodfacts_client, "OFF_LOCAL_SEARCH", "off")
+    openfoodfacts_client.set_offline_index(None)
+    assert openfoodfacts_client.search_products("rifiutata") == (None, openfoodfacts_client.ERROR_RATE_LIMITED)
+
+    response = api_server.app.test_client().get("/api/search_food?query=rifiutata")
+    assert (response.status_code, response.headers["Retry-After"]) == (503, "10")
+    assert response.get_json() == {"error": api_server.RATE_LIMITED_MESSAGE}
+    status, headers, content = asyncio.run(call_asgi("GET", "/api/search_food", "query=rifiutata"))
+    assert (status, headers["retry-after"]) == (503, "10")
+    assert json.loads(content) == {"error": api_server.RATE_LIMITED_MESSAGE}
+
+
+def test_batch_lookups_use_batch_priority(stub_off, scheduler_for):  # noqa: F811
+    scheduler_for("off_barcode", rate_per_minute=0)
+    series = upstream_scheduler.QUEUE_WAIT_SECONDS.labels("off_barcode", "batch")
+    before = series.count
+    results = openfoodfacts_client.get_products_by_barcodes(["8001", "8002", "8001"])
+    assert [item["error"] for item in results] == [None, None, None]
+    assert series.count - before == 2
+
+
+def test_gemini_calls_respect_the_scheduler(scheduler_for):
+    scheduler = scheduler_for("gemini", rate_per_minute=1, burst=1)
+    scheduler.acquire()
+
+    class NeverCalled:
+        def generate_content(self, *args, **kwargs):
+            raise AssertionError("il modello non deve essere chiamato")
+
+    gemini_service.set_model(NeverCalled())
+    try:
+        result = gemini_service._generate_nutritional_notes({"age": "30"}, {"calories": 2000})
+    finally:
+        gemini_service.set_model(None)
+    assert result == {"error": gemini_service.RATE_LIMITED_MESSAGE}
+
+
+def test_scheduler_state_is_observable(scheduler_for):
+    scheduler_for("off_search", rate_per_minute=10, burst=5)
+    client = api_server.app.test_client()
+    assert client.get("/api/cache/stats").get_json()["upstream"]["off_search"]["rate_per_minute"] == 10
+    text = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE allenatore_scheduler_queue_depth gauge" in text
+    assert "# TYPE allenatore_scheduler_wait_seconds histogram" in text
@@ -0,0 +1,225 @@
+# tests/test_user_profile.py
+
+import random
+import threading
+
+import pytest
+
+from src import api_server
+from src.core import user_profile
+from src.core.user_profile import ProfileStore
+
+PROFILE = {"age": "30", "weight": "70", "height": "175", "gender": "male", "activity_level": "moderate",
+           "objectives": "mantenere il peso"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ProfileStore(str(tmp_path / "utenti.sqlite3"), flush_interval=60)
+    yield store
+    store.close()
+
+
+def _resum(store: ProfileStore, sql: str, params: tuple) -> tuple:
+    with store._lock:
+        return store._conn.execute(sql, params).fetchone()
+
+
+def test_logging_updates_daily_totals_and_remaining_macros(store):
+    profile = store.save_profile("anna", PROFILE)
+    store.log_food("anna", {"name": "Pasta", "calories_100g": 350, "protein_100g": 12, "carbs_100g": 70,
+                            "fat_100g": 1.5, "grams": 80}, day="2024-03-06")
+    store.log_food("anna", {"name": "Mela", "calories": 52, "carbs": 14}, day="2024-03-06")
+    today = store.remaining_today("anna", "2024-03-06")
+    assert today["items"] == 2
+    assert today["consumed"] == {"calories": 332.0, "protein": 9.6, "carbs": 70.0, "fat": 1.2}
+    assert today["remaining"]["calories"] == round(profile["targets"]["calories"] - 332.0, 1)
+    assert store.remaining_today("anna", "2024-03-07")["consumed"]["calories"] == 0.0
+    assert store.remaining_today("luca", "2024-03-06")["remaining"] is None
+
+
+def test_invalid_entries_are_rejected(store):
+    for item in ({"name": "senza calorie"}, {"calories_100g": 100}, {"calories": -5}, {"calories": "tante"},
+                 {"name": ["x"], "calories": 100}, {"barcode": {"ean": "8001"}, "calories": 100},
+                 {"name": "x" * 201, "calories": 100}):
+        with pytest.raises(ValueError):
+            store.log_food("anna", item)
+    with pytest.raises(ValueError):
+        store.log_food("anna", {"calories": 100}, day="06/03/2024")
+    with pytest.raises(ValueError):
+        store.log_food("../anna", {"calories": 100})
+
+
+def test_weekly_trend_counts_logged_days_and_averages(store):
+    store.log_food("anna", {"calories": 2000}, day="2024-03-03")     # domenica: settimana precedente
+    store.log_food("anna", {"calories": 1500}, day="2024-03-04")     # lunedì
+    store.log_food("anna", {"calories": 500}, day="2024-03-04")
+    store.log_food("anna", {"calories": 1800}, day="2024-03-06")
+    trend = store.weekly_trend("anna", weeks=3, day="2024-03-10")
+    assert [week["week"] for week in trend] == ["2024-02-19", "2024-02-26", "2024-03-04"]
+    assert trend[0]["days_logged"] == 0 and trend[0]["totals"]["calories"] == 0.0
+    assert (trend[1]["days_logged"], trend[1]["daily_average"]["calories"]) == (1, 2000.0)
+    assert (trend[2]["items"], trend[2]["days_logged"], trend[2]["daily_average"]["calories"]) == (3, 2, 1900.0)
+
+
+def test_deleting_an_entry_updates_the_totals(store):
+    first = store.log_food("anna", {"calories": 600}, day="2024-03-04")
+    second = store.log_food("anna", {"calories": 400}, day="2024-03-05")
+    assert store.delete_entry("anna", second["id"])
+    assert not store.delete_entry("anna", second["id"])
+    assert not store.delete_entry("luca", first["id"])
+    week = store.weekly_trend("anna", weeks=1, day="2024-03-05")[0]
+    assert (week["items"], week["days_logged"], week["totals"]["calories"]) == (1, 1, 600.0)
+    assert store.remaining_today("anna", "2024-03-05")["items"] == 0
+    store.delete_entry("anna", first["id"])
+    assert store.weekly_trend("anna", weeks=1, day="2024-03-05")[0]["days_logged"] == 0
+
+
+def test_aggregates_match_the_food_log(store):
+    rng = random.Random(0)
+    days = [f"2024-01-{day:02d}" for day in range(1, 32)]
+    ids = [store.log_food("anna", {"calories": rng.uniform(50, 800), "protein": rng.uniform(0, 40)},
+                          day=rng.choice(days))["id"] for _ in range(300)]
+    for entry_id in rng.sample(ids, 50):
+        store.delete_entry("anna", entry_id)
+    for day in days:
+        expected = _resum(store, "SELECT COALESCE(SUM(calories), 0), COUNT(*) FROM food_log WHERE user_id = ? AND day = ?",
+                          ("anna", day))
+        today = store.remaining_today("anna", day)
+        assert (today["consumed"]["calories"], today["items"]) == (round(expected[0], 1), expected[1])
+    for week in store.weekly_trend("anna", weeks=6, day="2024-01-31"):
+        expected = _resum(store, "SELECT COALESCE(SUM(calories), 0), COUNT(*), COUNT(DISTINCT day) FROM food_log"
+                                 " WHERE user_id = ? AND day >= date(?) AND day < date(?, '+7 days')",
+                          ("anna", week["week"], week["week"]))
+        assert (week["totals"]["calories"], week["items"], week["days_logged"]) == (round(expected[0], 1), *expected[1:])
+
+
+def test_queries_read_only_the_aggregate_tables(store):
+    store.save_profile("anna", PROFILE)
+    store.log_food("anna", {"calories": 500})
+    statements = []
+    store._conn.set_trace_callback(statements.append)
+    store.remaining_today("anna")
+    store.weekly_trend("anna", weeks=8)
+    store._conn.set_trace_callback(None)
+    assert statements and not any("food_log" in statement for statement in statements)
+
+
+def test_profiles_are_written_behind(tmp_path):
+    path = str(tmp_path / "utenti.sqlite3")
+    writer = ProfileStore(path, flush_interval=60)
+    reader = ProfileStore(path, cache_ttl=0)
+    try:
+        writer.save_profile("anna", PROFILE)
+        assert writer.get_profile("anna")["data"] == PROFILE
+        assert reader.get_profile("anna") is None                  # non ancora su disco
+        assert writer.stats()["pending_profiles"] == 1
+        assert writer.flush() == 1
+        assert reader.get_profile("anna")["targets"]["calories"] > 0
+        writer.save_profile("anna", dict(PROFILE, weight="80"))
+    finally:
+        writer.close()                                             # la chiusura scrive i profili in sospeso
+    assert reader.get_profile("anna")["data"]["weight"] == "80"
+    reader.close()
+
+
+def test_flush_keeps_the_most_recent_profile(tmp_path):
+    path = str(tmp_path / "utenti.sqlite3")
+    older, newer = ProfileStore(path, flush_interval=60), ProfileStore(path, flush_interval=60)
+    older.save_profile("anna", PROFILE)
+    newer.save_profile("anna", dict(PROFILE, weight="65"))
+    newer.close()
+    older.close()                   # scrive dopo, ma la sua modifica è più vecchia
+    reader = ProfileStore(path)
+    assert reader.get_profile("anna")["data"]["weight"] == "65"
+    reader.close()
+
+
+def test_concurrent_writers_do_not_lose_increments(tmp_path):
+    path = str(tmp_path / "utenti.sqlite3")
+    workers = [ProfileStore(path) for _ in range(4)]       # una connessione ciascuno, come processi separati
+    start = threading.Barrier(len(workers))
+
+    def write(store):
+        start.wait()
+        for _ in range(50):
+            store.log_food("anna", {"calories": 10, "protein": 1}, day="2024-03-04")
+
+    threads = [threading.Thread(target=write, args=(store,)) for store in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    today = workers[0].remaining_today("anna", "2024-03-04")
+    assert (today["items"], today["consumed"]["calories"], today["consumed"]["protein"]) == (200, 2000.0, 200.0)
+    assert workers[1].weekly_trend("anna", weeks=1, day="2024-03-04")[0]["days_logged"] == 1
+    for store in workers:
+        store.close()
+
+
+def test_profile_api(tmp_path):
+    user_profile.set_profile_store(ProfileStore(str(tmp_path / "utenti.sqlite3")))
+    client = api_server.app.test_client()
+    try:
+        assert client.post("/api/profile/anna", json={"age": "30"}).status_code == 400
+        saved = client.post("/api/profile/anna", json=PROFILE)
+        assert saved.status_code == 200
+        auth = {"Authorization": f"Bearer {saved.get_json()['token']}"}
+        assert client.get("/api/profile/anna", headers=auth).get_json()["targets"] == saved.get_json()["targets"]
+        assert "token" not in client.post("/api/profile/anna", json=PROFILE, headers=auth).get_json()
+
+        logged = client.post("/api/profile/anna/log", json={"name": "Yogurt", "calories": 120, "protein": 10,
+                                                            "day": "2024-03-04"}, headers=auth)
+        assert logged.status_code == 201
+        body = logged.get_json()
+        assert body["today"]["remaining"]["calories"] == saved.get_json()["targets"]["calories"] - 120
+        assert client.post("/api/profile/anna/log", json={"name": "?"}, headers=auth).status_code == 400
+        assert client.post("/api/profile/anna/log", json={"name": ["x"], "calories": 100},
+                           headers=auth).status_code == 400
+
+        today = client.get("/api/profile/anna/today?day=2024-03-04", headers=auth).get_json()
+        assert today["consumed"]["protein"] == 10.0
+        trend = client.get("/api/profile/anna/trend?weeks=2&day=2024-03-04", headers=auth).get_json()
+        assert [week["days_logged"] for week in trend["weeks"]] == [0, 1]
+        assert client.delete(f"/api/profile/anna/log/{body['entry']['id']}", headers=auth).status_code == 200
+        assert client.delete(f"/api/profile/anna/log/{body['entry']['id']}", headers=auth).status_code == 404
+    finally:
+        user_profile.get_profile_store().close()
+        user_profile.set_profile_store(None)
+
+
+def test_profile_routes_require_the_users_token(tmp_path):
+    user_profile.set_profile_store(ProfileStore(str(tmp_path / "utenti.sqlite3")))
+    client = api_server.app.test_client()
+    try:
+        anna = {"Authorization": f"Bearer {client.post('/api/profile/anna', json=PROFILE).get_json()['token']}"}
+        luca = {"Authorization": f"Bearer {client.post('/api/profile/luca', json=PROFILE).get_json()['token']}"}
+        for headers in ({}, luca, {"Authorization": "Bearer sbagliato"}, {"Authorization": anna["Authorization"][7:]}):
+            assert client.get("/api/profile/anna", headers=headers).status_code == 401
+            assert client.get("/api/profile/anna/today", headers=headers).status_code == 401
+            assert client.post("/api/profile/anna/log", json={"calories": 100}, headers=headers).status_code == 401
+            assert client.post("/api/profile/anna", json=PROFILE, headers=headers).status_code == 401
+        assert client.get("/api/profile/marco", headers=anna).status_code == 401
+        assert client.get("/api/profile/anna", headers=anna).status_code == 200
+        assert client.get("/api/profile/nome%20non%20valido", headers=anna).status_code == 400
+    finally:
+        user_profile.get_profile_store().close()
+        user_profile.set_profile_store(None)
+
+
+def test_profile_routes_fail_loudly_without_user_db_path(monkeypatch):
+    monkeypatch.setattr(user_profile, "USER_DB_PATH", "")
+    user_profile.set_profile_store(None)
+    with pytest.raises(user_profile.ProfileStoreNotConfigured):
+        user_profile.get_profile_store()
+    response = api_server.app.test_client().post("/api/profile/anna", json=PROFILE)
+    assert response.status_code == 503
+    assert "configurato" in response.get_json()["error"]
+
+
+def test_tokens_are_issued_once_and_stored_hashed(store):
+    token = store.issue_token("anna")
+    assert token and store.issue_token("anna") is None
+    assert store.check_token("anna", token) and not store.check_token("anna", token + "x")
+    assert not store.check_token("luca", token) and not store.check_token("anna", None)
+    assert token not in _resum(store, "SELECT token_hash FROM profile_tokens WHERE user_id = ?", ("anna",))